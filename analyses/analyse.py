@@ -1,113 +1,317 @@
+import argparse
+import os
 import time
-import math
-import pandas as pd
+from datetime import datetime, timedelta
 import numpy as np
-import matplotlib.pyplot as plt
-from insert_local import *
+from database import connection
+from ring_buffer import RingBuffer
+from rollups import fetch_rollups, sketch_histogram, sketch_quantiles, summarize
+from stream_reader import concat_columns, stream_columns
+from utils.logger import get_logger
 
+log = get_logger("dashboard")
 
-def analyze_and_plot():
+# Painel ao vivo das velocidades de mouse_analyse.
+#
+# A evolução mostra as últimas JANELA análises, guardadas num RingBuffer:
+# a cada ciclo, busca só as linhas com movement_ts a partir do mais
+# recente visto menos ATRASO segundos (no máximo uma janela), descartando
+# pelo id as já exibidas. O id não serve de cursor: o analisador ao vivo e
+# os workers do parallel_analysis gravam em paralelo, e um id menor pode
+# ser confirmado depois de um maior. Linhas confirmadas com mais de ATRASO
+# segundos de atraso (ex.: um backfill regravando movimentos antigos) não
+# entram na evolução, que mostra só o presente.
+#
+# Distribuição e boxplot vêm dos rollups (rollups.py) dos últimos
+# DISTRIBUICAO minutos: os sketches somados dão o histograma e os quantis.
+#
+# Os artistas do matplotlib são criados uma vez e atualizados no lugar; na
+# tela, só eles são redesenhados sobre o fundo em cache (blitting). Sem
+# tela (--saida), a figura é renderizada em PNG/SVG a cada intervalo.
+# Buscar e desenhar custa proporcional à janela, não à tabela.
+
+JANELA = 2000     # análises exibidas (as mais recentes)
+INTERVALO = 2.0   # segundos entre atualizações
+ATRASO = 30.0     # segundos de movement_ts relidos a cada ciclo (commits atrasados)
+# Período da distribuição e do boxplot e resolução dos rollups lidos ("1s" ou "1m")
+DISTRIBUICAO = timedelta(minutes=30)
+RESOLUCAO = "1m"
+
+DIRECOES = {
+    "vel_direita": "Direita",
+    "vel_esquerda": "Esquerda",
+    "vel_cima": "Cima",
+    "vel_baixo": "Baixo",
+}
+ESTILOS = {"vel_direita": "-", "vel_esquerda": "--", "vel_cima": "-.", "vel_baixo": ":"}
+
+# Bins logarítmicos do histograma (px/s); velocidades abaixo de 1 px/s ficam de fora
+BINS = np.geomspace(1, 1e5, 61)
+
+# Quantis do boxplot: bigodes em p5/p95
+QUANTIS = (5, 25, 50, 75, 95)
+
+
+class LiveWindow:
+    """Janela das análises mais recentes, alimentada só pelas linhas novas."""
+
+    def __init__(self, capacity: int = JANELA, device_id: str | None = None, delay: float = ATRASO):
+        """
+        :param capacity: análises exibidas
+        :param device_id: só as análises deste dispositivo (None: todas)
+        :param delay: segundos de movement_ts relidos a cada poll()
+        """
+        self.fields = [("id", "i8"), ("t", "datetime64[us]")] + [(metric, "f8") for metric in DIRECOES]
+        self.buffer = RingBuffer(capacity, fields=self.fields)
+        self.device_id = device_id
+        self.delay = np.timedelta64(int(delay * 1e6), "us")
+        self.last_ts = None
+        # Já exibidas dentro da releitura (id, movement_ts)
+        self._seen = {"id": np.empty(0, dtype="i8"), "t": np.empty(0, dtype="datetime64[us]")}
+
+    def poll(self, conn) -> int:
+        """
+        Busca as análises com movement_ts >= último visto - delay (até uma
+        janela) ainda não exibidas; retorna quantas chegaram.
+        """
+        since = self._since()
+        since = None if since is None else since.item()
+        new = 0
+        # Mais recentes primeiro, limitado à janela (um único lote, pois
+        # itersize = LIMIT): um backlog grande não passa de `capacity` linhas
+        for chunk in stream_columns(
+            conn,
+            "SELECT id, movement_ts, " + ", ".join(DIRECOES) + " FROM mouse_analyse "
+            "WHERE (%s::timestamp IS NULL OR movement_ts >= %s) AND (%s::text IS NULL OR device_id = %s) "
+            "ORDER BY movement_ts DESC, movement_id DESC LIMIT %s;",
+            (since, since, self.device_id, self.device_id, self.buffer.capacity),
+            self.fields, itersize=self.buffer.capacity,
+        ):
+            fresh = ~np.isin(chunk["id"], self._seen["id"])
+            chunk = {name: col[fresh][::-1] for name, col in chunk.items()}
+            self.buffer.extend(*chunk.values())
+            self._seen = concat_columns(self._seen, {"id": chunk["id"], "t": chunk["t"]})
+            new += len(chunk["id"])
+        if new:
+            self.last_ts = self._seen["t"].max()
+            keep = self._seen["t"] >= self._since()
+            self._seen = {name: col[keep] for name, col in self._seen.items()}
+        return new
+
+    def _since(self) -> np.datetime64 | None:
+        """Início da releitura; um movement_ts no futuro (relógio errado) não congela o cursor."""
+        if self.last_ts is None:
+            return None
+        return min(self.last_ts, np.datetime64(datetime.now(), "us")) - self.delay
+
+    def snapshot(self) -> dict:
+        return self.buffer.snapshot()
+
+
+class LiveDashboard:
     """
-    Executa continuamente:
-    1. Processa apenas novos registros da tabela `mouse_movements`.
-    2. Insere os cálculos na tabela `mouse_analyse`.
-    3. Plota gráficos de evolução da velocidade.
+    Figura com a evolução das velocidades da janela e a distribuição e o
+    boxplot dos rollups do período. Os artistas são criados uma vez;
+    update() só troca os dados deles.
     """
-    while True:
-        conn = get_connection()
-        if conn is None:
-            time.sleep(5)
-            continue
 
-        cursor = conn.cursor()
-        try:
-            # 🔹 Busca apenas movimentos que ainda não foram processados
-            cursor.execute(f"""
-                SELECT id, timestamp, dx_direita, dx_esquerda, dy_cima, dy_baixo,
-                    (LEAD(timestamp) OVER (ORDER BY timestamp) - timestamp) AS tempo_total
-                FROM mouse_movements
-                ORDER BY timestamp ASC;
-            """)
-            rows = cursor.fetchall()
-
-            velocities = []
-            timestamps = []
-
-            mov_id, ts, dx_direita, dx_esquerda, dy_cima, dy_baixo, tempo_total = rows
-
-            # ⚠ Evita divisão por zero
-            if tempo_total is None or tempo_total.total_seconds() < 0.01:
-                tempo_total = 0.01
-            else:
-                tempo_total = tempo_total.total_seconds()
-
-            # Calcula deslocamentos líquidos
-            net_dx = dx_direita - dx_esquerda
-            net_dy = dy_baixo - dy_cima
-
-            # Distância Euclidiana (hipotenusa)
-            deslocamento_euclidiano = math.sqrt(net_dx**2 + net_dy**2)
-
-            # Calculando velocidades médias (px/s)
-            vel_direita = dx_direita / tempo_total
-            vel_esquerda = dx_esquerda / tempo_total
-            vel_cima = dy_cima / tempo_total
-            vel_baixo = dy_baixo / tempo_total
-            vel_euclidiana = deslocamento_euclidiano / tempo_total
-
-            # Salvando os dados para visualização
-            velocities.append([vel_direita, vel_esquerda, vel_cima, vel_baixo, vel_euclidiana])
-            timestamps.append(ts)
-
-
-            print("✅ Todos os novos movimentos foram processados!\n")
-
-            # 📊 Gera gráficos a cada iteração
-            df = pd.DataFrame(velocities, columns=["Velocidade Direita", "Velocidade Esquerda", "Velocidade Cima", "Velocidade Baixo", "Velocidade Euclidiana"])
-
-            # 📈 1. Gráfico de Linha - Evolução da Velocidade ao Longo do Tempo
-            plt.figure(figsize=(10, 5))
-            plt.plot(df.index, df["Velocidade Direita"], label="Direita", linestyle='-', marker='o')
-            plt.plot(df.index, df["Velocidade Esquerda"], label="Esquerda", linestyle='--', marker='s')
-            plt.plot(df.index, df["Velocidade Cima"], label="Cima", linestyle='-.', marker='^')
-            plt.plot(df.index, df["Velocidade Baixo"], label="Baixo", linestyle=':', marker='d')
-            plt.xlabel("Movimentos")
-            plt.ylabel("Velocidade (px/s)")
-            plt.title("Evolução da Velocidade nas Direções")
-            plt.legend()
-            plt.grid(True)
-            plt.show()
-
-            # 📊 2. Histograma - Distribuição das Velocidades
-            plt.figure(figsize=(10, 5))
-            plt.hist(df["Velocidade Direita"], bins=10, alpha=0.5, label="Direita")
-            plt.hist(df["Velocidade Esquerda"], bins=10, alpha=0.5, label="Esquerda")
-            plt.hist(df["Velocidade Cima"], bins=10, alpha=0.5, label="Cima")
-            plt.hist(df["Velocidade Baixo"], bins=10, alpha=0.5, label="Baixo")
-            plt.xlabel("Velocidade (px/s)")
-            plt.ylabel("Frequência")
-            plt.title("Distribuição das Velocidades")
-            plt.legend()
-            plt.grid(True)
-            plt.show()
-
-            # 📊 3. Boxplot - Comparação das Velocidades por Direção
-            plt.figure(figsize=(8, 6))
-            df.boxplot(column=["Velocidade Direita", "Velocidade Esquerda", "Velocidade Cima", "Velocidade Baixo"])
-            plt.ylabel("Velocidade (px/s)")
-            plt.title("Boxplot das Velocidades nas Direções")
-            plt.grid(True)
-            plt.show()
+    def __init__(self, window: LiveWindow, output: str | None = None,
+                 period: timedelta = DISTRIBUICAO, resolution: str = RESOLUCAO):
+        """
+        :param window: janela de análises exibida
+        :param output: arquivo .png/.svg para renderizar sem tela (None: janela interativa)
+        :param period: período dos rollups da distribuição e do boxplot
+        :param resolution: resolução dos rollups lidos ("1s" ou "1m")
+        """
+        self.window = window
+        self.output = output
+        self.period = period
+        self.resolution = resolution
+        self._counts = None   # análises por métrica nos rollups exibidos
+        if output:
+            # Sem pyplot: nenhuma dependência de backend gráfico
+            from matplotlib.figure import Figure
+            self.fig = Figure(figsize=(10, 14))
+        else:
+            import matplotlib.pyplot as plt
+            plt.ion()
+            self.fig = plt.figure(figsize=(10, 14))
+        self.ax_line, self.ax_hist, self.ax_box = self.fig.subplots(3, 1)
+        self._build()
+        self._background = None
+        self._need_full_draw = True
+        if not output:
+            self.fig.canvas.mpl_connect("draw_event", self._on_draw)
+            self.fig.show()
 
-        except Exception as e:
-            print(f"❌ Erro ao processar movimentos: {e}")
+    def _build(self):
+        capacity = self.window.buffer.capacity
+        centers = np.sqrt(BINS[:-1] * BINS[1:])
+        self.lines, self.hists = {}, {}
+        for metric, label in DIRECOES.items():
+            self.lines[metric], = self.ax_line.plot([], [], label=label, linestyle=ESTILOS[metric])
+            self.hists[metric], = self.ax_hist.plot(centers, np.zeros(len(centers)), label=label,
+                                                    drawstyle="steps-mid", alpha=0.7)
+        self.ax_line.set_xlim(-capacity + 1, 0)
+        self.ax_line.set_xlabel("Análises (0 = mais recente)")
+        self.ax_line.set_ylabel("Velocidade (px/s)")
+        self.ax_line.set_title("Evolução da Velocidade nas Direções")
+        self.ax_line.legend(loc="upper left")
+        self.ax_line.grid(True)
+
+        self.ax_hist.set_xscale("log")
+        self.ax_hist.set_xlim(BINS[0], BINS[-1])
+        self.ax_hist.set_xlabel("Velocidade (px/s)")
+        self.ax_hist.set_ylabel("Frequência")
+        self.ax_hist.set_title(f"Distribuição das Velocidades ({_minutes(self.period)})")
+        self.ax_hist.legend(loc="upper left")
+        self.ax_hist.grid(True)
+
+        # Boxplot montado uma vez; os quantis só movem as linhas
+        empty = [{"label": label, "whislo": 0, "q1": 0, "med": 0, "q3": 0, "whishi": 0, "fliers": []}
+                 for label in DIRECOES.values()]
+        self.box = self.ax_box.bxp(empty, showfliers=False)
+        self.ax_box.set_ylabel("Velocidade (px/s)")
+        self.ax_box.set_title(f"Boxplot das Velocidades (p5–p95, {_minutes(self.period)})")
+        self.ax_box.grid(True)
 
-        finally:
-            cursor.close()
-            conn.close()
+        self.artists = (list(self.lines.values()) + list(self.hists.values())
+                        + [a for key in ("boxes", "medians", "whiskers", "caps") for a in self.box[key]])
+        if not self.output:
+            for artist in self.artists:
+                artist.set_animated(True)
 
-        time.sleep(2)  # Aguarda 2 segundos antes de verificar novos dados
+    def _on_draw(self, event):
+        # Redesenho completo (início, redimensionamento): novo fundo em cache
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self.artists:
+            artist.axes.draw_artist(artist)
+
+    def _set_data(self, data: dict, series: dict):
+        """Evolução da janela (`data`); distribuição e boxplot dos rollups (`series`)."""
+        n = len(data["id"])
+        x = np.arange(-n + 1, 1)
+        line_max = hist_max = box_max = 1.0
+        for i, metric in enumerate(DIRECOES):
+            values = data[metric]
+            self.lines[metric].set_data(x, values)
+            total = summarize(series[metric])
+            centers, weights = sketch_histogram(total["sketch"])
+            counts, _ = np.histogram(centers, BINS, weights=weights)
+            self.hists[metric].set_ydata(counts)
+            q = np.nan_to_num(sketch_quantiles(total["sketch"], [p / 100 for p in QUANTIS]))
+            p05, q1, med, q3, p95 = q
+            self.box["boxes"][i].set_ydata([q1, q1, q3, q3, q1])
+            self.box["medians"][i].set_ydata([med, med])
+            self.box["whiskers"][2 * i].set_ydata([q1, p05])
+            self.box["whiskers"][2 * i + 1].set_ydata([q3, p95])
+            self.box["caps"][2 * i].set_ydata([p05, p05])
+            self.box["caps"][2 * i + 1].set_ydata([p95, p95])
+            if n:
+                line_max = max(line_max, float(values.max()))
+            hist_max = max(hist_max, float(counts.max()))
+            box_max = max(box_max, float(p95))
+        # Eixo y só muda quando os dados saem da escala (ou encolhem muito)
+        for ax, top in ((self.ax_line, line_max), (self.ax_hist, hist_max), (self.ax_box, box_max)):
+            current = ax.get_ylim()[1]
+            if top > current or top < current / 4:
+                ax.set_ylim(0, top * 1.2)
+                self._need_full_draw = True
+
+    def update(self) -> int:
+        """Busca as análises novas e os rollups e redesenha; retorna quantas análises chegaram."""
+        with connection() as conn:
+            if conn is None:
+                return 0
+            new = self.window.poll(conn)
+            with conn.cursor() as cur:
+                series = fetch_rollups(cur, DIRECOES, datetime.now() - self.period,
+                                       resolution=self.resolution, device_id=self.window.device_id)
+            conn.commit()
+        counts = [int(series[metric]["count"].sum()) for metric in DIRECOES]
+        if new or counts != self._counts or self._need_full_draw:
+            self._counts = counts
+            self._set_data(self.window.snapshot(), series)
+            self.render()
+        return new
+
+    def render(self):
+        if self.output:
+            self._save()
+        elif self._need_full_draw or self._background is None:
+            self.fig.canvas.draw()   # _on_draw guarda o fundo e desenha os artistas
+            self.fig.canvas.blit(self.fig.bbox)
+        else:
+            canvas = self.fig.canvas
+            canvas.restore_region(self._background)
+            for artist in self.artists:
+                artist.axes.draw_artist(artist)
+            canvas.blit(self.fig.bbox)
+        self._need_full_draw = False
+
+    def _save(self):
+        # Grava num arquivo temporário e troca: leitores nunca veem a imagem pela metade
+        root, ext = os.path.splitext(self.output)
+        tmp = f"{root}.tmp{ext}"
+        self.fig.savefig(tmp)
+        os.replace(tmp, self.output)
+
+    def is_open(self) -> bool:
+        if self.output:
+            return True
+        import matplotlib.pyplot as plt
+        return plt.fignum_exists(self.fig.number)
+
+    def wait(self, seconds: float):
+        if self.output:
+            time.sleep(seconds)
+        else:
+            # Processa eventos da janela sem forçar um redesenho completo
+            self.fig.canvas.start_event_loop(seconds)
+
+
+def _minutes(period: timedelta) -> str:
+    return f"últimos {period.total_seconds() / 60:g} min"
+
+
+def analyze_and_plot(janela: int = JANELA, intervalo: float = INTERVALO,
+                     saida: str | None = None, device_id: str | None = None,
+                     distribuicao: timedelta = DISTRIBUICAO, resolucao: str = RESOLUCAO):
+    """
+    Executa continuamente:
+    1. Busca as análises novas de `mouse_analyse` (movement_ts >= último
+       visto - ATRASO, sem as já exibidas; ver LiveWindow.poll).
+    2. Atualiza a janela das JANELA análises mais recentes.
+    3. Lê os rollups de velocidade do período `distribuicao`.
+    4. Redesenha evolução (janela), distribuição e boxplot (rollups), na
+       tela (blitting) ou em `saida` (.png/.svg) a cada intervalo.
+    """
+    dashboard = LiveDashboard(LiveWindow(janela, device_id), output=saida,
+                              period=distribuicao, resolution=resolucao)
+    while dashboard.is_open():
+        try:
+            new = dashboard.update()
+            if new and saida:
+                log.debug("🖼 %d análises novas -> %s", new, saida)
+        except Exception as e:
+            log.error("❌ Erro ao atualizar o painel: %s", e, every=60.0)
+        dashboard.wait(intervalo)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Painel ao vivo das velocidades do mouse.")
+    parser.add_argument("--janela", type=int, default=JANELA, help="análises exibidas")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO, help="segundos entre atualizações")
+    parser.add_argument("--saida", help="renderiza sem tela neste arquivo (.png ou .svg)")
+    parser.add_argument("--device", help="só as análises deste device_id")
+    parser.add_argument("--distribuicao", type=float, default=DISTRIBUICAO.total_seconds() / 60,
+                        help="minutos de rollups na distribuição e no boxplot")
+    parser.add_argument("--resolucao", choices=("1s", "1m"), default=RESOLUCAO,
+                        help="resolução dos rollups lidos")
+    args = parser.parse_args()
+
     print("🚀 Serviço de análise de movimentos iniciado...\nPressione Ctrl+C para interromper.\n")
-    analyze_and_plot()
+    try:
+        analyze_and_plot(args.janela, args.intervalo, args.saida, args.device,
+                         timedelta(minutes=args.distribuicao), args.resolucao)
+    except KeyboardInterrupt:
+        print("\n❎ Encerrado pelo usuário.")
@@ -0,0 +1,76 @@
+# bench_framing.py
+"""
+Micro-benchmark do enquadramento de linhas do UART BLE: o framer antigo
+(str + split("\\n", 1)) contra framing.LineFramer, com notificações
+fragmentadas (20 bytes, MTU padrão do HM-10) e coalescidas (muitas
+linhas por notificação).
+
+Uso (com src/ no PYTHONPATH):
+    python benchmarks/bench_framing.py [n_linhas]
+"""
+import json
+import sys
+import time
+import numpy as np
+from framing import LineFramer, is_json_object
+
+
+def legacy_framer():
+    """Réplica do notification_handler original, para comparação."""
+    state = {"buffer": ""}
+
+    def feed(data):
+        out = []
+        state["buffer"] += data.decode("ascii", errors="ignore")
+        while "\n" in state["buffer"]:
+            line, state["buffer"] = state["buffer"].split("\n", 1)
+            line = line.strip()
+            if line.startswith("{") and line.endswith("}"):
+                out.append(line)
+        return out
+
+    return feed
+
+
+def make_stream(n: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    lines = (
+        json.dumps({"dx": int(dx), "dy": int(dy), "L": 0, "U": 0, "R": 0, "D": 0, "X": 0},
+                   separators=(",", ":"))
+        for dx, dy in rng.integers(-30, 31, (n, 2))
+    )
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def chunks(stream: bytes, size: int) -> list:
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+
+def run(feed, notifications) -> tuple[float, int]:
+    start = time.perf_counter()
+    count = 0
+    for data in notifications:
+        count += len(feed(data))
+    return time.perf_counter() - start, count
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    stream = make_stream(n)
+    patterns = {
+        "fragmentado (20 B)": chunks(stream, 20),
+        "coalescido (4 KiB)": chunks(stream, 4096),
+        "coalescido (64 KiB)": chunks(stream, 65536),
+    }
+    print(f"📊 {n} linhas, {len(stream) / 1e6:.1f} MB")
+    for label, notifications in patterns.items():
+        for name, make in (("legado", legacy_framer),
+                           ("LineFramer", lambda: LineFramer(accept=is_json_object).feed)):
+            elapsed, count = run(make(), notifications)
+            assert count == n, (name, label, count)
+            print(f"  {label:<20} {name:<11} {n / elapsed:>12,.0f} linhas/s "
+                  f"{len(stream) / elapsed / 1e6:>8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# bench_ingest.py
+"""
+Compara a vazão de gravação em mouse_movements (linhas/s) para
+executemany, execute_values e COPY FROM STDIN contra um PostgreSQL local.
+
+Uso (com src/ no PYTHONPATH):
+    python benchmarks/bench_ingest.py [n_linhas] [tamanho_lote]
+
+Cada método grava numa tabela temporária com o mesmo esquema de
+mouse_movements; nada é escrito nas tabelas reais.
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from psycopg2.extras import execute_values
+from database import get_connection
+from insert_local import MOVEMENT_COLUMNS, copy_movements
+
+TABLE = "bench_mouse_movements"
+
+
+def make_rows(n: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    t0 = datetime.now()
+    dx = rng.integers(-20, 21, n).tolist()
+    dy = rng.integers(-20, 21, n).tolist()
+    buttons = (rng.random((n, 5)) < 0.02).astype(int).tolist()
+    return [(t0 + timedelta(microseconds=500 * i), dx[i], dy[i], *buttons[i], f"BENCH-{i % 4}",
+             500 * i, i // 4)
+            for i in range(n)]
+
+
+def write_executemany(cur, rows):
+    cols = ", ".join(MOVEMENT_COLUMNS)
+    params = ",".join(["%s"] * len(MOVEMENT_COLUMNS))
+    cur.executemany(f"INSERT INTO {TABLE} ({cols}) VALUES ({params})", rows)
+
+
+def write_execute_values(cur, rows):
+    cols = ", ".join(MOVEMENT_COLUMNS)
+    execute_values(cur, f"INSERT INTO {TABLE} ({cols}) VALUES %s", rows, page_size=len(rows))
+
+
+def write_copy(cur, rows):
+    copy_movements(cur, rows, table=TABLE)
+
+
+METHODS = {
+    "executemany": write_executemany,
+    "execute_values": write_execute_values,
+    "copy": write_copy,
+}
+
+
+def bench(conn, method, rows, batch_size: int) -> float:
+    """Grava `rows` em lotes de batch_size (um commit por lote); retorna linhas/s."""
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {TABLE};")
+    conn.commit()
+
+    start = time.perf_counter()
+    with conn.cursor() as cur:
+        for i in range(0, len(rows), batch_size):
+            method(cur, rows[i:i + batch_size])
+            conn.commit()
+    elapsed = time.perf_counter() - start
+    return len(rows) / elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    conn = get_connection()
+    if conn is None:
+        sys.exit(1)
+    with conn.cursor() as cur:
+        # Sequência própria para não consumir ids de mouse_movements
+        cur.execute(f"CREATE TEMP TABLE {TABLE} (LIKE mouse_movements);")
+        cur.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY;")
+    conn.commit()
+
+    rows = make_rows(n)
+    print(f"📊 {n} linhas, lotes de {batch_size}")
+    results = {name: bench(conn, method, rows, batch_size) for name, method in METHODS.items()}
+    base = results["executemany"]
+    for name, rate in results.items():
+        print(f"  {name:<15} {rate:>12,.0f} linhas/s  ({rate / base:5.1f}x)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
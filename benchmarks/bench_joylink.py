@@ -0,0 +1,137 @@
+# bench_joylink.py
+"""
+Compara a ingestão do joystick serial linha a linha (INSERT + commit por
+amostra, como o joylink.py antigo) com JoyLinkReader + JoystickWriter
+(COPY em lote), lendo de um pty alimentado por uma thread, sem hardware.
+
+Uso (com src/ no PYTHONPATH):
+    python benchmarks/bench_joylink.py [n_linhas] [baud]
+
+baud = 0 (padrão) alimenta o pty o mais rápido possível; 115200 simula a
+UART real (~10 bits por byte). Grava numa tabela própria, apagada no fim.
+"""
+import fcntl
+import os
+import struct
+import sys
+import termios
+import threading
+import time
+import tty
+import numpy as np
+from database import get_connection, get_pool
+from framing import LineFramer
+from joylink import TABLE_DDL, FileSource, JoyLinkReader, JoystickWriter
+
+TABLE = "bench_joystick_data"
+
+
+def make_lines(n: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    axes = rng.integers(0, 1024, (n, 2)).tolist()
+    buttons = (rng.random((n, 4)) < 0.1).astype(int).tolist()
+    return "".join(f"A0={x},A1={y},B0={b0},B1={b1},B2={b2},B3={b3}\n"
+                   for (x, y), (b0, b1, b2, b3) in zip(axes, buttons)).encode()
+
+
+def feed_pty(data: bytes, baud: int):
+    """Cria um pty e escreve `data` no lado mestre numa thread; retorna (caminho, thread)."""
+    master, slave = os.openpty()
+    # Raw antes do primeiro byte: sem eco nem tradução de fim de linha
+    tty.setraw(slave, termios.TCSANOW)
+    path = os.ttyname(slave)
+
+    def pump():
+        step = 4096
+        bytes_per_s = baud / 10 if baud else None
+        start = time.perf_counter()
+        for i in range(0, len(data), step):
+            os.write(master, data[i:i + step])
+            if bytes_per_s:
+                delay = (i + step) / bytes_per_s - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+        # Fecha o mestre (fim da fonte) só depois que o leitor esvaziou o pty
+        while struct.unpack("i", fcntl.ioctl(slave, termios.FIONREAD, b"\0" * 4))[0]:
+            time.sleep(0.01)
+        os.close(master)
+
+    thread = threading.Thread(target=pump, daemon=True)
+    # O escravo continua aberto até o leitor abrir o seu
+    return path, thread, slave
+
+
+def per_line(path: str) -> int:
+    """Caminho antigo: um INSERT e um commit por linha."""
+    conn = get_connection()
+    source = FileSource(path)
+    framer = LineFramer(max_frame=128, accept=lambda frame: b"=" in frame)
+    rows = 0
+    with conn.cursor() as cur:
+        while (data := source.read(4096)) is not None:
+            for frame in framer.feed(data):
+                item = dict(part.split("=") for part in frame.decode().split(","))
+                states = {key: int(value) for key, value in item.items() if key.startswith("B")}
+                cur.execute(f"INSERT INTO {TABLE} (analog_x, analog_y, button_states) VALUES (%s, %s, %s)",
+                            (int(item["A0"]), int(item["A1"]), str(states).replace("'", '"')))
+                conn.commit()
+                rows += 1
+    source.close()
+    conn.close()
+    return rows
+
+
+def batched(path: str) -> int:
+    writer = JoystickWriter(table=TABLE)
+    reader = JoyLinkReader(FileSource(path), writer)
+    reader.start()
+    reader.join()
+    reader.stop()
+    writer.close()
+    return reader.rows
+
+
+METHODS = {"linha a linha": per_line, "lote (COPY)": batched}
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    baud = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    conn = get_connection()
+    if conn is None or get_pool() is None:
+        sys.exit(1)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE};")
+        for stmt in TABLE_DDL:
+            cur.execute(stmt.format(table=TABLE))
+    conn.commit()
+
+    data = make_lines(n)
+    link = f"{baud} baud" if baud else "sem limite de taxa"
+    print(f"📊 {n} linhas ({len(data) / n:.0f} bytes/linha), {link}")
+    try:
+        for name, method in METHODS.items():
+            with conn.cursor() as cur:
+                cur.execute(f"TRUNCATE {TABLE};")
+            conn.commit()
+            path, pump, slave = feed_pty(data, baud)
+            start = time.perf_counter()
+            pump.start()
+            rows = method(path)
+            elapsed = time.perf_counter() - start
+            os.close(slave)
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT count(*) FROM {TABLE};")
+                stored = cur.fetchone()[0]
+            conn.commit()
+            print(f"  {name:<15} {rows:>8} lidas  {stored:>8} gravadas  {rows / elapsed:>10,.0f} linhas/s")
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {TABLE};")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
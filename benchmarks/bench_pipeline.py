@@ -0,0 +1,384 @@
+# bench_pipeline.py
+"""
+Benchmark ponta a ponta: dispositivos sintéticos -> DeviceSupervisor ->
+IngestPipeline -> MouseMovementInserter (spool + replay) -> PostgreSQL ->
+NOTIFY -> analisador (_process_new) -> AnalysisWriter.
+
+Mede a vazão de ingestão e de análise, a latência amostra -> análise
+gravada (p50/p95/p99, a partir do timestamp de cada movimento) e a
+memória (RSS) do processo. Cada execução acrescenta uma linha JSON a
+--resultados (commit do git, máquina, parâmetros e resultados), para
+comparar versões com --comparar.
+
+Uso (com src/ e a raiz no PYTHONPATH):
+    python benchmarks/bench_pipeline.py [--modo db|memoria] [--dispositivos 4] [--taxa 500]
+        [--formato binary|json] [--duracao 20] [--ocioso 0.5] [--rajada 0] [--semente 0]
+    python benchmarks/bench_pipeline.py --comparar
+
+--modo memoria troca o PostgreSQL por um substituto em memória: o replay
+do spool numera as amostras e entrega cada lote direto ao analisador,
+sem banco (mede o custo do próprio Python).
+
+--modo db grava nas tabelas reais do banco de PG_DB: use um banco só para
+benchmarks. Os dispositivos se chamam BENCH-<n>; as linhas deles (e os
+checkpoints da execução) são apagadas no fim, a não ser com --manter.
+Não rode o analisador ao vivo no mesmo banco durante a medição.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+import numpy as np
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from database import get_connection
+from ble_supervisor import DeviceSupervisor
+from ingest_queue import IngestPipeline
+from insert_local import AnalysisWriter, MouseMovementInserter, NOTIFY_CHANNEL, movements_to_csv
+from pointer_analyse import AnalyzerState, _analyze_chunk, _process_new
+from schema import ensure_schema
+from spool import FLAG_NO_DEVICE_TS
+from benchmarks.synthetic import SyntheticTransport, generate_samples, notifications
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "pipeline.jsonl")
+DEVICE_PREFIX = "BENCH-"
+BENCH_TABLES = ("mouse_movements", "mouse_analyse", "mouse_clicks", "mouse_rollup_1s", "mouse_rollup_1m")
+
+
+class LatencyProbe:
+    """Latência (s) entre o timestamp de cada movimento e a gravação da sua análise."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = []
+        self.analyzed = 0
+        self.first = None
+        self.last = None
+
+    def analyzed_batch(self, n: int):
+        with self._lock:
+            self.analyzed += n
+
+    def committed(self, movement_ts: np.ndarray):
+        now = datetime.now()
+        with self._lock:
+            self._latencies.append((np.datetime64(now, "us") - movement_ts) / np.timedelta64(1, "s"))
+            self.first = self.first or now
+            self.last = now
+
+    def latencies(self) -> np.ndarray:
+        with self._lock:
+            return np.concatenate(self._latencies) if self._latencies else np.zeros(0)
+
+
+class ProbedAnalysisWriter(AnalysisWriter):
+    """AnalysisWriter que registra, no commit, a latência das linhas gravadas."""
+
+    def __init__(self, probe: LatencyProbe, **kwargs):
+        self._probe = probe
+        self._inflight = []
+        super().__init__(**kwargs)
+
+    def write_batch(self, batch, checkpoint=None) -> int:
+        self._probe.analyzed_batch(len(batch))
+        return super().write_batch(batch, checkpoint)
+
+    def _write(self, cur, rows):
+        self._inflight = [row[0] for row in rows]
+        super()._write(cur, rows)
+
+    def _flush(self) -> int:
+        self._inflight = []
+        written = super()._flush()
+        if written and self._inflight:
+            self._probe.committed(np.array(self._inflight, dtype="M8[us]"))
+        return written
+
+
+class MemoryAnalysisWriter:
+    """Destino das análises no modo memória: só mede."""
+
+    def __init__(self, probe: LatencyProbe):
+        self._probe = probe
+
+    def write_batch(self, batch, checkpoint=None) -> int:
+        self._probe.analyzed_batch(len(batch))
+        kept = batch.select(batch.nonzero_mask())
+        self._probe.committed(kept.movement_ts)
+        return len(kept)
+
+    def close(self):
+        pass
+
+
+class MemoryInserter(MouseMovementInserter):
+    """
+    Substituto do banco: o replay do spool converte o lote como para o COPY,
+    numera as amostras e as analisa na hora, na thread do replay.
+    """
+
+    def __init__(self, probe: LatencyProbe, **kwargs):
+        self._writer = MemoryAnalysisWriter(probe)
+        self._state = AnalyzerState()
+        self._next_id = 1
+        super().__init__(**kwargs)
+
+    def _connect(self) -> bool:
+        self._conn = self._cur = self
+        return True
+
+    def _disconnect(self, broken: bool = True):
+        self._conn = self._cur = None
+
+    def _write(self, records: np.ndarray, keep: bool = True):
+        states = {}
+        if keep:
+            movements_to_csv(self._rows(records))
+            _, states = self._button_events(records)
+            ids = np.arange(self._next_id, self._next_id + len(records), dtype=np.int64)
+            self._next_id += len(records)
+            devices = self._spool.device_ids(records["device"])
+            chunk = {
+                "id": ids,
+                "device_id": np.array(["" if d is None else d for d in devices], dtype=object),
+                "timestamp": records["ts"],
+                "dx": records["dx"].astype(np.int64),
+                "dy": records["dy"].astype(np.int64),
+                "device_ts": np.where(records["flags"] & FLAG_NO_DEVICE_TS, np.nan,
+                                      records["device_ts"].astype(np.float64)),
+            }
+            _analyze_chunk(self._writer, self._state, chunk)
+        self._buttons.commit(states)
+        self._spool.commit(int(records["lsn"][-1]))
+
+
+def db_analyzer(writer, stop: threading.Event, ready: threading.Event, itersize: int):
+    """Laço LISTEN do analisador, a partir do maior id atual, até `stop`."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            ensure_schema(cur)
+            conn.commit()
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL};")
+            cur.execute("SELECT COALESCE(MAX(id), 0) FROM mouse_movements;")
+            state = AnalyzerState(cur.fetchone()[0])
+    except Exception:
+        conn.close()
+        stop.set()
+        raise
+    finally:
+        ready.set()
+    try:
+        while not stop.is_set():
+            if select.select([conn], [], [], 0.1) == ([], [], []):
+                continue
+            conn.poll()
+            if not conn.notifies:
+                continue
+            upto = max(int(n.payload.split("-")[1]) for n in conn.notifies)
+            conn.notifies.clear()
+            _process_new(conn, writer, state, upto, itersize)
+    finally:
+        conn.close()
+
+
+class MemorySampler:
+    """Amostra o RSS do processo (Linux: /proc/self/statm) em segundo plano."""
+
+    def __init__(self, interval: float = 0.2):
+        self.start = self.peak = self.rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def rss() -> float:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+        except OSError:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            self.peak = max(self.peak, self.rss())
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._thread.join()
+        return {"start": round(self.start, 1), "peak": round(max(self.peak, self.rss()), 1)}
+
+
+def cleanup(run_checkpoints: list[str]):
+    conn = get_connection()
+    with conn.cursor() as cur:
+        for table in BENCH_TABLES:
+            cur.execute(f"DELETE FROM {table} WHERE device_id LIKE %s;", (DEVICE_PREFIX + "%",))
+        cur.execute("DELETE FROM analysis_checkpoint WHERE name = ANY(%s);", (run_checkpoints,))
+    conn.commit()
+    conn.close()
+
+
+async def drive(streams: dict, sink, expected: int, probe: LatencyProbe, settle: float) -> dict:
+    """Roda supervisor + fila até os dispositivos terminarem e as análises alcançarem `expected`."""
+    transport = SyntheticTransport(streams)
+    pipeline = IngestPipeline(sink)
+    pipeline.start()
+    supervisor = DeviceSupervisor(transport, pipeline, prefixes=(DEVICE_PREFIX,), scan_timeout=0.0)
+    task = asyncio.create_task(supervisor.run())
+    start = time.perf_counter()
+    await transport.done.wait()
+    delivered = time.perf_counter() - start
+    deadline = time.perf_counter() + settle
+    while probe.analyzed < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    task.cancel()
+    await supervisor.stop()
+    await pipeline.stop()
+    return {"delivered_s": delivered, "elapsed_s": time.perf_counter() - start,
+            "queue": pipeline.stats()}
+
+
+def run(args) -> dict:
+    streams, total = {}, 0
+    for i in range(args.dispositivos):
+        samples = generate_samples(args.taxa, args.duracao, idle=args.ocioso, seed=args.semente + i)
+        streams[f"{DEVICE_PREFIX}{i}"] = notifications(samples, args.formato, mtu=args.mtu,
+                                                       burst=args.rajada, seed=args.semente + i)
+        total += len(samples)
+    # A última amostra de cada dispositivo fica pendente no analisador
+    expected = total - args.dispositivos
+
+    probe = LatencyProbe()
+    memory = MemorySampler()
+    with tempfile.TemporaryDirectory() as spool_dir:
+        stop = threading.Event()
+        if args.modo == "memoria":
+            inserter = MemoryInserter(probe, spool_dir=spool_dir)
+            writer = analyzer = None
+        else:
+            checkpoint = f"bench:{uuid.uuid4().hex[:8]}"
+            writer = ProbedAnalysisWriter(probe, checkpoint_name=checkpoint)
+            ready = threading.Event()
+            analyzer = threading.Thread(target=db_analyzer, args=(writer, stop, ready, args.itersize),
+                                        daemon=True)
+            analyzer.start()
+            ready.wait()
+            if stop.is_set():
+                raise RuntimeError("analisador não iniciou (ver o erro acima)")
+            inserter = MouseMovementInserter(spool_dir=spool_dir)
+
+        timing = asyncio.run(drive(streams, inserter.insert_packets, expected, probe, args.espera))
+        stop.set()
+        if analyzer is not None:
+            analyzer.join()
+            writer.close()
+        inserter.close()
+        if args.modo == "db" and not args.manter:
+            cleanup([checkpoint, f"spool:{inserter._spool.spool_id}"])
+
+    latencies = probe.latencies() * 1e3
+    span = (probe.last - probe.first).total_seconds() if probe.first else 0.0
+    pct = (lambda q: round(float(np.percentile(latencies, q)), 2)) if len(latencies) else (lambda q: None)
+    return {
+        "samples": total,
+        "analyzed": probe.analyzed,
+        "complete": probe.analyzed >= expected,
+        "ingest_per_s": round(total / timing["delivered_s"], 1),
+        "analysis_per_s": round(probe.analyzed / max(timing["elapsed_s"], 1e-9), 1),
+        "analysis_span_s": round(span, 2),
+        "latency_ms": {"p50": pct(50), "p95": pct(95), "p99": pct(99),
+                       "max": round(float(latencies.max()), 2) if len(latencies) else None},
+        "rss_mb": memory.stop(),
+        "dropped": timing["queue"]["dropped"],
+        "max_queue_depth": timing["queue"]["max_depth"],
+    }
+
+
+def environment() -> dict:
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], capture_output=True, text=True, timeout=10,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+    return {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+PARAMS = ("modo", "dispositivos", "taxa", "formato", "duracao", "ocioso", "rajada", "mtu", "semente")
+
+
+def compare(path: str, last: int = 2):
+    """Mostra, por cenário (mesmos parâmetros), as `last` execuções mais recentes."""
+    scenarios = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            key = tuple((k, record["params"][k]) for k in PARAMS)
+            scenarios.setdefault(key, []).append(record)
+    for key, records in scenarios.items():
+        print("📊 " + " ".join(f"{k}={v}" for k, v in key))
+        for record in records[-last:]:
+            r = record["results"]
+            print(f"  {record['ts'][:19]}  {record['env']['commit'] or '-':<9}"
+                  f"{'*' if record['env']['dirty'] else ' '}"
+                  f" ingest {r['ingest_per_s']:>10,.0f}/s  análise {r['analysis_per_s']:>10,.0f}/s"
+                  f"  p50 {r['latency_ms']['p50']} ms  p99 {r['latency_ms']['p99']} ms"
+                  f"  RSS {r['rss_mb']['peak']} MiB{'' if r['complete'] else '  (incompleto)'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta da ingestão e análise.")
+    parser.add_argument("--modo", choices=("db", "memoria"), default="db")
+    parser.add_argument("--dispositivos", type=int, default=4)
+    parser.add_argument("--taxa", type=float, default=500, help="amostras/s por dispositivo")
+    parser.add_argument("--formato", choices=("binary", "json"), default="binary")
+    parser.add_argument("--duracao", type=float, default=20, help="segundos de fluxo por dispositivo")
+    parser.add_argument("--ocioso", type=float, default=0.5, help="fração do tempo em repouso")
+    parser.add_argument("--rajada", type=float, default=0.0, help="duração média (s) dos travamentos do link")
+    parser.add_argument("--mtu", type=int, default=20, help="bytes por notificação")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--itersize", type=int, default=20_000, help="linhas por lote lido pelo analisador")
+    parser.add_argument("--espera", type=float, default=60.0, help="espera máxima (s) pelas análises no fim")
+    parser.add_argument("--resultados", default=RESULTS, help="arquivo JSON Lines dos resultados")
+    parser.add_argument("--manter", action="store_true", help="não apaga as linhas BENCH-* do banco")
+    parser.add_argument("--comparar", action="store_true", help="compara as execuções já gravadas")
+    args = parser.parse_args()
+
+    if args.comparar:
+        compare(args.resultados)
+        return
+
+    print(f"📊 {args.modo}: {args.dispositivos} dispositivos x {args.taxa:g} Hz, {args.formato}, "
+          f"{args.duracao:g}s, ocioso {args.ocioso:g}, rajada {args.rajada:g}s")
+    results = run(args)
+    record = {"bench": "pipeline", "ts": datetime.now().isoformat(timespec="seconds"),
+              "env": environment(), "params": {k: getattr(args, k) for k in PARAMS},
+              "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.resultados)), exist_ok=True)
+    with open(args.resultados, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    print(json.dumps(results, indent=1))
+    if not results["complete"]:
+        print(f"⚠ só {results['analyzed']} de {results['samples']} amostras analisadas em --espera")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
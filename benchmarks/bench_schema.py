@@ -0,0 +1,139 @@
+# bench_schema.py
+"""
+Mede as consultas do analisador (pointer_analyse) sobre o esquema
+particionado de schema.py à medida que as tabelas crescem.
+
+Uso (com src/ no PYTHONPATH):
+    python benchmarks/bench_schema.py [linhas_por_dia] [dias ...]
+
+Tudo roda num schema temporário (bench_schema), removido no fim; nada é
+escrito nas tabelas reais. Para cada tamanho, imprime o tempo mediano de
+cada consulta, os nós do plano (EXPLAIN ANALYZE) e os buffers lidos: com
+os índices certos, o custo depende do tamanho do lote, não da tabela.
+Consultas por id (sem a chave de partição) sondam um índice por
+partição: crescem com o número de dias guardados, limitado pela
+retenção (python src/schema.py retention N), não com as linhas.
+"""
+import sys
+import time
+from datetime import date, timedelta
+from statistics import median
+from database import get_connection
+from pointer_analyse import _MOVEMENT_SELECT
+import schema
+
+SCHEMA = "bench_schema"
+DEVICES = 4
+BATCH = 1000     # linhas novas por rodada do analisador
+REPEAT = 20
+
+# nome -> (sql, parâmetros calculados a partir do maior id e do maior timestamp)
+QUERIES = {
+    "faixa de id (lote novo)": (
+        _MOVEMENT_SELECT + " WHERE id > %s AND id <= %s ORDER BY id;",
+        lambda max_id, max_ts: (max_id - BATCH, max_id),
+    ),
+    "MAX(id)": (
+        "SELECT MAX(id) FROM mouse_movements;",
+        lambda max_id, max_ts: (),
+    ),
+    "id = ANY (pendentes)": (
+        _MOVEMENT_SELECT + " WHERE id = ANY(%s);",
+        lambda max_id, max_ts: ([max_id - i for i in range(DEVICES)],),
+    ),
+    "última análise": (
+        "SELECT movement_ts FROM mouse_analyse ORDER BY movement_ts DESC LIMIT 1;",
+        lambda max_id, max_ts: (),
+    ),
+    "dispositivo, última hora": (
+        "SELECT timestamp, dx, dy FROM mouse_movements "
+        "WHERE device_id = %s AND timestamp >= %s ORDER BY timestamp;",
+        lambda max_id, max_ts: ("BENCH-0", max_ts - timedelta(hours=1)),
+    ),
+}
+
+
+def load_day(cur, day: date, rows: int):
+    """Grava `rows` movimentos espalhados pelo dia e a análise de cada um."""
+    schema.ensure_partitions(cur, day, day)
+    step = 86_400.0 / rows
+    cur.execute("""
+        INSERT INTO mouse_movements (timestamp, dx, dy, L, U, R, D, X, device_id)
+        SELECT %s::timestamp + make_interval(secs => g * %s), (g %% 41) - 20, (g %% 37) - 18,
+               0, 0, 0, 0, 0, 'BENCH-' || (g %% %s)
+        FROM generate_series(0, %s - 1) AS g;
+    """, (day, step, DEVICES, rows))
+    cur.execute("""
+        INSERT INTO mouse_analyse (movement_ts, device_id, movement_id, vel_euclidiana)
+        SELECT timestamp, device_id, id, 0 FROM mouse_movements
+        WHERE timestamp >= %s AND timestamp < %s;
+    """, (day, day + timedelta(days=1)))
+
+
+def plan_summary(cur, sql: str, params) -> tuple[str, int]:
+    """Nós do plano (sem repetição) e blocos lidos, via EXPLAIN (ANALYZE, BUFFERS)."""
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0][0]["Plan"]
+    nodes, stack = [], [plan]
+    while stack:
+        node = stack.pop()
+        if node["Node Type"] not in nodes:
+            nodes.append(node["Node Type"])
+        stack.extend(reversed(node.get("Plans", [])))
+    blocks = plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+    return " > ".join(nodes), blocks
+
+
+def time_query(cur, sql: str, params) -> float:
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        samples.append(time.perf_counter() - start)
+    return median(samples) * 1000
+
+
+def main():
+    per_day = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    sizes = [int(d) for d in sys.argv[2:]] or [1, 4, 16]
+
+    conn = get_connection()
+    if conn is None:
+        sys.exit(1)
+    today = date.today()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+            cur.execute(f"CREATE SCHEMA {SCHEMA};")
+            cur.execute(f"SET search_path TO {SCHEMA};")
+            schema.ensure_schema(cur, today)
+            conn.commit()
+
+            loaded = 0
+            for days in sorted(sizes):
+                while loaded < days:
+                    load_day(cur, today - timedelta(days=loaded), per_day)
+                    loaded += 1
+                conn.commit()
+                cur.execute("ANALYZE mouse_movements; ANALYZE mouse_analyse;")
+                cur.execute("SELECT MAX(id), MAX(timestamp) FROM mouse_movements;")
+                max_id, max_ts = cur.fetchone()
+
+                print(f"📊 {days} dias, {days * per_day:,} movimentos, "
+                      f"{len(schema.list_partitions(cur, 'mouse_movements'))} partições")
+                for name, (sql, make_params) in QUERIES.items():
+                    params = make_params(max_id, max_ts)
+                    ms = time_query(cur, sql, params)
+                    nodes, blocks = plan_summary(cur, sql, params)
+                    print(f"  {name:<26} {ms:8.2f} ms  {blocks:>6} blocos  {nodes}")
+                conn.commit()
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
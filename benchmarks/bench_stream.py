@@ -0,0 +1,63 @@
+# bench_stream.py
+"""
+Compara fetchall() com stream_columns() (cursor nomeado, lotes NumPy) ao
+ler as n primeiras linhas de mouse_movements: tempo e pico de memória do
+cliente (tracemalloc).
+
+Uso (com src/ no PYTHONPATH):
+    python benchmarks/bench_stream.py [n_linhas] [itersize]
+
+Só lê do banco; nada é gravado.
+"""
+import sys
+import time
+import tracemalloc
+from database import get_connection
+from pointer_analyse import MOVEMENT_FIELDS, _MOVEMENT_SELECT
+from stream_reader import rows_to_columns, stream_columns
+
+
+def read_fetchall(conn, n: int, itersize: int) -> int:
+    with conn.cursor() as cur:
+        cur.execute(_MOVEMENT_SELECT + " ORDER BY id LIMIT %s;", (n,))
+        columns = rows_to_columns(cur.fetchall(), MOVEMENT_FIELDS)
+    conn.commit()
+    return len(columns["id"])
+
+
+def read_stream(conn, n: int, itersize: int) -> int:
+    total = 0
+    for chunk in stream_columns(conn, _MOVEMENT_SELECT + " ORDER BY id LIMIT %s;", (n,),
+                                MOVEMENT_FIELDS, itersize):
+        total += len(chunk["id"])
+    conn.commit()
+    return total
+
+
+METHODS = {"fetchall": read_fetchall, "stream_columns": read_stream}
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    itersize = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+
+    conn = get_connection()
+    if conn is None:
+        sys.exit(1)
+    print(f"📊 até {n} linhas, itersize {itersize}")
+    for name, method in METHODS.items():
+        start = time.perf_counter()
+        rows = method(conn, n, itersize)
+        elapsed = time.perf_counter() - start
+
+        # Segunda passada só para medir a memória (tracemalloc deixa mais lento)
+        tracemalloc.start()
+        method(conn, n, itersize)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {name:<15} {rows:>9} linhas  {rows / elapsed:>12,.0f} linhas/s  pico {peak / 2**20:8.1f} MiB")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
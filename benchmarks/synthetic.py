@@ -0,0 +1,197 @@
+# synthetic.py
+"""
+Gerador de fluxos sintéticos de ponteiro para benchmarks, reprodutível
+pela semente.
+
+Amostras (generate_samples): o firmware amostra a `rate_hz` fixo; o
+ponteiro alterna repouso (dx = dy = 0) e traços com perfil de velocidade
+de jerk mínimo (sino), direção levemente curva e distância log-normal,
+quantizados em contagens inteiras sem perder o deslocamento total. Entre
+os traços há cliques em X (às vezes duplos), arrastos com X segurado e, mais
+raramente, L/U/R/D segurados. `idle` é a fração do tempo em repouso.
+
+Entrega (notifications): as amostras saem em notificações BLE de `mtu`
+bytes a cada intervalo de conexão (`tick`), em JSON ou no quadro binário
+de packet_format. Com `burst` > 0, o link trava por períodos de duração
+média `burst` s (a cada `burst_every` s, em média) e entrega o acumulado de
+uma vez, como acontece com retransmissões BLE.
+
+SyntheticTransport reproduz as notificações em tempo real com a interface
+do BleakTransport (discover/stream), para o DeviceSupervisor.
+"""
+import asyncio
+import json
+import math
+import numpy as np
+from packet_format import BUTTON_BITS, encode_frames
+
+SAMPLE_DTYPE = np.dtype([
+    ("t", "<f8"),           # instante da amostra (s desde o início do fluxo)
+    ("seq", "<i8"),
+    ("device_ts", "<i8"),   # relógio do dispositivo (µs, com deriva)
+    ("dx", "<i2"),
+    ("dy", "<i2"),
+    ("buttons", "u1"),
+])
+
+STROKE_SECONDS = 0.35     # duração mediana de um traço
+STROKE_COUNTS = 250.0     # distância mediana de um traço (contagens do sensor)
+P_CLICK = 0.35            # chance de clique depois de um traço
+P_DOUBLE = 0.15           # chance de o clique ser duplo
+P_DRAG = 0.05             # chance de o traço ser um arrasto (X segurado)
+P_DPAD = 0.03             # chance de L/U/R/D segurado numa pausa
+
+X = 1 << BUTTON_BITS["X"]
+DPAD = [1 << BUTTON_BITS[name] for name in ("L", "U", "R", "D")]
+
+
+def generate_samples(rate_hz: float, duration: float, idle: float = 0.5, seed: int = 0,
+                     skew_ppm: float = 0.0) -> np.ndarray:
+    """
+    Amostras de um dispositivo (SAMPLE_DTYPE) por `duration` segundos.
+    :param idle: fração do tempo em repouso, entre os traços (0 a <1)
+    :param skew_ppm: deriva do relógio do dispositivo
+    """
+    rng = np.random.default_rng(seed)
+    n = int(duration * rate_hz)
+    vx, vy = np.zeros(n), np.zeros(n)
+    buttons = np.zeros(n, dtype=np.uint8)
+    idle = min(max(idle, 0.0), 0.95)
+    pause_mean = STROKE_SECONDS * idle / (1 - idle)
+
+    def span(seconds: float) -> int:
+        return max(int(seconds * rate_hz), 1)
+
+    i = span(rng.exponential(pause_mean)) if pause_mean else 0
+    while i < n:
+        m = max(span(np.clip(rng.lognormal(math.log(STROKE_SECONDS), 0.5), 0.08, 2.0)), 2)
+        distance = rng.lognormal(math.log(STROKE_COUNTS), 0.8)
+        tau = (np.arange(m) + 0.5) / m
+        speed = distance * 30 * tau ** 2 * (1 - tau) ** 2 / m
+        angle = rng.uniform(0, 2 * math.pi) + rng.normal(0, 0.4) * (tau - 0.5)
+        end = min(i + m, n)
+        vx[i:end] = (speed * np.cos(angle))[:end - i]
+        vy[i:end] = (speed * np.sin(angle))[:end - i]
+        if rng.random() < P_DRAG:
+            buttons[max(i - span(0.05), 0):min(end + span(0.05), n)] |= X
+        i = end
+
+        pause = rng.exponential(pause_mean) if pause_mean else 0.0
+        j = i + span(0.05)
+        if rng.random() < P_CLICK:
+            for _ in range(2 if rng.random() < P_DOUBLE else 1):
+                hold = span(rng.lognormal(math.log(0.09), 0.3))
+                buttons[j:min(j + hold, n)] |= X
+                j += hold + span(0.08)
+        if rng.random() < P_DPAD:
+            buttons[j:min(j + span(rng.lognormal(math.log(0.5), 0.5)), n)] |= DPAD[rng.integers(4)]
+        i += max(span(pause), j - i) if pause_mean else 0
+
+    samples = np.zeros(n, dtype=SAMPLE_DTYPE)
+    samples["t"] = np.arange(n) / rate_hz
+    samples["seq"] = np.arange(n)
+    samples["device_ts"] = (samples["t"] * (1 + skew_ppm * 1e-6) * 1e6).astype(np.int64)
+    # Quantiza acumulando o resto: a soma dos dx/dy segue o caminho contínuo
+    for axis, v in (("dx", vx), ("dy", vy)):
+        position = np.round(np.cumsum(v))
+        samples[axis] = np.clip(np.diff(position, prepend=0), -32768, 32767)
+    samples["buttons"] = buttons
+    return samples
+
+
+def encode_samples(samples: np.ndarray, fmt: str = "binary") -> list[bytes]:
+    """Bytes de cada amostra no formato do firmware ("json" ou "binary")."""
+    if fmt == "binary":
+        data = encode_frames(samples["seq"], samples["device_ts"], samples["dx"], samples["dy"],
+                             samples["buttons"])
+        size = len(data) // len(samples) if len(samples) else 0
+        return [data[k:k + size] for k in range(0, len(data), size)]
+    if fmt != "json":
+        raise ValueError(f"Formato inválido: {fmt}")
+    bits = {name: (samples["buttons"] >> bit) & 1 for name, bit in BUTTON_BITS.items()}
+    return [
+        (json.dumps({"dx": int(dx), "dy": int(dy), "L": int(L), "U": int(U), "R": int(R),
+                     "D": int(D), "X": int(X), "t": int(t) & 0xFFFFFFFF, "s": int(s) & 0xFFFF},
+                    separators=(",", ":")) + "\n").encode("ascii")
+        for dx, dy, L, U, R, D, X, t, s in zip(
+            samples["dx"].tolist(), samples["dy"].tolist(), *(bits[k].tolist() for k in "LURDX"),
+            samples["device_ts"].tolist(), samples["seq"].tolist())
+    ]
+
+
+def notifications(samples: np.ndarray, fmt: str = "binary", mtu: int = 20, tick: float = 0.0075,
+                  burst: float = 0.0, burst_every: float = 2.0, seed: int = 0) -> list[tuple[float, bytes]]:
+    """
+    Notificações (instante de entrega em s, bytes) de um dispositivo, em ordem.
+    :param mtu: bytes por notificação (20 no HM-10)
+    :param tick: intervalo de conexão BLE (s): as amostras saem no próximo
+    :param burst: duração média (s) de um travamento do link (0: sem travamentos)
+    :param burst_every: intervalo médio (s) entre travamentos
+    """
+    if not len(samples):
+        return []
+    delivery = np.ceil(samples["t"] / tick) * tick
+    if burst > 0:
+        rng = np.random.default_rng(seed)
+        end = samples["t"][-1]
+        start = rng.exponential(burst_every)
+        while start < end:
+            stall = rng.exponential(burst)
+            inside = (delivery >= start) & (delivery < start + stall)
+            delivery[inside] = start + stall
+            start += stall + rng.exponential(burst_every)
+    payloads = encode_samples(samples, fmt)
+    out = []
+    bounds = np.flatnonzero(np.diff(delivery)) + 1
+    for lo, hi in zip(np.r_[0, bounds].tolist(), np.r_[bounds, len(delivery)].tolist()):
+        data = b"".join(payloads[lo:hi])
+        when = float(delivery[lo])
+        out.extend((when, data[k:k + mtu]) for k in range(0, len(data), mtu))
+    return out
+
+
+class SyntheticTransport:
+    """
+    Transporte para o DeviceSupervisor que entrega notificações
+    pré-geradas em tempo real. Depois da última, o link fica aberto e
+    parado; `done` é sinalizado quando todos os dispositivos terminaram.
+    """
+
+    def __init__(self, streams: dict[str, list[tuple[float, bytes]]]):
+        """:param streams: endereço do dispositivo -> notificações (ver notifications())"""
+        self._streams = streams
+        self._finished = 0
+        self.done = asyncio.Event()
+
+    async def discover(self, timeout: float) -> list[tuple[str, str]]:
+        await asyncio.sleep(0)
+        return [(address, address) for address in self._streams]
+
+    async def stream(self, address: str, on_data):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for when, data in self._streams[address]:
+            delay = start + when - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            on_data(data)
+        self._finished += 1
+        if self._finished == len(self._streams):
+            self.done.set()
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    # Resumo de um fluxo gerado
+    import sys
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 500
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+    samples = generate_samples(rate, duration)
+    moving = (samples["dx"] != 0) | (samples["dy"] != 0)
+    edges = np.count_nonzero(np.diff(samples["buttons"].astype(np.int16)))
+    for fmt in ("binary", "json"):
+        notes = notifications(samples, fmt, burst=0.05)
+        size = sum(len(data) for _, data in notes)
+        print(f"📊 {fmt:<6} {len(samples)} amostras, {len(notes)} notificações, {size / duration / 1e3:.1f} kB/s")
+    print(f"📊 {moving.mean():.0%} das amostras em movimento, {edges} bordas de botão, "
+          f"deslocamento |dx| total {np.abs(samples['dx']).sum()}")
@@ -0,0 +1,158 @@
+# button_events.py
+
+from datetime import datetime, timedelta
+from typing import NamedTuple
+import numpy as np
+from packet_format import BUTTON_BITS, pack_buttons
+
+# Eventos de botão a partir do campo de bits L/U/R/D/X das amostras.
+#
+# O firmware manda o estado dos botões em toda amostra, então um botão
+# segurado aparece em centenas de amostras seguidas. O ButtonTracker compara
+# cada amostra com a anterior do mesmo dispositivo e só emite as bordas:
+#   press    o botão desceu
+#   double   o botão desceu até DOUBLE_CLICK_WINDOW depois da descida
+#            anterior (um press comum): é o segundo clique de um duplo
+#   release  o botão subiu; duration_ms = tempo que ficou segurado
+#
+# Os eventos vão para mouse_clicks (button = L/U/R/D/X) na mesma transação
+# das amostras e da posição do spool (ver insert_local.py). Por isso o estado
+# dos botões pode ser reconstruído do próprio mouse_clicks (restore()): após
+# um reinício ou reconexão, um botão que continua segurado não gera outro press.
+
+DOUBLE_CLICK_WINDOW = 0.4          # segundos entre as duas descidas
+RESTORE_LOOKBACK = timedelta(days=1)
+
+BUTTONS = tuple(BUTTON_BITS)       # nomes na ordem dos bits
+PRESS_ACTIONS = ("press", "double")
+
+
+class ButtonEvent(NamedTuple):
+    """Uma borda de botão, na ordem de CLICK_COLUMNS."""
+    timestamp: datetime
+    dx: int
+    dy: int
+    action: str                    # "press" | "double" | "release"
+    device_id: str | None
+    button: str                    # L, U, R, D ou X
+    duration_ms: float | None      # só no release
+
+CLICK_COLUMNS = ButtonEvent._fields
+
+
+class ButtonState(NamedTuple):
+    """Estado dos botões de um dispositivo após a última amostra vista."""
+    bits: int                      # campo de bits da última amostra
+    pressed_at: tuple              # por bit: última descida (µs, horário local) ou None
+    double: tuple                  # por bit: a última descida completou um duplo clique
+
+EMPTY_STATE = ButtonState(0, (None,) * len(BUTTONS), (False,) * len(BUTTONS))
+
+
+def button_bits(records: np.ndarray) -> np.ndarray:
+    """Campo de bits (packet_format.BUTTON_BITS) de registros com colunas L, U, R, D, X."""
+    return pack_buttons(*(records[name].astype(np.uint8) for name in BUTTONS))
+
+
+def _us(value) -> int:
+    return int(np.datetime64(value, "us").astype(np.int64))
+
+
+class ButtonTracker:
+    """
+    Detector de bordas por dispositivo. detect() não altera o estado:
+    devolve os eventos e o estado seguinte, que o chamador aplica com
+    commit() depois de gravar os eventos (uma transação desfeita não deixa
+    o estado adiantado).
+    """
+
+    def __init__(self, double_click: float = DOUBLE_CLICK_WINDOW):
+        """
+        :param double_click: intervalo máximo (s) entre descidas de um duplo clique
+        """
+        self._window_us = int(double_click * 1e6)
+        self._states: dict[str | None, ButtonState] = {}
+
+        # Contadores
+        self.samples = 0
+        self.events = 0
+
+    def state(self, device_id: str | None) -> ButtonState:
+        return self._states.get(device_id, EMPTY_STATE)
+
+    def detect(self, device_id: str | None, ts: np.ndarray, bits: np.ndarray,
+               dx: np.ndarray, dy: np.ndarray) -> tuple[list[ButtonEvent], ButtonState]:
+        """
+        Bordas de uma sequência de amostras de um dispositivo, em ordem.
+        :param ts: instantes (datetime64, horário local)
+        :param bits: campo de bits dos botões de cada amostra
+        :param dx, dy: deslocamento de cada amostra (copiado para o evento)
+        :return: (eventos, estado após a última amostra)
+        """
+        state = self.state(device_id)
+        bits = np.asarray(bits, dtype=np.uint8)
+        if not len(bits):
+            return [], state
+        self.samples += len(bits)
+        prev = np.empty_like(bits)
+        prev[0] = state.bits
+        prev[1:] = bits[:-1]
+        changed = np.flatnonzero(bits != prev)
+        if not len(changed):
+            return [], state
+
+        ts = np.asarray(ts, dtype="M8[us]")
+        pressed_at, double = list(state.pressed_at), list(state.double)
+        events = []
+        for i in changed.tolist():
+            now, flipped = int(bits[i]), int(bits[i] ^ prev[i])
+            t = int(ts[i].astype(np.int64))
+            for bit, name in enumerate(BUTTONS):
+                mask = 1 << bit
+                if not flipped & mask:
+                    continue
+                last = pressed_at[bit]
+                if now & mask:
+                    is_double = last is not None and not double[bit] and t - last <= self._window_us
+                    pressed_at[bit], double[bit] = t, is_double
+                    action, duration = ("double" if is_double else "press"), None
+                else:
+                    action, duration = "release", None if last is None else (t - last) / 1000
+                events.append(ButtonEvent(ts[i].item(), int(dx[i]), int(dy[i]), action,
+                                          device_id, name, duration))
+        self.events += len(events)
+        return events, ButtonState(int(bits[-1]), tuple(pressed_at), tuple(double))
+
+    def commit(self, states: dict):
+        """Aplica os estados devolvidos por detect() ({device_id: ButtonState})."""
+        self._states.update(states)
+
+    def restore(self, cur, lookback: timedelta = RESTORE_LOOKBACK):
+        """
+        Reconstrói o estado a partir do último evento de cada botão em
+        mouse_clicks (dentro de `lookback`); substitui o estado em memória.
+        """
+        cur.execute("""
+            SELECT DISTINCT ON (device_id, button) device_id, button, action, timestamp, duration_ms
+            FROM mouse_clicks
+            WHERE timestamp >= %s AND button = ANY(%s)
+            ORDER BY device_id, button, timestamp DESC, id DESC;
+        """, (datetime.now() - lookback, list(BUTTONS)))
+        states = {}
+        for device_id, button, action, timestamp, duration_ms in cur.fetchall():
+            state = states.get(device_id, EMPTY_STATE)
+            bit = BUTTON_BITS[button]
+            pressed_at, double = list(state.pressed_at), list(state.double)
+            if action in PRESS_ACTIONS:
+                bits = state.bits | 1 << bit
+                pressed_at[bit], double[bit] = _us(timestamp), action == "double"
+            else:
+                bits = state.bits
+                if duration_ms is not None:
+                    pressed_at[bit] = _us(timestamp) - int(duration_ms * 1000)
+            states[device_id] = ButtonState(bits, tuple(pressed_at), tuple(double))
+        self._states = states
+
+    def stats(self) -> dict:
+        return {"samples": self.samples, "events": self.events, "devices": len(self._states)}
+
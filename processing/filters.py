@@ -0,0 +1,280 @@
+# filters.py
+
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from utils import config
+
+# Suavização e rejeição de outliers das velocidades antes da análise.
+#
+# Os intervalos entre amostras vêm do relógio do host quando o firmware não
+# manda o seu, e uma amostra com intervalo encurtado pelo jitter (piso de
+# 1 ms) vira um pico de dezenas de milhares de contagens/s. Os filtros aqui
+# recebem, por dispositivo, a velocidade de cada amostra (vx, vy) e o seu
+# intervalo dt, e devolvem as três séries filtradas, alinhadas às amostras:
+#   median:k           mediana das últimas k amostras (velocidade e dt): remove
+#                      picos isolados sem atrasar degraus de mais de k/2 amostras
+#   savgol:w:p         Savitzky–Golay: polinômio de grau p ajustado às últimas w
+#                      amostras, avaliado na mais recente (supõe taxa ~constante)
+#   oneeuro:fc:beta:dc One-Euro: passa-baixa de primeira ordem cujo corte sobe de
+#                      fc Hz com a rapidez da variação (beta); dc é o corte da
+#                      derivada. Tira o tremor parado sem atrasar movimentos rápidos
+#
+# Todos são causais (só usam amostras passadas), então o modo contínuo, com
+# estado por dispositivo (FilterChain), dá o mesmo resultado em qualquer
+# divisão em lotes que as funções de lote aplicadas à série inteira.
+#
+# resample() / Resampler fazem outra coisa: interpolam a posição acumulada
+# numa grade de taxa fixa (pontos múltiplos do período), para consumidores
+# que preferem operações de array simples a intervalos variáveis. Mudam o
+# número de amostras, por isso não entram na cadeia do analisador, que grava
+# uma análise por amostra de mouse_movements.
+
+FILTERS = ("median", "savgol", "oneeuro")
+
+# Cadeia usada pelo analisador e pelo backfill (ANALYSIS_FILTER; vazia: nenhum filtro)
+DEFAULT_CHAIN = config.get("ANALYSIS_FILTER", "")
+
+
+def _trailing(x: np.ndarray, history: np.ndarray | None, k: int) -> np.ndarray:
+    """Janelas das últimas k amostras de cada posição (as primeiras, incompletas, repetem a mais antiga)."""
+    x = np.asarray(x, dtype=np.float64)
+    ext = x if history is None or not len(history) or k <= 1 else np.concatenate([history[-(k - 1):], x])
+    pad = k - 1 - (len(ext) - len(x))
+    if pad > 0:
+        ext = np.concatenate([np.full(pad, ext[0]), ext])
+    return sliding_window_view(ext, k)
+
+
+def median_filter(x, k: int, history=None) -> np.ndarray:
+    """
+    Mediana móvel das últimas k amostras.
+    :param history: amostras anteriores a `x` (as últimas k - 1 bastam)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if k <= 1 or not len(x):
+        return x.copy()
+    offset = 0 if history is None else min(len(history), k - 1)
+    if offset >= k - 1:
+        return np.median(_trailing(x, history, k), axis=1)
+    # Início da série: janelas crescentes, só com o que existe
+    known = np.concatenate([history[-offset:], x]) if offset else x
+    lead = min(k - 1 - offset, len(x))
+    head = [np.median(known[:offset + i + 1]) for i in range(lead)]
+    if lead == len(x):
+        return np.array(head)
+    return np.concatenate([head, np.median(sliding_window_view(known, k), axis=1)])
+
+
+def savgol_coefficients(window: int, order: int) -> np.ndarray:
+    """Pesos de Savitzky–Golay para a última amostra de uma janela de `window` amostras."""
+    if order >= window:
+        raise ValueError(f"Grau {order} precisa ser menor que a janela {window}")
+    s = np.arange(-(window - 1), 1, dtype=np.float64)
+    return np.linalg.pinv(np.vander(s, order + 1, increasing=True))[0]
+
+
+def savgol_filter(x, window: int, order: int, history=None) -> np.ndarray:
+    """
+    Savitzky–Golay causal: cada amostra é o valor na posição mais recente do
+    polinômio de grau `order` ajustado às últimas `window` amostras. No início
+    da série, com menos amostras, a janela é completada com a primeira.
+    :param history: amostras anteriores a `x` (as últimas window - 1 bastam)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if window <= 1 or not len(x):
+        return x.copy()
+    return _trailing(x, history, window) @ savgol_coefficients(window, order)
+
+
+def _alpha(cutoff: float, dt: float) -> float:
+    tau = 1.0 / (2 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+def one_euro(x, dt, min_cutoff: float = 3.0, beta: float = 0.002, d_cutoff: float = 1.0,
+             state: tuple | None = None) -> tuple[np.ndarray, tuple]:
+    """
+    Filtro One-Euro (Casiez et al., 2012). É recursivo, então percorre as
+    amostras uma a uma (O(1) por amostra).
+    :param dt: intervalo (s) de cada amostra
+    :param state: (valor filtrado, derivada filtrada) da amostra anterior
+    :return: (série filtrada, estado após a última amostra)
+    """
+    out = np.empty(len(x))
+    prev, deriv = state if state is not None else (None, 0.0)
+    for i, (value, step) in enumerate(zip(np.asarray(x, dtype=np.float64).tolist(),
+                                          np.asarray(dt, dtype=np.float64).tolist())):
+        if prev is None:
+            prev = value
+        else:
+            a_d = _alpha(d_cutoff, step)
+            deriv += a_d * ((value - prev) / step - deriv)
+            a = _alpha(min_cutoff + beta * abs(deriv), step)
+            prev += a * (value - prev)
+        out[i] = prev
+    return out, (prev, deriv)
+
+
+class MedianFilter:
+    """median:k em modo contínuo: guarda as últimas k - 1 amostras de cada dispositivo."""
+
+    def __init__(self, k: int = 3):
+        self.k = int(k)
+        self._history = {}
+
+    def apply(self, key, vx, vy, dt):
+        history = self._history.get(key, (None, None, None))
+        out = tuple(median_filter(x, self.k, h) for x, h in zip((vx, vy, dt), history))
+        keep = self.k - 1
+        self._history[key] = tuple(
+            (np.concatenate([h, x]) if h is not None else np.array(x, dtype=np.float64))[-keep:]
+            if keep else None
+            for x, h in zip((vx, vy, dt), history))
+        return out
+
+
+class SavitzkyGolay:
+    """savgol:w:p em modo contínuo sobre vx e vy (dt passa intacto)."""
+
+    def __init__(self, window: int = 7, order: int = 2):
+        self.window, self.order = int(window), int(order)
+        savgol_coefficients(self.window, self.order)  # valida os parâmetros
+        self._history = {}
+
+    def apply(self, key, vx, vy, dt):
+        hx, hy = self._history.get(key, (None, None))
+        keep = self.window - 1
+        fx = savgol_filter(vx, self.window, self.order, hx)
+        fy = savgol_filter(vy, self.window, self.order, hy)
+        if keep:
+            self._history[key] = tuple(
+                (np.concatenate([h, x]) if h is not None else np.array(x, dtype=np.float64))[-keep:]
+                for x, h in ((vx, hx), (vy, hy)))
+        return fx, fy, dt
+
+
+class OneEuro:
+    """oneeuro:fc:beta:dc em modo contínuo, um filtro por eixo (dt passa intacto)."""
+
+    def __init__(self, min_cutoff: float = 3.0, beta: float = 0.002, d_cutoff: float = 1.0):
+        self.params = (float(min_cutoff), float(beta), float(d_cutoff))
+        self._state = {}
+
+    def apply(self, key, vx, vy, dt):
+        sx, sy = self._state.get(key, (None, None))
+        fx, sx = one_euro(vx, dt, *self.params, state=sx)
+        fy, sy = one_euro(vy, dt, *self.params, state=sy)
+        self._state[key] = (sx, sy)
+        return fx, fy, dt
+
+
+_STAGES = {"median": MedianFilter, "savgol": SavitzkyGolay, "oneeuro": OneEuro}
+
+
+class FilterChain:
+    """
+    Sequência de filtros com estado por dispositivo. Chamada com lotes de
+    amostras de vários dispositivos; cada trecho contínuo de um mesmo
+    dispositivo passa pelos filtros em ordem, continuando de onde o lote
+    anterior dele parou.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.spec = ",".join(_describe(stage) for stage in self.stages)
+
+    def __call__(self, groups, vx, vy, dt):
+        """
+        :param groups: dispositivo de cada amostra
+        :param vx, vy: velocidades (contagens/s)
+        :param dt: intervalo (s) de cada amostra
+        :return: (vx, vy, dt) filtrados, na ordem de entrada
+        """
+        groups = np.asarray(groups, dtype=object)
+        out = [np.array(a, dtype=np.float64) for a in (vx, vy, dt)]
+        n = len(groups)
+        if not n or not self.stages:
+            return tuple(out)
+        bounds = (np.flatnonzero(groups[1:] != groups[:-1]) + 1).tolist()
+        for lo, hi in zip([0] + bounds, bounds + [n]):
+            parts = tuple(a[lo:hi] for a in out)
+            for stage in self.stages:
+                parts = stage.apply(groups[lo], *parts)
+            for a, part in zip(out, parts):
+                a[lo:hi] = part
+        return tuple(out)
+
+
+def _describe(stage) -> str:
+    if isinstance(stage, MedianFilter):
+        return f"median:{stage.k}"
+    if isinstance(stage, SavitzkyGolay):
+        return f"savgol:{stage.window}:{stage.order}"
+    return "oneeuro:" + ":".join(f"{p:g}" for p in stage.params)
+
+
+def parse_chain(spec: str | None) -> FilterChain | None:
+    """
+    Cadeia a partir de uma especificação como "median:3,oneeuro:3:0.002"
+    (ver o cabeçalho do módulo; parâmetros omitidos usam o padrão).
+    Vazia ou "none": sem filtros (None).
+    """
+    if not spec or spec.strip().lower() in ("none", "off"):
+        return None
+    stages = []
+    for item in spec.split(","):
+        name, *params = item.strip().split(":")
+        if name not in _STAGES:
+            raise ValueError(f"Filtro desconhecido: {name!r} (opções: {', '.join(FILTERS)})")
+        stages.append(_STAGES[name](*(float(p) for p in params if p)))
+    return FilterChain(stages)
+
+
+def resample(t, dx, dy, rate: float, state: tuple | None = None) -> tuple:
+    """
+    Reamostra deslocamentos numa grade de `rate` Hz (pontos em múltiplos do
+    período desde a epoch), interpolando linearmente a posição acumulada.
+    O deslocamento da primeira amostra de uma série (sem estado) não tem
+    intervalo conhecido e fica fora.
+    :param t: instantes (µs, inteiros crescentes)
+    :param state: estado devolvido pela chamada anterior da mesma série
+    :return: (instantes da grade em µs, dx, dy em contagens fracionárias, estado)
+    """
+    t = np.asarray(t, dtype=np.int64)
+    dx = np.asarray(dx, dtype=np.float64)
+    dy = np.asarray(dy, dtype=np.float64)
+    empty = np.empty(0)
+    if not len(t):
+        return np.empty(0, dtype=np.int64), empty, empty, state
+    if state is None:
+        t0, gx, gy = int(t[0]), 0.0, 0.0
+        times, px, py = t, np.cumsum(dx) - dx[0], np.cumsum(dy) - dy[0]
+    else:
+        t0, x0, y0, gx, gy = state
+        times = np.concatenate([[t0], t])
+        px = np.concatenate([[x0], x0 + np.cumsum(dx)])
+        py = np.concatenate([[y0], y0 + np.cumsum(dy)])
+    period = 1e6 / rate
+    first, last = math.floor(t0 / period) + 1, math.floor(int(t[-1]) / period)
+    grid = np.round(np.arange(first, last + 1) * period).astype(np.int64)
+    gpx, gpy = np.interp(grid, times, px), np.interp(grid, times, py)
+    out_x = np.diff(gpx, prepend=gx)
+    out_y = np.diff(gpy, prepend=gy)
+    if len(grid):
+        gx, gy = float(gpx[-1]), float(gpy[-1])
+    return grid, out_x, out_y, (int(t[-1]), float(px[-1]), float(py[-1]), gx, gy)
+
+
+class Resampler:
+    """resample() em modo contínuo, com estado por dispositivo."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._state = {}
+
+    def process(self, key, t, dx, dy) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Amostras novas de `key` -> (instantes da grade em µs, dx, dy)."""
+        grid, rx, ry, self._state[key] = resample(t, dx, dy, self.rate, self._state.get(key))
+        return grid, rx, ry
+
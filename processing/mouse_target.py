@@ -1,73 +1,51 @@
-import psycopg2
+from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
-import numpy as np
+from database import connection
+from rollups import fetch_rollups, summarize
+from utils.logger import get_logger
 
-# 🔹 Configuração do Banco de Dados PostgreSQL
-DB_NAME = "postgres"
-DB_USER = "postgres"
-DB_PASSWORD = "1234"
-DB_HOST = "localhost"
-DB_PORT = "5432"
+# 🔹 Janela analisada (rollups por minuto)
+JANELA = timedelta(minutes=10)
 
+DIRECOES = ("vel_direita", "vel_esquerda", "vel_cima", "vel_baixo")
 
-# 🔹 Conectar ao banco e buscar dados de velocidade
-def get_speed_data():
-    try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT
-        )
-        cursor = conn.cursor()
+log = get_logger("mouse_target")
 
-        # 🔹 Buscar os últimos 100 registros para análise
-        cursor.execute("""
-            SELECT avg_speed, x_position, y_position 
-            FROM mouse_speed 
-            JOIN mouse_events ON mouse_speed.timestamp = mouse_events.timestamp
-            ORDER BY mouse_speed.timestamp DESC 
-            LIMIT 100;
-        """)
-        rows = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        return rows
-    except Exception as e:
-        print(f"❌ Erro ao conectar ao banco: {e}")
-        return []
 
-# 🔹 Processar os dados e calcular a força de cada direção
-def process_data(rows):
-    direita, esquerda, cima, baixo = 0, 0, 0, 0
-
-    for avg_speed, x, y in rows:
-        if x > 0:   # Movimento para a direita
-            direita += avg_speed
-        elif x < 0:  # Movimento para a esquerda
-            esquerda += avg_speed
-        if y > 0:   # Movimento para cima
-            cima += avg_speed
-        elif y < 0:  # Movimento para baixo
-            baixo += avg_speed
+# 🔹 Conectar ao banco e buscar os rollups de velocidade por direção
+def get_speed_data(janela: timedelta = JANELA) -> dict:
+    with connection() as conn:
+        if conn is None:
+            return {}
+        try:
+            with conn.cursor() as cur:
+                series = fetch_rollups(cur, DIRECOES, datetime.now() - janela, resolution="1m")
+            conn.commit()
+            return {metric: summarize(s) for metric, s in series.items()}
+        except Exception as e:
+            log.error("❌ Erro ao ler os rollups: %s", e, every=60.0)
+            return {}
 
+# 🔹 Força de cada direção: velocidade média na janela
+def process_data(totals):
+    direita, esquerda, cima, baixo = (
+        totals[metric]["mean"] if totals[metric]["count"] else 0.0 for metric in DIRECOES
+    )
     return direita, esquerda, cima, baixo
 
 # 🔹 Criar o gráfico do alvo
 def plot_target(direita, esquerda, cima, baixo):
-    angles = ["Direita", "Esquerda", "Cima", "Baixo"]
     values = [direita, esquerda, cima, baixo]
+    limit = max(values)
 
     # 🔹 Criar gráfico de radar (alvo)
     fig, ax = plt.subplots(figsize=(6, 6))
-    ax.set_xlim(-max(values)-10, max(values)+10)
-    ax.set_ylim(-max(values)-10, max(values)+10)
+    ax.set_xlim(-limit * 1.1, limit * 1.1)
+    ax.set_ylim(-limit * 1.1, limit * 1.1)
 
     # 🔹 Desenhar os círculos do alvo
-    for i in range(10, max(values)+10, 10):
-        circle = plt.Circle((0, 0), i, color="gray", fill=False, linestyle="dotted")
+    for i in range(1, 11):
+        circle = plt.Circle((0, 0), limit * i / 10, color="gray", fill=False, linestyle="dotted")
         ax.add_patch(circle)
 
     # 🔹 Plotar direções
@@ -81,14 +59,14 @@ def plot_target(direita, esquerda, cima, baixo):
     ax.set_yticks([])
     ax.set_title("🔥 Alvo de Movimento do Mouse 🔥")
     ax.legend()
-    
+
     # 🔹 Mostrar gráfico
     plt.show()
 
 # 🔹 Rodar o programa
-data = get_speed_data()
-if data:
-    direita, esquerda, cima, baixo = process_data(data)
-    plot_target(direita, esquerda, cima, baixo)
-else:
-    print("⚠️ Nenhum dado encontrado!")
+if __name__ == "__main__":
+    totals = get_speed_data()
+    if totals and any(t["count"] for t in totals.values()):
+        plot_target(*process_data(totals))
+    else:
+        print("⚠️ Nenhum dado encontrado!")
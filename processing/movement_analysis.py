@@ -0,0 +1,271 @@
+# movement_analysis.py
+
+import math
+from datetime import datetime
+from typing import NamedTuple
+import numpy as np
+from analysis_kernels import MIN_DELTA
+
+# Características de trajetória por movimento, calculadas em fluxo.
+#
+# Cada dispositivo tem uma trilha; update() recebe uma amostra (instante em
+# µs, dx, dy) e atualiza só acumuladores, em O(1) e memória constante, então
+# o motor roda junto com a ingestão ou com o analisador sem reler a tabela.
+# Um movimento começa na primeira amostra com deslocamento e termina quando
+# o ponteiro fica TEMPO_INATIVIDADE segundos sem se mover (o mesmo critério
+# da captura do mouse do sistema); amostras zeradas no meio dele contam como
+# velocidade nula.
+#
+# Derivadas por diferenças finitas em grade não uniforme: a velocidade é o
+# deslocamento de uma janela dividido pela sua duração e vale no ponto médio
+# dela; a aceleração é a diferença de duas velocidades pela distância entre
+# seus pontos médios, e o jerk a diferença de duas acelerações. Contagens
+# inteiras a centenas de Hz tornam essas diferenças puro ruído de
+# quantização, então cada janela soma as amostras de pelo menos `window`
+# segundos (20 ms: bem acima da banda do movimento humano, ~10 Hz).
+#
+# Por movimento: duração, comprimento do caminho x deslocamento (retidão),
+# direção, velocidade média e de pico, tempo até o pico, aceleração de pico,
+# jerk RMS e normalizado (suavidade, adimensional), curvatura média (giro da
+# direção por contagem percorrida) e submovimentos (picos de velocidade),
+# que com fitts_throughput() dão as métricas no estilo de Fitts.
+
+# Tempo parado (s) que encerra um movimento
+TEMPO_INATIVIDADE = 1.0
+
+WINDOW = 0.02             # duração (s) mínima de cada medida de velocidade
+MAX_INTERVAL = 0.05       # intervalo (s) máximo atribuído à primeira amostra de um movimento
+SUBMOVEMENT_DROP = 0.3    # queda relativa da velocidade que separa dois picos
+SUBMOVEMENT_FLOOR = 0.1   # picos abaixo desta fração do pico do movimento são ignorados
+
+
+class MovementFeatures(NamedTuple):
+    """Características de um movimento, na ordem de FEATURE_COLUMNS."""
+    device_id: str | None
+    start_ts: datetime
+    end_ts: datetime
+    samples: int
+    duration: float            # s, do início do primeiro deslocamento à última amostra com movimento
+    path_length: float         # contagens percorridas
+    displacement: float        # distância em linha reta entre início e fim
+    straightness: float        # displacement / path_length (1 = reta)
+    direction: float           # graus, 0 = direita, 90 = cima
+    mean_speed: float          # contagens/s
+    peak_speed: float
+    time_to_peak: float        # s
+    peak_accel: float          # contagens/s²
+    jerk_rms: float            # contagens/s³
+    normalized_jerk: float     # sqrt(½ ∫j² dt · T⁵ / L²)
+    curvature: float           # rad por contagem
+    submovements: int
+    reason: str                # "idle" | "stop"
+
+FEATURE_COLUMNS = MovementFeatures._fields
+
+
+def fitts_throughput(features: MovementFeatures, width: float) -> float:
+    """
+    Vazão de Fitts (bits/s) de um movimento até um alvo de largura `width`
+    (mesma unidade das contagens): log2(D / W + 1) / duração.
+    """
+    if features.duration <= 0 or width <= 0:
+        return 0.0
+    return math.log2(features.displacement / width + 1) / features.duration
+
+
+class _Track:
+    """Estado de um dispositivo: última amostra, derivadas e o movimento ativo."""
+    __slots__ = (
+        "last_t", "active", "start", "end", "samples", "moving_samples",
+        "wx", "wy", "w0", "ux", "uy", "vm", "ax", "ay", "am", "has_a",
+        "path", "sx", "sy", "turning", "peak", "peak_t", "peak_accel", "jerk_sq",
+        "rising", "local_max", "local_min", "peaks",
+    )
+
+    def __init__(self):
+        self.last_t = None
+        self.active = False
+
+    def begin(self, start: int):
+        self.active = True
+        self.start = self.end = start
+        self.samples = self.moving_samples = 0
+        self.wx = self.wy = 0     # contagens da janela em aberto
+        self.w0 = start           # início (µs) da janela
+        self.ux = self.uy = 0.0
+        self.vm = start          # instante (µs) da velocidade atual
+        self.ax = self.ay = 0.0
+        self.am = start          # instante (µs) da aceleração atual
+        self.has_a = False       # parte do repouso: velocidade nula
+        self.path = self.sx = self.sy = self.turning = 0.0
+        self.peak = self.peak_t = self.peak_accel = self.jerk_sq = 0.0
+        self.rising, self.local_max, self.local_min, self.peaks = True, 0.0, 0.0, 0
+
+
+class MovementFeatureEngine:
+    """
+    Motor de características por dispositivo. Cada movimento encerrado vai
+    para `sink` como MovementFeatures. Não usa threads: movimentos são
+    encerrados na amostra seguinte ao prazo de inatividade, em flush() (para
+    dispositivos que pararam de enviar) ou em close().
+    """
+
+    def __init__(self, sink, idle_gap: float = TEMPO_INATIVIDADE, window: float = WINDOW,
+                 max_interval: float = MAX_INTERVAL):
+        """
+        :param sink: função chamada com cada MovementFeatures
+        :param idle_gap: tempo parado (s) que encerra o movimento
+        :param window: duração (s) mínima de cada medida de velocidade (0: uma por amostra)
+        :param max_interval: intervalo (s) máximo da primeira amostra de um
+            movimento; após um repouso sem amostras, o tempo desde a última
+            não é o tempo do deslocamento
+        """
+        self._sink = sink
+        self._gap_us = int(idle_gap * 1e6)
+        self._window_us = int(window * 1e6)
+        self._max_interval = max_interval
+        self._tracks: dict[str | None, _Track] = {}
+
+        # Contadores
+        self.samples = 0
+        self.movements = 0
+
+    def update(self, device_id: str | None, t: int, dx: int, dy: int):
+        """
+        Registra uma amostra.
+        :param t: instante da amostra (µs, horário local), crescente por dispositivo
+        :param dx, dy: deslocamento desde a amostra anterior (positivo = direita/baixo)
+        """
+        track = self._tracks.get(device_id)
+        if track is None:
+            track = self._tracks[device_id] = _Track()
+        self.samples += 1
+        last, track.last_t = track.last_t, t
+        if track.active and t - track.end > self._gap_us:
+            self._close(device_id, track, "idle")
+        if not dx and not dy and not track.active:
+            return
+        if not track.active:
+            if last is None or t <= last:
+                dt = MIN_DELTA
+            else:
+                dt = min(max((t - last) / 1e6, MIN_DELTA), self._max_interval)
+            track.begin(t - int(dt * 1e6))
+
+        track.samples += 1
+        if dx or dy:
+            track.path += math.hypot(dx, dy)
+            track.sx += dx
+            track.sy += dy
+            track.wx += dx
+            track.wy += dy
+            track.end = t
+            track.moving_samples = track.samples
+        if t - track.w0 >= self._window_us:
+            self._step(track, t)
+
+    def _step(self, track: _Track, t: int):
+        """Fecha a janela em aberto (até t): velocidade, aceleração e jerk."""
+        dt = max((t - track.w0) / 1e6, MIN_DELTA)
+        ux, uy = track.wx / dt, track.wy / dt
+        vm = (t + track.w0) / 2
+        track.wx = track.wy = 0
+        track.w0 = t
+        span = max((vm - track.vm) / 1e6, MIN_DELTA)
+        ax, ay = (ux - track.ux) / span, (uy - track.uy) / span
+        am = (vm + track.vm) / 2
+        if track.has_a:
+            a_span = max((am - track.am) / 1e6, MIN_DELTA)
+            jx, jy = (ax - track.ax) / a_span, (ay - track.ay) / a_span
+            track.jerk_sq += (jx * jx + jy * jy) * a_span
+
+        # Giro da direção entre velocidades consecutivas
+        cross = track.ux * uy - track.uy * ux
+        dot = track.ux * ux + track.uy * uy
+        if cross or dot > 0:
+            track.turning += abs(math.atan2(cross, dot))
+
+        speed = math.hypot(ux, uy)
+        accel = math.hypot(ax, ay)
+        if accel > track.peak_accel:
+            track.peak_accel = accel
+        if speed > track.peak:
+            track.peak, track.peak_t = speed, vm
+
+        # Submovimentos: picos de velocidade separados por uma queda relativa
+        if track.rising:
+            if speed > track.local_max:
+                track.local_max = speed
+            elif speed < track.local_max * (1 - SUBMOVEMENT_DROP):
+                if track.local_max >= track.peak * SUBMOVEMENT_FLOOR:
+                    track.peaks += 1
+                track.rising, track.local_min = False, speed
+        elif speed < track.local_min:
+            track.local_min = speed
+        elif speed * (1 - SUBMOVEMENT_DROP) > track.local_min:
+            track.rising, track.local_max = True, speed
+
+        track.ux, track.uy, track.vm = ux, uy, vm
+        track.ax, track.ay, track.am, track.has_a = ax, ay, am, True
+
+    def _close(self, device_id, track: _Track, reason: str):
+        if track.wx or track.wy:
+            self._step(track, track.end)
+        track.active = False
+        if track.rising and track.local_max >= track.peak * SUBMOVEMENT_FLOOR and track.local_max > 0:
+            track.peaks += 1
+        duration = (track.end - track.start) / 1e6
+        displacement = math.hypot(track.sx, track.sy)
+        path = track.path
+        jerk_rms = math.sqrt(track.jerk_sq / duration) if duration > 0 else 0.0
+        normalized = math.sqrt(0.5 * track.jerk_sq * duration ** 5 / path ** 2) if path else 0.0
+        self.movements += 1
+        self._sink(MovementFeatures(
+            device_id,
+            np.datetime64(track.start, "us").item(), np.datetime64(track.end, "us").item(),
+            track.moving_samples, duration, path, displacement,
+            displacement / path if path else 0.0,
+            math.degrees(math.atan2(-track.sy, track.sx)),
+            path / duration if duration > 0 else 0.0,
+            track.peak, max((track.peak_t - track.start) / 1e6, 0.0), track.peak_accel,
+            jerk_rms, normalized, track.turning / path if path else 0.0,
+            track.peaks, reason,
+        ))
+
+    def process(self, device_ids, timestamps, dx, dy):
+        """
+        Registra um lote de amostras (em ordem de chegada; dispositivos
+        intercalados são separados pelas trilhas).
+        :param timestamps: instantes (datetime64, horário local)
+        """
+        ts = np.asarray(timestamps, dtype="M8[us]").astype(np.int64)
+        devices = device_ids.tolist() if isinstance(device_ids, np.ndarray) else list(device_ids)
+        update = self.update
+        for device_id, t, x, y in zip(devices, ts.tolist(), np.asarray(dx).tolist(),
+                                      np.asarray(dy).tolist()):
+            update(device_id, t, x, y)
+
+    def flush(self, now: datetime | None = None) -> int:
+        """Encerra os movimentos parados há mais de idle_gap em `now` (horário local)."""
+        t = int(np.datetime64(now or datetime.now(), "us").astype(np.int64))
+        closed = 0
+        for device_id, track in self._tracks.items():
+            if track.active and t - track.end > self._gap_us:
+                self._close(device_id, track, "idle")
+                closed += 1
+        return closed
+
+    def close(self):
+        """Encerra os movimentos em andamento ("stop")."""
+        for device_id, track in self._tracks.items():
+            if track.active:
+                self._close(device_id, track, "stop")
+
+    def stats(self) -> dict:
+        return {
+            "samples": self.samples,
+            "movements": self.movements,
+            "devices": len(self._tracks),
+            "active": sum(track.active for track in self._tracks.values()),
+        }
+
@@ -0,0 +1,342 @@
+# parallel_analysis.py
+
+import argparse
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from tqdm import tqdm
+from database import connection
+from analysis_kernels import ANALYSIS_COLUMNS, analyze_grouped
+from checkpoint import ensure_checkpoint_table, load_checkpoint, save_checkpoint
+from schema import ensure_partitions, ensure_schema
+from rollups import RESOLUTIONS, update_rollups_from_batch
+from processing.filters import DEFAULT_CHAIN, parse_chain
+
+# Reanálise histórica (backfill) de mouse_movements em paralelo.
+#
+# A tabela é dividida em faixas de id; cada faixa é analisada num processo
+# do pool com os kernels vetorizados e gravada com um único COPY. O
+# intervalo de uma amostra depende da próxima amostra do mesmo
+# dispositivo, então cada faixa lê também, por dispositivo, a primeira
+# amostra depois dela (sobreposição de uma linha).
+#
+# O backfill cobre os ids até o checkpoint do analisador ao vivo (ou até
+# MAX(id), se ele nunca rodou) e, como ele, não grava a última amostra de
+# cada dispositivo: ela continua pendente para o serviço ao vivo.
+# Cada faixa grava as análises e marca sua conclusão na mesma transação;
+# rodar de novo com o mesmo --name retoma só as faixas que faltam.
+# Com filtros (--filtro), cada faixa começa uma cadeia nova: as primeiras
+# amostras de cada dispositivo na faixa são filtradas sem histórico.
+
+ANALYZER_CHECKPOINT = "analyzer"
+
+BACKFILL_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS analysis_backfill_runs (
+        name        TEXT      PRIMARY KEY,
+        lo          BIGINT    NOT NULL,
+        hi          BIGINT    NOT NULL,
+        chunk_rows  INTEGER   NOT NULL,
+        pending_ids BIGINT[]  NOT NULL DEFAULT '{}',
+        created_at  TIMESTAMP NOT NULL DEFAULT now(),
+        finished_at TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analysis_backfill_ranges (
+        name    TEXT      NOT NULL REFERENCES analysis_backfill_runs (name) ON DELETE CASCADE,
+        lo      BIGINT    NOT NULL,
+        hi      BIGINT    NOT NULL,
+        rows    INTEGER   NOT NULL,
+        written INTEGER   NOT NULL,
+        done_at TIMESTAMP NOT NULL DEFAULT now(),
+        PRIMARY KEY (name, lo)
+    );
+    """,
+]
+
+_SELECT = ("SELECT id, COALESCE(device_id, ''), timestamp, dx, dy, device_ts "
+           "FROM mouse_movements")
+
+# Próxima amostra (menor id > %(end)s) de cada dispositivo que não apareceu
+# na sobreposição, numa única consulta por faixa. A ordem é a dos ids, a
+# mesma do analisador ao vivo (AnalyzerState): com pacotes fora de ordem, o
+# backfill forma os mesmos pares que ele. Cada busca desce o índice
+# (device_id, id) em vez de percorrer os ids do resto da tabela: um
+# dispositivo que parou de enviar custa uma descida de índice vazia por
+# partição, não uma varredura. Amostras sem dispositivo (NULL) têm um ramo
+# próprio com IS NULL, que o mesmo índice atende.
+_SUCCESSORS = """
+    SELECT m.* FROM unnest(%(devices)s::text[]) AS d (device_id)
+    CROSS JOIN LATERAL (
+        SELECT id, device_id, timestamp, dx, dy, device_ts FROM mouse_movements
+        WHERE device_id = d.device_id AND id > %(end)s AND id <= %(limit)s
+        ORDER BY id LIMIT 1
+    ) AS m
+    UNION ALL
+    (SELECT id, '', timestamp, dx, dy, device_ts FROM mouse_movements
+     WHERE %(no_device)s AND device_id IS NULL AND id > %(end)s AND id <= %(limit)s
+     ORDER BY id LIMIT 1);
+"""
+
+
+def plan_run(cur, name: str, chunk_rows: int, replace: bool = False) -> tuple:
+    """
+    Cria (ou retoma) o backfill `name` e retorna (lo, hi, chunk_rows, pending_ids, faixas).
+    As faixas já concluídas não entram na lista.
+    """
+    ensure_schema(cur)
+    for stmt in BACKFILL_DDL:
+        cur.execute(stmt)
+    ensure_checkpoint_table(cur)
+    cur.execute("SELECT lo, hi, chunk_rows, pending_ids FROM analysis_backfill_runs WHERE name = %s;",
+                (name,))
+    row = cur.fetchone()
+    if row:
+        lo, hi, chunk_rows, pending_ids = row
+        print(f"📌 Retomando backfill '{name}' (ids {lo}..{hi}, faixas de {chunk_rows})")
+    else:
+        cur.execute("SELECT MIN(id), MAX(id) FROM mouse_movements;")
+        lo, max_id = cur.fetchone()
+        if lo is None:
+            return None
+        hi, pending_ids = load_checkpoint(cur, ANALYZER_CHECKPOINT)
+        if not hi:
+            # Analisador ao vivo nunca rodou: a última amostra de cada
+            # dispositivo fica pendente para ele
+            hi = max_id
+            cur.execute("SELECT MAX(id) FROM mouse_movements WHERE id <= %s "
+                        "GROUP BY COALESCE(device_id, '');", (hi,))
+            pending_ids = [r[0] for r in cur.fetchall()]
+
+        if replace:
+            print("🧹 Limpando mouse_analyse e rollups (o analisador ao vivo deve estar parado)")
+            cur.execute("TRUNCATE mouse_analyse, " + ", ".join(RESOLUTIONS) + ";")
+        else:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM mouse_analyse);")
+            if cur.fetchone()[0]:
+                raise RuntimeError("mouse_analyse já tem análises; use --replace para refazê-las")
+
+        cur.execute("""
+            INSERT INTO analysis_backfill_runs (name, lo, hi, chunk_rows, pending_ids)
+            VALUES (%s, %s, %s, %s, %s);
+        """, (name, lo, hi, chunk_rows, pending_ids))
+        print(f"🆕 Backfill '{name}': ids {lo}..{hi}, faixas de {chunk_rows}")
+
+    # Partições diárias para todo o período reanalisado: sem elas, meses de
+    # análises e rollups cairiam nas DEFAULT, fora da poda por partição e da
+    # retenção por DROP
+    cur.execute("SELECT MIN(timestamp)::date, MAX(timestamp)::date FROM mouse_movements "
+                "WHERE id BETWEEN %s AND %s;", (lo, hi))
+    first, last = cur.fetchone()
+    if first is not None:
+        ensure_partitions(cur, first, last, tables=("mouse_analyse", *RESOLUTIONS))
+
+    cur.execute("SELECT lo FROM analysis_backfill_ranges WHERE name = %s;", (name,))
+    done = {r[0] for r in cur.fetchall()}
+    ranges = [(start, min(start + chunk_rows - 1, hi))
+              for start in range(lo, hi + 1, chunk_rows) if start not in done]
+    return lo, hi, chunk_rows, list(pending_ids), ranges
+
+
+def _fetch_range(cur, lo: int, hi: int, limit: int, lookahead: int) -> tuple[list, int]:
+    """
+    Lê a faixa [lo, hi] mais a primeira amostra seguinte (até `limit`) de
+    cada dispositivo presente nela. Retorna (linhas, quantas são da faixa).
+    """
+    end = min(hi + lookahead, limit)
+    cur.execute(_SELECT + " WHERE id BETWEEN %s AND %s ORDER BY id;", (lo, end))
+    rows = cur.fetchall()
+    n = next((i for i, r in enumerate(rows) if r[0] > hi), len(rows))
+
+    # Sobreposição de uma linha: o próximo de cada dispositivo, se ainda não veio junto
+    following = {}
+    for row in rows[n:]:
+        following.setdefault(row[1], row)
+    # Dispositivos da faixa que ficaram sem o próximo
+    missing = {r[1] for r in rows[:n] if r[1] not in following}
+    if end < limit and missing:
+        no_device = "" in missing
+        missing.discard("")
+        cur.execute(_SUCCESSORS, {"devices": sorted(missing), "no_device": no_device,
+                                  "end": end, "limit": limit})
+        for row in cur.fetchall():
+            following[row[1]] = row
+    return rows[:n] + list(following.values()), n
+
+
+# COPY binário: cabeçalho fixo, tuplas big-endian e -1 (int16) no fim
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + b"\x00" * 8
+_COPY_TRAILER = b"\xff\xff"
+_PG_EPOCH = np.datetime64("2000-01-01T00:00:00", "us")
+
+
+def _copy_binary(batch) -> io.BytesIO:
+    """
+    Serializa o lote no formato binário do COPY sem laço por linha: as
+    linhas de um mesmo dispositivo têm todas o mesmo layout, então cada
+    dispositivo vira um único array estruturado (converter 10 floats por
+    linha para texto custa mais que a análise inteira).
+    """
+    buf = io.BytesIO()
+    buf.write(_COPY_HEADER)
+    for device in np.unique(batch.device_id):
+        idx = np.flatnonzero(batch.device_id == device)
+        raw = device.encode()
+        fields = [("n", ">i2"), ("ts_len", ">i4"), ("ts", ">i8"), ("dev_len", ">i4")]
+        if raw:
+            fields.append(("dev", f"S{len(raw)}"))
+        fields += [("id_len", ">i4"), ("id", ">i8")]
+        for name in ANALYSIS_COLUMNS:
+            fields += [(name + "_len", ">i4"), (name, ">f8")]
+
+        records = np.empty(len(idx), dtype=fields)
+        records["n"] = 3 + len(ANALYSIS_COLUMNS)
+        records["ts_len"] = 8
+        # timestamp: µs desde 2000-01-01
+        records["ts"] = (batch.movement_ts[idx] - _PG_EPOCH).astype(np.int64)
+        # device_id '' (sem dispositivo) é gravado como NULL (tamanho -1)
+        records["dev_len"] = len(raw) if raw else -1
+        if raw:
+            records["dev"] = raw
+        records["id_len"] = 8
+        records["id"] = batch.movement_id[idx]
+        for name in ANALYSIS_COLUMNS:
+            records[name + "_len"] = 8
+            records[name] = batch[name][idx]
+        buf.write(records.tobytes())
+    buf.write(_COPY_TRAILER)
+    buf.seek(0)
+    return buf
+
+
+def analyze_range(name: str, lo: int, hi: int, limit: int, pending_ids: list[int],
+                  lookahead: int = 1000, filters: str = "") -> tuple[int, int, int]:
+    """
+    Analisa e grava a faixa de ids [lo, hi] numa única transação (roda num
+    processo do pool, com uma conexão do pool daquele processo). `limit` é o maior id coberto
+    pelo backfill; `filters`, a cadeia de filtros das velocidades.
+    Retorna (lo, linhas lidas, análises gravadas).
+    """
+    # Pool do processo de trabalho: uma conexão reaproveitada por todas as faixas dele
+    with connection() as conn:
+        if conn is None:
+            raise RuntimeError("sem conexão com o banco")
+        return _analyze_range(conn, name, lo, hi, limit, pending_ids, lookahead, filters)
+
+
+def _range_batch(cur, lo, hi, limit, pending_ids, lookahead, filters=""):
+    """
+    Análises da faixa [lo, hi] a gravar (AnalysisBatch, ou None se a faixa
+    estiver vazia) e quantas linhas da faixa foram lidas.
+    """
+    rows, n = _fetch_range(cur, lo, hi, limit, lookahead)
+    if not n:
+        return None, 0
+    ids, devices, ts_col, dx_col, dy_col, dev_ts_col = zip(*rows)
+    batch, perm, last = analyze_grouped(
+        devices, ids, ts_col, dx_col, dy_col,
+        device_ts=np.array(dev_ts_col, dtype=np.float64),
+        smooth=parse_chain(filters))
+    batch.movement_id = np.asarray(ids)[perm]
+    # Só linhas da faixa, com a próxima amostra conhecida e fora das pendentes
+    keep = (perm < n) & ~last & ~np.isin(np.asarray(ids)[perm], pending_ids)
+    batch = batch.select(keep)
+    return batch.select(batch.nonzero_mask()), n
+
+
+def _analyze_range(conn, name, lo, hi, limit, pending_ids, lookahead, filters=""):
+    try:
+        with conn.cursor() as cur:
+            batch, n = _range_batch(cur, lo, hi, limit, pending_ids, lookahead, filters)
+            written = len(batch) if batch is not None else 0
+            if written:
+                cur.copy_expert(
+                    "COPY mouse_analyse (movement_ts, device_id, movement_id, "
+                    + ", ".join(ANALYSIS_COLUMNS)
+                    + ") FROM STDIN WITH (FORMAT binary)",
+                    _copy_binary(batch),
+                )
+                update_rollups_from_batch(cur, batch)
+            cur.execute("""
+                INSERT INTO analysis_backfill_ranges (name, lo, hi, rows, written)
+                VALUES (%s, %s, %s, %s, %s);
+            """, (name, lo, hi, n, written))
+        conn.commit()
+        return lo, n, written
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def backfill(name: str = "backfill", chunk_rows: int = 50_000, workers: int | None = None,
+             replace: bool = False, filters: str = DEFAULT_CHAIN):
+    """
+    Reanalisa mouse_movements em paralelo, com progresso e retomada.
+    :param name: identificador do backfill (reusar o nome retoma de onde parou)
+    :param chunk_rows: ids por faixa
+    :param workers: processos do pool (padrão: número de CPUs)
+    :param replace: apaga mouse_analyse (e os rollups) antes de começar um backfill novo
+    :param filters: cadeia de filtros das velocidades (processing/filters.py)
+    """
+    with connection() as conn:
+        if conn is None:
+            return
+        with conn.cursor() as cur:
+            plan = plan_run(cur, name, chunk_rows, replace)
+        conn.commit()
+    if plan is None:
+        print("⚠ mouse_movements está vazia.")
+        return
+    lo, hi, chunk_rows, pending_ids, ranges = plan
+
+    workers = workers or os.cpu_count()
+    failed = 0
+    # spawn: os processos não herdam as conexões do pool deste processo
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn")) as pool, \
+            tqdm(total=len(ranges), unit="faixa", desc=f"backfill {name}") as progress:
+        futures = {pool.submit(analyze_range, name, a, b, hi, pending_ids, filters=filters): (a, b)
+                   for a, b in ranges}
+        rows = written = 0
+        for future in as_completed(futures):
+            try:
+                _, n, w = future.result()
+                rows += n
+                written += w
+                progress.set_postfix(linhas=rows, gravadas=written)
+            except Exception as e:
+                failed += 1
+                a, b = futures[future]
+                tqdm.write(f"❌ Faixa {a}..{b}: {e}")
+            progress.update()
+
+    if failed:
+        print(f"⚠ {failed} faixas falharam; rode de novo com --name {name} para retomar.")
+        return
+    with connection() as conn:
+        if conn is None:
+            return
+        with conn.cursor() as cur:
+            cur.execute("UPDATE analysis_backfill_runs SET finished_at = now() WHERE name = %s;", (name,))
+            # Prepara o analisador ao vivo para continuar de onde o backfill parou
+            # (não retrocede um checkpoint mais adiantado)
+            save_checkpoint(cur, ANALYZER_CHECKPOINT, hi, pending_ids)
+        conn.commit()
+    print(f"✅ Backfill '{name}' concluído.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reanálise paralela de mouse_movements")
+    parser.add_argument("--name", default="backfill", help="identificador (reusar para retomar)")
+    parser.add_argument("--chunk", type=int, default=50_000, help="ids por faixa")
+    parser.add_argument("--workers", type=int, default=None, help="processos (padrão: CPUs)")
+    parser.add_argument("--replace", action="store_true",
+                        help="apaga mouse_analyse antes de começar (pare o analisador ao vivo)")
+    parser.add_argument("--filtro", default=DEFAULT_CHAIN,
+                        help='filtros das velocidades, ex.: "median:3" (padrão: ANALYSIS_FILTER)')
+    args = parser.parse_args()
+    parse_chain(args.filtro)  # valida antes de abrir o pool
+    backfill(args.name, args.chunk, args.workers, args.replace, args.filtro)
@@ -0,0 +1,203 @@
+# analysis_kernels.py
+
+import math
+import numpy as np
+
+# Piso (s) para o intervalo entre amostras: evita divisão por zero e
+# reproduz o comportamento histórico do analisador.
+MIN_DELTA = 0.001
+
+# Colunas de mouse_analyse, na ordem usada por insert_analysis()
+ANALYSIS_COLUMNS = (
+    "vel_direita", "vel_esquerda", "vel_cima", "vel_baixo", "vel_euclidiana",
+    "acel_direita", "acel_esquerda", "acel_cima", "acel_baixo", "acel_euclidiana",
+)
+VELOCITY_COLUMNS = ANALYSIS_COLUMNS[:5]
+
+
+class AnalysisBatch:
+    """
+    Resultado colunar da análise de uma janela de mouse_movements.
+    Cada coluna de ANALYSIS_COLUMNS é um np.ndarray float64 alinhado
+    com movement_ts (datetime64[us]) e, se houver, com device_id e
+    movement_id (id em mouse_movements).
+    """
+    __slots__ = ("movement_ts", "columns", "device_id", "movement_id")
+
+    def __init__(self, movement_ts: np.ndarray, columns: dict, device_id: np.ndarray | None = None,
+                 movement_id: np.ndarray | None = None):
+        self.movement_ts = movement_ts
+        self.columns = columns
+        self.device_id = device_id
+        self.movement_id = movement_id
+
+    def __len__(self) -> int:
+        return len(self.movement_ts)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def nonzero_mask(self) -> np.ndarray:
+        """Máscara das linhas com algum deslocamento (alguma velocidade != 0)."""
+        mask = np.zeros(len(self), dtype=bool)
+        for name in VELOCITY_COLUMNS:
+            mask |= self.columns[name] != 0
+        return mask
+
+    def select(self, mask) -> "AnalysisBatch":
+        """Retorna um novo lote só com as linhas selecionadas por `mask`."""
+        return AnalysisBatch(
+            self.movement_ts[mask],
+            {name: col[mask] for name, col in self.columns.items()},
+            self.device_id[mask] if self.device_id is not None else None,
+            self.movement_id[mask] if self.movement_id is not None else None,
+        )
+
+    def rows(self):
+        """
+        Itera tuplas (movement_ts, device_id, movement_id, vel_direita, ...,
+        acel_euclidiana) com tipos nativos do Python, prontas para o driver do banco.
+        """
+        cols = [self.columns[name].tolist() for name in ANALYSIS_COLUMNS]
+        devices = self.device_id.tolist() if self.device_id is not None else [None] * len(self)
+        ids = self.movement_id.tolist() if self.movement_id is not None else [None] * len(self)
+        return zip(self.movement_ts.tolist(), devices, ids, *cols)
+
+
+def deltas_from_timestamps(timestamps: np.ndarray, next_timestamp=None) -> np.ndarray:
+    """
+    Equivalente vetorizado de LEAD(timestamp) - timestamp, em segundos.
+    O último elemento usa `next_timestamp` quando informado; caso contrário é NaN.
+    """
+    ts = np.asarray(timestamps, dtype="datetime64[us]")
+    deltas = np.full(len(ts), np.nan)
+    if len(ts) > 1:
+        deltas[:-1] = np.diff(ts) / np.timedelta64(1, "s")
+    if len(ts) and next_timestamp is not None:
+        deltas[-1] = (np.datetime64(next_timestamp, "us") - ts[-1]) / np.timedelta64(1, "s")
+    return deltas
+
+
+def analyze_window(timestamps, dx, dy, deltas=None, next_timestamp=None) -> AnalysisBatch:
+    """
+    Calcula de uma só vez todas as velocidades e acelerações direcionais
+    de uma janela ordenada de movimentos.
+
+    :param timestamps: timestamps dos movimentos (datetime ou datetime64)
+    :param dx: deslocamentos horizontais (positivo = direita)
+    :param dy: deslocamentos verticais (positivo = baixo)
+    :param deltas: intervalos em segundos até a próxima amostra (NaN = desconhecido);
+                   se omitido, é derivado de `timestamps`
+    :param next_timestamp: timestamp da amostra seguinte à janela, se conhecido
+    """
+    ts = np.asarray(timestamps, dtype="datetime64[us]")
+    dx = np.asarray(dx, dtype=np.float64)
+    dy = np.asarray(dy, dtype=np.float64)
+    if deltas is None:
+        deltas = deltas_from_timestamps(ts, next_timestamp)
+    else:
+        deltas = np.asarray(deltas, dtype=np.float64)
+
+    t = floor_deltas(deltas)
+    return AnalysisBatch(ts, velocity_columns(dx / t, dy / t, t))
+
+
+def floor_deltas(deltas: np.ndarray) -> np.ndarray:
+    """NaN (sem próxima amostra), zero, negativos e valores minúsculos caem no piso."""
+    return np.where(deltas >= MIN_DELTA, deltas, MIN_DELTA)
+
+
+def velocity_columns(vx: np.ndarray, vy: np.ndarray, t: np.ndarray) -> dict:
+    """
+    Colunas de ANALYSIS_COLUMNS a partir das velocidades com sinal (positivo =
+    direita/baixo) e dos intervalos `t` já no piso.
+    """
+    zero = np.zeros_like(vx)
+    vel_dir = np.where(vx > 0, vx, zero)
+    vel_esq = np.where(vx < 0, -vx, zero)
+    vel_baixo = np.where(vy > 0, vy, zero)
+    vel_cima = np.where(vy < 0, -vy, zero)
+    vel_euclid = np.hypot(vx, vy)
+
+    return {
+        "vel_direita": vel_dir,
+        "vel_esquerda": vel_esq,
+        "vel_cima": vel_cima,
+        "vel_baixo": vel_baixo,
+        "vel_euclidiana": vel_euclid,
+        "acel_direita": vel_dir / t,
+        "acel_esquerda": vel_esq / t,
+        "acel_cima": vel_cima / t,
+        "acel_baixo": vel_baixo / t,
+        "acel_euclidiana": vel_euclid / t,
+    }
+
+
+def analyze_grouped(groups, order, timestamps, dx, dy, device_ts=None, smooth=None):
+    """
+    Analisa amostras de vários dispositivos intercaladas (ex.: em ordem de id).
+
+    As linhas são reordenadas por (grupo, order) e os intervalos calculados
+    só dentro de cada grupo; a última amostra de cada grupo fica com
+    intervalo desconhecido (NaN), pois depende da próxima amostra daquele
+    dispositivo.
+
+    :param device_ts: relógio do dispositivo em µs (NaN/None onde não houver);
+        quando duas amostras seguidas o têm (e ele avançou), o intervalo vem
+        dele, livre do jitter de chegada e das correções de offset do host
+    :param smooth: filtro com estado por dispositivo (ex.: filters.FilterChain),
+        chamado como smooth(grupos, vx, vy, t) -> (vx, vy, t) só com as amostras
+        de intervalo conhecido (não as últimas de cada grupo), em ordem; amostras
+        sem deslocamento continuam com velocidade zero (e fora de mouse_analyse)
+
+    Retorna (batch, perm, last): batch na ordem (grupo, order) com
+    device_id = grupo, perm com o índice de entrada de cada linha do batch
+    e last marcando a última amostra de cada grupo.
+    """
+    groups = np.asarray(groups, dtype=object)
+    _, codes = np.unique(groups, return_inverse=True)
+    perm = np.lexsort((np.asarray(order), codes))
+    codes = codes[perm]
+
+    ts = np.asarray(timestamps, dtype="datetime64[us]")[perm]
+    deltas = deltas_from_timestamps(ts)
+    if device_ts is not None:
+        device_deltas = np.diff(np.asarray(device_ts, dtype=np.float64)[perm]) / 1e6
+        known = device_deltas > 0  # NaN e relógio reiniciado: fica o tempo do host
+        deltas[:-1][known] = device_deltas[known]
+    last = np.ones(len(perm), dtype=bool)
+    last[:-1] = codes[1:] != codes[:-1]
+    deltas[last] = np.nan
+
+    if smooth is None:
+        batch = analyze_window(ts, np.asarray(dx)[perm], np.asarray(dy)[perm], deltas=deltas)
+    else:
+        t = floor_deltas(deltas)
+        dx = np.asarray(dx, dtype=np.float64)[perm]
+        dy = np.asarray(dy, dtype=np.float64)[perm]
+        vx, vy = dx / t, dy / t
+        known = ~last
+        vx[known], vy[known], t[known] = smooth(groups[perm][known], vx[known], vy[known], t[known])
+        still = (dx == 0) & (dy == 0)
+        vx[still] = vy[still] = 0.0
+        batch = AnalysisBatch(ts, velocity_columns(vx, vy, t))
+    batch.device_id = groups[perm]
+    return batch, perm, last
+
+
+def analyze_row(dx: int, dy: int, delta: float | None) -> tuple:
+    """
+    Fórmulas escalares originais do analisador (referência para o kernel).
+    Retorna os valores na ordem de ANALYSIS_COLUMNS.
+    """
+    t = delta if delta and delta >= MIN_DELTA else MIN_DELTA
+
+    vel_dir    = dx  / t if dx > 0 else 0
+    vel_esq    = -dx / t if dx < 0 else 0
+    vel_baixo  = dy  / t if dy > 0 else 0
+    vel_cima   = -dy / t if dy < 0 else 0
+    vel_euclid = math.hypot(dx, dy) / t
+
+    return (vel_dir, vel_esq, vel_cima, vel_baixo, vel_euclid,
+            vel_dir / t, vel_esq / t, vel_cima / t, vel_baixo / t, vel_euclid / t)
+
@@ -1,8 +1,13 @@
 # ble_hm10_reader.py
 
 import asyncio
-from bleak import BleakScanner, BleakClient
-from insert_local import insert_local_from_json, close_inserter
+import sys
+from insert_local import insert_local_packets, close_inserter, clock_stats
+from ingest_queue import IngestPipeline
+from ble_supervisor import BleakTransport, DeviceSupervisor, FakeTransport
+from utils.logger import get_logger, start_exporters
+
+log = get_logger("ble")
 
 
 # UUIDs do HM‑10 (BLE) padrão para UART emblema: FFE0/FFE1
@@ -11,59 +16,46 @@ HM10_CHAR_RX_UUID      = "0000ffe1-0000-1000-8000-00805f9b34fb"
 
 DEVICE_NAME = "CORE"
 SCAN_TIMEOUT = 5.0  # segundos
-buffer             = ""
-
-async def notification_handler(sender, data: bytearray):
-    global buffer
-    chunk = data.decode('ascii', errors='ignore')
-    buffer += chunk
-    while "\n" in buffer:
-        line, buffer = buffer.split("\n", 1)
-        line = line.strip()
-        if line.startswith("{") and line.endswith("}"):
-            insert_local_from_json(line)
-
-async def run():
-
-    print(f"Escaneando por '{DEVICE_NAME}' ({SCAN_TIMEOUT}s)…")
-    devices = await BleakScanner.discover(timeout=SCAN_TIMEOUT)
-    target = next((d for d in devices if d.name == DEVICE_NAME), None)
-    if not target:
-        print("❌ Dispositivo não encontrado.")
-        return
-
-    print(f"➜ Encontrado {target.name} [{target.address}]")
-    async with BleakClient(target.address) as client:
-        
-        # Bleak v0.20+: is_connected é propriedade
-        if not client.is_connected:
-            print("❌ Falha ao conectar.")
-            return
-        print("✅ Conectado!")
-       
-        # **Liste serviços e characteristics** para verificar UUIDs
-        svcs = await client.get_services()
-        print("Serviços encontrados:")
-        for svc in svcs:
-            print(f" • Service: {svc.uuid}")
-            for ch in svc.characteristics:
-                props = ",".join(ch.properties)
-                print(f"   └ Char: {ch.uuid} ({props})")
-
-        # Aguarde um pouco antes de assinar
-        await asyncio.sleep(1)
-
-        # Inicie notificações na característica FFE1
-        print(f"\nInscrevendo em {HM10_CHAR_RX_UUID}…")
-        await client.start_notify(HM10_CHAR_RX_UUID, notification_handler)
-
-        print("🔄 Lendo dados BLE (CTRL+C para sair)…\n")
-        while True:
-            await asyncio.sleep(1)
+QUEUE_SIZE = 10_000  # itens aguardando gravação antes de descartar
+
+async def run(prefixes=(DEVICE_NAME,), fake_devices: int = 0):
+    """
+    Conecta a todos os dispositivos cujo nome começa com um dos prefixos
+    e grava as amostras de todos por um único IngestPipeline.
+    Com fake_devices > 0, usa dispositivos simulados em vez do BLE.
+    """
+    pipeline = IngestPipeline(insert_local_packets, maxsize=QUEUE_SIZE)
+    pipeline.start()
+    if fake_devices:
+        transport = FakeTransport(n_devices=fake_devices)
+        prefixes = ("CORE-FAKE",)
+    else:
+        transport = BleakTransport(HM10_CHAR_RX_UUID)
+    supervisor = DeviceSupervisor(transport, pipeline, prefixes=prefixes,
+                                  scan_timeout=SCAN_TIMEOUT)
+
+    start_exporters()
+    log.info("Escaneando por %s* (%ss)…", ", ".join(prefixes), SCAN_TIMEOUT)
+    log.info("🔄 Lendo dados BLE (CTRL+C para sair)…\n")
+    try:
+        await supervisor.run()
+    finally:
+        await supervisor.stop()
+        await pipeline.stop()
+        log.info("📊 Fila de ingestão: %s", pipeline.stats())
+        log.info("📊 Dispositivos: %s", supervisor.stats())
+        log.info("📊 Relógios: %s", clock_stats())
 
 if __name__ == "__main__":
+    # Uso: python ble.py [PREFIXO ...] [--fake N]
+    args = sys.argv[1:]
+    fake = 0
+    if "--fake" in args:
+        i = args.index("--fake")
+        fake = int(args[i + 1])
+        del args[i:i + 2]
     try:
-        asyncio.run(run())
+        asyncio.run(run(tuple(args) or (DEVICE_NAME,), fake_devices=fake))
     except KeyboardInterrupt:
         close_inserter()
         print("\n❎ Encerrado pelo usuário.")
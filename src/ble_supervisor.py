@@ -0,0 +1,223 @@
+# ble_supervisor.py
+
+import asyncio
+import json
+import random
+import time
+import numpy as np
+from packet_format import PacketStream, encode_frames, pack_buttons
+from utils.logger import counter, gauge, get_logger
+
+log = get_logger("ble")
+
+
+class BleakTransport:
+    """
+    Transporte BLE real (bleak) para módulos UART como o HM-10.
+    stream() conecta, assina as notificações e só retorna quando o link cai.
+    """
+
+    def __init__(self, char_uuid: str):
+        self._char_uuid = char_uuid
+
+    async def discover(self, timeout: float) -> list[tuple[str, str]]:
+        from bleak import BleakScanner
+        devices = await BleakScanner.discover(timeout=timeout)
+        return [(d.address, d.name) for d in devices if d.name]
+
+    async def stream(self, address: str, on_data):
+        from bleak import BleakClient
+        disconnected = asyncio.Event()
+        async with BleakClient(address, disconnected_callback=lambda _: disconnected.set()) as client:
+            if not client.is_connected:
+                raise ConnectionError("falha ao conectar")
+            await client.start_notify(self._char_uuid, lambda _, data: on_data(data))
+            await disconnected.wait()
+
+
+class FakeTransport:
+    """
+    Dispositivos simulados dentro do processo, com a mesma interface do
+    BleakTransport: permitem testar carga do supervisor e da gravação sem
+    hardware. Cada dispositivo envia `rate_hz` amostras/s em notificações
+    de `chunk` bytes, em JSON ou no quadro binário, e pode derrubar o link
+    após `disconnect_after` segundos para exercitar a reconexão. O relógio
+    simulado do dispositivo adianta/atrasa `skew_ppm` partes por milhão.
+    """
+
+    def __init__(self, n_devices: int = 1, rate_hz: float = 100.0, fmt: str = "json",
+                 chunk: int = 20, tick: float = 0.01, disconnect_after: float | None = None,
+                 skew_ppm: float = 0.0, seed: int = 0):
+        if fmt not in ("json", "binary"):
+            raise ValueError(f"Formato inválido: {fmt}")
+        self._devices = [(f"FA:KE:00:00:{i // 256:02X}:{i % 256:02X}", f"CORE-FAKE-{i}")
+                         for i in range(n_devices)]
+        self._rate_hz = rate_hz
+        self._fmt = fmt
+        self._chunk = chunk
+        self._tick = tick
+        self._disconnect_after = disconnect_after
+        self._skew = skew_ppm * 1e-6
+        self._rng = random.Random(seed)
+
+    async def discover(self, timeout: float) -> list[tuple[str, str]]:
+        await asyncio.sleep(0)
+        return list(self._devices)
+
+    async def stream(self, address: str, on_data):
+        loop = asyncio.get_running_loop()
+        rng = np.random.default_rng(self._rng.randrange(2**32))
+        started = loop.time()
+        deadline = None
+        if self._disconnect_after:
+            deadline = started + self._disconnect_after * (0.5 + self._rng.random())
+        seq = 0
+        owed = 0.0
+        last = started
+        while True:
+            await asyncio.sleep(self._tick)
+            now = loop.time()
+            if deadline is not None and now >= deadline:
+                raise ConnectionError("link simulado caiu")
+            owed += (now - last) * self._rate_hz
+            last = now
+            n = int(owed)
+            if not n:
+                continue
+            owed -= n
+            payload = self._samples(rng, seq, n)
+            seq += n
+            for i in range(0, len(payload), self._chunk):
+                on_data(payload[i:i + self._chunk])
+
+    def _samples(self, rng, seq: int, n: int) -> bytes:
+        dx = rng.integers(-15, 16, n)
+        dy = rng.integers(-15, 16, n)
+        clicks = rng.random(n) < 0.01
+        # Amostragem em período fixo, medida pelo relógio (com deriva) do dispositivo
+        seqs = np.arange(seq, seq + n)
+        ts = (seqs * (1 + self._skew) * 1e6 / self._rate_hz).astype(np.int64)
+        if self._fmt == "binary":
+            return encode_frames(seqs, ts, dx, dy, clicks * pack_buttons(X=1))
+        lines = (
+            json.dumps({"dx": int(a), "dy": int(b), "L": 0, "U": 0, "R": 0, "D": 0, "X": int(c),
+                        "t": int(t) & 0xFFFFFFFF, "s": int(s) & 0xFFFF},
+                       separators=(",", ":"))
+            for a, b, c, t, s in zip(dx, dy, clicks, ts, seqs)
+        )
+        return ("\n".join(lines) + "\n").encode("ascii")
+
+
+class DeviceSupervisor:
+    """
+    Descobre e mantém conectados N dispositivos ao mesmo tempo, num único
+    event loop. Cada dispositivo tem sua task: conecta, decodifica o fluxo
+    (PacketStream) e envia (device_id, quadro) para o IngestPipeline
+    compartilhado, com o instante de chegada da notificação (para a
+    correção de relógio no host). Se o link cai, reconecta com backoff exponencial com
+    jitter; um link que ficou de pé por backoff_max segundos zera o backoff.
+    """
+
+    def __init__(self, transport, pipeline, prefixes=("CORE",), scan_timeout: float = 5.0,
+                 scan_interval: float = 10.0, backoff_initial: float = 1.0,
+                 backoff_max: float = 30.0, max_devices: int | None = None):
+        """
+        :param transport: BleakTransport, FakeTransport ou equivalente
+        :param pipeline: IngestPipeline que recebe (device_id, linha JSON | registros, time.time())
+        :param prefixes: prefixos de nome aceitos (ex.: "CORE" aceita "CORE-2")
+        :param scan_interval: intervalo (s) entre buscas por novos dispositivos
+        :param max_devices: limite de dispositivos simultâneos (None = sem limite)
+        """
+        self._transport = transport
+        self._pipeline = pipeline
+        self._prefixes = tuple(prefixes)
+        self._scan_timeout = scan_timeout
+        self._scan_interval = scan_interval
+        self._backoff_initial = backoff_initial
+        self._backoff_max = backoff_max
+        self._max_devices = max_devices
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._streams: dict[str, PacketStream] = {}
+        self.connects: dict[str, int] = {}
+        self.disconnects: dict[str, int] = {}
+
+    def _wanted(self, name: str) -> bool:
+        return any(name.startswith(prefix) for prefix in self._prefixes)
+
+    async def run(self):
+        """Busca dispositivos periodicamente e mantém uma task por dispositivo."""
+        while True:
+            try:
+                found = await self._transport.discover(self._scan_timeout)
+            except Exception as e:
+                log.error("❌ Falha na busca por dispositivos: %s", e, every=60.0)
+                found = []
+            for address, name in found:
+                if address in self._tasks or not self._wanted(name):
+                    continue
+                if self._max_devices is not None and len(self._tasks) >= self._max_devices:
+                    break
+                log.info("➜ Encontrado %s [%s]", name, address)
+                self._tasks[address] = asyncio.create_task(self._run_device(address, name))
+            await asyncio.sleep(self._scan_interval)
+
+    async def _run_device(self, address: str, name: str):
+        loop = asyncio.get_running_loop()
+        stream = self._streams[address] = PacketStream()
+        submit = self._pipeline.submit
+        backoff = self._backoff_initial
+        notifications = counter("pointertrack_ble_notifications_total", "Notificações BLE recebidas",
+                                device=address)
+        received = counter("pointertrack_ble_bytes_total", "Bytes BLE recebidos", device=address)
+        for key in ("frames", "malformed", "oversized", "discarded_bytes"):
+            # Contadores do framer, lidos só na exportação
+            gauge(f"pointertrack_ble_{key}", f"Framer do dispositivo: {key}", device=address) \
+                .set_function(lambda key=key: stream.stats()[key])
+
+        def on_data(data):
+            # Roda no event loop: só decodifica e enfileira
+            received_at = time.time()
+            notifications.inc()
+            received.inc(len(data))
+            lines, records = stream.feed(data)
+            for line in lines:
+                submit((address, line, received_at))
+            if records is not None and len(records):
+                submit((address, records, received_at))
+
+        while True:
+            stream.reset()
+            started = loop.time()
+            try:
+                self.connects[address] = self.connects.get(address, 0) + 1
+                log.info("🔗 Conectando a %s [%s]…", name, address)
+                await self._transport.stream(address, on_data)
+                log.warning("⚠ %s [%s] desconectou.", name, address)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("❌ %s [%s]: %s", name, address, e)
+            self.disconnects[address] = self.disconnects.get(address, 0) + 1
+
+            if loop.time() - started >= self._backoff_max:
+                backoff = self._backoff_initial
+            delay = backoff * (0.5 + random.random() / 2)
+            log.info("🔄 Reconectando a %s em %.1fs…", name, delay)
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, self._backoff_max)
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> dict:
+        return {
+            address: {
+                "connects": self.connects.get(address, 0),
+                "disconnects": self.disconnects.get(address, 0),
+                **stream.stats(),
+            }
+            for address, stream in self._streams.items()
+        }
@@ -0,0 +1,45 @@
+# checkpoint.py
+
+# Marcadores persistentes de progresso do analisador, por nome de serviço.
+#   last_id:     maior id de mouse_movements já lido pelo serviço (no replay
+#                do spool de ingestão, "spool:<id>", o último lsn gravado)
+#   pending_ids: última amostra lida de cada dispositivo, ainda não analisada
+#                (seu intervalo depende da próxima amostra do mesmo dispositivo)
+CHECKPOINT_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS analysis_checkpoint (
+        name        TEXT      PRIMARY KEY,
+        last_id     BIGINT    NOT NULL,
+        pending_ids BIGINT[]  NOT NULL DEFAULT '{}',
+        updated_at  TIMESTAMP NOT NULL DEFAULT now()
+    );
+    """,
+    "ALTER TABLE analysis_checkpoint ADD COLUMN IF NOT EXISTS pending_ids BIGINT[] NOT NULL DEFAULT '{}';",
+]
+
+def ensure_checkpoint_table(cur):
+    for stmt in CHECKPOINT_DDL:
+        cur.execute(stmt)
+
+def load_checkpoint(cur, name: str) -> tuple[int, list[int]]:
+    """
+    Retorna (last_id, pending_ids) do serviço `name` ((0, []) se nunca rodou).
+    """
+    cur.execute("SELECT last_id, pending_ids FROM analysis_checkpoint WHERE name = %s;", (name,))
+    row = cur.fetchone()
+    return (row[0], list(row[1])) if row else (0, [])
+
+def save_checkpoint(cur, name: str, last_id: int, pending_ids=()):
+    """
+    Avança o marcador de `name` para last_id (nunca retrocede).
+    Deve rodar na mesma transação que grava as análises correspondentes.
+    """
+    cur.execute("""
+        INSERT INTO analysis_checkpoint (name, last_id, pending_ids, updated_at)
+        VALUES (%s, %s, %s, now())
+        ON CONFLICT (name) DO UPDATE
+        SET last_id     = EXCLUDED.last_id,
+            pending_ids = EXCLUDED.pending_ids,
+            updated_at  = EXCLUDED.updated_at
+        WHERE analysis_checkpoint.last_id <= EXCLUDED.last_id;
+    """, (name, last_id, list(pending_ids)))
@@ -1,30 +1,312 @@
 # data/database.py
 import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
 from typing import Optional
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from utils.config import database_settings
+from utils.logger import gauge, get_logger
+
+# Conexões do processo.
+#
+# Todo componente pega conexões do pool compartilhado (get_pool() ou o
+# atalho connection()), em vez de abrir uma por operação: abrir conexão
+# custa CPU do cliente e um backend novo no servidor. Configuração (PG_*,
+# statement_timeout, tamanho do pool) vem de utils/config.py.
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Pools herdados por fork: mantidos referenciados para não serem coletados no
+# filho (fechar as conexões do pai encerraria as sessões dele no servidor).
+# Processos de trabalho devem preferir o método spawn.
+_inherited = []
+# Falha ao criar o pool: novas tentativas só a partir de _retry_at (monotônico),
+# com espera dobrando de POOL_RETRY_INITIAL até POOL_RETRY_MAX segundos. Até
+# lá get_pool() retorna None na hora, sem segurar quem chama em conexões
+# que vão falhar de novo.
+POOL_RETRY_INITIAL = 1.0
+POOL_RETRY_MAX = 30.0
+_retry_at = None
+_retry_delay = POOL_RETRY_INITIAL
+
+log = get_logger("database")
+
+def _connect_params() -> dict:
+    return database_settings().connect_params()
 
 def get_connection():
     """
-    Abre e retorna uma conexão psycopg2 com o banco de dados.
-    - PG_DB: nome do banco (default: 'postgres')
-    - PG_USER: usuário (default: 'postgres')
-    - PG_PASS: senha (default: '1234')
-    - PG_HOST: host (default: 'localhost')
-    - PG_PORT: porta (default: '5432')
+    Abre e retorna uma conexão psycopg2 dedicada, fora do pool, com as
+    configurações de utils/config.py (PG_DB, PG_USER, PG_PASS, PG_HOST,
+    PG_PORT, PG_STATEMENT_TIMEOUT...). Prefira connection()/get_pool();
+    conexões dedicadas são para sessões próprias e longas.
 
     Retorna None caso falhe na conexão.
     """
     try:
-        conn = psycopg2.connect(
-            dbname=os.getenv("PG_DB", "postgres"),
-            user=os.getenv("PG_USER", "postgres"),
-            password=os.getenv("PG_PASS", "1234"),
-            host=os.getenv("PG_HOST", "localhost"),
-            port=os.getenv("PG_PORT", "5432"),
-            options="-c client_encoding=UTF8"
-        )
+        conn = psycopg2.connect(**_connect_params())
         return conn
     except Exception as e:
-        print(f"❌ Falha ao conectar no PostgreSQL: {e}")
+        log.error("❌ Falha ao conectar no PostgreSQL: %s", e, every=5.0)
         return None
-    
\ No newline at end of file
+
+
+class ConnectionPool:
+    """
+    Pool de conexões seguro entre threads.
+
+    - getconn() espera (até `timeout`) por uma conexão livre quando todas
+      estão emprestadas, em vez de falhar.
+    - Health check: uma conexão ociosa há mais de `health_check` segundos
+      passa por um SELECT 1 antes de ser entregue; se o servidor caiu ou
+      reiniciou, ela é descartada e outra é aberta (com novas tentativas).
+    - putconn() desfaz transações abertas e autocommit, e descarta
+      conexões fechadas ou quebradas; quem pegou a conexão não precisa
+      saber se ela ainda presta.
+    - statement_timeout e keepalives TCP vêm dos parâmetros de conexão.
+    """
+
+    def __init__(self, minconn: int = 1, maxconn: int = 8, params: dict | None = None,
+                 timeout: float = 30.0, health_check: float = 30.0, retries: int = 3):
+        """
+        :param minconn: conexões abertas já na criação (e mantidas ociosas)
+        :param maxconn: máximo de conexões abertas ao mesmo tempo
+        :param params: argumentos de psycopg2.connect
+        :param timeout: espera máxima (s) por uma conexão livre
+        :param health_check: ociosidade (s) a partir da qual a conexão é testada antes do uso
+        :param retries: tentativas ao abrir uma conexão
+        """
+        if not 0 <= minconn <= maxconn or maxconn < 1:
+            raise ValueError(f"Tamanho de pool inválido: {minconn}..{maxconn}")
+        self._params = params or {}
+        self._maxconn = maxconn
+        self._timeout = timeout
+        self._health_check = health_check
+        self._retries = retries
+        self._idle = []   # (conexão, instante da devolução); a mais recente no fim
+        self._size = 0    # conexões abertas: ociosas + emprestadas
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Contadores
+        self.opened = 0
+        self.discarded = 0
+        self.health_checks = 0
+        self.waits = 0
+
+        for _ in range(minconn):
+            conn = self._open()
+            self._size += 1
+            self._idle.append((conn, time.monotonic()))
+
+    def _open(self):
+        for attempt in range(self._retries):
+            try:
+                conn = psycopg2.connect(**self._params)
+                self.opened += 1
+                return conn
+            except psycopg2.OperationalError:
+                if attempt == self._retries - 1:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+
+    def _alive(self, conn) -> bool:
+        self.health_checks += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self, timeout: float | None = None):
+        """
+        Empresta uma conexão saudável. Levanta PoolError se nenhuma ficar
+        livre a tempo, ou psycopg2.OperationalError se o banco não aceitar
+        conexões.
+        """
+        deadline = time.monotonic() + (self._timeout if timeout is None else timeout)
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("pool de conexões fechado")
+                if self._idle:
+                    conn, since = self._idle.pop()
+                    break
+                if self._size < self._maxconn:
+                    conn, since = None, None
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError(f"nenhuma conexão livre do pool em {self._timeout:.0f}s")
+                self.waits += 1
+                self._cond.wait(remaining)
+        try:
+            if conn is not None and (conn.closed or (time.monotonic() - since > self._health_check
+                                                     and not self._alive(conn))):
+                self._close_quietly(conn)
+                self.discarded += 1
+                conn = None
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def _reset(self, conn) -> bool:
+        """Volta a conexão ao estado padrão; False se ela não serve mais."""
+        if conn.closed:
+            return False
+        status = conn.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        try:
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            return False
+        conn.notifies.clear()
+        return True
+
+    def putconn(self, conn, close: bool = False):
+        """Devolve uma conexão; com close=True (ou se estiver quebrada), ela é fechada."""
+        usable = not close and self._reset(conn)
+        with self._cond:
+            if usable and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._close_quietly(conn)
+                self._size -= 1
+                if not close:
+                    self.discarded += 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, statement_timeout: str | int | None = None):
+        """
+        with pool.connection() as conn: ... — empresta e devolve uma conexão.
+        Erros de conexão descartam a conexão; o commit é do chamador.
+        :param statement_timeout: limite só para este empréstimo (ms ou com unidade; 0 desliga)
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            if statement_timeout is not None:
+                with conn.cursor() as cur:
+                    cur.execute("SET statement_timeout = %s;", (str(statement_timeout),))
+                conn.commit()
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if statement_timeout is not None and not broken and not conn.closed:
+                try:
+                    conn.rollback()
+                    with conn.cursor() as cur:
+                        cur.execute("RESET statement_timeout;")
+                    conn.commit()
+                except psycopg2.Error:
+                    broken = True
+            self.putconn(conn, close=broken)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "opened": self.opened,
+                "discarded": self.discarded,
+                "health_checks": self.health_checks,
+                "waits": self.waits,
+            }
+
+
+def _export_pool_stats(conn_pool: ConnectionPool):
+    # Lidas só quando as métricas são exportadas
+    for key in ("size", "idle", "opened", "discarded", "waits"):
+        gauge(f"pointertrack_pool_{key}", f"Pool de conexões: {key}").set_function(
+            lambda key=key: conn_pool.stats()[key])
+
+def get_pool(minconn: int | None = None, maxconn: int | None = None) -> Optional[ConnectionPool]:
+    """
+    Retorna o pool de conexões compartilhado do processo, criando-o na
+    primeira chamada (tamanho padrão: PG_POOL_MIN/PG_POOL_MAX).
+    Use pool.getconn()/pool.putconn(conn) ou pool.connection() em vez de
+    abrir e fechar conexões.
+
+    Retorna None caso falhe na conexão; depois de uma falha, retorna None
+    sem tentar de novo até o fim da espera (ver POOL_RETRY_INITIAL).
+    """
+    global _pool, _pool_pid, _retry_at, _retry_delay
+    with _pool_lock:
+        if _pool is not None and _pool_pid != os.getpid():
+            # Processo filho (fork): as conexões herdadas pertencem ao pai
+            _inherited.append(_pool)
+            _pool = None
+        if _pool is None:
+            if _retry_at is not None and time.monotonic() < _retry_at:
+                return None
+            settings = database_settings()
+            try:
+                _pool = ConnectionPool(
+                    settings.pool_min if minconn is None else minconn,
+                    settings.pool_max if maxconn is None else maxconn,
+                    settings.connect_params(),
+                    timeout=settings.pool_timeout,
+                    health_check=settings.health_check,
+                )
+                _pool_pid = os.getpid()
+                _retry_at, _retry_delay = None, POOL_RETRY_INITIAL
+                _export_pool_stats(_pool)
+            except Exception as e:
+                log.error("❌ Falha ao criar pool do PostgreSQL (nova tentativa em %.0fs): %s",
+                          _retry_delay, e, every=5.0)
+                _retry_at = time.monotonic() + _retry_delay
+                _retry_delay = min(_retry_delay * 2, POOL_RETRY_MAX)
+                return None
+        return _pool
+
+@contextmanager
+def connection(statement_timeout: str | int | None = None):
+    """
+    with connection() as conn: ... — conexão do pool do processo,
+    devolvida na saída. `conn` é None se o banco não estiver disponível.
+    :param statement_timeout: limite só para este uso (ex.: 0 em manutenções longas)
+    """
+    with ExitStack() as stack:
+        conn = None
+        conn_pool = get_pool()
+        if conn_pool is not None:
+            try:
+                conn = stack.enter_context(conn_pool.connection(statement_timeout))
+            except (psycopg2.Error, PoolError) as e:
+                log.error("❌ Falha ao obter conexão do pool: %s", e, every=5.0)
+        yield conn
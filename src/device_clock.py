@@ -0,0 +1,193 @@
+# device_clock.py
+
+import numpy as np
+
+
+def unwrap(raw: np.ndarray, previous: int | None, bits: int) -> np.ndarray:
+    """
+    Desfaz a volta de um contador de `bits` bits (seq u16, relógio u32).
+
+    Cada diferença entre amostras consecutivas é lida módulo 2**bits como
+    inteiro com sinal: passos para trás (pacote fora de ordem) ficam
+    negativos em vez de parecerem uma volta completa.
+
+    :param raw: valores crus, na ordem de chegada
+    :param previous: último valor já desenrolado (None no início do fluxo)
+    Retorna os valores desenrolados (int64).
+    """
+    raw = np.asarray(raw, dtype=np.int64)
+    modulus = 1 << bits
+    half = modulus >> 1
+    start = int(raw[0]) if previous is None else previous
+    steps = np.diff(raw, prepend=start % modulus)
+    steps = (steps + half) % modulus - half
+    return start + np.cumsum(steps)
+
+
+def unwrap_one(raw: int, previous: int | None, bits: int) -> int:
+    """unwrap() de um valor só, em inteiros do Python (sem o custo do numpy)."""
+    if previous is None:
+        return raw
+    modulus = 1 << bits
+    half = modulus >> 1
+    return previous + (raw - previous % modulus + half) % modulus - half
+
+
+class DeviceClock:
+    """
+    Relógio de um dispositivo: desenrola timestamp e sequência do firmware,
+    conta perdas e reordenações e converte o tempo do dispositivo para o
+    horário do host, corrigindo offset e deriva (skew) dos cristais.
+
+    Cada lote chega ao host em `received_at`; o atraso de transporte só
+    pode ser >= 0, então o menor (host - dispositivo) de uma janela é a
+    melhor estimativa do offset real (filtro de mínimo, como no NTP). Os
+    mínimos das últimas janelas definem por mínimos quadrados a reta
+    offset(t_dispositivo), cuja inclinação é a deriva.
+
+    Se a chegada destoa da previsão por mais de `resync` segundos (ex.: o
+    dispositivo reiniciou e o relógio voltou a zero), a estimativa recomeça.
+    """
+
+    def __init__(self, window: float = 5.0, anchors: int = 8,
+                 ts_bits: int = 32, seq_bits: int = 16, max_skew: float = 1e-3,
+                 resync: float = 2.0):
+        """
+        :param window: duração (s, tempo do dispositivo) de cada janela de mínimo
+        :param anchors: quantas janelas entram no ajuste da deriva
+        :param max_skew: deriva máxima aceita (1e-3 = 1000 ppm)
+        :param resync: desvio (s) que descarta a estimativa atual
+        """
+        self._window = window
+        self._max_anchors = anchors
+        self._ts_bits = ts_bits
+        self._seq_bits = seq_bits
+        self._max_slope = max_skew
+        self._resync = resync
+        self._last_ts = None
+        self._max_seq = None
+        self._anchors = []        # (t_dispositivo, offset) mínimos de janelas fechadas
+        self._win_start = None
+        self._win_min = None      # (t_dispositivo, offset) mínimo da janela atual
+        self._slope = 0.0
+
+        # Contadores
+        self.samples = 0
+        self.lost = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.resyncs = 0
+
+    @property
+    def skew(self) -> float:
+        """Deriva do relógio do dispositivo (> 0: adianta em relação ao host)."""
+        return -self._slope or 0.0
+
+    def observe(self, device_ts, seq, received_at: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Registra um lote de amostras recebido no instante `received_at`
+        (epoch do host, em segundos).
+
+        :param device_ts: relógio do dispositivo, em µs (cru, com volta)
+        :param seq: sequência do firmware (crua, com volta) ou None
+        Retorna (timestamps do host em s desde a epoch, device_ts desenrolado
+        em µs, seq desenrolada ou None).
+        """
+        device_us = unwrap(device_ts, self._last_ts, self._ts_bits)
+        self._last_ts = int(device_us[-1])
+        self.samples += len(device_us)
+        device_s = device_us / 1e6
+        newest = float(device_s.max())
+        self._check_resync(newest, received_at)
+
+        seq_unwrapped = None
+        if seq is not None:
+            seq_unwrapped = unwrap(seq, self._max_seq, self._seq_bits)
+            # Comparação com o maior seq já visto: um salto abre lacuna, e um
+            # pacote atrasado (reordenado) preenche uma lacuna contada antes
+            start = seq_unwrapped[0] - 1 if self._max_seq is None else self._max_seq
+            seen = np.maximum.accumulate(np.concatenate(([start], seq_unwrapped)))
+            ahead = seq_unwrapped - seen[:-1]
+            late = int(np.count_nonzero(ahead < 0))
+            self.lost += int(np.sum(ahead[ahead > 1] - 1)) - late
+            self.reordered += late
+            self.duplicates += int(np.count_nonzero(ahead == 0))
+            self._max_seq = int(seen[-1])
+
+        self._update(newest, received_at)
+        return device_s + self._offset_at(device_s), device_us, seq_unwrapped
+
+    def observe_one(self, device_ts: int, seq: int | None, received_at: float) -> tuple[float, int, int | None]:
+        """
+        observe() de uma amostra só (linhas JSON, que chegam uma a uma):
+        mesmo estado e mesmos resultados, sem montar arrays.
+
+        Retorna (timestamp do host em s desde a epoch, device_ts desenrolado
+        em µs, seq desenrolada ou None).
+        """
+        device_us = unwrap_one(device_ts, self._last_ts, self._ts_bits)
+        self._last_ts = device_us
+        self.samples += 1
+        device_s = device_us / 1e6
+        self._check_resync(device_s, received_at)
+
+        if seq is not None:
+            seq = unwrap_one(seq, self._max_seq, self._seq_bits)
+            seen = seq - 1 if self._max_seq is None else self._max_seq
+            ahead = seq - seen
+            if ahead < 0:
+                self.lost -= 1
+                self.reordered += 1
+            elif ahead == 0:
+                self.duplicates += 1
+            else:
+                self.lost += ahead - 1
+            self._max_seq = max(seen, seq)
+
+        self._update(device_s, received_at)
+        return device_s + self._offset_at(device_s), device_us, seq
+
+    def _check_resync(self, device_s: float, received_at: float):
+        if self._win_min is None and not self._anchors:
+            return
+        if abs(received_at - device_s - self._offset_at(device_s)) > self._resync:
+            # Relógio (e sequência) recomeçaram: as estimativas não valem mais
+            self.resyncs += 1
+            self._anchors.clear()
+            self._win_start = self._win_min = None
+            self._slope = 0.0
+            self._max_seq = None
+
+    def _update(self, device_s: float, received_at: float):
+        offset = received_at - device_s
+        if self._win_start is None:
+            self._win_start = device_s
+        if self._win_min is None or offset < self._win_min[1]:
+            self._win_min = (device_s, offset)
+        if device_s - self._win_start >= self._window:
+            self._anchors.append(self._win_min)
+            del self._anchors[:-self._max_anchors]
+            self._win_start = device_s
+            self._win_min = None
+            if len(self._anchors) >= 2:
+                t, o = np.array(self._anchors).T
+                slope = np.polyfit(t - t[-1], o, 1)[0]
+                self._slope = float(np.clip(slope, -self._max_slope, self._max_slope))
+
+    def _offset_at(self, device_s: np.ndarray) -> np.ndarray:
+        # Reta pelo último mínimo fechado; o mínimo da janela atual a puxa
+        # para baixo se o atraso de transporte diminuiu
+        points = self._anchors[-1:] + ([self._win_min] if self._win_min else [])
+        base = min(o - self._slope * (t - points[0][0]) for t, o in points)
+        return base + self._slope * (device_s - points[0][0])
+
+    def stats(self) -> dict:
+        return {
+            "samples": self.samples,
+            "lost": self.lost,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "resyncs": self.resyncs,
+            "skew_ppm": self.skew * 1e6,
+        }
+
@@ -0,0 +1,114 @@
+# framing.py
+
+# A partir deste tamanho (bytes) vale a pena fatiar o buffer via memoryview
+_VIEW_THRESHOLD = 4096
+
+def is_json_object(frame: bytes) -> bool:
+    """Aceita só quadros com cara de objeto JSON ({...}), como o firmware do HM-10 envia."""
+    return frame[:1] == b"{" and frame[-1:] == b"}"
+
+
+class LineFramer:
+    """
+    Separador incremental de linhas para fluxos de bytes (UART BLE, serial).
+
+    Os bytes recebidos são acumulados num bytearray e cada feed() varre só
+    o trecho novo; as linhas completas são copiadas de uma vez, separadas
+    por um split em C, e o prefixo consumido é removido de uma vez. O custo é linear no volume recebido, mesmo com
+    muitas linhas por notificação.
+
+    Quadros maiores que max_frame são descartados: sem delimitador à vista,
+    o framer entra em modo de ressincronização e ignora bytes até a próxima
+    quebra de linha. Quadros recusados por `accept` contam como malformados.
+    """
+
+    def __init__(self, max_frame: int = 256, delimiter: bytes = b"\n", accept=None):
+        """
+        :param max_frame: tamanho máximo de um quadro (bytes, sem o delimitador)
+        :param delimiter: delimitador de quadros
+        :param accept: predicado opcional sobre o quadro (bytes, já sem espaços nas pontas)
+        """
+        self._buf = bytearray()
+        self._max_frame = max_frame
+        self._delimiter = delimiter
+        self._accept = accept
+        self._resync = False
+
+        # Contadores
+        self.frames = 0
+        self.malformed = 0
+        self.oversized = 0
+        self.discarded_bytes = 0
+
+    def feed(self, data) -> list[bytes]:
+        """Adiciona um pedaço do fluxo e retorna os quadros completos encontrados."""
+        buf = self._buf
+        delimiter = self._delimiter
+        step = len(delimiter)
+        # Só o trecho novo (mais step-1 bytes, se o delimitador vier partido) é varrido
+        scan_from = max(len(buf) - step + 1, 0)
+        buf += data
+
+        end = buf.rfind(delimiter, scan_from)
+        if end < 0:
+            if len(buf) > self._max_frame:
+                self._discard_pending()
+            return []
+
+        # Todas as linhas completas de uma vez: uma cópia e um split em C.
+        # Em blocos grandes a memoryview evita a cópia intermediária do slice;
+        # em notificações pequenas ela custa mais do que economiza.
+        if end > _VIEW_THRESHOLD:
+            with memoryview(buf) as view:
+                parts = bytes(view[:end]).split(delimiter)
+        else:
+            parts = bytes(buf[:end]).split(delimiter)
+        del buf[:end + step]
+
+        if self._resync:
+            # O primeiro pedaço é o fim do lixo que causou a ressincronização
+            self.discarded_bytes += len(parts[0]) + step
+            parts = parts[1:]
+            self._resync = False
+
+        frames = []
+        accept = self._accept
+        max_frame = self._max_frame
+        for part in parts:
+            if len(part) > max_frame:
+                self.oversized += 1
+                self.discarded_bytes += len(part) + step
+                continue
+            frame = part.strip()
+            if not frame:
+                continue
+            if accept is None or accept(frame):
+                frames.append(frame)
+            else:
+                self.malformed += 1
+        self.frames += len(frames)
+
+        if len(buf) > max_frame:
+            self._discard_pending()
+        return frames
+
+    def _discard_pending(self):
+        """Nenhum delimitador dentro do limite: descarta e ressincroniza."""
+        if not self._resync:
+            self.oversized += 1
+        self.discarded_bytes += len(self._buf)
+        self._buf.clear()
+        self._resync = True
+
+    def reset(self):
+        self._buf.clear()
+        self._resync = False
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "malformed": self.malformed,
+            "oversized": self.oversized,
+            "discarded_bytes": self.discarded_bytes,
+            "pending_bytes": len(self._buf),
+        }
@@ -0,0 +1,132 @@
+# ingest_queue.py
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from utils.logger import SIZE_BUCKETS, counter, gauge, get_logger, histogram
+
+log = get_logger("ingest_queue")
+
+
+class IngestPipeline:
+    """
+    Fila asyncio limitada entre quem recebe pacotes (callbacks BLE) e quem
+    grava no banco. O produtor só enfileira; uma task separada junta os
+    itens em lotes e chama `sink(lote)` num executor de threads, de modo
+    que a latência do banco nunca bloqueia o event loop.
+
+    Backpressure: produtores que podem esperar usam `await put()`; callbacks
+    que não podem atrasar usam `submit()`, que descarta o item e conta em
+    `dropped` quando a fila está cheia.
+    """
+
+    def __init__(self, sink, maxsize: int = 10_000, batch_size: int = 500,
+                 executor: ThreadPoolExecutor | None = None):
+        """
+        :param sink: função bloqueante que recebe uma lista de itens e os grava
+        :param maxsize: capacidade da fila (itens)
+        :param batch_size: máximo de itens por chamada a sink
+        :param executor: executor para o sink (padrão: uma thread, preserva a ordem)
+        """
+        self._sink = sink
+        self._queue = asyncio.Queue(maxsize)
+        self._batch_size = batch_size
+        self._executor = executor or ThreadPoolExecutor(max_workers=1,
+                                                        thread_name_prefix="ingest")
+        self._task = None
+
+        # Contadores
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+
+        # Métricas (a profundidade é lida só na exportação)
+        gauge("pointertrack_ingest_queue_depth", "Itens na fila de ingestão").set_function(
+            lambda: self.depth)
+        self._dropped_total = counter("pointertrack_ingest_queue_dropped_total",
+                                      "Itens descartados com a fila cheia")
+        self._sink_seconds = histogram("pointertrack_ingest_sink_seconds",
+                                       "Duração de cada chamada ao sink")
+        self._batch_items = histogram("pointertrack_ingest_batch_items", "Itens por chamada ao sink",
+                                      SIZE_BUCKETS)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, item) -> bool:
+        """Enfileira sem nunca esperar; retorna False (e conta) se a fila estiver cheia."""
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self._dropped_total.inc()
+            log.warning("⚠ Fila de ingestão cheia: itens descartados", every=5.0, dropped=self.dropped)
+            return False
+        self._enqueued()
+        return True
+
+    async def put(self, item):
+        """Enfileira aguardando espaço na fila (backpressure para o produtor)."""
+        await self._queue.put(item)
+        self._enqueued()
+
+    def _enqueued(self):
+        self.enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def start(self):
+        """Inicia a task de gravação no event loop corrente."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            # Lotes crescem sozinhos quando o banco fica para trás
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            start = loop.time()
+            try:
+                await loop.run_in_executor(self._executor, self._sink, batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                log.error("❌ Erro ao gravar lote da fila de ingestão: %s", e, every=5.0)
+            finally:
+                self._sink_seconds.observe(loop.time() - start)
+                self._batch_items.observe(len(batch))
+                self.batches += 1
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def stop(self):
+        """Grava o que restar na fila e encerra a task e o executor."""
+        if self._task is not None:
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+        }
@@ -1,65 +1,258 @@
+import io
 import json
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import psycopg2
+import numpy as np
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError
 from database import *
+from analysis_kernels import ANALYSIS_COLUMNS, AnalysisBatch
+from checkpoint import ensure_checkpoint_table, load_checkpoint, save_checkpoint
+from packet_format import unpack_buttons
+from device_clock import DeviceClock
+from segmenter import SEGMENT_COLUMNS, Segment
+from schema import ensure_schema, maintain
+from rollups import update_rollups_from_rows
+from spool import DEFAULT_DIR as DEFAULT_SPOOL_DIR, FLAG_NO_DEVICE_TS, FLAG_NO_SEQ, Spool, make_records
+from processing.button_events import CLICK_COLUMNS, ButtonTracker, button_bits
+from processing.movement_analysis import FEATURE_COLUMNS, MovementFeatures
+from utils.logger import SIZE_BUCKETS, counter, gauge, get_logger, histogram
+
+# Canal NOTIFY com a faixa de ids ("primeiro-último") de cada lote gravado
+NOTIFY_CHANNEL = "mouse_movements_new"
+
+# Um lote por vez em mouse_movements, entre todos os processos de ingestão: os
+# ids são reservados e confirmados em ordem crescente, então o analisador
+# (que lê id > último id visto) nunca passa por um id ainda não confirmado
+_INGEST_LOCK = "SELECT pg_advisory_xact_lock(hashtext('pointertrack_ingest'));"
+
+# Espera máxima (s) entre tentativas de reconexão do replay do spool
+RECONNECT_MAX = 30.0
+
+# Erros repetidos por amostra (JSON inválido...) saem no máximo a cada LOG_EVERY s
+LOG_EVERY = 5.0
+
+# Erros que atingem o lote inteiro, não uma linha: tabela ausente, sem permissão,
+# banco só leitura (réplica/failover) e statement_timeout. Dividir o lote não
+# adianta; as linhas voltam para o buffer como numa falha de conexão
+_BATCH_ERRORS = (
+    psycopg2.errors.UndefinedTable,
+    psycopg2.errors.InsufficientPrivilege,
+    psycopg2.errors.ReadOnlySqlTransaction,
+    psycopg2.errors.QueryCanceled,
+)
+
+log = get_logger("ingest")
+_samples = {source: counter("pointertrack_ingest_samples_total", "Amostras anexadas ao spool",
+                            source=source) for source in ("json", "frames")}
+_parse_errors = counter("pointertrack_ingest_parse_errors_total", "Pacotes descartados na conversão")
+_spool_pending = gauge("pointertrack_spool_pending", "Amostras no spool ainda não gravadas no banco")
+_replay_seconds = histogram("pointertrack_replay_seconds", "Duração das transações do replay do spool")
+_replay_rows = histogram("pointertrack_replay_rows", "Amostras por transação do replay", SIZE_BUCKETS)
+_replay_errors = counter("pointertrack_replay_errors_total", "Falhas do replay (conexão ou dados)")
+_dropped = counter("pointertrack_replay_dropped_total", "Amostras descartadas do spool por erro de dados")
+_button_events_total = counter("pointertrack_button_events_total", "Bordas de botão gravadas")
+
+MOVEMENT_COLUMNS = ("timestamp", "dx", "dy", "L", "U", "R", "D", "X", "device_id",
+                    "device_ts", "seq")
+
+def _csv_text(value: str | None) -> str:
+    # Campo vazio sem aspas é NULL no COPY CSV; texto vai sempre entre aspas
+    if value is None:
+        return ""
+    return '"' + value.replace('"', '""') + '"'
+
+def _csv_num(value) -> str:
+    return "" if value is None else str(value)
+
+def movements_to_csv(rows, ids=None) -> io.StringIO:
+    """
+    Serializa tuplas na ordem de MOVEMENT_COLUMNS em CSV na memória,
+    no formato esperado por COPY ... FROM STDIN WITH (FORMAT csv).
+    :param ids: id de cada linha (primeira coluna), se reservados pelo chamador
+    """
+    buf = io.StringIO()
+    lines = (
+        f"{ts.isoformat()},{dx},{dy},{L},{U},{R},{D},{X},{_csv_text(device_id)},"
+        f"{_csv_num(device_ts)},{_csv_num(seq)}\n"
+        for ts, dx, dy, L, U, R, D, X, device_id, device_ts, seq in rows
+    )
+    buf.writelines(lines if ids is None else (f"{i},{line}" for i, line in zip(ids, lines)))
+    buf.seek(0)
+    return buf
+
+def copy_movements(cur, rows, table: str = "mouse_movements", ids=None):
+    """
+    Grava as linhas com um único COPY FROM STDIN (CSV).
+    :param ids: ids já reservados (reserve_ids()); sem eles, o padrão da tabela
+    """
+    columns = MOVEMENT_COLUMNS if ids is None else ("id",) + MOVEMENT_COLUMNS
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        movements_to_csv(rows, ids),
+    )
+
+def reserve_ids(cur, n: int, sequence: str = "mouse_movements_id_seq"):
+    """
+    Reserva `n` ids de `sequence`, em ordem crescente. Contíguos (o caso
+    normal, sob _INGEST_LOCK) voltam como range, sem trafegar um id por linha.
+    """
+    cur.execute("""
+        SELECT min(id), max(id),
+               CASE WHEN max(id) - min(id) + 1 = count(*) THEN NULL ELSE array_agg(id ORDER BY id) END
+        FROM (SELECT nextval(%s::regclass) AS id FROM generate_series(1, %s)) AS reserved;
+    """, (sequence, n))
+    first, last, ids = cur.fetchone()
+    return range(first, last + 1) if ids is None else ids
+
+def _utc_offset(t: float) -> timedelta:
+    return datetime.fromtimestamp(t) - datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None)
+
+def _local_us(host: np.ndarray) -> np.ndarray:
+    """Instantes do host (s desde a época) como datetime64[us] no horário local."""
+    host = np.asarray(host, dtype=np.float64)
+    first, last = host[0], host[-1]
+    offset = _utc_offset(first)
+    if offset != _utc_offset(last):
+        # Lote atravessa uma mudança de fuso (horário de verão): uma a uma
+        return np.array([datetime.fromtimestamp(t) for t in host.tolist()], dtype="M8[us]")
+    us = np.round(host * 1e6).astype(np.int64) + offset // timedelta(microseconds=1)
+    return us.astype("M8[us]")
 
 class MouseMovementInserter:
-    def __init__(self, buffer_size: int = 10):
+    """
+    Ingestão de amostras em mouse_movements através do spool local
+    (spool.py): as amostras são anexadas ao spool, sem nunca esperar pelo
+    banco, e uma thread de replay as drena para o PostgreSQL em lotes
+    grandes, reconectando sozinha quando o banco cai. A posição drenada
+    (lsn) é confirmada em analysis_checkpoint na mesma transação das
+    linhas, então nada é perdido nem gravado duas vezes, mesmo com
+    reinícios do banco ou do processo.
+
+    Os botões não viram uma linha de clique por amostra: o ButtonTracker
+    (processing/button_events.py) grava em mouse_clicks só as bordas
+    (press, double, release com a duração), no mesmo lote dos movimentos.
+    """
+
+    def __init__(self, buffer_size: int = 500, flush_interval: float = 0.5,
+                 mode: str = "copy", spool_dir: str | None = None,
+                 batch_size: int = 50_000, fsync_interval: float = 1.0):
         """
-        Inicializa o inserter: abre conexão e garante tabelas.
-        :param buffer_size: número de eventos antes de batch insert
+        Abre (ou recupera) o spool e inicia a thread de replay.
+        :param buffer_size: amostras pendentes que antecipam o replay
+        :param flush_interval: tempo máximo (s) que uma amostra espera pelo replay
+        :param mode: "copy" (COPY FROM STDIN) ou "values" (INSERT multi-linha)
+        :param spool_dir: diretório do spool (padrão: spool.DEFAULT_DIR)
+        :param batch_size: máximo de amostras por transação no replay
+        :param fsync_interval: intervalo (s) entre msync do spool
         """
-        self._conn = get_connection()
-        self._cur = self._conn.cursor() if self._conn else None
-        self._buffer = []
+        if mode not in ("copy", "values"):
+            raise ValueError(f"Modo de ingestão inválido: {mode}")
+        self._spool = Spool(spool_dir or DEFAULT_SPOOL_DIR)
+        self._checkpoint_name = f"spool:{self._spool.spool_id}"
+        self._aligned = False     # spool já conferido com o checkpoint do banco
+        self._pool = None
+        self._conn = None
+        self._cur = None
         self._buffer_size = buffer_size
-        if self._cur:
-            self._ensure_tables()
-
-    def _ensure_tables(self):
-        ddl = [
-            """
-            CREATE TABLE IF NOT EXISTS mouse_movements (
-                id        SERIAL PRIMARY KEY,
-                timestamp TIMESTAMP NOT NULL,
-                dx        INTEGER   NOT NULL,
-                dy        INTEGER   NOT NULL,
-                L         INTEGER   NOT NULL,
-                U         INTEGER   NOT NULL,
-                R         INTEGER   NOT NULL,
-                D         INTEGER   NOT NULL,
-                X         INTEGER   NOT NULL
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS mouse_clicks (
-                id        SERIAL      PRIMARY KEY,
-                timestamp TIMESTAMP   NOT NULL,
-                dx        INTEGER     NOT NULL,
-                dy        INTEGER     NOT NULL,
-                action    VARCHAR(10) NOT NULL
-            );
-            """
-        ]
-        for stmt in ddl:
-            self._cur.execute(stmt)
-        self._conn.commit()
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._fsync_interval = fsync_interval
+        self._mode = mode
+        self._clocks: dict[str | None, DeviceClock] = {}
+        self._buttons = ButtonTracker()
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        _spool_pending.set_function(lambda: self._spool.pending)
 
-    def insert_from_json(self, json_payload: str):
+    def _connect(self) -> bool:
         """
-        Parseia JSON com chaves dx,dy,L,U,R,D,X,
-        adiciona ao buffer e faz batch de movimentos;
-        insere clique imediatamente.
+        Pega do pool a conexão do replay (mantida enquanto funcionar) e
+        alinha o spool com a posição confirmada no banco.
         """
-        if not self._cur:
-            return
+        conn_pool = get_pool()
+        if conn_pool is None:
+            return False
+        try:
+            conn = conn_pool.getconn()
+        except (psycopg2.Error, PoolError) as e:
+            log.error("❌ Falha ao obter conexão para o replay do spool: %s", e, every=RECONNECT_MAX)
+            return False
+        try:
+            with conn.cursor() as cur:
+                ensure_schema(cur)
+                ensure_checkpoint_table(cur)
+                committed, _ = load_checkpoint(cur, self._checkpoint_name)
+                # Botões segurados continuam segurados: o estado vem das bordas já gravadas
+                self._buttons.restore(cur)
+            conn.commit()
+        except psycopg2.Error as e:
+            log.error("❌ Falha ao preparar o banco para o replay do spool: %s", e, every=RECONNECT_MAX)
+            conn_pool.putconn(conn, close=True)
+            return False
+        self._pool = conn_pool
+        self._conn, self._cur = conn, conn.cursor()
+        if not self._aligned and committed > self._spool.recovered:
+            # O banco já viu lsns que o spool perdeu (queda do sistema antes do
+            # msync): recomeça com outra identidade para não pular amostras novas.
+            # Tudo o que sobreviveu à queda já está no banco: só os lsns anexados
+            # depois da abertura são drenados (sob o novo marcador)
+            self._spool.renew_id()
+            self._checkpoint_name = f"spool:{self._spool.spool_id}"
+            self._spool.commit(self._spool.recovered)
+        else:
+            # Lotes gravados antes de uma queda podem não ter chegado ao marcador local
+            self._spool.commit(committed)
+        self._aligned = True
+        return True
+
+    def _disconnect(self, broken: bool = True):
+        """Devolve a conexão do replay ao pool (fechando-a se estiver quebrada)."""
+        if self._conn is not None:
+            self._pool.putconn(self._conn, close=broken)
+        self._conn = self._cur = None
+
+    @property
+    def pending(self) -> int:
+        """Amostras no spool ainda não gravadas no banco."""
+        return self._spool.pending
+
+    def clock(self, device_id: str | None) -> DeviceClock:
+        """Relógio (offset, deriva, perdas) de um dispositivo."""
+        clock = self._clocks.get(device_id)
+        if clock is None:
+            clock = self._clocks[device_id] = DeviceClock()
+        return clock
+
+    def clock_stats(self) -> dict:
+        return {device_id: clock.stats() for device_id, clock in self._clocks.items()}
+
+    def button_stats(self) -> dict:
+        return self._buttons.stats()
 
+    def insert_from_json(self, json_payload: str, device_id: str | None = None,
+                         received_at: float | None = None):
+        """
+        Parseia JSON com chaves dx,dy,L,U,R,D,X (e, opcionalmente, t = relógio
+        do dispositivo em µs e s = sequência) e anexa a amostra ao spool;
+        as bordas dos botões são gravadas pelo replay junto com os movimentos.
+        :param device_id: identificador do dispositivo de origem (endereço BLE)
+        :param received_at: instante de chegada (time.time()); padrão: agora
+        """
         try:
             data = json.loads(json_payload)
-        except json.JSONDecodeError:
-            print(f"❌ JSON inválido: {json_payload}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            _parse_errors.inc()
+            log.warning("❌ JSON inválido: %r", json_payload, every=LOG_EVERY)
             return
 
-        ts = datetime.now()
+        if received_at is None:
+            received_at = time.time()
         try:
             dx = int(data.get("dx", 0))
             dy = int(data.get("dy", 0))
@@ -68,55 +261,600 @@ class MouseMovementInserter:
             R  = int(data.get("R",  0))
             D  = int(data.get("D",  0))
             X  = int(data.get("X",  0))
+            device_ts = int(data["t"]) if "t" in data else None
+            seq = int(data["s"]) if "s" in data else None
         except (ValueError, TypeError) as e:
-            print(f"❌ Falha ao converter tipos: {e}")
+            _parse_errors.inc()
+            log.warning("❌ Falha ao converter tipos: %s", e, every=LOG_EVERY)
+            return
+
+        if device_ts is None:
+            ts = datetime.fromtimestamp(received_at)
+        else:
+            with self._lock:
+                host, device_ts, seq = self.clock(device_id).observe_one(device_ts, seq, received_at)
+            ts = datetime.fromtimestamp(host)
+
+        if self._append_sample(ts, dx, dy, L, U, R, D, X, device_id, device_ts, seq):
+            _samples["json"].inc()
+
+    def insert_frames(self, records: np.ndarray, device_id: str | None = None,
+                      received_at: float | None = None):
+        """
+        Anexa ao spool um lote de quadros binários já decodificados
+        (packet_format.FRAME_DTYPE), sem parse nem laço por amostra. O
+        timestamp de cada amostra vem do relógio do dispositivo, convertido
+        para o horário do host pelo DeviceClock.
+        """
+        if not len(records):
             return
+        if received_at is None:
+            received_at = time.time()
+        buttons = unpack_buttons(records["buttons"])
+        with self._lock:
+            host, device_us, seqs = self.clock(device_id).observe(
+                records["device_ts"], records["seq"], received_at)
+        samples = make_records(len(records))
+        samples["ts"] = _local_us(host)
+        samples["dx"] = records["dx"]
+        samples["dy"] = records["dy"]
+        for name in ("L", "U", "R", "D", "X"):
+            samples[name] = buttons[name]
+        samples["device"] = self._spool.device_index(device_id)
+        samples["device_ts"] = device_us
+        samples["seq"] = seqs
+        self._append(samples)
+        _samples["frames"].inc(len(samples))
+
+    def insert_packets(self, items):
+        """
+        Sink do IngestPipeline: aceita linhas JSON (str/bytes) e lotes de
+        quadros binários (np.ndarray) misturados, na ordem recebida, cada um
+        opcionalmente como tupla (device_id, item) ou
+        (device_id, item, instante de chegada).
+        """
+        with self._lock:
+            for item in items:
+                device_id = received_at = None
+                if isinstance(item, tuple):
+                    device_id, item, *rest = item
+                    received_at = rest[0] if rest else None
+                if isinstance(item, np.ndarray):
+                    self.insert_frames(item, device_id, received_at)
+                else:
+                    self.insert_from_json(item, device_id, received_at)
+
+    def _append_sample(self, ts, dx, dy, L, U, R, D, X, device_id=None,
+                       device_ts=None, seq=None) -> bool:
+        sample = make_records(1)
+        try:
+            sample["ts"] = ts
+            sample["dx"], sample["dy"] = dx, dy
+            sample["L"], sample["U"], sample["R"], sample["D"], sample["X"] = L, U, R, D, X
+            sample["device_ts"] = 0 if device_ts is None else device_ts
+            sample["seq"] = 0 if seq is None else seq
+        except OverflowError as e:
+            _parse_errors.inc()
+            log.warning("❌ Valor fora do intervalo: %s", e, every=LOG_EVERY)
+            return False
+        sample["device"] = self._spool.device_index(device_id)
+        sample["flags"] = ((FLAG_NO_DEVICE_TS if device_ts is None else 0)
+                           | (FLAG_NO_SEQ if seq is None else 0))
+        self._append(sample)
+        return True
+
+    def _append(self, samples: np.ndarray):
+        self._spool.append(samples)
+        if self._spool.pending >= self._buffer_size:
+            self._wake.set()
+
+    def _rows(self, records: np.ndarray) -> list:
+        """Registros do spool como tuplas na ordem de MOVEMENT_COLUMNS."""
+        flags = records["flags"]
+        device_ts = np.where(flags & FLAG_NO_DEVICE_TS, None, records["device_ts"].astype(object))
+        seq = np.where(flags & FLAG_NO_SEQ, None, records["seq"].astype(object))
+        columns = [records["ts"].tolist()]
+        columns += [records[name].tolist() for name in ("dx", "dy", "L", "U", "R", "D", "X")]
+        columns += [self._spool.device_ids(records["device"]), device_ts.tolist(), seq.tolist()]
+        return list(zip(*columns))
+
+    def _button_events(self, records: np.ndarray) -> tuple[list, dict]:
+        """Bordas dos botões no lote e o estado seguinte de cada dispositivo."""
+        bits = button_bits(records)
+        devices = records["device"]
+        indexes = np.unique(devices)
+        events, states = [], {}
+        for index, device_id in zip(indexes.tolist(), self._spool.device_ids(indexes)):
+            sel = slice(None) if len(indexes) == 1 else devices == index
+            found, states[device_id] = self._buttons.detect(
+                device_id, records["ts"][sel], bits[sel], records["dx"][sel], records["dy"][sel])
+            events += found
+        return events, states
 
-        # Buffer de movimentos
-        self._buffer.append((ts, dx, dy, L, U, R, D, X))
-        print(f"📥 Buffer: {len(self._buffer)}/{self._buffer_size}")
+    def _write(self, records: np.ndarray, keep: bool = True):
+        """
+        Grava um lote do spool numa transação: movimentos, bordas dos
+        botões, NOTIFY e a nova posição do spool. Com keep=False só avança
+        a posição (descarta o lote).
+        """
+        cur = self._cur
+        last_lsn = int(records["lsn"][-1])
+        start = time.perf_counter()
+        states = {}
+        # Cria as partições dos próximos dias quando necessário
+        maintain(cur)
+        if keep:
+            rows = self._rows(records)
+            cur.execute(_INGEST_LOCK)
+            if self._mode == "copy":
+                # COPY não tem RETURNING: os ids são reservados antes e gravados junto
+                ids = reserve_ids(cur, len(rows))
+                copy_movements(cur, rows, ids=ids)
+                first, last = ids[0], ids[-1]
+            else:
+                sql = (f"INSERT INTO mouse_movements ({', '.join(MOVEMENT_COLUMNS)}) "
+                       "VALUES %s RETURNING id")
+                ids = [r[0] for r in execute_values(cur, sql, rows, page_size=len(rows), fetch=True)]
+                first, last = min(ids), max(ids)
+            events, states = self._button_events(records)
+            if events:
+                execute_values(cur, f"INSERT INTO mouse_clicks ({', '.join(CLICK_COLUMNS)}) VALUES %s",
+                               events, page_size=len(events))
+                _button_events_total.inc(len(events))
+            # Entregue pelo PostgreSQL só no commit, junto com as linhas
+            cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, f"{first}-{last}"))
+        save_checkpoint(cur, self._checkpoint_name, last_lsn)
+        self._conn.commit()
+        self._buttons.commit(states)
+        self._spool.commit(last_lsn)
+        if keep:
+            _replay_seconds.observe(time.perf_counter() - start)
+            _replay_rows.observe(len(records))
 
-        if len(self._buffer) >= self._buffer_size:
-            self._flush_buffer()
+    def _replay_batch(self, records: np.ndarray):
+        """
+        Grava um lote; erros de dados (não de conexão) dividem o lote ao
+        meio até isolar a amostra com problema, que é descartada sem
+        travar o resto do spool.
+        """
+        try:
+            self._write(records)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            raise
+        except Exception as e:
+            self._conn.rollback()
+            _replay_errors.inc()
+            if len(records) == 1:
+                _dropped.inc()
+                log.error("❌ Amostra lsn %d descartada do spool: %s", int(records["lsn"][0]), e,
+                          every=LOG_EVERY)
+                self._write(records, keep=False)
+                return
+            half = len(records) // 2
+            self._replay_batch(records[:half])
+            self._replay_batch(records[half:])
 
-        # Clique X imediato
-        if X == 1:
+    def replay(self) -> int:
+        """
+        Drena o spool para o banco enquanto houver amostras e conexão;
+        retorna quantas foram gravadas.
+        """
+        done = 0
+        while self._spool.pending:
+            if self._conn is None and not self._connect():
+                break
+            records = self._spool.read(self._batch_size)
             try:
-                self._cur.execute(
-                    "INSERT INTO mouse_clicks (timestamp, dx, dy, action) VALUES (%s, %s, %s, %s)",
-                    (ts, dx, dy, 'press')
-                )
-                self._conn.commit()
-            except Exception as e:
-                print(f"❌ Erro no insert_click: {e}")
-
-    def _flush_buffer(self):
-        if not self._buffer:
+                self._replay_batch(records)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # Banco fora do ar: as amostras ficam no spool para a próxima tentativa
+                _replay_errors.inc()
+                log.error("❌ Conexão perdida no replay do spool (%d pendentes): %s",
+                          self._spool.pending, e, every=RECONNECT_MAX)
+                self._disconnect()
+                break
+            done += len(records)
+            log.debug("✅ Batch insert de %d movimentos", len(records))
+        return done
+
+    def _run(self):
+        """
+        Thread de replay: drena o spool a cada flush_interval (ou antes,
+        quando há buffer_size amostras pendentes), faz msync a cada
+        fsync_interval e apaga os segmentos já gravados. Sem banco, tenta
+        reconectar com espera crescente (até RECONNECT_MAX segundos).
+        """
+        delay = self._flush_interval
+        next_try = last_sync = time.monotonic()
+        while not self._stop.is_set():
+            # Acorda ao menos a cada fsync_interval, mesmo com o banco fora do ar
+            self._wake.wait(min(delay, self._fsync_interval))
+            woke = self._wake.is_set()
+            self._wake.clear()
+            now = time.monotonic()
+            if now >= next_try or (woke and self._conn is not None):
+                try:
+                    self.replay()
+                except Exception as e:
+                    _replay_errors.inc()
+                    log.error("❌ Erro no replay do spool: %s", e, every=RECONNECT_MAX)
+                    self._disconnect()
+                if self._conn is None and self._spool.pending:
+                    delay = min(delay * 2, RECONNECT_MAX)
+                else:
+                    delay = self._flush_interval
+                next_try = now + delay
+            if now - last_sync >= self._fsync_interval:
+                self._spool.sync()
+                self._spool.compact()
+                last_sync = now
+
+    def close(self):
+        """Para o replay, tenta drenar o que restou e fecha o spool (o resto fica para a próxima execução)."""
+        if self._stop.is_set():
             return
-        sql = ("INSERT INTO mouse_movements "
-               "(timestamp, dx, dy, L, U, R, D, X) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)")
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
         try:
-            self._cur.executemany(sql, self._buffer)
-            self._conn.commit()
-            print(f"✅ Batch insert de {len(self._buffer)} movimentos")
+            self.replay()
         except Exception as e:
-            print(f"❌ Erro no batch insert: {e}")
+            log.error("❌ Erro no replay do spool: %s", e)
+        self._disconnect(broken=False)
+        self._spool.compact()
+        _spool_pending.set_function(None)
+        _spool_pending.set(self._spool.pending)
+        self._spool.close()
+
+# Instância padrão, criada no primeiro uso: importar este módulo (ex.: pelo
+# analisador) não abre o spool nem inicia o replay
+_inserter = None
+_inserter_lock = threading.Lock()
+
+def default_inserter() -> MouseMovementInserter:
+    global _inserter
+    with _inserter_lock:
+        if _inserter is None:
+            _inserter = MouseMovementInserter()
+        return _inserter
+
+def insert_local_from_json(json_payload: str, device_id: str | None = None,
+                           received_at: float | None = None):
+    default_inserter().insert_from_json(json_payload, device_id, received_at)
+
+def insert_local_packets(items):
+    default_inserter().insert_packets(items)
+
+def close_inserter():
+    if _inserter is not None:
+        _inserter.close()
+
+def clock_stats() -> dict:
+    return _inserter.clock_stats() if _inserter is not None else {}
+
+class BatchWriter:
+    """
+    Escritor em lote genérico sobre o pool de conexões: acumula linhas e
+    grava com um único INSERT multi-linha (execute_values) quando o buffer
+    atinge flush_size, a cada flush_interval segundos e no close().
+    Subclasses definem `sql` (com um único placeholder VALUES %s) e, com
+    supports_checkpoint, gravam um checkpoint na mesma transação das linhas
+    (_save_checkpoint). _prepare() roda no início de cada transação de gravação.
+
+    Com `blocking` (padrão), add_rows() grava o lote cheio na própria thread
+    de quem chama, o que segura um produtor mais rápido que o banco. Produtores
+    que não podem esperar o banco (callbacks de entrada, leitura da UART)
+    usam blocking = False: add_rows() só enfileira e acorda a thread do
+    writer, a única que grava.
+
+    Sem conexão, o lote volta para o buffer, limitado a max_rows linhas: além
+    disso as mais antigas são descartadas (e contadas); o mesmo vale para
+    erros que recusam o lote inteiro (_BATCH_ERRORS). Um erro de dados
+    divide o lote ao meio, em transações separadas, até isolar as linhas com
+    problema, que são descartadas (e registradas); o checkpoint vai com a
+    última parte.
+    """
+    sql = None
+    template = None
+    blocking = True
+    supports_checkpoint = False
+
+    def __init__(self, flush_size: int = 500, flush_interval: float = 1.0,
+                 max_rows: int | None = 100_000):
+        """
+        :param flush_size: número de linhas que dispara a gravação
+        :param flush_interval: intervalo máximo (s) entre gravações
+        :param max_rows: máximo de linhas no buffer com o banco fora do ar (None: sem limite)
+        """
+        self._rows = []
+        self._max_rows = max_rows
+        self._checkpoint = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # uma transação por vez, na ordem dos lotes
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        name = type(self).__name__
+        self._queued = gauge("pointertrack_writer_queued_rows", "Linhas aguardando gravação", writer=name)
+        self._flush_seconds = histogram("pointertrack_writer_flush_seconds",
+                                        "Duração das transações de gravação em lote", writer=name)
+        self._flush_rows = histogram("pointertrack_writer_flush_rows", "Linhas por transação",
+                                     SIZE_BUCKETS, writer=name)
+        self._errors = counter("pointertrack_writer_errors_total", "Falhas de gravação em lote",
+                               writer=name)
+        self._dropped = counter("pointertrack_writer_dropped_total",
+                                "Linhas descartadas da gravação em lote (erro de dados ou buffer cheio)",
+                                writer=name)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._retry = False   # último flush devolveu linhas ao buffer (sem banco)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add_rows(self, rows, checkpoint=None):
+        """
+        Enfileira linhas; `checkpoint`, se informado, é persistido junto com
+        elas (e com tudo o que foi enfileirado antes). Com o buffer cheio,
+        grava aqui mesmo (blocking) ou só acorda a thread do writer.
+        """
+        if checkpoint is not None and not self.supports_checkpoint:
+            raise ValueError(f"{type(self).__name__} não suporta checkpoint")
+        with self._lock:
+            self._rows.extend(rows)
+            if checkpoint is not None:
+                self._checkpoint = checkpoint
+            excess = self._trim()
+            queued = len(self._rows)
+            full = queued >= self._flush_size
+        self._queued.set(queued)
+        self._log_trimmed(excess)
+        if full:
+            if self.blocking:
+                self.flush()
+            else:
+                self._wake.set()
+
+    def flush(self) -> int:
+        """
+        Grava as linhas pendentes numa única transação (ou em partes, se
+        houver erro de dados); retorna quantas foram gravadas.
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        self._retry = False
+        with self._lock:
+            rows, self._rows = self._rows, []
+            checkpoint, self._checkpoint = self._checkpoint, None
+        if not rows and checkpoint is None:
+            return 0
+
+        conn_pool = get_pool()
+        if conn_pool is None:
+            # Sem banco: devolve as linhas para a próxima tentativa
+            self._requeue(rows, checkpoint)
+            return 0
+
+        try:
+            conn = conn_pool.getconn()
+        except (psycopg2.Error, PoolError) as e:
+            # Banco fora do ar ou pool esgotado: devolve as linhas para a próxima tentativa
+            self._errors.inc()
+            log.error("❌ Sem conexão para a gravação em lote (%s): %s", type(self).__name__, e,
+                      every=LOG_EVERY)
+            self._requeue(rows, checkpoint)
+            return 0
+        # Pilha de pedaços a gravar (o próximo no fim); o checkpoint vai com o último
+        pieces = [rows]
+        written = 0
+        broken = False
+        try:
+            while pieces:
+                piece = pieces.pop()
+                final = not pieces
+                try:
+                    self._commit_rows(conn, piece, checkpoint if final else None)
+                    written += len(piece)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError, *_BATCH_ERRORS):
+                    pieces.append(piece)
+                    raise
+                except Exception as e:
+                    # Erro de dados: divide o pedaço ao meio até isolar a linha com
+                    # problema, que é descartada sem perder o resto nem o checkpoint
+                    conn.rollback()
+                    self._errors.inc()
+                    if len(piece) > 1:
+                        half = len(piece) // 2
+                        pieces += [piece[half:], piece[:half]]
+                    elif piece:
+                        self._dropped.inc()
+                        log.error("❌ Linha descartada na gravação em lote (%s): %s | %r",
+                                  type(self).__name__, e, piece[0], every=LOG_EVERY)
+                        if final and checkpoint is not None:
+                            pieces.append([])
+                    else:
+                        log.error("❌ Erro ao gravar o checkpoint (%s): %s", type(self).__name__, e)
+            return written
+        except _BATCH_ERRORS as e:
+            # A conexão está boa, mas nenhuma linha entraria: tenta o lote de novo depois
+            conn.rollback()
+            self._errors.inc()
+            log.error("❌ Lote recusado pelo banco (%s): %s", type(self).__name__, e, every=LOG_EVERY)
+            self._requeue([row for piece in reversed(pieces) for row in piece], checkpoint)
+            return written
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            # Falha de conexão: o que não foi confirmado volta para a próxima tentativa
+            self._errors.inc()
+            log.error("❌ Conexão perdida na gravação em lote (%s): %s", type(self).__name__, e,
+                      every=LOG_EVERY)
+            self._requeue([row for piece in reversed(pieces) for row in piece], checkpoint)
+            broken = True
+            return written
         finally:
-            self._buffer.clear()
+            self._queued.set(len(self._rows))
+            conn_pool.putconn(conn, close=broken)
+
+    def _commit_rows(self, conn, rows, checkpoint):
+        """Uma transação: _prepare(), as linhas e o checkpoint (se houver)."""
+        start = time.perf_counter()
+        with conn.cursor() as cur:
+            self._prepare(cur)
+            if rows:
+                self._write(cur, rows)
+            if checkpoint is not None:
+                self._save_checkpoint(cur, checkpoint)
+        conn.commit()
+        self._flush_seconds.observe(time.perf_counter() - start)
+        self._flush_rows.observe(len(rows))
+
+    def _requeue(self, rows, checkpoint):
+        self._retry = True
+        with self._lock:
+            self._rows[:0] = rows
+            if self._checkpoint is None:
+                self._checkpoint = checkpoint
+            excess = self._trim()
+        self._log_trimmed(excess)
+
+    def _trim(self) -> int:
+        """Descarta as linhas mais antigas além de max_rows (com self._lock); retorna quantas."""
+        if self._max_rows is None or len(self._rows) <= self._max_rows:
+            return 0
+        excess = len(self._rows) - self._max_rows
+        del self._rows[:excess]
+        self._dropped.inc(excess)
+        return excess
+
+    def _log_trimmed(self, excess: int):
+        if excess:
+            log.error("❌ Buffer cheio (%s): %d linhas mais antigas descartadas",
+                      type(self).__name__, excess, every=LOG_EVERY)
+
+    def _prepare(self, cur):
+        # Esquema e partições das tabelas gerenciadas (barato após a primeira vez)
+        maintain(cur)
+
+    def _write(self, cur, rows):
+        execute_values(cur, self.sql, rows, template=self.template, page_size=len(rows))
+
+    def _save_checkpoint(self, cur, checkpoint):
+        """Grava o checkpoint na transação das linhas (subclasses com supports_checkpoint)."""
+
+    def _run(self):
+        while not self._stop.is_set():
+            # A cada flush_interval ou quando um produtor não bloqueante enche o buffer
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.flush()
+            if self._retry:
+                # Sem banco: espera o intervalo antes da próxima tentativa, mesmo com o buffer cheio
+                self._stop.wait(self._flush_interval)
 
     def close(self):
-        if self._cur:
-            self._flush_buffer()
-            try:
-                self._cur.close()
-                self._conn.close()
-            except:
-                pass
+        """Para o flush periódico e grava o que restar no buffer."""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+
+
+class AnalysisWriter(BatchWriter):
+    """
+    Grava análises em mouse_analyse em lote. Assim como insert_analysis,
+    ignora registros sem deslocamento. O checkpoint (last_id, pending_ids)
+    vai para analysis_checkpoint na mesma transação, sob o nome
+    `checkpoint_name`. Análises de um movimento já analisado são ignoradas
+    (chave única movement_ts, movement_id), então regravar um lote é seguro.
+    As linhas de fato inseridas atualizam os rollups (rollups.py) na mesma
+    transação.
+    """
+    sql = (
+        "INSERT INTO mouse_analyse (movement_ts, device_id, movement_id, "
+        + ", ".join(ANALYSIS_COLUMNS) + ") VALUES %s ON CONFLICT DO NOTHING "
+        "RETURNING movement_ts, device_id, " + ", ".join(ANALYSIS_COLUMNS)
+    )
+    supports_checkpoint = True
+    # Amostras sem dispositivo são agrupadas como '' e gravadas como NULL
+    template = "(%s, NULLIF(%s, ''), %s" + ", %s" * len(ANALYSIS_COLUMNS) + ")"
+
+    def __init__(self, flush_size: int = 500, flush_interval: float = 1.0,
+                 checkpoint_name: str = "analyzer"):
+        self._checkpoint_name = checkpoint_name
+        super().__init__(flush_size, flush_interval)
+
+    def write(self, movement_ts: datetime, *values: float, device_id: str | None = None,
+              movement_id: int | None = None):
+        """Enfileira uma análise (valores na ordem de ANALYSIS_COLUMNS)."""
+        if not any(values[:5]):
+            return
+        self.add_rows([(movement_ts, device_id, movement_id, *values)])
+
+    def write_batch(self, batch: AnalysisBatch, checkpoint: tuple | None = None) -> int:
+        """
+        Enfileira um lote colunar; retorna o número de linhas aceitas.
+        :param checkpoint: (last_id, pending_ids) coberto pelo lote
+        """
+        kept = batch.select(batch.nonzero_mask())
+        self.add_rows(kept.rows(), checkpoint=checkpoint)
+        return len(kept)
+
+    def _write(self, cur, rows):
+        inserted = execute_values(cur, self.sql, rows, template=self.template,
+                                  page_size=len(rows), fetch=True)
+        update_rollups_from_rows(cur, inserted)
+
+    def _save_checkpoint(self, cur, checkpoint: tuple):
+        save_checkpoint(cur, self._checkpoint_name, *checkpoint)
+
+
+class SegmentWriter(BatchWriter):
+    """
+    Grava em lote os segmentos de movimento (segmenter.Segment) em
+    mouse_segments. Não bloqueia: o segmentador o chama de dentro dos
+    callbacks de entrada.
+    """
+    sql = "INSERT INTO mouse_segments (" + ", ".join(SEGMENT_COLUMNS) + ") VALUES %s"
+    blocking = False
+
+    def write(self, segment: Segment):
+        """Sink do MovementSegmenter."""
+        self.add_rows([segment[:len(SEGMENT_COLUMNS)]])
+
+
+class FeatureWriter(BatchWriter):
+    """
+    Grava em lote as características de movimento
+    (movement_analysis.MovementFeatures) em mouse_movement_features.
+    Movimentos já gravados (mesmo dispositivo e início, inclusive sem
+    dispositivo) são ignorados.
+    """
+    sql = ("INSERT INTO mouse_movement_features (" + ", ".join(FEATURE_COLUMNS)
+           + ") VALUES %s ON CONFLICT DO NOTHING")
+    # Amostras sem dispositivo são agrupadas como '' e gravadas como NULL
+    template = "(NULLIF(%s, '')" + ", %s" * (len(FEATURE_COLUMNS) - 1) + ")"
+
+    def write(self, features: MovementFeatures):
+        """Sink do MovementFeatureEngine."""
+        self.add_rows([features])
+
+
+class ClickWriter(BatchWriter):
+    """
+    Grava em lote cliques em mouse_clicks (botão, ação e posição absoluta).
+    Não bloqueia: write() roda no callback de clique do pynput.
+    """
+    sql = "INSERT INTO mouse_clicks (timestamp, dx, dy, action, device_id, button, x, y) VALUES %s"
+    blocking = False
+
+    def __init__(self, flush_size: int = 50, flush_interval: float = 0.5):
+        super().__init__(flush_size, flush_interval)
+
+    def write(self, timestamp: datetime, button: str, action: str, x: int, y: int,
+              device_id: str | None = None):
+        self.add_rows([(timestamp, 0, 0, action, device_id, button, x, y)])
 
-# Instância padrão e atalhos
-inserter = MouseMovementInserter()
-insert_local_from_json = inserter.insert_from_json
-close_inserter = inserter.close
 
 def insert_analysis(movement_ts: datetime,
                     vel_dir: float, vel_esq: float,
@@ -133,12 +871,16 @@ def insert_analysis(movement_ts: datetime,
     """
     # filtra movimentos sem deslocamento
     if vel_dir == 0 and vel_esq == 0 and vel_cima == 0 and vel_baixo == 0 and vel_euclid == 0:
-        print(f"⏭ Análise ignorada para movimento em {movement_ts}: sem deslocamento.")
+        log.debug("⏭ Análise ignorada para movimento em %s: sem deslocamento.", movement_ts)
         return
 
-    conn = get_connection()
-    if conn is None:
-        return
+    with connection() as conn:
+        if conn is None:
+            return
+        _insert_analysis(conn, movement_ts, vel_dir, vel_esq, vel_cima, vel_baixo, vel_euclid,
+                         acel_dir, acel_esq, acel_cima, acel_baixo, acel_euclid)
+
+def _insert_analysis(conn, movement_ts, *values):
     cur = conn.cursor()
     try:
         query = (
@@ -146,15 +888,11 @@ def insert_analysis(movement_ts: datetime,
             "vel_euclidiana, acel_direita, acel_esquerda, acel_cima, acel_baixo, acel_euclidiana) "
             "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
         )
-        cur.execute(query, (
-            movement_ts,
-            vel_dir, vel_esq, vel_cima, vel_baixo, vel_euclid,
-            acel_dir, acel_esq, acel_cima, acel_baixo, acel_euclid
-        ))
+        cur.execute(query, (movement_ts, *values))
         conn.commit()
-        print(f"✔ Análise inserida para movimento em {movement_ts}")
+        log.debug("✔ Análise inserida para movimento em %s", movement_ts)
     except Exception as e:
-        print(f"❌ Erro ao inserir análise: {e}")
+        conn.rollback()
+        log.error("❌ Erro ao inserir análise: %s", e)
     finally:
         cur.close()
-        conn.close()
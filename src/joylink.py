@@ -1,45 +1,288 @@
-import psycopg2
-import serial
-
-# Conectar ao PostgreSQL
-conn = psycopg2.connect(
-    dbname="joylink_db",
-    user="pi",
-    password="raspberry",
-    host="localhost"
-)
-cursor = conn.cursor()
-
-# Criar a tabela
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS joystick_data (
-    id SERIAL PRIMARY KEY,
-    timestamp TIMESTAMP DEFAULT NOW(),
-    analog_x INT,
-    analog_y INT,
-    button_states JSONB
-)
-""")
-conn.commit()
-
-# Configuração da UART
-ser = serial.Serial("/dev/serial0", 115200, timeout=1)
-
-while True:
+# joylink.py
+
+import argparse
+import io
+import json
+import os
+import select
+import stat
+import threading
+import time
+from datetime import datetime
+from framing import LineFramer
+from insert_local import BatchWriter
+from utils import config
+from utils.logger import counter, get_logger, start_exporters
+
+# Ingestão do joystick serial (Raspberry Pi, UART a 115200 baud).
+#
+# O firmware envia linhas "A0=512,A1=498,B0=1,B1=0,...". Uma thread
+# (JoyLinkReader) lê a fonte em blocos, separa as linhas com o LineFramer,
+# converte cada uma numa linha da tabela e entrega lotes ao
+# JoystickWriter, que grava com um único COPY por lote (por tamanho ou
+# por tempo). A thread de leitura só enfileira: toda gravação roda na
+# thread do writer, então um banco lento ou fora do ar nunca segura a
+# leitura nem deixa a UART transbordar. Sem banco, o writer guarda até
+# max_rows linhas; além disso descarta as mais antigas e as conta em
+# pointertrack_writer_dropped_total{writer="JoystickWriter"}.
+#
+# Botões: `buttons` guarda o bitfield (bit n = botão Bn) e `button_states`
+# o mesmo estado como JSON ({"B0": 1, ...}). O timestamp é o instante em
+# que o bloco chegou ao host, não o do commit.
+#
+# A fonte pode ser a UART (pyserial), um pty ou um arquivo de captura,
+# para testes e benchmarks sem hardware.
+
+DEFAULT_PORT = "/dev/serial0"
+BAUDRATE = 115200
+CHUNK_SIZE = 4096
+# Linhas guardadas com o banco fora do ar (~100 s a 1 kHz)
+MAX_ROWS = 100_000
+
+TABLE_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id SERIAL PRIMARY KEY,
+        timestamp TIMESTAMP DEFAULT NOW(),
+        analog_x INT,
+        analog_y INT,
+        button_states JSONB
+    );
+    """,
+    "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS buttons INTEGER;  -- bit n = botão Bn",
+]
+COLUMNS = ("timestamp", "analog_x", "analog_y", "buttons", "button_states")
+
+log = get_logger("joylink")
+_rows = counter("pointertrack_joylink_rows_total", "Linhas do joystick enviadas para gravação")
+_invalid = counter("pointertrack_joylink_invalid_total", "Linhas do joystick descartadas")
+_bytes = counter("pointertrack_joylink_bytes_total", "Bytes lidos da porta do joystick")
+
+
+def parse_line(line: bytes, timestamp: datetime) -> tuple | None:
+    """
+    Converte uma linha do firmware numa tupla na ordem de COLUMNS;
+    None se faltar A0/A1 ou algum valor não for inteiro.
+    """
+    fields = {}
+    for item in line.decode("ascii", errors="ignore").split(","):
+        key, sep, value = item.partition("=")
+        if sep:
+            fields[key.strip()] = value
     try:
-        line = ser.readline().decode("utf-8").strip()
-        if line:
-            data = dict(item.split("=") for item in line.split(","))
-            analog_x = int(data["A0"])
-            analog_y = int(data["A1"])
-            button_states = {key: int(value) for key, value in data.items() if key.startswith("B")}
-
-            cursor.execute(
-                "INSERT INTO joystick_data (analog_x, analog_y, button_states) VALUES (%s, %s, %s)",
-                (analog_x, analog_y, str(button_states))
-            )
-            conn.commit()
-            print(f"Salvo: {analog_x}, {analog_y}, {button_states}")
-
-    except Exception as e:
-        print(f"Erro: {e}")
+        analog_x = int(fields.pop("A0"))
+        analog_y = int(fields.pop("A1"))
+        states = {key: int(value) for key, value in fields.items()
+                  if key.startswith("B") and key[1:].isdigit()}
+    except (KeyError, ValueError):
+        return None
+    buttons = 0
+    for key, value in states.items():
+        if value:
+            buttons |= 1 << int(key[1:])
+    return (timestamp, analog_x, analog_y, buttons, json.dumps(states, separators=(",", ":")))
+
+
+def _csv_json(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+class JoystickWriter(BatchWriter):
+    """
+    Grava em lote amostras do joystick com COPY FROM STDIN (CSV). Não
+    bloqueia: add_rows() roda na thread de leitura da UART.
+    """
+    blocking = False
+
+    def __init__(self, flush_size: int = 2000, flush_interval: float = 0.5,
+                 table: str = "joystick_data", max_rows: int = MAX_ROWS):
+        self.table = table
+        self._ready = False
+        super().__init__(flush_size, flush_interval, max_rows)
+
+    def _prepare(self, cur):
+        # Só a tabela do joystick; não cria o esquema do mouse neste banco.
+        # Confirmada numa transação própria: se o primeiro lote for recusado,
+        # o rollback dele não desfaz a tabela
+        if not self._ready:
+            for stmt in TABLE_DDL:
+                cur.execute(stmt.format(table=self.table))
+            cur.connection.commit()
+            self._ready = True
+
+    def _write(self, cur, rows):
+        buf = io.StringIO()
+        buf.writelines(f"{ts.isoformat()},{x},{y},{buttons},{_csv_json(states)}\n"
+                       for ts, x, y, buttons, states in rows)
+        buf.seek(0)
+        cur.copy_expert(f"COPY {self.table} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+class FileSource:
+    """
+    Fonte de bytes sobre um descritor: arquivo de captura, FIFO ou pty.
+    Em terminais o modo é ajustado para raw (sem eco nem edição de linha).
+    """
+
+    def __init__(self, path: str, timeout: float = 1.0):
+        self._fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOCTTY", 0))
+        self._timeout = timeout
+        self._regular = stat.S_ISREG(os.fstat(self._fd).st_mode)
+        if os.isatty(self._fd):
+            import termios
+            import tty
+            # TCSANOW: não descarta o que já chegou antes da abertura
+            tty.setraw(self._fd, termios.TCSANOW)
+
+    def read(self, size: int) -> bytes | None:
+        """Até `size` bytes; b"" se nada chegou no timeout; None no fim da fonte."""
+        if not self._regular:
+            ready, _, _ = select.select([self._fd], [], [], self._timeout)
+            if not ready:
+                return b""
+        try:
+            data = os.read(self._fd, size)
+        except OSError:
+            return None  # pty cujo lado mestre foi fechado
+        return data or None
+
+    def close(self):
+        os.close(self._fd)
+
+
+class SerialSource:
+    """Fonte de bytes sobre a UART (requer pyserial)."""
+
+    def __init__(self, port: str, baudrate: int = BAUDRATE, timeout: float = 1.0):
+        import serial  # opcional: só a leitura da UART real precisa dele
+        self._serial = serial.Serial(port, baudrate, timeout=timeout)
+
+    def read(self, size: int) -> bytes | None:
+        # Lê o que já chegou de uma vez (ou espera 1 byte até o timeout)
+        return self._serial.read(min(self._serial.in_waiting or 1, size))
+
+    def close(self):
+        self._serial.close()
+
+
+def open_source(path: str, baudrate: int = BAUDRATE):
+    """
+    Terminais (UART, pty) via pyserial; arquivos e FIFOs (ou terminais,
+    sem pyserial instalado) via FileSource.
+    """
+    if os.path.exists(path) and stat.S_ISCHR(os.stat(path).st_mode):
+        try:
+            return SerialSource(path, baudrate)
+        except ImportError:
+            log.warning("⚠ pyserial não instalado: lendo a porta como arquivo (sem ajustar o baud rate)")
+    return FileSource(path)
+
+
+class JoyLinkReader:
+    """
+    Thread de leitura: fonte -> LineFramer -> parse_line -> writer.add_rows,
+    um lote por bloco lido. O writer não deve gravar nesta thread
+    (JoystickWriter não bloqueia): a leitura nunca espera o banco.
+    """
+
+    def __init__(self, source, writer, chunk_size: int = CHUNK_SIZE):
+        """
+        :param source: objeto com read(n) (bytes, b"" sem dados, None no fim) e close()
+        :param writer: destino das linhas (JoystickWriter ou qualquer add_rows)
+        :param chunk_size: máximo de bytes por leitura
+        """
+        self._source = source
+        self._writer = writer
+        self._chunk_size = chunk_size
+        self._framer = LineFramer(max_frame=128, accept=lambda frame: b"=" in frame)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+        # Contadores
+        self.bytes = 0
+        self.rows = 0
+        self.invalid = 0
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        parse = parse_line
+        while not self._stop.is_set():
+            data = self._source.read(self._chunk_size)
+            if data is None:
+                break
+            if not data:
+                continue
+            now = datetime.now()
+            self.bytes += len(data)
+            _bytes.inc(len(data))
+            rows = []
+            invalid = 0
+            for frame in self._framer.feed(data):
+                row = parse(frame, now)
+                if row is None:
+                    invalid += 1
+                else:
+                    rows.append(row)
+            if invalid:
+                self.invalid += invalid
+                _invalid.inc(invalid)
+            if rows:
+                self.rows += len(rows)
+                _rows.inc(len(rows))
+                self._writer.add_rows(rows)
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Espera a fonte terminar; retorna True se a thread acabou."""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._source.close()
+
+    def stats(self) -> dict:
+        return {"bytes": self.bytes, "rows": self.rows, "invalid": self.invalid,
+                **self._framer.stats()}
+
+
+def run(port: str = DEFAULT_PORT, baudrate: int = BAUDRATE, flush_size: int = 2000,
+        flush_interval: float = 0.5, table: str = "joystick_data", max_rows: int = MAX_ROWS):
+    """Lê `port` até o fim da fonte (ou Ctrl+C) gravando em `table`."""
+    start_exporters()
+    writer = JoystickWriter(flush_size, flush_interval, table, max_rows)
+    reader = JoyLinkReader(open_source(port, baudrate), writer)
+    reader.start()
+    start = time.perf_counter()
+    try:
+        while not reader.join(5.0):
+            log.info("📊 %s", reader.stats())
+    except KeyboardInterrupt:
+        log.info("\n❎ Encerrado pelo usuário.")
+    finally:
+        reader.stop()
+        writer.close()
+        elapsed = time.perf_counter() - start
+        log.info("✅ %d amostras em %.1fs (%s/s): %s", reader.rows, elapsed,
+                 f"{reader.rows / elapsed:,.0f}", reader.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestão do joystick serial em joystick_data.")
+    parser.add_argument("--porta", default=DEFAULT_PORT, help="UART, pty ou arquivo de captura")
+    parser.add_argument("--baud", type=int, default=BAUDRATE)
+    parser.add_argument("--lote", type=int, default=2000, help="linhas por COPY")
+    parser.add_argument("--intervalo", type=float, default=0.5, help="segundos máximos entre gravações")
+    parser.add_argument("--tabela", default="joystick_data")
+    parser.add_argument("--buffer", type=int, default=MAX_ROWS,
+                        help="linhas guardadas com o banco fora do ar (além disso, descarta as mais antigas)")
+    args = parser.parse_args()
+
+    # Padrões do Raspberry; PG_* do ambiente ou do .env têm precedência
+    config.load()
+    os.environ.setdefault("PG_DB", "joylink_db")
+    os.environ.setdefault("PG_USER", "pi")
+    os.environ.setdefault("PG_PASS", "raspberry")
+    run(args.porta, args.baud, args.lote, args.intervalo, args.tabela, args.buffer)
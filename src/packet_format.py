@@ -0,0 +1,182 @@
+# packet_format.py
+
+import struct
+import numpy as np
+from framing import LineFramer, is_json_object
+
+# Quadro binário de amostra (little-endian, 13 bytes), alternativa ao JSON:
+#
+#   off  tipo  campo
+#     0  u8    sync (0xA5)
+#     1  u16   seq        contador de amostras do firmware (dá a volta em 65536)
+#     3  u32   device_ts  relógio monotônico do dispositivo, em µs
+#     7  i16   dx
+#     9  i16   dy
+#    11  u8    buttons    bit0=L bit1=U bit2=R bit3=D bit4=X
+#    12  u8    checksum   XOR dos bytes 1..11
+#
+# 0xA5 não é ASCII, então um fluxo JSON nunca começa com o byte de sync.
+SYNC = 0xA5
+FRAME_STRUCT = struct.Struct("<BHIhhBB")
+FRAME_SIZE = FRAME_STRUCT.size
+FRAME_DTYPE = np.dtype([
+    ("sync", "u1"),
+    ("seq", "<u2"),
+    ("device_ts", "<u4"),
+    ("dx", "<i2"),
+    ("dy", "<i2"),
+    ("buttons", "u1"),
+    ("checksum", "u1"),
+])
+assert FRAME_DTYPE.itemsize == FRAME_SIZE
+
+BUTTON_BITS = {"L": 0, "U": 1, "R": 2, "D": 3, "X": 4}
+
+
+def pack_buttons(L: int = 0, U: int = 0, R: int = 0, D: int = 0, X: int = 0) -> int:
+    return (L & 1) | (U & 1) << 1 | (R & 1) << 2 | (D & 1) << 3 | (X & 1) << 4
+
+
+def unpack_buttons(buttons: np.ndarray) -> dict:
+    """Separa o campo de bits em arrays 0/1 por botão (chaves L, U, R, D, X)."""
+    buttons = np.asarray(buttons, dtype=np.uint8)
+    return {name: (buttons >> bit) & 1 for name, bit in BUTTON_BITS.items()}
+
+
+def encode_frame(seq: int, device_ts: int, dx: int, dy: int, buttons: int) -> bytes:
+    """Monta um quadro binário (referência para firmware, testes e dispositivos falsos)."""
+    body = FRAME_STRUCT.pack(SYNC, seq & 0xFFFF, device_ts & 0xFFFFFFFF, dx, dy, buttons, 0)
+    checksum = 0
+    for b in body[1:-1]:
+        checksum ^= b
+    return body[:-1] + bytes((checksum,))
+
+
+def encode_frames(seq, device_ts, dx, dy, buttons) -> bytes:
+    """Versão vetorizada de encode_frame para arrays de amostras."""
+    frames = np.zeros(len(seq), dtype=FRAME_DTYPE)
+    frames["sync"] = SYNC
+    frames["seq"] = np.asarray(seq) & 0xFFFF
+    frames["device_ts"] = np.asarray(device_ts) & 0xFFFFFFFF
+    frames["dx"] = dx
+    frames["dy"] = dy
+    frames["buttons"] = buttons
+    raw = frames.view(np.uint8).reshape(-1, FRAME_SIZE)
+    frames["checksum"] = np.bitwise_xor.reduce(raw[:, 1:-1], axis=1)
+    return frames.tobytes()
+
+
+def decode_frames(buf) -> tuple[np.ndarray, int, int]:
+    """
+    Decodifica de uma vez todos os quadros completos de `buf`.
+
+    No caso comum (fluxo alinhado, sem erros) é um único np.frombuffer mais
+    uma verificação vetorizada de sync e checksum. Quadros inválidos fazem
+    o decodificador procurar o próximo byte de sync e continuar dali.
+
+    Retorna (registros FRAME_DTYPE, bytes consumidos, bytes descartados).
+    Bytes de um quadro incompleto no fim de `buf` não são consumidos.
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    blocks = []
+    pos = 0
+    skipped = 0
+    while len(data) - pos >= FRAME_SIZE:
+        n = (len(data) - pos) // FRAME_SIZE
+        block = data[pos:pos + n * FRAME_SIZE].reshape(n, FRAME_SIZE)
+        ok = (block[:, 0] == SYNC) & (np.bitwise_xor.reduce(block[:, 1:-1], axis=1) == block[:, -1])
+        bad = np.flatnonzero(~ok)
+        good = int(bad[0]) if len(bad) else n
+        if good:
+            blocks.append(block[:good])
+            pos += good * FRAME_SIZE
+        if good == n:
+            break
+
+        # Quadro inválido: ressincroniza no próximo byte de sync
+        nxt = np.flatnonzero(data[pos + 1:] == SYNC)
+        if not len(nxt):
+            skipped += len(data) - pos
+            pos = len(data)
+            break
+        skipped += int(nxt[0]) + 1
+        pos += int(nxt[0]) + 1
+
+    if not blocks:
+        return np.empty(0, dtype=FRAME_DTYPE), pos, skipped
+    # Cópia: os registros não podem segurar uma referência ao buffer de entrada
+    raw = blocks[0].copy() if len(blocks) == 1 else np.concatenate(blocks)
+    records = raw.view(FRAME_DTYPE).reshape(-1)
+    return records, pos, skipped
+
+
+class PacketStream:
+    """
+    Decodificador de um fluxo de dispositivo com detecção automática do
+    formato: o primeiro byte significativo decide entre linhas JSON ('{')
+    e quadros binários (SYNC). Firmwares JSON existentes continuam
+    funcionando sem mudança.
+    """
+
+    def __init__(self, max_frame: int = 256):
+        self.mode = None  # "json" | "binary"
+        self._framer = LineFramer(max_frame=max_frame, accept=is_json_object)
+        self._buf = bytearray()
+        self._max_pending = max_frame * FRAME_SIZE
+
+        # Contadores do modo binário
+        self.frames = 0
+        self.discarded_bytes = 0
+
+    def feed(self, data) -> tuple[list[bytes], np.ndarray | None]:
+        """
+        Adiciona um pedaço do fluxo. Retorna (linhas JSON, registros binários);
+        só um dos dois vem preenchido, conforme o modo detectado.
+        """
+        if self.mode is None:
+            data = self._detect(data)
+            if self.mode is None:
+                return [], None
+        if self.mode == "json":
+            return self._framer.feed(data), None
+
+        buf = self._buf
+        buf += data
+        records, consumed, skipped = decode_frames(buf)
+        del buf[:consumed]
+        if len(buf) > self._max_pending:
+            skipped += len(buf)
+            buf.clear()
+        self.frames += len(records)
+        self.discarded_bytes += skipped
+        return [], records
+
+    def _detect(self, data) -> bytes:
+        """Descarta bytes até o início de um quadro reconhecível e fixa o modo."""
+        data = bytes(data)
+        for i, b in enumerate(data):
+            if b == SYNC:
+                self.mode = "binary"
+            elif b == 0x7B:  # '{'
+                self.mode = "json"
+            else:
+                continue
+            self.discarded_bytes += i
+            return data[i:]
+        self.discarded_bytes += len(data)
+        return b""
+
+    def reset(self):
+        """Volta a detectar o formato (ex.: após reconexão do dispositivo)."""
+        self.mode = None
+        self._framer.reset()
+        self._buf.clear()
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "frames": self.frames + self._framer.frames,
+            "discarded_bytes": self.discarded_bytes + self._framer.discarded_bytes,
+            "malformed": self._framer.malformed,
+            "oversized": self._framer.oversized,
+        }
@@ -0,0 +1,294 @@
+# parquet_store.py
+
+import argparse
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+import numpy as np
+from database import connection
+from schema import PARTITIONED, list_partitions
+from utils import config
+from utils.logger import get_logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+except ImportError:  # opcional: só exportar/carregar Parquet precisa dele
+    pa = None
+
+# Cópia colunar das tabelas para análise offline (notebook, scripts).
+#
+# export_day() transmite um dia de uma tabela com COPY (SELECT ...) TO STDOUT
+# direto para o leitor CSV em streaming do pyarrow (memória constante) e
+# grava Parquet particionado no estilo Hive:
+#
+#     <raiz>/<tabela>/day=AAAA-MM-DD/device_id=<id>/part-0.parquet
+#
+# Cada arquivo é ordenado pela coluna de tempo, em row groups de
+# ROW_GROUP_ROWS linhas, para que filtros de tempo pulem row groups pelas
+# estatísticas. Reexportar um dia substitui o diretório dele inteiro.
+#
+# load() lê com mmap, projeção de colunas e filtros empurrados para o
+# scan: dia e dispositivo podam diretórios; o tempo poda row groups.
+
+DEFAULT_ROOT = config.get("PARQUET_ROOT", "data/parquet")
+ROW_GROUP_ROWS = 131_072
+# Valor de partição Hive para device_id NULL
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+log = get_logger("parquet")
+
+# Tipo PostgreSQL (udt_name) -> tipo Arrow
+_ARROW_TYPES = {
+    "int4": "int32",
+    "int8": "int64",
+    "float4": "float32",
+    "float8": "float64",
+    "timestamp": "timestamp[us]",
+    "text": "string",
+    "varchar": "string",
+    "jsonb": "string",   # JSON em texto
+    "_int8": "string",   # arrays em texto ({1,2,3})
+}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow não está instalado (pip install pyarrow)")
+
+
+def table_columns(cur, table: str) -> list[tuple[str, str]]:
+    """(coluna, udt_name) de `table` no schema atual, na ordem da tabela."""
+    cur.execute("""
+        SELECT column_name, udt_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position;
+    """, (table,))
+    return cur.fetchall()
+
+
+def _partition_value(device) -> str:
+    if device is None:
+        return NULL_PARTITION
+    # Ids BLE têm ':'; a codificação URI é a que o pyarrow decodifica na leitura
+    return quote(device, safe="")
+
+
+class _DeviceWriter:
+    """Acumula lotes de um dispositivo e grava row groups de ROW_GROUP_ROWS linhas."""
+
+    def __init__(self, path: str, schema):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._writer = pq.ParquetWriter(path, schema, compression="zstd")
+        self._pending = []
+        self._rows = 0
+
+    def write(self, table):
+        self._pending.append(table)
+        self._rows += table.num_rows
+        if self._rows >= ROW_GROUP_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._writer.write_table(pa.concat_tables(self._pending), row_group_size=ROW_GROUP_ROWS)
+        self._pending, self._rows = [], 0
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def export_day(conn, table: str, day: date, root: str = DEFAULT_ROOT) -> int:
+    """
+    Exporta as linhas de `table` de um dia para Parquet; retorna quantas.
+    Dias sem linhas não mexem no que já foi exportado (a retenção do banco
+    não apaga o arquivo local).
+    """
+    _require_pyarrow()
+    column = PARTITIONED[table]
+    with conn.cursor() as cur:
+        columns = table_columns(cur, table)
+    names = [name for name, _ in columns]
+    column_types = {name: pa.type_for_alias(_ARROW_TYPES.get(udt, "string")) for name, udt in columns}
+    file_schema = pa.schema([(name, column_types[name]) for name in names if name != "device_id"])
+
+    table_dir = os.path.join(root, table)
+    final_dir = os.path.join(table_dir, f"day={day.isoformat()}")
+    # Prefixo '.': ignorado pelo leitor enquanto o dia é escrito
+    tmp_dir = os.path.join(table_dir, f".tmp-day={day.isoformat()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # COPY escreve num pipe numa thread; o leitor CSV consome em lotes
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def copy_out():
+        try:
+            with os.fdopen(write_fd, "wb") as sink, conn.cursor() as cur:
+                sql = cur.mogrify(
+                    f"COPY (SELECT {', '.join(names)} FROM {table} "
+                    f"WHERE {column} >= %s AND {column} < %s ORDER BY device_id, {column}) "
+                    "TO STDOUT WITH (FORMAT csv, HEADER true)",
+                    (day, day + timedelta(days=1)),
+                ).decode()
+                cur.copy_expert(sql, sink)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=copy_out, daemon=True)
+    thread.start()
+    total = 0
+    writer, current = None, None
+    try:
+        with os.fdopen(read_fd, "rb") as source:
+            # Sem threads de leitura antecipada: o pipe já é sequencial, e o
+            # leitor é fechado antes do pipe
+            reader = pacsv.open_csv(
+                source,
+                read_options=pacsv.ReadOptions(use_threads=False),
+                convert_options=pacsv.ConvertOptions(
+                    column_types=column_types,
+                    strings_can_be_null=True,          # campo vazio sem aspas = NULL
+                    quoted_strings_can_be_null=False,  # "" = texto vazio
+                ),
+            )
+            try:
+                for batch in reader:
+                    devices = batch.column(names.index("device_id")).to_numpy(zero_copy_only=False)
+                    # Lote ordenado por dispositivo: corta nas trocas
+                    cuts = np.flatnonzero(devices[1:] != devices[:-1]) + 1
+                    data = pa.Table.from_batches([batch]).drop_columns(["device_id"])
+                    for start, end in zip(np.r_[0, cuts], np.r_[cuts, len(devices)]):
+                        device = devices[start]
+                        if writer is None or device != current:
+                            if writer is not None:
+                                writer.close()
+                            path = os.path.join(tmp_dir, f"device_id={_partition_value(device)}",
+                                                "part-0.parquet")
+                            writer, current = _DeviceWriter(path, file_schema), device
+                        writer.write(data.slice(start, end - start))
+                    total += batch.num_rows
+            finally:
+                reader.close()
+    finally:
+        if writer is not None:
+            writer.close()
+        thread.join()
+    if errors:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise errors[0]
+
+    if total:
+        # Troca o dia inteiro de uma vez
+        old_dir = os.path.join(table_dir, f".old-day={day.isoformat()}")
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(final_dir):
+            os.rename(final_dir, old_dir)
+        os.rename(tmp_dir, final_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return total
+
+
+def export(table: str, first: date | None = None, last: date | None = None,
+           root: str = DEFAULT_ROOT) -> int:
+    """
+    Exporta os dias de `first` a `last` (inclusive). Padrão: do dia da
+    partição mais antiga até hoje. Retorna o total de linhas.
+    """
+    _require_pyarrow()
+    # Um COPY por dia inteiro: sem o statement_timeout padrão
+    with connection(statement_timeout=0) as conn:
+        if conn is None:
+            return 0
+        if first is None:
+            with conn.cursor() as cur:
+                days = [upper - timedelta(days=1) for _, upper in list_partitions(cur, table) if upper]
+            first = min(days, default=date.today())
+        last = last or date.today()
+        total = 0
+        day = first
+        while day <= last:
+            start = time.perf_counter()
+            rows = export_day(conn, table, day, root)
+            conn.commit()
+            if rows:
+                log.info("📦 %s %s: %d linhas em %.1fs", table, day, rows, time.perf_counter() - start)
+            total += rows
+            day += timedelta(days=1)
+        return total
+
+
+def dataset(table: str, root: str = DEFAULT_ROOT):
+    """pyarrow.dataset de uma tabela exportada, com partições day/device_id e leitura por mmap."""
+    _require_pyarrow()
+    partitioning = ds.partitioning(
+        pa.schema([("day", pa.date32()), ("device_id", pa.string())]), flavor="hive")
+    return ds.dataset(os.path.abspath(os.path.join(root, table)), format="parquet",
+                      partitioning=partitioning, filesystem=pafs.LocalFileSystem(use_mmap=True))
+
+
+def load(table: str, columns: list[str] | None = None, since: datetime | None = None,
+         until: datetime | None = None, device_id: str | None = None, filter=None,
+         root: str = DEFAULT_ROOT):
+    """
+    Carrega uma tabela exportada como pyarrow.Table.
+    :param columns: colunas lidas (projeção); None = todas
+    :param since: início (inclusive) na coluna de tempo da tabela
+    :param until: fim (exclusivo)
+    :param device_id: só este dispositivo
+    :param filter: expressão pyarrow.dataset extra (ex.: ds.field("vel_euclidiana") > 1000)
+    """
+    column = PARTITIONED[table]
+    data = dataset(table, root)
+    conditions = []
+    if since is not None:
+        conditions += [ds.field("day") >= pa.scalar(since.date(), pa.date32()),
+                       ds.field(column) >= pa.scalar(since, pa.timestamp("us"))]
+    if until is not None:
+        conditions += [ds.field("day") <= pa.scalar(until.date(), pa.date32()),
+                       ds.field(column) < pa.scalar(until, pa.timestamp("us"))]
+    if device_id is not None:
+        conditions.append(ds.field("device_id") == device_id)
+    if filter is not None:
+        conditions.append(filter)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    result = data.to_table(columns=columns, filter=expression)
+    if column in result.column_names:
+        # Arquivos são ordenados por dispositivo; o resultado sai em ordem de tempo
+        result = result.take(pc.sort_indices(result, sort_keys=[(column, "ascending")]))
+    return result
+
+
+def load_columns(table: str, columns: list[str] | None = None, **kwargs) -> dict:
+    """Como load(), mas devolve {coluna: np.ndarray} (tempo em datetime64[us])."""
+    result = load(table, columns, **kwargs)
+    return {name: result.column(name).to_numpy(zero_copy_only=False) for name in result.column_names}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta tabelas para Parquet (dia/dispositivo).")
+    parser.add_argument("tables", nargs="*", default=["mouse_analyse"], choices=list(PARTITIONED),
+                        help="tabelas exportadas (padrão: mouse_analyse)")
+    parser.add_argument("--desde", type=date.fromisoformat, help="primeiro dia (AAAA-MM-DD)")
+    parser.add_argument("--ate", type=date.fromisoformat, help="último dia (padrão: hoje)")
+    parser.add_argument("--saida", default=DEFAULT_ROOT, help="diretório raiz dos arquivos")
+    args = parser.parse_args()
+
+    try:
+        for name in args.tables:
+            rows = export(name, args.desde, args.ate, args.saida)
+            print(f"✅ {name}: {rows} linhas exportadas para {args.saida}")
+    except ImportError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
@@ -1,145 +1,325 @@
 # analyze_service.py
 
-import math
+import argparse
+import select
 import time
 from datetime import datetime
-from database import get_connection
-from insert_local import insert_analysis
+import numpy as np
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.pool import PoolError
+from database import connection, get_pool
+from insert_local import AnalysisWriter, FeatureWriter, NOTIFY_CHANNEL
+from analysis_kernels import analyze_grouped
+from checkpoint import ensure_checkpoint_table, load_checkpoint
+from schema import ensure_schema
+from stream_reader import DEFAULT_ITERSIZE, concat_columns, rows_to_columns, stream_columns
+from processing.filters import DEFAULT_CHAIN, FilterChain, parse_chain
+from processing.movement_analysis import MovementFeatureEngine
+from utils.logger import SIZE_BUCKETS, counter, gauge, get_logger, histogram, start_exporters
+
+# Nome do checkpoint deste serviço em analysis_checkpoint
+CHECKPOINT_NAME = "analyzer"
+
+# Espera máxima (s) por um NOTIFY antes de voltar ao select()
+LISTEN_TIMEOUT = 5.0
+
+# Espera (s) antes de reabrir a conexão do LISTEN; dobra a cada falha seguida, até RECONNECT_MAX
+RECONNECT_MIN = 1.0
+RECONNECT_MAX = 30.0
+
+log = get_logger("analyzer")
+_analyzed = counter("pointertrack_analysis_rows_total", "Movimentos analisados")
+_kept = counter("pointertrack_analysis_written_total", "Análises com deslocamento enviadas para gravação")
+_lag = gauge("pointertrack_analysis_lag_seconds",
+             "Atraso da amostra mais recente analisada em relação a agora")
+_chunk_seconds = histogram("pointertrack_analysis_chunk_seconds", "Duração da análise de cada lote lido")
+_movements = counter("pointertrack_analysis_movements_total", "Movimentos encerrados (características)")
+_chunk_rows = histogram("pointertrack_analysis_chunk_rows", "Movimentos por lote lido", SIZE_BUCKETS)
 
 def get_last_analysis_timestamp() -> datetime | None:
     """
-    Retorna o timestamp do último registro inserido em mouse_analyse.
+    Retorna o timestamp do último movimento analisado em mouse_analyse.
     Se não houver registro, retorna None.
+    O serviço retoma pelo checkpoint de ids (analysis_checkpoint), não por aqui.
+    """
+    with connection() as conn:
+        if conn is None:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT movement_ts FROM mouse_analyse ORDER BY movement_ts DESC LIMIT 1;"
+                )
+                row = cur.fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            log.error("❌ Erro ao obter último timestamp de análise: %s", e)
+            return None
+
+# Colunas lidas de mouse_movements; dispositivo NULL (dados antigos) vira ''
+_MOVEMENT_SELECT = "SELECT id, COALESCE(device_id, ''), timestamp, dx, dy, device_ts FROM mouse_movements"
+# Campos (nome, dtype) das colunas de _MOVEMENT_SELECT; device_ts NULL vira NaN
+MOVEMENT_FIELDS = (("id", "i8"), ("device_id", object), ("timestamp", "datetime64[us]"),
+                   ("dx", "i8"), ("dy", "i8"), ("device_ts", "f8"))
+
+class AnalyzerState:
+    """
+    Progresso do analisador: maior id lido (last_id) e, por dispositivo, a
+    última amostra lida ainda sem análise (pending, em colunas
+    MOVEMENT_FIELDS), que depende da próxima amostra do mesmo dispositivo
+    para ter seu intervalo.
+
+    `features`, se houver, recebe cada amostra lida (na ordem dos ids) e
+    extrai as características por movimento; `filters`, se houver, filtra
+    as velocidades de cada dispositivo antes de gravá-las. O estado dos
+    dois só existe em memória: num reinício, um movimento em andamento é
+    dividido e os filtros recomeçam sem histórico.
+    """
+
+    def __init__(self, last_id: int = 0, pending: dict | None = None,
+                 features: MovementFeatureEngine | None = None, filters: FilterChain | None = None):
+        self.last_id = last_id
+        self.pending = pending if pending is not None else rows_to_columns([], MOVEMENT_FIELDS)
+        self.features = features
+        self.filters = filters
+
+    def checkpoint(self) -> tuple[int, list[int]]:
+        return self.last_id, sorted(self.pending["id"].tolist())
+
+def analyze_new_movements(listen: bool = True, itersize: int = DEFAULT_ITERSIZE,
+                          filters: str = DEFAULT_CHAIN):
+    """
+    Serviço contínuo de análise, retomado do checkpoint persistido em
+    analysis_checkpoint.
+
+    Modo padrão (listen): escuta NOTIFY em NOTIFY_CHANNEL numa conexão
+    persistente e analisa só a faixa de ids de cada lote gravado pelo
+    MouseMovementInserter, sem consultas enquanto não há dados.
+
+    Sem banco, ou se a conexão do LISTEN cair, tenta de novo com espera
+    crescente (até RECONNECT_MAX s) e recupera o que foi gravado nesse meio
+    tempo a partir do checkpoint.
+
+    Polling, usado com listen=False:
+      1. Lê só o MAX(id) de mouse_movements para ver se há novidade.
+      2. Enquanto não houver nada novo, dorme 1 s e volta.
+      3. Quando surge um id maior, busca os registros após o checkpoint,
+         faz os cálculos e grava em lote via AnalysisWriter.
+
+    Os movimentos novos são lidos em lotes de `itersize` linhas (cursor
+    nomeado), então um backlog de qualquer tamanho é analisado com
+    memória constante. As mesmas amostras alimentam o
+    MovementFeatureEngine, que grava um resumo por movimento em
+    mouse_movement_features.
+
+    `filters` é a cadeia de filtros das velocidades (processing/filters.py,
+    ex.: "median:3"); vazia, as velocidades são gravadas sem filtro.
     """
-    conn = get_connection()
-    if conn is None:
-        return None
+    writer = AnalysisWriter(checkpoint_name=CHECKPOINT_NAME)
+    feature_writer = FeatureWriter()
+    engine = MovementFeatureEngine(feature_writer.write)
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT timestamp FROM mouse_analyse ORDER BY movement_ts DESC LIMIT 1;"
-            )
-            row = cur.fetchone()
-            return row[0] if row else None
-    except Exception as e:
-        print(f"❌ Erro ao obter último timestamp de análise: {e}")
-        return None
+        state = _load_state()
+        state.features = engine
+        state.filters = parse_chain(filters)
+        if state.filters is not None:
+            log.info("🔧 Filtros das velocidades: %s", state.filters.spec)
+        log.info("📌 Retomando após o movimento id %d (%d dispositivos com amostra pendente)",
+                 state.last_id, len(state.pending["id"]))
+        if listen:
+            log.info("🚀 Iniciando serviço de análise de movimentos (LISTEN/NOTIFY)…")
+            _listen_loop(writer, state, itersize)
+        else:
+            log.info("🚀 Iniciando serviço de análise de movimentos (polling leve)…")
+            _poll_loop(writer, state, itersize)
     finally:
-        conn.close()
+        engine.close()
+        feature_writer.close()
+        writer.close()
 
-def analyze_new_movements():
+def _load_state() -> AnalyzerState:
+    """Lê o checkpoint do analisador, aguardando o banco ficar disponível."""
+    while True:
+        with connection() as conn:
+            if conn is not None:
+                try:
+                    with conn.cursor() as cur:
+                        ensure_schema(cur)
+                        ensure_checkpoint_table(cur)
+                        last_id, pending_ids = load_checkpoint(cur, CHECKPOINT_NAME)
+                        # Uma linha por dispositivo: cabe na memória
+                        cur.execute(_MOVEMENT_SELECT + " WHERE id = ANY(%s);", (pending_ids,))
+                        pending = rows_to_columns(cur.fetchall(), MOVEMENT_FIELDS)
+                    conn.commit()
+                    return AnalyzerState(last_id, pending)
+                except Exception as e:
+                    log.error("❌ Falha ao ler checkpoint: %s", e, every=60.0)
+        time.sleep(5)
+
+def _process_new(conn, writer: AnalysisWriter, state: AnalyzerState,
+                 upto: int | None = None, itersize: int = DEFAULT_ITERSIZE) -> int | None:
     """
-    Serviço contínuo que:
-      1. Lê só o MAX(timestamp) de mouse_movements para ver se há novidade.
-      2. Enquanto não houver nada novo, dorme 1 s e volta.
-      3. Quando surge um timestamp maior, busca esses novos registros,
-         faz os cálculos e insere via insert_analysis().
+    Analisa os movimentos com id > state.last_id (e id <= upto, se informado),
+    lidos em lotes de `itersize` linhas.
+
+    Amostras de dispositivos diferentes são analisadas separadamente. A
+    última amostra lida de cada dispositivo não é analisada: seu intervalo
+    depende da próxima amostra dele, que ainda não chegou. Ela fica em
+    state.pending e entra no próximo lote (sobreposição de uma linha),
+    então nenhum delta cai no piso por causa da fronteira entre lotes,
+    sejam eles lotes do streaming ou chamadas seguidas.
+
+    Retorna o maior id lido, ou None se não havia nada novo.
+    """
+    max_id = None
+    for chunk in stream_columns(conn, _MOVEMENT_SELECT + " WHERE id > %s AND id <= %s ORDER BY id;",
+                                (state.last_id, upto if upto is not None else 2**63 - 1),
+                                MOVEMENT_FIELDS, itersize):
+        max_id = int(chunk["id"][-1])
+        _analyze_chunk(writer, state, chunk)
+    return max_id
+
+def _analyze_chunk(writer: AnalysisWriter, state: AnalyzerState, chunk: dict):
+    """Analisa um lote (com as amostras pendentes na frente) e grava com o checkpoint."""
+    start = time.perf_counter()
+    rows = concat_columns(state.pending, chunk)
+
+    # Calcula o lote inteiro de uma vez; intervalos pelo relógio do
+    # dispositivo quando o firmware o envia (NULL vira NaN)
+    batch, perm, last = analyze_grouped(rows["device_id"], rows["id"], rows["timestamp"],
+                                        rows["dx"], rows["dy"], device_ts=rows["device_ts"],
+                                        smooth=state.filters)
+    batch.movement_id = rows["id"][perm]
+    batch = batch.select(~last)
+    state.last_id = int(chunk["id"][-1])
+    state.pending = {name: col[perm[last]] for name, col in rows.items()}
+    kept = writer.write_batch(batch, checkpoint=state.checkpoint())
+    if state.features is not None:
+        # Só as amostras novas: as pendentes já passaram pelo motor
+        closed = state.features.movements
+        state.features.process(chunk["device_id"], chunk["timestamp"], chunk["dx"], chunk["dy"])
+        _movements.inc(state.features.movements - closed)
+
+    _analyzed.inc(len(batch))
+    _kept.inc(kept)
+    _chunk_seconds.observe(time.perf_counter() - start)
+    _chunk_rows.observe(len(chunk["id"]))
+    newest = chunk["timestamp"].max()
+    _lag.set((np.datetime64(datetime.now(), "us") - newest) / np.timedelta64(1, "s"))
+    log.debug("  ✔ %d movimentos analisados (%d com deslocamento).", len(batch), kept)
+
+def _flush_features(state: AnalyzerState):
+    """Encerra os movimentos de dispositivos que pararam de enviar amostras."""
+    if state.features is not None:
+        _movements.inc(state.features.flush())
+
+def notified_upto(payloads) -> int | None:
     """
-    print("🚀 Iniciando serviço de análise de movimentos (polling leve)…")
-    last_processed_ts = None
+    Maior id anunciado nos payloads "primeiro-último" (None se nenhum for
+    válido). Qualquer cliente pode dar NOTIFY no canal: payloads malformados
+    são ignorados; a leitura parte do checkpoint de qualquer forma.
+    """
+    upto = None
+    for payload in payloads:
+        try:
+            last = int(payload.rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            log.warning("⚠ NOTIFY ignorado em '%s': %r", NOTIFY_CHANNEL, payload, every=60.0)
+            continue
+        upto = last if upto is None else max(upto, last)
+    return upto
 
+def _listen_loop(writer: AnalysisWriter, state: AnalyzerState, itersize: int):
+    """
+    Processa os lotes anunciados via NOTIFY. Sem conexão, ou se ela cair
+    (ou a análise de um lote falhar), espera e reconecta, com espera
+    crescente entre falhas seguidas; nunca retorna.
+    """
+    delay = RECONNECT_MIN
     while True:
-        # 1) Verifica só o máximo timestamp existente
-        conn = get_connection()
+        conn_pool = get_pool()
+        try:
+            conn = conn_pool.getconn() if conn_pool is not None else None
+        except (psycopg2.Error, PoolError) as e:
+            log.error("❌ Falha ao obter conexão para o LISTEN: %s", e, every=60.0)
+            conn = None
         if conn is None:
-            time.sleep(5)
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
             continue
-
         try:
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
             with conn.cursor() as cur:
-                cur.execute("SELECT MAX(timestamp) FROM mouse_movements;")
-                max_ts = cur.fetchone()[0]
+                cur.execute(f"LISTEN {NOTIFY_CHANNEL};")
+
+                # Recupera o que foi gravado enquanto ninguém escutava
+                _process_new(conn, writer, state, itersize=itersize)
+                log.info("👂 Aguardando notificações em '%s'…", NOTIFY_CHANNEL)
+                delay = RECONNECT_MIN
+
+                while True:
+                    if select.select([conn], [], [], LISTEN_TIMEOUT) == ([], [], []):
+                        _flush_features(state)
+                        continue
+                    conn.poll()
+                    if not conn.notifies:
+                        continue
+
+                    # Junta todas as faixas pendentes numa única consulta
+                    upto = notified_upto(n.payload for n in conn.notifies)
+                    conn.notifies.clear()
+                    if upto is not None:
+                        _process_new(conn, writer, state, upto, itersize)
+        except psycopg2.Error as e:
+            log.error("❌ Conexão LISTEN perdida: %s", e, every=60.0)
         except Exception as e:
-            print(f"❌ Falha ao buscar MAX(timestamp): {e}")
-            conn.close()
-            time.sleep(5)
-            continue
+            log.error("❌ Erro ao processar movimentos novos: %s", e, every=60.0, exc_info=True)
         finally:
-            conn.close()
+            # Sessão com LISTEN ativo: não volta para o pool
+            conn_pool.putconn(conn, close=True)
+        time.sleep(delay)
+        delay = min(delay * 2, RECONNECT_MAX)
 
-        # 2) Se não mudou, dorme e repete (polling leve)
-        if max_ts is None or (last_processed_ts and max_ts <= last_processed_ts):
-            time.sleep(1)
-            continue
+def _poll_loop(writer: AnalysisWriter, state: AnalyzerState, itersize: int):
+    last_seen_id = None
 
-        # 3) Encontrou algo novo: processa tudo entre last_processed_ts e max_ts
-        print(f"🚀 Novos dados: de {last_processed_ts} até {max_ts}")
+    while True:
+        # Uma conexão do pool por ciclo: sem abrir conexão a cada segundo
+        with connection() as conn:
+            if conn is None:
+                time.sleep(5)
+                continue
 
-        conn = get_connection()
-        if conn is None:
-            time.sleep(5)
-            continue
+            try:
+                with conn.cursor() as cur:
+                    # 1) Verifica só o máximo id existente (índice da chave primária)
+                    cur.execute("SELECT MAX(id) FROM mouse_movements;")
+                    max_id = cur.fetchone()[0]
+                conn.commit()
 
-        try:
-            with conn.cursor() as cur:
-                if last_processed_ts:
-                    cur.execute("""
-                        SELECT
-                          id,
-                          timestamp,
-                          dx,
-                          dy,
-                          (LEAD(timestamp) OVER (ORDER BY timestamp) - timestamp) AS tempo_delta
-                        FROM mouse_movements
-                        WHERE timestamp > %s
-                        ORDER BY timestamp;
-                    """, (last_processed_ts,))
-                else:
-                    cur.execute("""
-                        SELECT
-                          id,
-                          timestamp,
-                          dx,
-                          dy,
-                          (LEAD(timestamp) OVER (ORDER BY timestamp) - timestamp) AS tempo_delta
-                        FROM mouse_movements
-                        ORDER BY timestamp;
-                    """)
-                rows = cur.fetchall()
-        except Exception as e:
-            print(f"❌ Erro ao buscar movimentos novos: {e}")
-            conn.close()
-            time.sleep(5)
-            continue
-        finally:
-            conn.close()
-
-        # 4) Calcula e insere cada análise
-        for mov_id, ts, dx, dy, delta in rows:
-            t = delta.total_seconds() if delta and delta.total_seconds() >= 0.001 else 0.001
-
-            vel_dir    = dx  / t if dx > 0 else 0
-            vel_esq    = -dx / t if dx < 0 else 0
-            vel_baixo  = dy  / t if dy > 0 else 0
-            vel_cima   = -dy / t if dy < 0 else 0
-
-            hip        = math.hypot(dx, dy)
-            vel_euclid = hip / t
-
-            acel_dir    = vel_dir    / t
-            acel_esq    = vel_esq    / t
-            acel_baixo  = vel_baixo  / t
-            acel_cima   = vel_cima   / t
-            acel_euclid = vel_euclid / t
-
-            insert_analysis(
-                movement_ts=ts,
-                vel_dir=vel_dir,
-                vel_esq=vel_esq,
-                vel_cima=vel_cima,
-                vel_baixo=vel_baixo,
-                vel_euclid=vel_euclid,
-                acel_dir=acel_dir,
-                acel_esq=acel_esq,
-                acel_cima=acel_cima,
-                acel_baixo=acel_baixo,
-                acel_euclid=acel_euclid
-            )
-            print(f"  ✔ ID {mov_id} @ {ts} analisado.")
-
-        # 5) Atualiza o marcador e volta ao início
-        last_processed_ts = max_ts
-        print("✅ Lote concluído. Aguardando próximos dados…\n")
+                # 2) Se não mudou, dorme e repete (polling leve)
+                if max_id is None or (last_seen_id is not None and max_id <= last_seen_id):
+                    _flush_features(state)
+                    time.sleep(1)
+                    continue
+
+                # 3) Encontrou algo novo: processa tudo após o checkpoint
+                log.debug("🚀 Novos dados: ids %d até %d", state.last_id + 1, max_id)
+                last_seen_id = _process_new(conn, writer, state, max_id, itersize) or max_id
+                conn.commit()
+                log.debug("✅ Lote concluído. Aguardando próximos dados…")
+            except Exception as e:
+                log.error("❌ Erro ao processar movimentos novos: %s", e, every=60.0)
+                time.sleep(5)
 
 if __name__ == "__main__":
-    analyze_new_movements()
+    parser = argparse.ArgumentParser(description="Serviço de análise de movimentos.")
+    parser.add_argument("--poll", action="store_true", help="polling em vez de LISTEN/NOTIFY")
+    parser.add_argument("--itersize", type=int, default=DEFAULT_ITERSIZE,
+                        help="linhas por lote lido do banco")
+    parser.add_argument("--filtro", default=DEFAULT_CHAIN,
+                        help='filtros das velocidades, ex.: "median:3,oneeuro:3:0.002" (padrão: ANALYSIS_FILTER)')
+    args = parser.parse_args()
+    start_exporters()
+    analyze_new_movements(listen=not args.poll, itersize=args.itersize, filters=args.filtro)
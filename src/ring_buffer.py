@@ -0,0 +1,86 @@
+# ring_buffer.py
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Buffer circular de capacidade fixa sobre arrays NumPy pré-alocados.
+
+    append() é O(1) e nunca aloca: com o buffer cheio, a amostra mais
+    antiga é sobrescrita (e contada em `overwritten`). Cada campo é uma
+    coluna própria, no dtype informado.
+    """
+
+    def __init__(self, capacity: int, fields=(("x", "f8"), ("y", "f8"), ("t", "f8"))):
+        """
+        :param capacity: número máximo de amostras guardadas
+        :param fields: pares (nome, dtype) das colunas
+        """
+        if capacity <= 0:
+            raise ValueError(f"Capacidade inválida: {capacity}")
+        self._capacity = capacity
+        self._names = tuple(name for name, _ in fields)
+        self._columns = tuple(np.empty(capacity, dtype=dtype) for _, dtype in fields)
+        self._head = 0   # próxima posição de escrita
+        self._size = 0
+        self.overwritten = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def fields(self) -> tuple:
+        return self._names
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, *values):
+        """Grava uma amostra (um valor por campo, na ordem de `fields`)."""
+        head = self._head
+        for column, value in zip(self._columns, values):
+            column[head] = value
+        self._head = head + 1 if head + 1 < self._capacity else 0
+        if self._size < self._capacity:
+            self._size += 1
+        else:
+            self.overwritten += 1
+
+    def extend(self, *columns):
+        """
+        Grava um lote de amostras (um array por campo, na ordem de `fields`).
+        Vetorizado: custa O(len(lote)), limitado à capacidade.
+        """
+        total = len(columns[0])
+        if not total:
+            return
+        n = min(total, self._capacity)
+        idx = (self._head + np.arange(n)) % self._capacity
+        for column, values in zip(self._columns, columns):
+            column[idx] = np.asarray(values)[total - n:]
+        self._head = (self._head + n) % self._capacity
+        size = min(self._size + total, self._capacity)
+        self.overwritten += self._size + total - size
+        self._size = size
+
+    def last(self) -> tuple | None:
+        """Amostra mais recente, ou None se vazio."""
+        if not self._size:
+            return None
+        i = self._head - 1
+        return tuple(column[i].item() for column in self._columns)
+
+    def snapshot(self) -> dict:
+        """Cópia das amostras em ordem cronológica, por campo."""
+        start = self._head - self._size
+        if start >= 0:
+            return {name: column[start:self._head].copy()
+                    for name, column in zip(self._names, self._columns)}
+        return {name: np.concatenate((column[start:], column[:self._head]))
+                for name, column in zip(self._names, self._columns)}
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
@@ -0,0 +1,291 @@
+# rollups.py
+
+import math
+import sys
+from datetime import datetime
+import numpy as np
+from psycopg2.extras import Json, execute_values
+from database import connection
+from analysis_kernels import ANALYSIS_COLUMNS
+from schema import ensure_schema
+from stream_reader import stream_columns
+
+# Agregados incrementais de mouse_analyse.
+#
+# Para cada segundo (mouse_rollup_1s) e minuto (mouse_rollup_1m), por
+# dispositivo e por métrica de ANALYSIS_COLUMNS, guarda count, sum, min,
+# max e um sketch de quantis: um histograma com bins logarítmicos de
+# razão SKETCH_GAMMA, armazenado esparso como {bin: contagem}. Sketches
+# do mesmo bucket se somam bin a bin (rollup_sketch_merge no upsert), então
+# lotes, reprocessamentos parciais e buckets maiores se combinam sem
+# voltar às linhas brutas. O quantil lido do sketch tem erro relativo de
+# no máximo (SKETCH_GAMMA - 1) / (SKETCH_GAMMA + 1), cerca de 2%.
+#
+# Métricas por direção (vel_direita, acel_cima...) são zero nas amostras que
+# se movem para o outro lado; elas só agregam os valores > 0, então count é o
+# número de amostras naquela direção e a média é a velocidade enquanto o
+# ponteiro vai para lá. Rollups gravados antes disso: rollups.py rebuild.
+#
+# Os rollups são atualizados na mesma transação que grava as análises
+# (AnalysisWriter, backfill); os gráficos leem só os rollups.
+
+SKETCH_GAMMA = 1.04
+# Valores com |v| abaixo disso caem no bin 0
+SKETCH_MIN = 1e-3
+# Bins além disso (|v| > ~1e12) são saturados
+_MAX_BIN = 1023
+_LOG_GAMMA = math.log(SKETCH_GAMMA)
+
+# Tabela -> unidade do bucket (datetime64)
+RESOLUTIONS = {"mouse_rollup_1s": "s", "mouse_rollup_1m": "m"}
+
+# Métricas agregadas só sobre valores > 0 (as euclidianas não têm direção)
+DIRECTIONAL = tuple(name for name in ANALYSIS_COLUMNS if not name.endswith("euclidiana"))
+
+ROLLUP_FIELDS = ("bucket", "device_id", "metric", "count", "sum", "min", "max", "sketch")
+
+_UPSERT = """
+    INSERT INTO {table} AS r (bucket, device_id, metric, count, sum, min, max, sketch)
+    VALUES %s
+    ON CONFLICT (bucket, device_id, metric) DO UPDATE SET
+        count  = r.count + EXCLUDED.count,
+        sum    = r.sum + EXCLUDED.sum,
+        min    = LEAST(r.min, EXCLUDED.min),
+        max    = GREATEST(r.max, EXCLUDED.max),
+        sketch = rollup_sketch_merge(r.sketch, EXCLUDED.sketch)
+"""
+
+
+def sketch_bins(values: np.ndarray) -> np.ndarray:
+    """
+    Bin de cada valor: 0 para |v| < SKETCH_MIN; k > 0 para
+    SKETCH_MIN·γ^(k-2) < |v| <= SKETCH_MIN·γ^(k-1); -k para negativos.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    mag = np.abs(values)
+    with np.errstate(divide="ignore"):
+        k = np.ceil(np.log(np.maximum(mag, SKETCH_MIN) / SKETCH_MIN) / _LOG_GAMMA) + 1
+    k = np.minimum(k, _MAX_BIN).astype(np.int64)
+    k[mag < SKETCH_MIN] = 0
+    return np.where(values < 0, -k, k)
+
+
+def bin_value(k: int) -> float:
+    """Valor representativo do bin (erro relativo mínimo dentro dele)."""
+    if k == 0:
+        return 0.0
+    value = 2 * SKETCH_MIN * SKETCH_GAMMA ** (abs(k) - 1) / (1 + SKETCH_GAMMA)
+    return value if k > 0 else -value
+
+
+def merge_sketches(*sketches) -> dict:
+    """Soma sketches bin a bin (aceita as chaves em texto vindas do JSONB)."""
+    merged = {}
+    for sketch in sketches:
+        for k, n in sketch.items():
+            k = int(k)
+            merged[k] = merged.get(k, 0) + n
+    return merged
+
+
+def sketch_histogram(sketch: dict) -> tuple[np.ndarray, np.ndarray]:
+    """(valores representativos, contagens), em ordem crescente de valor."""
+    keys = sorted(int(k) for k in sketch)
+    values = np.array([bin_value(k) for k in keys])
+    counts = np.array([sketch.get(k, sketch.get(str(k))) for k in keys], dtype=np.int64)
+    return values, counts
+
+
+def sketch_quantiles(sketch: dict, qs) -> list[float]:
+    """Quantis q em [0, 1] estimados a partir do sketch (NaN se vazio)."""
+    values, counts = sketch_histogram(sketch)
+    if not len(counts):
+        return [math.nan for _ in qs]
+    cum = np.cumsum(counts)
+    ranks = [q * (cum[-1] - 1) for q in qs]
+    return [float(values[np.searchsorted(cum, rank, side="right")]) for rank in ranks]
+
+
+def aggregate(movement_ts, device_id, values, unit: str) -> list[tuple]:
+    """
+    Agrega análises em buckets de `unit` ('s' ou 'm') por dispositivo e
+    métrica. Valores não finitos são ignorados, e nas métricas de
+    DIRECTIONAL também os zeros (amostras em outra direção).
+    :param movement_ts: datetime64 (n,)
+    :param device_id: str (n,), '' para amostras sem dispositivo
+    :param values: float64 (n, len(ANALYSIS_COLUMNS))
+    :return: linhas na ordem de ROLLUP_FIELDS, ordenadas pela chave
+    """
+    buckets = np.asarray(movement_ts, dtype="datetime64[us]").astype(f"datetime64[{unit}]")
+    devices, dev_code = np.unique(np.asarray(device_id, dtype=object).astype(str), return_inverse=True)
+    keys, group = np.unique(buckets.astype(np.int64) * len(devices) + dev_code, return_inverse=True)
+    group = group.ravel()
+    n_groups = len(keys)
+    group_bucket = (keys // len(devices)).astype(f"datetime64[{unit}]").astype("datetime64[us]").tolist()
+    group_device = devices[keys % len(devices)].tolist()
+    span = 2 * _MAX_BIN + 1
+
+    out = []
+    for j, metric in enumerate(ANALYSIS_COLUMNS):
+        v = values[:, j]
+        ok = np.isfinite(v)
+        if metric in DIRECTIONAL:
+            ok &= v > 0
+        g, v = group[ok], v[ok]
+        if not len(v):
+            continue
+        count = np.bincount(g, minlength=n_groups)
+        total = np.bincount(g, weights=v, minlength=n_groups)
+        lo = np.full(n_groups, np.inf)
+        hi = np.full(n_groups, -np.inf)
+        np.minimum.at(lo, g, v)
+        np.maximum.at(hi, g, v)
+
+        pairs, pair_counts = np.unique(g * span + sketch_bins(v) + _MAX_BIN, return_counts=True)
+        sketches = [{} for _ in range(n_groups)]
+        for pair, n in zip(pairs.tolist(), pair_counts.tolist()):
+            sketches[pair // span][str(pair % span - _MAX_BIN)] = n
+
+        for i in np.flatnonzero(count).tolist():
+            out.append((group_bucket[i], group_device[i], metric, int(count[i]),
+                        float(total[i]), float(lo[i]), float(hi[i]), sketches[i]))
+    out.sort(key=lambda r: r[:3])
+    return out
+
+
+def update_rollups(cur, movement_ts, device_id, values):
+    """
+    Soma um lote de análises aos rollups (upsert; o chamador faz o commit).
+    Buckets ordenados pela chave: transações concorrentes travam as linhas
+    na mesma ordem.
+    """
+    if not len(movement_ts):
+        return
+    values = np.asarray(values, dtype=np.float64).reshape(len(movement_ts), len(ANALYSIS_COLUMNS))
+    for table, unit in RESOLUTIONS.items():
+        rows = aggregate(movement_ts, device_id, values, unit)
+        execute_values(cur, _UPSERT.format(table=table),
+                       [(*row[:-1], Json(row[-1])) for row in rows], page_size=1000)
+
+
+def update_rollups_from_rows(cur, rows):
+    """Versão para tuplas (movement_ts, device_id, vel_direita, ..., acel_euclidiana)."""
+    if not rows:
+        return
+    ts, devices, *cols = zip(*rows)
+    values = np.array([[np.nan if x is None else x for x in col] for col in cols], dtype=np.float64).T
+    update_rollups(cur, np.array(ts, dtype="datetime64[us]"),
+                   ["" if d is None else d for d in devices], values)
+
+
+def update_rollups_from_batch(cur, batch):
+    """Versão para um analysis_kernels.AnalysisBatch."""
+    devices = batch.device_id if batch.device_id is not None else np.full(len(batch), "", dtype=object)
+    values = np.column_stack([batch[name] for name in ANALYSIS_COLUMNS]) if len(batch) else []
+    update_rollups(cur, batch.movement_ts, devices, values)
+
+
+def fetch_rollups(cur, metrics, since: datetime, until: datetime | None = None,
+                  resolution: str = "1m", device_id: str | None = None) -> dict:
+    """
+    Lê os rollups de `metrics` a partir de `since`, somando os
+    dispositivos (ou só `device_id`). O custo depende da janela pedida,
+    não do histórico.
+    :return: {métrica: {"bucket": datetime64[], "count", "sum", "min", "max": arrays,
+                        "sketch": [dict, ...]}}
+    """
+    table = f"mouse_rollup_{resolution}"
+    if table not in RESOLUTIONS:
+        raise ValueError(f"Resolução inválida: {resolution}")
+    cur.execute(f"""
+        SELECT metric, bucket, count, sum, min, max, sketch FROM {table}
+        WHERE metric = ANY(%s) AND bucket >= %s AND bucket < %s
+          AND (%s::text IS NULL OR device_id = %s)
+        ORDER BY metric, bucket;
+    """, (list(metrics), since, until or datetime.max, device_id, device_id))
+
+    # Mesma métrica e bucket em dispositivos diferentes: combina
+    merged = {}
+    for metric, bucket, count, total, lo, hi, sketch in cur.fetchall():
+        entry = merged.setdefault(metric, {}).get(bucket)
+        if entry is None:
+            merged[metric][bucket] = [count, total, lo, hi, merge_sketches(sketch)]
+        else:
+            entry[0] += count
+            entry[1] += total
+            entry[2] = min(entry[2], lo)
+            entry[3] = max(entry[3], hi)
+            entry[4] = merge_sketches(entry[4], sketch)
+
+    series = {}
+    for metric in metrics:
+        buckets = merged.get(metric, {})
+        cols = list(zip(*buckets.values())) or [[]] * 5
+        series[metric] = {
+            "bucket": np.array(list(buckets), dtype="datetime64[us]"),
+            "count": np.array(cols[0], dtype=np.int64),
+            "sum": np.array(cols[1], dtype=np.float64),
+            "min": np.array(cols[2], dtype=np.float64),
+            "max": np.array(cols[3], dtype=np.float64),
+            "sketch": list(cols[4]),
+        }
+    return series
+
+
+def summarize(series: dict) -> dict:
+    """Reduz uma série de fetch_rollups a um único agregado (count, mean, min, max, sketch)."""
+    count = int(series["count"].sum())
+    return {
+        "count": count,
+        "mean": float(series["sum"].sum() / count) if count else math.nan,
+        "min": float(series["min"].min()) if count else math.nan,
+        "max": float(series["max"].max()) if count else math.nan,
+        "sketch": merge_sketches(*series["sketch"]),
+    }
+
+
+def rebuild(cur, since: datetime | None = None, chunk_rows: int = 100_000) -> int:
+    """
+    Recalcula os rollups a partir de mouse_analyse (todas as linhas, ou
+    de `since` em diante, alinhado ao minuto). Lê em lotes com
+    stream_columns(); como os rollups se somam, lotes podem cortar buckets.
+    Deve rodar numa transação própria (o cursor nomeado vive nela).
+    Retorna o número de análises lidas.
+    """
+    if since is not None:
+        since = since.replace(second=0, microsecond=0)
+    for table in RESOLUTIONS:
+        if since is None:
+            cur.execute(f"TRUNCATE {table};")
+        else:
+            cur.execute(f"DELETE FROM {table} WHERE bucket >= %s;", (since,))
+
+    total = 0
+    fields = [("movement_ts", "datetime64[us]"), ("device_id", object)] + [(name, "f8") for name in ANALYSIS_COLUMNS]
+    for chunk in stream_columns(
+        cur.connection,
+        "SELECT movement_ts, COALESCE(device_id, ''), " + ", ".join(ANALYSIS_COLUMNS)
+        + " FROM mouse_analyse WHERE movement_ts >= %s;",
+        (since or datetime.min,), fields, itersize=chunk_rows,
+    ):
+        values = np.column_stack([chunk[name] for name in ANALYSIS_COLUMNS])
+        update_rollups(cur, chunk["movement_ts"], chunk["device_id"], values)
+        total += len(values)
+    return total
+
+
+if __name__ == "__main__":
+    # Uso: python rollups.py rebuild [AAAA-MM-DD] -> recalcula os rollups
+    if sys.argv[1:2] != ["rebuild"]:
+        print("Uso: python rollups.py rebuild [AAAA-MM-DD]")
+        sys.exit(2)
+    # Recálculo longo: sem o statement_timeout padrão
+    with connection(statement_timeout=0) as conn:
+        if conn is None:
+            sys.exit(1)
+        since = datetime.fromisoformat(sys.argv[2]) if len(sys.argv) > 2 else None
+        with conn.cursor() as cur:
+            ensure_schema(cur)
+            total = rebuild(cur, since)
+        conn.commit()
+        print(f"✅ Rollups recalculados a partir de {total} análises.")
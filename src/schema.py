@@ -0,0 +1,484 @@
+# schema.py
+
+import re
+import sys
+import threading
+from datetime import date, timedelta
+import psycopg2
+from database import connection
+from utils.logger import get_logger
+
+# Esquema gerenciado do PointerTrack.
+#
+# mouse_movements, mouse_clicks e mouse_analyse são particionadas por dia
+# (RANGE na coluna de tempo), com uma partição DEFAULT para amostras fora
+# das partições criadas (relógio errado, virada de dia antes da
+# manutenção). Como toda chave única de uma tabela particionada precisa
+# conter a chave de partição, as chaves primárias passam a ser (id, tempo);
+# os ids continuam vindo da mesma sequência de antes, agora BIGINT (a
+# milhares de amostras por segundo, 2^31 ids acabam em dias; tabelas e
+# sequências antigas são alargadas pela CLI).
+#
+# Índices:
+#   - (id, tempo) da chave primária: consultas do analisador por faixa de id
+#   - BRIN no tempo: varreduras por período, quase sem custo de escrita
+#   - btree (device_id, tempo): consultas por dispositivo
+#   - mouse_analyse: único em (movement_ts, movement_id), uma análise por
+#     movimento (movement_ts sozinho colide entre dispositivos)
+#
+# mouse_rollup_1s e mouse_rollup_1m guardam agregados por segundo/minuto,
+# dispositivo e métrica de mouse_analyse (ver rollups.py), também por dia.
+#
+# Tabelas antigas (sem partição) são migradas uma vez: renomeadas, copiadas
+# para as partições novas e removidas. Migrações que reescrevem tabelas
+# inteiras só rodam pela CLI (python src/schema.py), sem statement_timeout;
+# os serviços recusam o esquema antigo com MigrationRequired.
+
+log = get_logger("schema")
+
+# Partições criadas à frente do dia atual
+PARTITION_DAYS_AHEAD = 3
+
+# Tabela particionada -> coluna de tempo usada na partição
+PARTITIONED = {
+    "mouse_movements": "timestamp",
+    "mouse_clicks": "timestamp",
+    "mouse_analyse": "movement_ts",
+    "mouse_rollup_1s": "bucket",
+    "mouse_rollup_1m": "bucket",
+}
+
+_ROLLUP_TABLE = """
+    CREATE TABLE {table} (
+        bucket    TIMESTAMP        NOT NULL,  -- início do segundo/minuto
+        device_id TEXT             NOT NULL,  -- '' para amostras sem dispositivo
+        metric    TEXT             NOT NULL,  -- coluna de mouse_analyse
+        count     BIGINT           NOT NULL,
+        sum       DOUBLE PRECISION NOT NULL,
+        min       DOUBLE PRECISION NOT NULL,
+        max       DOUBLE PRECISION NOT NULL,
+        sketch    JSONB            NOT NULL,  -- histograma logarítmico: bin -> contagem
+        PRIMARY KEY (bucket, device_id, metric)
+    ) PARTITION BY RANGE (bucket);
+"""
+
+_TABLES = {
+    "mouse_movements": """
+        CREATE TABLE mouse_movements (
+            id        BIGINT    NOT NULL DEFAULT nextval('mouse_movements_id_seq'),
+            timestamp TIMESTAMP NOT NULL,
+            dx        INTEGER   NOT NULL,
+            dy        INTEGER   NOT NULL,
+            L         INTEGER   NOT NULL,
+            U         INTEGER   NOT NULL,
+            R         INTEGER   NOT NULL,
+            D         INTEGER   NOT NULL,
+            X         INTEGER   NOT NULL,
+            device_id TEXT,
+            device_ts BIGINT,  -- relógio do firmware (µs), desenrolado; NULL em firmwares antigos
+            seq       BIGINT,  -- sequência do firmware, desenrolada
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+    """,
+    "mouse_clicks": """
+        CREATE TABLE mouse_clicks (
+            id        BIGINT      NOT NULL DEFAULT nextval('mouse_clicks_id_seq'),
+            timestamp TIMESTAMP   NOT NULL,
+            dx        INTEGER     NOT NULL,
+            dy        INTEGER     NOT NULL,
+            action    VARCHAR(10) NOT NULL,  -- press | double | release
+            device_id TEXT,
+            button    TEXT,     -- L/U/R/D/X (button_events) ou botão do mouse do sistema
+            x         INTEGER,
+            y         INTEGER,
+            duration_ms DOUBLE PRECISION,  -- release: tempo segurado
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+    """,
+    "mouse_analyse": """
+        CREATE TABLE mouse_analyse (
+            id              BIGINT    NOT NULL DEFAULT nextval('mouse_analyse_id_seq'),
+            movement_ts     TIMESTAMP NOT NULL,
+            vel_direita     DOUBLE PRECISION,
+            vel_esquerda    DOUBLE PRECISION,
+            vel_cima        DOUBLE PRECISION,
+            vel_baixo       DOUBLE PRECISION,
+            vel_euclidiana  DOUBLE PRECISION,
+            acel_direita    DOUBLE PRECISION,
+            acel_esquerda   DOUBLE PRECISION,
+            acel_cima       DOUBLE PRECISION,
+            acel_baixo      DOUBLE PRECISION,
+            acel_euclidiana DOUBLE PRECISION,
+            device_id       TEXT,
+            movement_id     BIGINT,  -- mouse_movements.id analisado
+            PRIMARY KEY (id, movement_ts),
+            UNIQUE (movement_ts, movement_id)
+        ) PARTITION BY RANGE (movement_ts);
+    """,
+    "mouse_rollup_1s": _ROLLUP_TABLE.format(table="mouse_rollup_1s"),
+    "mouse_rollup_1m": _ROLLUP_TABLE.format(table="mouse_rollup_1m"),
+}
+
+# Tabelas com id da sequência própria
+_ID_TABLES = [table for table in PARTITIONED if f"{table}_id_seq" in _TABLES[table]]
+
+# Colunas novas em tabelas já existentes
+_COLUMNS = [
+    "ALTER TABLE mouse_clicks ADD COLUMN IF NOT EXISTS duration_ms DOUBLE PRECISION;",
+]
+
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS mouse_movements_timestamp_brin ON mouse_movements USING brin (timestamp);",
+    "CREATE INDEX IF NOT EXISTS mouse_movements_device_ts_idx ON mouse_movements (device_id, timestamp);",
+    # Próxima amostra de um dispositivo na ordem dos ids (backfill, processing/parallel_analysis.py)
+    "CREATE INDEX IF NOT EXISTS mouse_movements_device_id_idx ON mouse_movements (device_id, id);",
+    "CREATE INDEX IF NOT EXISTS mouse_clicks_timestamp_brin ON mouse_clicks USING brin (timestamp);",
+    "CREATE INDEX IF NOT EXISTS mouse_clicks_device_ts_idx ON mouse_clicks (device_id, timestamp);",
+    "CREATE INDEX IF NOT EXISTS mouse_analyse_device_ts_idx ON mouse_analyse (device_id, movement_ts);",
+]
+
+# Tabelas pequenas, sem partição
+_OTHER_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS mouse_segments (
+        id          SERIAL      PRIMARY KEY,
+        start_ts    TIMESTAMP   NOT NULL,
+        end_ts      TIMESTAMP   NOT NULL,
+        events      INTEGER     NOT NULL,
+        dx_direita  REAL        NOT NULL,
+        dx_esquerda REAL        NOT NULL,
+        dy_cima     REAL        NOT NULL,
+        dy_baixo    REAL        NOT NULL,
+        distance    REAL        NOT NULL,
+        reason      VARCHAR(10) NOT NULL
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS mouse_segments_start_ts_idx ON mouse_segments (start_ts);",
+    # Um movimento por linha (processing/movement_analysis.py); a chave única
+    # (ver _unique_features()) torna seguro regravar após o analisador
+    # retomar do checkpoint
+    """
+    CREATE TABLE IF NOT EXISTS mouse_movement_features (
+        id              SERIAL      PRIMARY KEY,
+        device_id       TEXT,
+        start_ts        TIMESTAMP   NOT NULL,
+        end_ts          TIMESTAMP   NOT NULL,
+        samples         INTEGER     NOT NULL,
+        duration        REAL        NOT NULL,  -- s
+        path_length     REAL        NOT NULL,  -- contagens
+        displacement    REAL        NOT NULL,
+        straightness    REAL        NOT NULL,  -- displacement / path_length
+        direction       REAL        NOT NULL,  -- graus, 0 = direita, 90 = cima
+        mean_speed      REAL        NOT NULL,  -- contagens/s
+        peak_speed      REAL        NOT NULL,
+        time_to_peak    REAL        NOT NULL,  -- s
+        peak_accel      REAL        NOT NULL,  -- contagens/s²
+        jerk_rms        REAL        NOT NULL,  -- contagens/s³
+        normalized_jerk REAL        NOT NULL,  -- adimensional
+        curvature       REAL        NOT NULL,  -- rad/contagem
+        submovements    INTEGER     NOT NULL,
+        reason          VARCHAR(10) NOT NULL
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS mouse_movement_features_start_ts_idx ON mouse_movement_features (start_ts);",
+    # Soma dois sketches {bin: contagem}; usada no upsert dos rollups
+    """
+    CREATE OR REPLACE FUNCTION rollup_sketch_merge(a JSONB, b JSONB) RETURNS JSONB
+    LANGUAGE sql IMMUTABLE AS $$
+        SELECT COALESCE(jsonb_object_agg(k, n), '{}'::jsonb)
+        FROM (SELECT k, SUM(v::bigint) AS n
+              FROM (SELECT * FROM jsonb_each_text(a) UNION ALL SELECT * FROM jsonb_each_text(b)) AS s (k, v)
+              GROUP BY k) AS t;
+    $$;
+    """,
+]
+
+# Serializa migrações de processos diferentes (ingestão, analisador, backfill)
+_LOCK = "SELECT pg_advisory_xact_lock(hashtext('pointertrack_schema'));"
+
+# Último dia com partição garantida neste processo (ver maintain())
+_ready_until = None
+# Partições criadas em transações ainda não confirmadas: xid -> último dia.
+# Só passam para _ready_until depois do commit; um rollback as desfaz. Cada
+# thread grava na sua conexão: uma não descarta a transação aberta da outra
+_unconfirmed = {}
+# Protege os dois acima; nunca fica preso durante uma consulta (a trava do
+# esquema, no banco, pode estar esperando outra thread)
+_state_lock = threading.Lock()
+
+
+class MigrationRequired(psycopg2.OperationalError):
+    """
+    O esquema precisa de uma migração pesada, que só a CLI faz. É um
+    OperationalError: quem grava trata como banco indisponível e tenta de
+    novo depois, sem descartar dados.
+    """
+
+
+def table_kind(cur, table: str) -> str | None:
+    """'p' (particionada), 'r' (tabela comum) ou None (não existe) no schema atual."""
+    cur.execute("""
+        SELECT c.relkind FROM pg_class c
+        WHERE c.relname = %s AND c.relnamespace = current_schema()::regnamespace;
+    """, (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def ensure_schema(cur, today: date | None = None, migrate: bool = False):
+    """
+    Cria todas as tabelas, índices e as partições de ontem até
+    PARTITION_DAYS_AHEAD dias à frente. Idempotente; o chamador faz o commit.
+
+    :param migrate: migra tabelas antigas (sem partição, ids INTEGER). Só a
+        CLI passa True; sem ele, um esquema antigo levanta MigrationRequired.
+    """
+    today = today or date.today()
+    cur.execute(_LOCK)
+    legacy = []
+    for table in PARTITIONED:
+        kind = table_kind(cur, table)
+        if kind is None:
+            _create_parent(cur, table)
+        elif kind == "r":
+            legacy.append(table)
+    pending = legacy + [f"{table}.id" for table in _narrow_ids(cur) if table not in legacy]
+    if pending and not migrate:
+        log.error("❌ Esquema antigo (%s): rode python src/schema.py para migrar", ", ".join(pending),
+                  every=60.0)
+        raise MigrationRequired(f"migração pendente: {', '.join(pending)}")
+    for table in legacy:
+        _migrate_legacy(cur, table)
+    for stmt in _COLUMNS + _INDEXES + _OTHER_DDL:
+        cur.execute(stmt)
+    _widen_ids(cur)
+    _unique_features(cur)
+    _created(cur, ensure_partitions(cur, today - timedelta(days=1),
+                                    today + timedelta(days=PARTITION_DAYS_AHEAD)))
+
+
+def maintain(cur, today: date | None = None):
+    """
+    Chamada barata para o início de cada gravação: na primeira vez roda
+    ensure_schema(); depois só cria partições quando o dia se aproxima do
+    fim das já criadas.
+
+    Partições criadas numa transação só valem para o processo depois do
+    commit dela (conferido aqui, pelo xid): se foi desfeita, são criadas de novo.
+    Nunca migra: um esquema antigo levanta MigrationRequired (ver ensure_schema()).
+    """
+    global _ready_until
+    today = today or date.today()
+    with _state_lock:
+        pending = list(_unconfirmed)
+    if pending:
+        cur.execute("SELECT x, txid_status(x), txid_current_if_assigned() FROM unnest(%s::bigint[]) AS x;",
+                    (pending,))
+        rows = cur.fetchall()
+        with _state_lock:
+            for xid, status, _ in rows:
+                if status == "in progress":
+                    continue
+                # Confirmada vale para o processo; desfeita é criada de novo abaixo
+                last = _unconfirmed.pop(xid, None)
+                if status == "committed" and last is not None:
+                    _ready_until = last if _ready_until is None else max(_ready_until, last)
+        if rows[0][2] in pending:
+            return  # criadas nesta mesma transação
+        # Abertas em outra conexão continuam pendentes; a trava espera por elas
+    with _state_lock:
+        ready_until = _ready_until
+    if ready_until is None:
+        ensure_schema(cur, today)
+    elif today + timedelta(days=1) >= ready_until:
+        cur.execute(_LOCK)
+        _created(cur, ensure_partitions(cur, today, today + timedelta(days=PARTITION_DAYS_AHEAD)))
+
+
+def _created(cur, last: date):
+    """Registra as partições até `last` como criadas pela transação atual."""
+    cur.execute("SELECT txid_current();")
+    xid = cur.fetchone()[0]
+    with _state_lock:
+        _unconfirmed[xid] = max(last, _unconfirmed.get(xid, last))
+
+
+def _narrow_ids(cur) -> list[str]:
+    """Tabelas gerenciadas cujo id ainda é INTEGER."""
+    cur.execute("""
+        SELECT table_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND column_name = 'id'
+          AND table_name = ANY(%s) AND data_type = 'integer';
+    """, (_ID_TABLES,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def _widen_ids(cur):
+    """
+    Passa para BIGINT os ids e as sequências ainda INTEGER (tabelas criadas
+    antes, sequências herdadas de SERIAL). Só altera o que precisa: o ALTER
+    reescreve a tabela.
+    """
+    for table in _narrow_ids(cur):
+        log.info("🔧 Alargando %s.id para BIGINT…", table)
+        cur.execute(f"ALTER TABLE {table} ALTER COLUMN id TYPE BIGINT;")
+    cur.execute("""
+        SELECT sequence_name FROM information_schema.sequences
+        WHERE sequence_schema = current_schema() AND sequence_name = ANY(%s) AND data_type = 'integer';
+    """, ([f"{table}_id_seq" for table in _ID_TABLES],))
+    for (sequence,) in cur.fetchall():
+        cur.execute(f"ALTER SEQUENCE {sequence} AS BIGINT;")
+
+
+def _unique_features(cur):
+    """
+    Chave única de mouse_movement_features em (COALESCE(device_id, ''),
+    start_ts): movimentos sem dispositivo (device_id NULL) também colidem,
+    o que UNIQUE (device_id, start_ts) não fazia (NULLs nunca são iguais).
+    Tabelas criadas antes perdem a constraint antiga e as linhas repetidas
+    sem dispositivo (fica a primeira gravada).
+    """
+    cur.execute("SELECT to_regclass('mouse_movement_features_device_start_key');")
+    if cur.fetchone()[0] is not None:
+        return
+    cur.execute("""
+        DELETE FROM mouse_movement_features a USING mouse_movement_features b
+        WHERE a.device_id IS NULL AND b.device_id IS NULL AND a.start_ts = b.start_ts AND a.id > b.id;
+    """)
+    cur.execute("ALTER TABLE mouse_movement_features "
+                "DROP CONSTRAINT IF EXISTS mouse_movement_features_device_id_start_ts_key;")
+    cur.execute("CREATE UNIQUE INDEX mouse_movement_features_device_start_key "
+                "ON mouse_movement_features ((COALESCE(device_id, '')), start_ts);")
+
+
+def _create_parent(cur, table: str):
+    has_id = f"{table}_id_seq" in _TABLES[table]
+    if has_id:
+        # A sequência pode já existir (tabela antiga renomeada): os ids continuam
+        cur.execute(f"CREATE SEQUENCE IF NOT EXISTS {table}_id_seq;")
+    cur.execute(_TABLES[table])
+    if has_id:
+        cur.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id;")
+    cur.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;")
+
+
+def _migrate_legacy(cur, table: str):
+    """Copia uma tabela antiga (sem partição) para o esquema particionado."""
+    column = PARTITIONED[table]
+    legacy = f"{table}_legacy"
+    log.info("🔧 Migrando %s para partições diárias…", table)
+    cur.execute(f"ALTER TABLE {table} RENAME TO {legacy};")
+    cur.execute(f"ALTER INDEX IF EXISTS {table}_pkey RENAME TO {legacy}_pkey;")
+    _create_parent(cur, table)
+
+    cur.execute(f"SELECT MIN({column})::date, MAX({column})::date FROM {legacy};")
+    first, last = cur.fetchone()
+    if first is not None:
+        ensure_partitions(cur, first, last, tables=(table,))
+
+    # Só as colunas que existem nas duas (tabelas antigas podem não ter as novas)
+    cur.execute("""
+        SELECT a.attname FROM pg_attribute a
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+          AND a.attname IN (SELECT attname FROM pg_attribute
+                            WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped)
+        ORDER BY a.attnum;
+    """, (table, legacy))
+    columns = ", ".join(f'"{r[0]}"' for r in cur.fetchall())
+    cur.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy} "
+                f"WHERE {column} IS NOT NULL;")
+    log.info("  ✔ %d linhas copiadas (linhas sem %s são descartadas)", cur.rowcount, column)
+    cur.execute(f"DROP TABLE {legacy};")
+
+
+def ensure_partitions(cur, first: date, last: date, tables=None) -> date:
+    """Garante uma partição por dia de `first` a `last` (inclusive); retorna `last`."""
+    day = first
+    while day <= last:
+        for table in tables or PARTITIONED:
+            _create_partition(cur, table, day)
+        day += timedelta(days=1)
+    return last
+
+
+def _create_partition(cur, table: str, day: date):
+    name = f"{table}_p{day:%Y%m%d}"
+    cur.execute("SELECT to_regclass(%s);", (name,))
+    if cur.fetchone()[0] is not None:
+        return
+    column = PARTITIONED[table]
+    lo, hi = day.isoformat(), (day + timedelta(days=1)).isoformat()
+
+    cur.execute(f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE {column} >= %s AND {column} < %s);",
+                (lo, hi))
+    if not cur.fetchone()[0]:
+        cur.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s);", (lo, hi))
+        return
+
+    # Amostras desse dia caíram na DEFAULT: move para a partição nova antes de anexá-la
+    cur.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {table}_default WHERE {column} >= %s AND {column} < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved;
+    """, (lo, hi))
+    cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s);", (lo, hi))
+
+
+def list_partitions(cur, table: str) -> list[tuple[str, date | None]]:
+    """Partições de `table` com o limite superior (exclusivo); None para a DEFAULT."""
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY c.relname;
+    """, (table,))
+    partitions = []
+    for name, bound in cur.fetchall():
+        match = re.search(r"TO \('(\d{4}-\d{2}-\d{2})", bound)
+        partitions.append((name, date.fromisoformat(match.group(1)) if match else None))
+    return partitions
+
+
+def drop_partitions_before(cur, table: str, cutoff: date) -> list[str]:
+    """
+    Retenção: remove as partições de `table` cujos dados são todos
+    anteriores a `cutoff`. Um DROP por partição, sem DELETE linha a linha;
+    só a DEFAULT, que não tem limite, perde as linhas antigas por DELETE.
+    """
+    cur.execute(_LOCK)
+    dropped = []
+    for name, upper in list_partitions(cur, table):
+        if upper is not None and upper <= cutoff:
+            cur.execute(f"DROP TABLE {name};")
+            dropped.append(name)
+    cur.execute(f"DELETE FROM {table}_default WHERE {PARTITIONED[table]} < %s;", (cutoff,))
+    if cur.rowcount:
+        log.info("🗑 %d linhas anteriores a %s removidas de %s_default", cur.rowcount, cutoff, table)
+    return dropped
+
+
+def apply_retention(cur, days: int, today: date | None = None) -> list[str]:
+    """Mantém só os últimos `days` dias de todas as tabelas particionadas."""
+    cutoff = (today or date.today()) - timedelta(days=days)
+    dropped = []
+    for table in PARTITIONED:
+        dropped += drop_partitions_before(cur, table, cutoff)
+    return dropped
+
+
+if __name__ == "__main__":
+    # Uso: python schema.py            -> cria/migra o esquema
+    #      python schema.py retention N -> apaga partições (e linhas da DEFAULT) com mais de N dias
+    # Migrações podem mover tabelas inteiras: sem o statement_timeout padrão
+    with connection(statement_timeout=0) as conn:
+        if conn is None:
+            sys.exit(1)
+        with conn.cursor() as cur:
+            ensure_schema(cur, migrate=True)
+            if sys.argv[1:2] == ["retention"]:
+                dropped = apply_retention(cur, int(sys.argv[2]))
+                print(f"🗑 {len(dropped)} partições removidas: {', '.join(dropped) or '-'}")
+        conn.commit()
+        print("✅ Esquema atualizado.")
@@ -0,0 +1,148 @@
+# segmenter.py
+
+import math
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple
+from ring_buffer import RingBuffer
+
+
+class Segment(NamedTuple):
+    """Resumo de um movimento contínuo (entre repousos ou cliques)."""
+    start_ts: datetime
+    end_ts: datetime
+    events: int
+    dx_direita: float
+    dx_esquerda: float
+    dy_cima: float
+    dy_baixo: float
+    distance: float        # comprimento do caminho percorrido
+    reason: str            # "idle" | "click" | "stop"
+    points: dict | None = None  # trajetória (x, y, t), se keep_points
+
+# Colunas persistidas (tudo menos a trajetória)
+SEGMENT_COLUMNS = Segment._fields[:-1]
+
+
+class MovementSegmenter:
+    """
+    Agrupa eventos de posição do mouse em segmentos de movimento.
+
+    on_move() é O(1) e de memória constante: atualiza os acumuladores por direção e
+    grava o ponto num RingBuffer de capacidade fixa, então um arrasto
+    longo não cresce a memória. Um único timer dorme até o prazo de
+    inatividade do segmento ativo (sem polling) e o fecha quando o mouse
+    fica parado por idle_timeout segundos. Cada segmento fechado vai para
+    `sink`, fora do lock, na thread que o fechou: o timer ou, em
+    close_segment(), quem chamou (o callback de clique). Por isso o sink
+    deve só enfileirar, como o SegmentWriter, que grava na própria thread.
+    """
+
+    def __init__(self, sink, idle_timeout: float = 1.0, capacity: int = 4096,
+                 keep_points: bool = False):
+        """
+        :param sink: função chamada com cada Segment fechado
+        :param idle_timeout: tempo parado (s) que encerra o segmento
+        :param capacity: pontos guardados da trajetória (os mais recentes)
+        :param keep_points: anexa a trajetória ao Segment emitido
+        """
+        self._sink = sink
+        self._idle_timeout = idle_timeout
+        self._keep_points = keep_points
+        self._ring = RingBuffer(capacity)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._active = False
+        self._reset()
+        self.segments = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _reset(self):
+        self._ring.clear()
+        self._start = self._last_t = 0.0
+        self._last_x = self._last_y = 0
+        self._events = 0
+        self._right = self._left = self._up = self._down = 0.0
+        self._distance = 0.0
+
+    def on_move(self, x, y, t: float | None = None):
+        """Registra uma posição absoluta (t em segundos desde a epoch; padrão: agora)."""
+        if t is None:
+            t = time.time()
+        with self._cond:
+            if not self._active:
+                self._reset()
+                self._active = True
+                self._start = t
+                # Acorda o timer para armar o prazo deste segmento
+                self._cond.notify()
+            else:
+                dx = x - self._last_x
+                dy = y - self._last_y
+                if dx > 0:
+                    self._right += dx
+                elif dx < 0:
+                    self._left -= dx
+                if dy < 0:
+                    self._up -= dy
+                elif dy > 0:
+                    self._down += dy
+                self._distance += math.hypot(dx, dy)
+            self._events += 1
+            self._last_x, self._last_y, self._last_t = x, y, t
+            self._ring.append(x, y, t)
+
+    def close_segment(self, reason: str = "click") -> Segment | None:
+        """Encerra o segmento ativo agora (ex.: num clique) e o entrega ao sink."""
+        with self._cond:
+            segment = self._take(reason)
+        if segment is not None:
+            self._sink(segment)
+        return segment
+
+    def _take(self, reason: str) -> Segment | None:
+        if not self._active:
+            return None
+        self._active = False
+        self.segments += 1
+        return Segment(
+            datetime.fromtimestamp(self._start), datetime.fromtimestamp(self._last_t),
+            self._events, self._right, self._left, self._up, self._down,
+            self._distance, reason,
+            self._ring.snapshot() if self._keep_points else None,
+        )
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._active and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # O prazo é recalculado a cada despertar a partir do último evento
+                remaining = self._last_t + self._idle_timeout - time.time()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                segment = self._take("idle")
+            self._sink(segment)
+
+    def close(self):
+        """Para o timer e entrega o segmento em andamento, se houver."""
+        with self._cond:
+            self._closed = True
+            segment = self._take("stop")
+            self._cond.notify()
+        self._thread.join()
+        if segment is not None:
+            self._sink(segment)
+
+    def stats(self) -> dict:
+        return {
+            "segments": self.segments,
+            "active": self._active,
+            "points": len(self._ring),
+            "overwritten": self._ring.overwritten,
+        }
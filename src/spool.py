@@ -0,0 +1,325 @@
+# spool.py
+
+import json
+import os
+import threading
+import uuid
+import mmap
+import numpy as np
+from utils import config
+from utils.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# Spool local de amostras (write-ahead log) para a ingestão.
+#
+# Toda amostra recebida é gravada primeiro aqui e só depois, por um
+# replayer (MouseMovementInserter), no PostgreSQL. Assim a aquisição nunca
+# espera pelo banco e nada se perde enquanto ele está fora do ar.
+#
+# Formato: segmentos de tamanho fixo <dir>/<n>.seg, pré-alocados e mapeados
+# em memória (mmap), com registros binários de RECORD_SIZE bytes
+# (RECORD_DTYPE). Cada registro leva seu número de sequência (lsn, a partir
+# de 1), e o registro de lsn L fica no segmento (L-1) // segment_records.
+# Na abertura, o fim do log é o último registro com lsn consecutivo, conferido
+# em todos os segmentos a partir do que ainda não foi confirmado: numa queda
+# do sistema, o fim de um segmento anterior ao último pode ficar zerado (lsn
+# 0, horário na epoch). O que vem depois da quebra é descartado; o resto do
+# segmento fica zerado (lsn 0 = vazio).
+#
+# Os device_id ficam em <dir>/devices.json (índice 0 = sem dispositivo);
+# os registros guardam só o índice.
+#
+# Durabilidade: append() só copia para o mmap (sobrevive à queda do
+# processo); sync() faz msync dos segmentos alterados e protege também
+# contra queda do sistema. commit(lsn) marca o que já está no banco e
+# compact() apaga os segmentos inteiramente confirmados.
+
+RECORD_DTYPE = np.dtype([
+    ("lsn", "<u8"),
+    ("ts", "<M8[us]"),        # horário do host (local, sem fuso)
+    ("device_ts", "<i8"),
+    ("seq", "<i8"),
+    ("dx", "<i4"),
+    ("dy", "<i4"),
+    ("device", "<u2"),        # índice em devices.json
+    ("L", "u1"),
+    ("U", "u1"),
+    ("R", "u1"),
+    ("D", "u1"),
+    ("X", "u1"),
+    ("flags", "u1"),          # bits FLAG_*: colunas NULL
+    ("reserved", "V16"),
+])
+RECORD_SIZE = RECORD_DTYPE.itemsize
+# Registros nunca cruzam uma página
+assert RECORD_SIZE == 64
+
+FLAG_NO_DEVICE_TS = 1
+FLAG_NO_SEQ = 2
+
+DEFAULT_DIR = config.get("SPOOL_DIR", "data/spool")
+SEGMENT_RECORDS = 65_536   # 4 MiB por segmento
+
+log = get_logger("spool")
+
+
+def make_records(n: int) -> np.ndarray:
+    """Registros zerados (lsn preenchido em append())."""
+    return np.zeros(n, dtype=RECORD_DTYPE)
+
+
+class Spool:
+    """
+    Log local, somente-anexação, de amostras de movimento em segmentos
+    mapeados em memória. Seguro entre threads; um único processo por
+    diretório (trava com flock onde disponível).
+    """
+
+    def __init__(self, path: str = DEFAULT_DIR, segment_records: int = SEGMENT_RECORDS):
+        """
+        :param path: diretório do spool (criado se não existir)
+        :param segment_records: registros por segmento (só vale para spools novos)
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._lock_file = open(os.path.join(path, "lock"), "a+")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise RuntimeError(f"Spool {path} já está em uso por outro processo")
+
+        meta = self._read_json("meta.json")
+        if meta is None:
+            meta = {"id": uuid.uuid4().hex, "segment_records": segment_records}
+            self._write_json("meta.json", meta)
+        self.spool_id = meta["id"]
+        self.segment_records = meta["segment_records"]
+        self._devices = self._read_json("devices.json") or [None]
+        self._device_index = {device: i for i, device in enumerate(self._devices)}
+
+        self._maps = {}      # segmento -> mmap aberto
+        self._dirty = set()  # segmentos com escrita ainda sem msync
+        self.committed = (self._read_json("committed.json") or {"lsn": 0})["lsn"]
+        self.head = self._recover()
+        # lsn íntegro na abertura: o que vier depois foi anexado por este processo
+        self.recovered = self.head
+
+    # -- arquivos auxiliares --------------------------------------------
+
+    def _read_json(self, name: str):
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_json(self, name: str, data, durable: bool = True):
+        # Grava num temporário e troca: nunca fica um arquivo pela metade
+        final = os.path.join(self.path, name)
+        tmp = final + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, final)
+
+    # -- segmentos --------------------------------------------------------
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"{segment:012d}.seg")
+
+    def _segments(self) -> list[int]:
+        return sorted(int(name[:-4]) for name in os.listdir(self.path) if name.endswith(".seg"))
+
+    def _map(self, segment: int, create: bool = False) -> mmap.mmap:
+        mm = self._maps.get(segment)
+        if mm is None:
+            path = self._segment_path(segment)
+            size = self.segment_records * RECORD_SIZE
+            if create and not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.truncate(size)
+                    os.fsync(f.fileno())
+            with open(path, "r+b") as f:
+                mm = self._maps[segment] = mmap.mmap(f.fileno(), size)
+        return mm
+
+    def _recover(self) -> int:
+        """
+        lsn do último registro íntegro (0 se o spool estiver vazio). Confere
+        os lsns de todos os segmentos com registros não confirmados e
+        descarta o que vier depois do primeiro fora de sequência.
+        """
+        head = self.committed
+        segments = self._segments()
+        for segment in segments:
+            base = segment * self.segment_records
+            if base + self.segment_records <= head:
+                continue  # inteiramente confirmado
+            if base > head:
+                break     # segmento faltando
+            lsn = np.frombuffer(self._map(segment)[:], dtype=RECORD_DTYPE)["lsn"]
+            expected = np.arange(head + 1, base + len(lsn) + 1, dtype=np.uint64)
+            broken = np.flatnonzero(lsn[head - base:] != expected)
+            head = base + len(lsn) if not len(broken) else head + int(broken[0])
+            if len(broken):
+                break
+        self._truncate(segments, head)
+        return head
+
+    def _truncate(self, segments: list[int], head: int):
+        """
+        Zera os registros depois de `head` e apaga os segmentos seguintes:
+        append() continua em `head` e não pode deixar registros antigos, de
+        lsn ainda válido, depois dos novos.
+        """
+        discarded = 0
+        for segment in segments:
+            base = segment * self.segment_records
+            if base + self.segment_records <= head:
+                continue
+            mm = self._map(segment)
+            start = max(head - base, 0)
+            stale = int(np.count_nonzero(np.frombuffer(mm[:], dtype=RECORD_DTYPE)["lsn"][start:]))
+            discarded += stale
+            if start:
+                if stale:
+                    mm[start * RECORD_SIZE:] = bytes(len(mm) - start * RECORD_SIZE)
+                    mm.flush()
+            else:
+                self._maps.pop(segment).close()
+                os.remove(self._segment_path(segment))
+        if discarded:
+            log.warning("⚠ Spool %s: %d registros depois do lsn %d descartados (fora de sequência)",
+                        self.path, discarded, head)
+
+    # -- API ----------------------------------------------------------------
+
+    def device_index(self, device_id: str | None) -> int:
+        """Índice de `device_id` nos registros (registra dispositivos novos)."""
+        index = self._device_index.get(device_id)
+        if index is None:
+            with self._lock:
+                index = self._device_index.get(device_id)
+                if index is None:
+                    if len(self._devices) > np.iinfo(np.uint16).max:
+                        raise ValueError("Spool sem espaço para novos dispositivos")
+                    self._devices.append(device_id)
+                    # Durável antes de qualquer registro que use o índice
+                    self._write_json("devices.json", self._devices)
+                    index = self._device_index[device_id] = len(self._devices) - 1
+        return index
+
+    def device_ids(self, indexes: np.ndarray) -> list:
+        """device_id (ou None) de cada índice."""
+        devices = self._devices
+        return [devices[i] for i in indexes.tolist()]
+
+    def renew_id(self):
+        """
+        Troca a identidade do spool (e, com ela, o marcador no banco). Usado
+        quando o banco já confirmou lsns que o spool perdeu numa queda do
+        sistema: os lsns seguintes seriam tomados como já gravados.
+        """
+        with self._lock:
+            self.spool_id = uuid.uuid4().hex
+            self._write_json("meta.json", {"id": self.spool_id, "segment_records": self.segment_records})
+
+    @property
+    def pending(self) -> int:
+        """Registros ainda não confirmados no banco."""
+        return self.head - self.committed
+
+    def append(self, records: np.ndarray) -> int:
+        """
+        Anexa registros RECORD_DTYPE (o campo lsn é preenchido aqui);
+        retorna o lsn do último. Só copia para a memória mapeada: não
+        espera disco nem banco.
+        """
+        n = len(records)
+        if not n:
+            return self.head
+        with self._lock:
+            records["lsn"] = np.arange(self.head + 1, self.head + 1 + n, dtype=np.uint64)
+            data = records.tobytes()
+            done = 0
+            while done < n:
+                segment, pos = divmod(self.head + done, self.segment_records)
+                count = min(n - done, self.segment_records - pos)
+                self._map(segment, create=True)[pos * RECORD_SIZE:(pos + count) * RECORD_SIZE] = \
+                    data[done * RECORD_SIZE:(done + count) * RECORD_SIZE]
+                self._dirty.add(segment)
+                done += count
+            self.head += n
+            return self.head
+
+    def read(self, limit: int) -> np.ndarray:
+        """
+        Cópia dos próximos registros não confirmados (até `limit`, sem cruzar
+        segmentos; vazio se não houver).
+        """
+        with self._lock:
+            start = self.committed
+            segment, pos = divmod(start, self.segment_records)
+            count = min(limit, self.head - start, self.segment_records - pos)
+            if count <= 0:
+                return make_records(0)
+            raw = self._map(segment)[pos * RECORD_SIZE:(pos + count) * RECORD_SIZE]
+        return np.frombuffer(raw, dtype=RECORD_DTYPE).copy()
+
+    def commit(self, lsn: int):
+        """
+        Marca os registros até `lsn` como gravados no banco. O marcador local
+        não precisa de fsync: o replayer confirma a posição no próprio banco.
+        """
+        with self._lock:
+            if lsn <= self.committed:
+                return
+            self.committed = min(lsn, self.head)
+        self._write_json("committed.json", {"lsn": self.committed}, durable=False)
+
+    def sync(self):
+        """msync dos segmentos alterados desde a última chamada."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            maps = [self._maps[segment] for segment in dirty if segment in self._maps]
+        for mm in maps:
+            mm.flush()
+
+    def compact(self) -> int:
+        """Apaga os segmentos cujos registros já estão todos no banco; retorna quantos."""
+        removed = 0
+        with self._lock:
+            # O segmento do fim do log fica: é nele que append() continua
+            keep_from = min(self.committed, self.head - 1) // self.segment_records if self.head else 0
+            if keep_from:
+                self._write_json("committed.json", {"lsn": self.committed})
+            for segment in self._segments():
+                if segment >= keep_from:
+                    break
+                mm = self._maps.pop(segment, None)
+                if mm is not None:
+                    if segment in self._dirty:
+                        mm.flush()
+                        self._dirty.discard(segment)
+                    mm.close()
+                os.remove(self._segment_path(segment))
+                removed += 1
+        return removed
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            for mm in self._maps.values():
+                mm.close()
+            self._maps.clear()
+        self._lock_file.close()
+
@@ -0,0 +1,62 @@
+# stream_reader.py
+
+import itertools
+import numpy as np
+
+# Leitura em streaming de consultas grandes.
+#
+# stream_columns() executa a consulta num cursor nomeado (server-side): o
+# PostgreSQL entrega `itersize` linhas por vez e cada lote vira um dict de
+# arrays NumPy, um por coluna. A memória do cliente fica limitada a um
+# lote, qualquer que seja o tamanho do resultado.
+
+DEFAULT_ITERSIZE = 50_000
+
+# Nomes únicos para os cursores nomeados da conexão
+_cursor_ids = itertools.count()
+
+
+def rows_to_columns(rows, fields) -> dict:
+    """
+    Converte tuplas em {campo: np.ndarray}.
+    :param fields: pares (nome, dtype) na ordem das colunas; em colunas
+        float, None vira NaN
+    """
+    if not rows:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in fields}
+    return {name: np.array(col, dtype=dtype) for (name, dtype), col in zip(fields, zip(*rows))}
+
+
+def concat_columns(*chunks) -> dict:
+    """Concatena lotes {campo: np.ndarray} com os mesmos campos."""
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def stream_columns(conn, sql: str, params=None, fields=(), itersize: int = DEFAULT_ITERSIZE):
+    """
+    Gera lotes {campo: np.ndarray} de até `itersize` linhas do resultado de `sql`.
+
+    :param fields: pares (nome, dtype), na ordem das colunas do SELECT
+    :param itersize: linhas por ida ao servidor (e por lote)
+
+    Cursores nomeados só existem dentro de uma transação: numa conexão em
+    autocommit (ex.: a do LISTEN), a leitura roda numa transação própria,
+    encerrada quando o gerador termina ou é fechado. Nas demais, a
+    transação continua sendo do chamador.
+    """
+    autocommit = conn.autocommit
+    if autocommit:
+        conn.autocommit = False
+    try:
+        with conn.cursor(name=f"stream_{next(_cursor_ids)}") as cur:
+            cur.itersize = itersize
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(itersize)
+                if not rows:
+                    break
+                yield rows_to_columns(rows, fields)
+    finally:
+        if autocommit and not conn.closed:
+            conn.rollback()  # só leitura: basta encerrar a transação
+            conn.autocommit = True
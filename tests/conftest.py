@@ -0,0 +1,25 @@
+# conftest.py
+
+import os
+import sys
+import pytest
+
+# Mesmo layout do PYTHONPATH=src:. dos scripts: módulos de src/ pelo nome,
+# pacotes utils/, processing/ e analyses/ a partir da raiz
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "src")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def db():
+    """
+    Conexão do pool (PG_* do ambiente/.env); pula o teste se o banco não
+    estiver disponível. Os testes apagam as linhas que gravam.
+    """
+    from database import connection
+    with connection() as conn:
+        if conn is None:
+            pytest.skip("PostgreSQL indisponível")
+        yield conn
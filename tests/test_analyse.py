@@ -0,0 +1,42 @@
+# test_analyse.py
+
+from datetime import datetime, timedelta
+from analyses.analyse import LiveWindow
+from schema import ensure_schema
+
+DEVICE = "TEST-LIVE-WINDOW"
+
+
+def _insert(cur, movement_ts, movement_id, id=None) -> int:
+    cur.execute("""
+        INSERT INTO mouse_analyse (id, movement_ts, vel_direita, vel_esquerda, vel_cima, vel_baixo,
+                                   device_id, movement_id)
+        VALUES (COALESCE(%s, nextval('mouse_analyse_id_seq')), %s, 1, 0, 0, 0, %s, %s) RETURNING id;
+    """, (id, movement_ts, DEVICE, movement_id))
+    return cur.fetchone()[0]
+
+
+def test_late_commit_with_smaller_id_is_shown_once(db):
+    """Id reservado antes e confirmado depois de um maior (gravações em paralelo) ainda entra na janela."""
+    now = datetime.now()
+    window = LiveWindow(capacity=10, device_id=DEVICE)
+    try:
+        with db.cursor() as cur:
+            ensure_schema(cur)
+            cur.execute("SELECT nextval('mouse_analyse_id_seq');")
+            late = cur.fetchone()[0]
+            first = _insert(cur, now, 2)
+        db.commit()
+        assert window.poll(db) == 1
+
+        with db.cursor() as cur:
+            _insert(cur, now - timedelta(seconds=1), 1, id=late)
+        db.commit()
+        assert window.poll(db) == 1
+        assert window.poll(db) == 0
+        assert window.snapshot()["id"].tolist() == [first, late]
+    finally:
+        db.rollback()
+        with db.cursor() as cur:
+            cur.execute("DELETE FROM mouse_analyse WHERE device_id = %s;", (DEVICE,))
+        db.commit()
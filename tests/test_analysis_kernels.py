@@ -0,0 +1,65 @@
+# test_analysis_kernels.py
+
+import numpy as np
+import pytest
+from analysis_kernels import ANALYSIS_COLUMNS, analyze_grouped, analyze_row, analyze_window, \
+    deltas_from_timestamps
+
+N = 10_000
+
+
+@pytest.fixture(scope="module")
+def samples():
+    """Deslocamentos com zeros e timestamps com intervalos nulos e abaixo do piso de 0.001 s."""
+    rng = np.random.default_rng(0)
+    dx = rng.integers(-40, 41, N)
+    dy = rng.integers(-40, 41, N)
+    dx[rng.random(N) < 0.1] = 0
+    dy[rng.random(N) < 0.1] = 0
+    steps = rng.choice([0, 200, 900, 1000, 5_000, 20_000], N - 1)  # µs
+    ts = np.datetime64("2025-01-01T00:00:00", "us") + np.concatenate(([0], np.cumsum(steps)))
+    return ts, dx, dy, rng
+
+
+def _assert_parity(batch, dx, dy, deltas):
+    got = np.column_stack([batch[name] for name in ANALYSIS_COLUMNS])
+    expected = np.array([
+        analyze_row(int(x), int(y), None if np.isnan(d) else float(d))
+        for x, y, d in zip(dx, dy, deltas)
+    ])
+    np.testing.assert_allclose(got, expected, rtol=1e-12, atol=0)
+
+
+def test_parity_with_scalar_formulas(samples):
+    ts, dx, dy, _ = samples
+    batch = analyze_window(ts, dx, dy)
+    _assert_parity(batch, dx, dy, deltas_from_timestamps(ts))
+
+
+def test_parity_with_explicit_deltas(samples):
+    """Intervalos desconhecidos (NaN), negativos, nulos e abaixo do piso."""
+    ts, dx, dy, rng = samples
+    deltas = rng.choice([np.nan, -0.5, 0.0, 0.0005, 0.001, 0.004], N)
+    batch = analyze_window(ts, dx, dy, deltas=deltas)
+    _assert_parity(batch, dx, dy, deltas)
+
+
+def test_grouped_intervals_stay_within_device():
+    """Amostras intercaladas: o intervalo de cada uma vem da próxima do mesmo dispositivo."""
+    t0 = np.datetime64("2025-01-01T00:00:00", "us")
+    groups = ["a", "b", "a", "b", "a"]
+    ts = t0 + np.array([0, 1_000, 4_000, 9_000, 10_000]) * np.timedelta64(1, "us")
+    dx = [4, 8, 6, 0, 1]
+    batch, perm, last = analyze_grouped(groups, np.arange(5), ts, dx, [0] * 5)
+    assert perm.tolist() == [0, 2, 4, 1, 3]
+    assert last.tolist() == [False, False, True, False, True]
+    np.testing.assert_allclose(batch["vel_direita"][:2], [4 / 0.004, 6 / 0.006])
+    np.testing.assert_allclose(batch["vel_direita"][3], 8 / 0.008)
+
+
+def test_grouped_prefers_device_clock():
+    t0 = np.datetime64("2025-01-01T00:00:00", "us")
+    ts = t0 + np.array([0, 5_000, 6_000]) * np.timedelta64(1, "us")   # chegada com jitter
+    device_ts = np.array([0.0, 2_000.0, np.nan])                      # relógio do dispositivo (µs)
+    batch, _, _ = analyze_grouped(["a"] * 3, np.arange(3), ts, [2, 2, 2], [0] * 3, device_ts=device_ts)
+    np.testing.assert_allclose(batch["vel_direita"][:2], [2 / 0.002, 2 / 0.001])
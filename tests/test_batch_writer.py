@@ -0,0 +1,207 @@
+# test_batch_writer.py
+
+import threading
+import time
+import pytest
+import insert_local
+from checkpoint import ensure_checkpoint_table, load_checkpoint, save_checkpoint
+from insert_local import BatchWriter
+
+TABLE = "test_batch_writer"
+CHECKPOINT = "test-batch-writer"
+
+
+class _Writer(BatchWriter):
+    sql = f"INSERT INTO {TABLE} (id, v) VALUES %s"
+    supports_checkpoint = True
+
+    def _prepare(self, cur):
+        pass
+
+    def _save_checkpoint(self, cur, checkpoint):
+        save_checkpoint(cur, CHECKPOINT, checkpoint)
+
+
+@pytest.fixture
+def table(db):
+    with db.cursor() as cur:
+        ensure_checkpoint_table(cur)
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}, {TABLE}_away;")
+        cur.execute(f"CREATE TABLE {TABLE} (id INTEGER PRIMARY KEY, v INTEGER CHECK (v >= 0));")
+        cur.execute("DELETE FROM analysis_checkpoint WHERE name = %s;", (CHECKPOINT,))
+    db.commit()
+    yield db
+    db.rollback()
+    with db.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}, {TABLE}_away;")
+        cur.execute("DELETE FROM analysis_checkpoint WHERE name = %s;", (CHECKPOINT,))
+    db.commit()
+
+
+def _stored(db):
+    with db.cursor() as cur:
+        cur.execute(f"SELECT id FROM {TABLE} ORDER BY id;")
+        ids = [r[0] for r in cur.fetchall()]
+        last, _ = load_checkpoint(cur, CHECKPOINT)
+    db.commit()
+    return ids, last
+
+
+def test_bad_rows_are_isolated(table):
+    """Duas linhas inválidas num lote de 100: só elas ficam de fora e o checkpoint avança."""
+    writer = _Writer(flush_size=1_000, flush_interval=3600)
+    try:
+        dropped = writer._dropped.get()
+        rows = [(i, -1 if i in (17, 80) else i) for i in range(100)]
+        writer.add_rows(rows, checkpoint=99)
+        assert writer.flush() == 98
+        assert writer._dropped.get() == dropped + 2
+    finally:
+        writer.close()
+    ids, last = _stored(table)
+    assert ids == [i for i in range(100) if i not in (17, 80)]
+    assert last == 99
+
+
+def test_bad_last_row_keeps_checkpoint(table):
+    writer = _Writer(flush_size=1_000, flush_interval=3600)
+    try:
+        writer.add_rows([(1, 1), (2, -1)], checkpoint=2)
+        assert writer.flush() == 1
+    finally:
+        writer.close()
+    assert _stored(table) == ([1], 2)
+
+
+def test_clean_batch_is_one_transaction(table):
+    writer = _Writer(flush_size=1_000, flush_interval=3600)
+    try:
+        before = writer._flush_rows.get()["count"]
+        writer.add_rows([(i, i) for i in range(10)], checkpoint=9)
+        assert writer.flush() == 10
+        assert writer._flush_rows.get()["count"] == before + 1
+    finally:
+        writer.close()
+    assert _stored(table) == (list(range(10)), 9)
+
+
+def test_buffer_keeps_newest_max_rows(table):
+    """Sem banco o buffer não passa de max_rows: as linhas mais antigas saem e são contadas."""
+    writer = _Writer(flush_size=1_000, flush_interval=3600, max_rows=5)
+    try:
+        dropped = writer._dropped.get()
+        writer.add_rows([(i, i) for i in range(4)])
+        # Lote que voltou do banco: mais antigo que o buffer, vai para a frente
+        writer._requeue([(i, i) for i in range(10, 14)], checkpoint=13)
+        assert writer._rows == [(13, 13), (0, 0), (1, 1), (2, 2), (3, 3)]
+        writer.add_rows([(4, 4)])
+        assert writer._rows[0] == (0, 0)
+        assert writer._dropped.get() == dropped + 4
+        assert writer.flush() == 5
+    finally:
+        writer.close()
+    assert _stored(table) == ([0, 1, 2, 3, 4], 13)
+
+
+class _Background(_Writer):
+    blocking = False
+
+
+def test_non_blocking_add_rows_wakes_writer_thread(table):
+    writer = _Background(flush_size=5, flush_interval=3600)
+    try:
+        writer.add_rows([(i, i) for i in range(6)], checkpoint=5)
+        deadline = time.monotonic() + 5
+        while _stored(table)[0] != list(range(6)) and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        writer.close()
+    assert _stored(table) == (list(range(6)), 5)
+
+
+def test_non_blocking_add_rows_never_waits_for_the_db(monkeypatch):
+    """Banco fora do ar e lento para recusar: quem enfileira não espera, só a thread do writer."""
+    calls = []
+
+    def slow_pool():
+        calls.append(threading.current_thread())
+        time.sleep(0.3)
+
+    monkeypatch.setattr(insert_local, "get_pool", slow_pool)
+    writer = _Background(flush_size=2, flush_interval=0.05)
+    try:
+        start = time.perf_counter()
+        for i in range(50):
+            writer.add_rows([(i, i)])
+        assert time.perf_counter() - start < 0.1
+        time.sleep(0.2)
+    finally:
+        writer._stop.set()
+        writer._wake.set()
+        writer._thread.join()
+    assert calls and threading.current_thread() not in calls
+    assert len(writer._rows) == 50           # tudo de volta ao buffer para a próxima tentativa
+
+
+class _Refused(_Writer):
+    """Transação que o banco recusa por inteiro enquanto `refuse` estiver definido."""
+    refuse = None
+
+    def _prepare(self, cur):
+        if self.refuse:
+            cur.execute(self.refuse)
+
+
+@pytest.mark.parametrize("refuse", [
+    "SET TRANSACTION READ ONLY;",                                          # réplica / failover
+    "SET LOCAL statement_timeout = '10ms'; SELECT pg_sleep(1);",           # statement_timeout
+])
+def test_batch_wide_error_keeps_rows(table, refuse):
+    """Erro que atinge o lote inteiro: uma só tentativa, nada descartado, tudo gravado depois."""
+    writer = _Refused(flush_size=1_000, flush_interval=3600)
+    try:
+        dropped, errors = writer._dropped.get(), writer._errors.get()
+        writer.refuse = refuse
+        writer.add_rows([(i, i) for i in range(100)], checkpoint=99)
+        assert writer.flush() == 0
+        assert (writer._dropped.get(), writer._errors.get()) == (dropped, errors + 1)
+        assert len(writer._rows) == 100 and writer._retry
+        writer.refuse = None
+        assert writer.flush() == 100
+    finally:
+        writer.close()
+    assert _stored(table) == (list(range(100)), 99)
+
+
+def test_missing_table_keeps_rows(table):
+    writer = _Writer(flush_size=1_000, flush_interval=3600)
+    try:
+        dropped = writer._dropped.get()
+        with table.cursor() as cur:
+            cur.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_away;")
+        table.commit()
+        writer.add_rows([(i, i) for i in range(10)])
+        assert writer.flush() == 0
+        assert len(writer._rows) == 10 and writer._dropped.get() == dropped
+        with table.cursor() as cur:
+            cur.execute(f"ALTER TABLE {TABLE}_away RENAME TO {TABLE};")
+        table.commit()
+        assert writer.flush() == 10
+    finally:
+        writer.close()
+    assert _stored(table)[0] == list(range(10))
+
+
+def test_checkpoint_rejected_without_support():
+    class _Plain(BatchWriter):
+        sql = f"INSERT INTO {TABLE} (id, v) VALUES %s"
+
+    writer = _Plain(flush_size=1_000, flush_interval=3600)
+    try:
+        with pytest.raises(ValueError):
+            writer.add_rows([(1, 1)], checkpoint=1)
+        assert writer._rows == [] and writer._checkpoint is None
+    finally:
+        writer._stop.set()
+        writer._wake.set()
+        writer._thread.join()
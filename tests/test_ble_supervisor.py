@@ -0,0 +1,133 @@
+# test_ble_supervisor.py
+
+import asyncio
+import json
+import ble_supervisor
+from ble_supervisor import DeviceSupervisor, FakeTransport
+
+_real_sleep = asyncio.sleep
+
+
+class _Pipeline:
+    """Recebe o que o supervisor enfileiraria no IngestPipeline."""
+
+    def __init__(self):
+        self.items = []
+
+    def submit(self, item) -> bool:
+        self.items.append(item)
+        return True
+
+
+class _FlakyTransport:
+    """Link que cai logo ao conectar, a não ser nas tentativas em `up` (fica de pé `up_for` s)."""
+
+    def __init__(self, attempts: int, up=(), up_for: float = 0.0):
+        self.attempts = 0
+        self._up = set(up)
+        self._up_for = up_for
+        self._until = attempts
+        self.done = asyncio.Event()
+
+    async def stream(self, address, on_data):
+        self.attempts += 1
+        if self.attempts >= self._until:
+            self.done.set()
+        if self.attempts in self._up:
+            await _real_sleep(self._up_for)
+            return
+        raise ConnectionError("link caiu")
+
+
+def _run_device(transport, monkeypatch, **kwargs) -> list[float]:
+    """Roda a task de um dispositivo até a última tentativa do transporte; retorna as esperas."""
+    delays = []
+
+    async def sleep(delay, *args):
+        delays.append(delay)
+        await _real_sleep(0)
+
+    async def scenario():
+        supervisor = DeviceSupervisor(transport, _Pipeline(), **kwargs)
+        monkeypatch.setattr(ble_supervisor.asyncio, "sleep", sleep)
+        task = asyncio.create_task(supervisor._run_device("AA:BB", "CORE-1"))
+        await transport.done.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        monkeypatch.undo()
+        return supervisor
+
+    supervisor = asyncio.run(scenario())
+    assert supervisor.connects["AA:BB"] == transport.attempts
+    return delays
+
+
+def test_reconnect_backoff_doubles_up_to_max(monkeypatch):
+    monkeypatch.setattr(ble_supervisor.random, "random", lambda: 1.0)   # sem jitter
+    delays = _run_device(_FlakyTransport(attempts=7), monkeypatch,
+                         backoff_initial=1.0, backoff_max=8.0)
+    assert delays == [1.0, 2.0, 4.0, 8.0, 8.0, 8.0, 8.0]
+
+
+def test_reconnect_jitter_stays_within_half(monkeypatch):
+    monkeypatch.setattr(ble_supervisor.random, "random", lambda: 0.0)
+    delays = _run_device(_FlakyTransport(attempts=4), monkeypatch,
+                         backoff_initial=1.0, backoff_max=8.0)
+    assert delays == [0.5, 1.0, 2.0, 4.0]
+
+
+def test_stable_link_resets_backoff(monkeypatch):
+    monkeypatch.setattr(ble_supervisor.random, "random", lambda: 1.0)
+    # A 4ª conexão fica de pé por backoff_max: a espera seguinte volta ao início
+    delays = _run_device(_FlakyTransport(attempts=6, up={4}, up_for=0.05), monkeypatch,
+                         backoff_initial=0.01, backoff_max=0.04)
+    assert delays == [0.01, 0.02, 0.04, 0.01, 0.02, 0.04]
+
+
+def test_samples_are_tagged_per_device():
+    """Três dispositivos falsos num só loop: cada amostra chega com o endereço de quem a enviou."""
+    async def scenario():
+        transport = FakeTransport(n_devices=3, rate_hz=500.0, chunk=7, seed=1)
+        pipeline = _Pipeline()
+        supervisor = DeviceSupervisor(transport, pipeline, prefixes=("CORE-FAKE",),
+                                      scan_interval=60.0)
+        runner = asyncio.create_task(supervisor.run())
+        await asyncio.sleep(0.3)
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        await supervisor.stop()
+        return transport, pipeline, supervisor
+
+    transport, pipeline, supervisor = asyncio.run(scenario())
+    addresses = [address for address, _ in transport._devices]
+    seqs = {address: [] for address in addresses}
+    for address, line, received_at in pipeline.items:
+        seqs[address].append(json.loads(line)["s"])
+        assert received_at > 0
+    for address in addresses:
+        # Notificações de 7 bytes cortam as linhas, mas nada se mistura entre dispositivos
+        assert len(seqs[address]) > 10
+        assert seqs[address] == list(range(len(seqs[address])))
+    stats = supervisor.stats()
+    assert sorted(stats) == sorted(addresses)
+    assert all(s["mode"] == "json" and s["malformed"] == 0 for s in stats.values())
+
+
+def test_prefix_filter_and_device_limit():
+    async def scenario():
+        transport = FakeTransport(n_devices=3)
+        pipeline = _Pipeline()
+        ignored = DeviceSupervisor(transport, pipeline, prefixes=("OTHER",), scan_interval=60.0)
+        limited = DeviceSupervisor(transport, pipeline, max_devices=2, scan_interval=60.0)
+        runners = [asyncio.create_task(s.run()) for s in (ignored, limited)]
+        await asyncio.sleep(0.05)
+        for runner in runners:
+            runner.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+        await ignored.stop()
+        await limited.stop()
+        return ignored, limited
+
+    ignored, limited = asyncio.run(scenario())
+    assert ignored.connects == {}
+    assert len(limited.connects) == 2
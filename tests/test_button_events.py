@@ -0,0 +1,89 @@
+# test_button_events.py
+
+from datetime import datetime, timedelta
+import numpy as np
+from packet_format import pack_buttons
+from processing.button_events import EMPTY_STATE, ButtonTracker
+
+START = np.datetime64("2026-01-01T12:00:00", "us")
+
+
+def _stream(n):
+    ts = START + np.arange(n) * np.timedelta64(1, "ms")
+    return ts, np.zeros(n, dtype=np.uint8), np.zeros(n, dtype=np.int32)
+
+
+def _detect(tracker, device_id, ts, bits, zeros):
+    events, state = tracker.detect(device_id, ts, bits, zeros, zeros)
+    tracker.commit({device_id: state})
+    return [(e.button, e.action, e.duration_ms) for e in events], state
+
+
+def test_edges_across_batches():
+    """Botão segurado, duplo clique e clique de uma amostra, cortados em dois lotes."""
+    ts, bits, zeros = _stream(1000)
+    bits[100:600] = pack_buttons(L=1)                       # L segurado 500 ms
+    bits[700:750] = bits[800:850] = pack_buttons(X=1)       # duplo clique em X
+    bits[900] = pack_buttons(R=1)                           # clique de uma amostra
+
+    tracker = ButtonTracker()
+    first, _ = _detect(tracker, "dev", ts[:650], bits[:650], zeros[:650])
+    second, state = _detect(tracker, "dev", ts[650:], bits[650:], zeros[650:])
+    assert first + second == [("L", "press", None), ("L", "release", 500.0),
+                              ("X", "press", None), ("X", "release", 50.0),
+                              ("X", "double", None), ("X", "release", 50.0),
+                              ("R", "press", None), ("R", "release", 1.0)]
+    assert state.bits == 0
+    assert tracker.stats() == {"samples": 1000, "events": 8, "devices": 1}
+
+
+def test_third_click_starts_new_pair():
+    ts, bits, zeros = _stream(600)
+    for start in (0, 100, 200, 500):                        # a última fora da janela
+        bits[start:start + 20] = pack_buttons(U=1)
+    got, _ = _detect(ButtonTracker(double_click=0.15), "dev", ts, bits, zeros)
+    assert [action for _, action, _ in got if action != "release"] == ["press", "double", "press", "press"]
+
+
+def test_detect_without_commit_keeps_state():
+    ts, bits, zeros = _stream(10)
+    bits[5:] = pack_buttons(D=1)
+    tracker = ButtonTracker()
+    events, _ = tracker.detect("dev", ts, bits, zeros, zeros)
+    assert len(events) == 1
+    assert tracker.state("dev") == EMPTY_STATE
+    again, _ = tracker.detect("dev", ts, bits, zeros, zeros)   # lote refeito após rollback
+    assert again == events
+
+
+def test_devices_are_independent():
+    ts, bits, zeros = _stream(10)
+    bits[:] = pack_buttons(L=1)
+    tracker = ButtonTracker()
+    _detect(tracker, "a", ts, bits, zeros)
+    got, _ = _detect(tracker, "b", ts, bits, zeros)
+    assert got == [("L", "press", None)]
+    got, _ = _detect(tracker, "a", ts, bits, zeros)
+    assert got == []
+
+
+def test_restore_keeps_held_button(db):
+    """Após reiniciar, um botão ainda segurado não gera outro press e o release tem a duração total."""
+    from schema import ensure_schema
+    pressed = datetime.now().replace(microsecond=0) - timedelta(seconds=2)
+    with db.cursor() as cur:
+        ensure_schema(cur)
+        db.commit()
+        cur.execute("""
+            INSERT INTO mouse_clicks (timestamp, dx, dy, action, device_id, button, duration_ms)
+            VALUES (%s, 0, 0, 'press', 'TEST-BUTTONS', 'L', NULL);
+        """, (pressed,))
+        tracker = ButtonTracker()
+        tracker.restore(cur)
+    db.rollback()
+
+    ts = np.datetime64(pressed, "us") + np.array([1_000_000, 2_000_000]) * np.timedelta64(1, "us")
+    bits = np.array([pack_buttons(L=1), 0], dtype=np.uint8)
+    zeros = np.zeros(2, dtype=np.int32)
+    got, _ = _detect(tracker, "TEST-BUTTONS", ts, bits, zeros)
+    assert got == [("L", "release", 2000.0)]
@@ -0,0 +1,148 @@
+# test_database.py
+
+import threading
+import time
+import psycopg2
+import pytest
+from psycopg2.pool import PoolError
+import database
+from database import ConnectionPool, connection, get_pool
+from utils.config import database_settings
+
+
+@pytest.fixture
+def fresh_pool(monkeypatch):
+    """Estado do pool do processo isolado: o teste parte sem pool e sem falha registrada."""
+    monkeypatch.setattr(database, "_pool", None)
+    monkeypatch.setattr(database, "_pool_pid", None)
+    monkeypatch.setattr(database, "_inherited", [])
+    monkeypatch.setattr(database, "_retry_at", None)
+    monkeypatch.setattr(database, "_retry_delay", database.POOL_RETRY_INITIAL)
+    yield
+    for conn_pool in [database._pool] + database._inherited:
+        if conn_pool is not None:
+            conn_pool.closeall()
+
+
+def _pool(**kwargs) -> ConnectionPool:
+    return ConnectionPool(params=database_settings().connect_params(), **kwargs)
+
+
+def _backend_pid(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_backend_pid();")
+        pid = cur.fetchone()[0]
+    conn.commit()
+    return pid
+
+
+def test_health_check_replaces_dead_connection(db):
+    conn_pool = _pool(minconn=1, maxconn=2, health_check=0.0)
+    try:
+        conn = conn_pool.getconn()
+        pid = _backend_pid(conn)
+        conn_pool.putconn(conn)
+        # Servidor derruba a sessão ociosa (reinício, idle timeout...)
+        with db.cursor() as cur:
+            cur.execute("SELECT pg_terminate_backend(%s);", (pid,))
+        db.commit()
+        time.sleep(0.1)
+
+        conn = conn_pool.getconn()
+        assert _backend_pid(conn) != pid
+        conn_pool.putconn(conn)
+        stats = conn_pool.stats()
+        assert (stats["discarded"], stats["opened"], stats["size"]) == (1, 2, 1)
+    finally:
+        conn_pool.closeall()
+
+
+def test_putconn_discards_broken_and_resets_state(db):
+    conn_pool = _pool(minconn=0, maxconn=2)
+    try:
+        conn = conn_pool.getconn()
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")              # transação aberta
+        conn_pool.putconn(conn)
+        assert conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        conn = conn_pool.getconn()
+        conn.autocommit = True
+        conn_pool.putconn(conn)
+        assert not conn.autocommit
+        assert conn_pool.stats()["idle"] == 1
+
+        conn = conn_pool.getconn()
+        conn.close()
+        conn_pool.putconn(conn)
+        stats = conn_pool.stats()
+        assert (stats["size"], stats["idle"], stats["opened"], stats["discarded"]) == (0, 0, 1, 1)
+    finally:
+        conn_pool.closeall()
+
+
+def test_exhausted_pool_waits_then_raises(db):
+    conn_pool = _pool(minconn=0, maxconn=1, timeout=0.1)
+    try:
+        conn = conn_pool.getconn()
+        with pytest.raises(PoolError):
+            conn_pool.getconn()
+
+        # Quem espera recebe a conexão assim que ela volta
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(conn_pool.getconn(timeout=5.0)))
+        waiter.start()
+        time.sleep(0.05)
+        conn_pool.putconn(conn)
+        waiter.join()
+        assert got == [conn]
+        assert conn_pool.stats()["waits"] >= 2
+        conn_pool.putconn(got[0])
+    finally:
+        conn_pool.closeall()
+
+
+def test_fork_gets_its_own_pool(db, fresh_pool, monkeypatch):
+    parent = get_pool()
+    assert parent is not None and get_pool() is parent
+    monkeypatch.setattr(database.os, "getpid", lambda: database._pool_pid + 1)
+    child = get_pool()
+    assert child is not None and child is not parent
+    # As conexões do pai não são fechadas no filho, só guardadas
+    assert database._inherited == [parent]
+    assert parent.stats()["size"] >= 1
+
+
+def test_db_down_is_cached_with_backoff(fresh_pool, monkeypatch):
+    attempts = []
+
+    def down(*args, **kwargs):
+        attempts.append(time.monotonic())
+        raise psycopg2.OperationalError("could not connect to server")
+
+    monkeypatch.setattr(database, "ConnectionPool", down)
+    with connection() as conn:
+        assert conn is None
+    assert get_pool() is None and get_pool() is None       # dentro da espera: nem tenta
+    assert len(attempts) == 1
+    assert database._retry_at - attempts[0] == pytest.approx(database.POOL_RETRY_INITIAL, abs=0.1)
+
+    delays = []
+    for _ in range(8):
+        database._retry_at = time.monotonic()                # fim da espera
+        delays.append(database._retry_delay)
+        assert get_pool() is None
+    assert len(attempts) == 9
+    assert delays == [2.0, 4.0, 8.0, 16.0, 30.0, 30.0, 30.0, 30.0]
+
+
+def test_connection_with_unreachable_server(fresh_pool, monkeypatch):
+    settings = database_settings()._replace(host="/nonexistent", connect_timeout=1)
+    monkeypatch.setattr(database, "database_settings", lambda: settings)
+    monkeypatch.setattr(ConnectionPool, "_open", lambda self: psycopg2.connect(**self._params))
+    start = time.perf_counter()
+    with connection() as conn:
+        assert conn is None
+    with connection() as conn:
+        assert conn is None
+    assert time.perf_counter() - start < 1.0
+    assert database._pool is None and database._retry_at is not None
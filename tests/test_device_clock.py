@@ -0,0 +1,80 @@
+# test_device_clock.py
+
+import numpy as np
+from device_clock import DeviceClock, unwrap, unwrap_one
+
+
+def test_unwrap_counts_backwards_steps_as_negative():
+    raw = np.array([65_534, 65_535, 0, 1, 0, 2])   # volta do u16 e um pacote atrasado
+    assert unwrap(raw, None, 16).tolist() == [65_534, 65_535, 65_536, 65_537, 65_536, 65_538]
+    assert unwrap(np.array([3]), 65_535, 16).tolist() == [65_539]
+    assert [unwrap_one(3, 65_535, 16), unwrap_one(65_534, 65_537, 16), unwrap_one(7, None, 16)] == [65_539, 65_534, 7]
+
+
+def test_skew_offset_and_counters():
+    """
+    Dispositivo com deriva de 150 ppm, atraso de transporte aleatório (mínimo
+    5 ms), 1% de perdas, 20 pares reordenados e volta dos contadores (u16/u32).
+    """
+    seconds, rate_hz, skew_ppm = 600.0, 100.0, 150.0
+    rng = np.random.default_rng(0)
+    n = int(seconds * rate_hz)
+    host_true = 1.7e9 + np.arange(n) / rate_hz
+    device_us = ((host_true - host_true[0]) * (1 + skew_ppm * 1e-6) * 1e6).astype(np.int64)
+    device_us += (1 << 32) - 30_000_000  # o u32 dá a volta 30 s após o início
+    seq = np.arange(n) + 65_000          # e o u16 logo depois
+
+    keep = rng.random(n) >= 0.01
+    keep[0] = True
+    idx = np.flatnonzero(keep)
+    swap = rng.choice(np.arange(0, len(idx) - 1, 2), 20, replace=False)
+    idx[swap], idx[swap + 1] = idx[swap + 1], idx[swap].copy()
+
+    clock = DeviceClock()
+    errors = []
+    for chunk in np.array_split(idx, len(idx) // 5):   # notificações de ~5 amostras
+        arrival = host_true[chunk].max() + 0.005 + rng.exponential(0.02)
+        host, unwrapped, _ = clock.observe(device_us[chunk] & 0xFFFFFFFF,
+                                           seq[chunk] & 0xFFFF, arrival)
+        np.testing.assert_array_equal(unwrapped, device_us[chunk])
+        errors.append(host - host_true[chunk])
+
+    errors = np.concatenate(errors)[len(idx) // 2:]   # após a convergência
+    stats = clock.stats()
+    assert stats["lost"] == n - len(idx)
+    assert stats["reordered"] == len(swap)
+    assert stats["duplicates"] == 0
+    assert abs(stats["skew_ppm"] - skew_ppm) < 20
+    assert abs(np.median(errors) - 0.005) < 0.005
+
+
+def test_resync_after_device_restart():
+    clock = DeviceClock()
+    for i in range(200):
+        clock.observe(np.array([i * 10_000]), np.array([i]), 1_000.0 + i * 0.01 + 0.005)
+    host, _, seq = clock.observe(np.array([0]), np.array([0]), 1_100.0)   # relógio voltou a zero
+    assert clock.resyncs == 1
+    assert abs(host[0] - 1_100.0) < 1e-6
+    assert seq.tolist() == [0]
+
+
+def test_observe_one_matches_observe():
+    """Caminho escalar (JSON) igual ao vetorial amostra a amostra: voltas, perdas, reordenação, duplicata e reinício."""
+    rng = np.random.default_rng(1)
+    n = 3_000
+    device_us = ((1 << 32) - 5_000_000 + np.arange(n) * 10_000) & 0xFFFFFFFF
+    seq = (np.arange(n) + 65_400) & 0xFFFF
+    order = np.flatnonzero(rng.random(n) >= 0.02)
+    order[[100, 101]] = order[[101, 100]]
+    order = np.insert(order, 500, order[499])          # duplicata
+    device_us[2_000:] -= device_us[2_000]              # reinício do dispositivo
+    seq[2_000:] -= seq[2_000]
+    arrival = 1_000.0 + order * 0.01 + 0.005 + rng.exponential(0.01, len(order))
+
+    vector, scalar = DeviceClock(), DeviceClock()
+    for i, t in zip(order, arrival):
+        host, us, s = vector.observe(device_us[[i]], seq[[i]], t)
+        assert scalar.observe_one(int(device_us[i]), int(seq[i]), t) == (host[0], us[0], s[0])
+    last = int(device_us[order[-1]]) + 10_000           # amostra seguinte, sem seq
+    assert scalar.observe_one(last, None, arrival[-1]) == tuple(vector.observe([last], None, arrival[-1])[:2]) + (None,)
+    assert scalar.stats() == vector.stats() and vector.resyncs == 1
@@ -0,0 +1,101 @@
+# test_filters.py
+
+import numpy as np
+import pytest
+from analysis_kernels import MIN_DELTA, analyze_grouped
+from processing.filters import Resampler, median_filter, parse_chain, resample, savgol_filter
+
+N = 20_000
+
+
+@pytest.fixture(scope="module")
+def jittered():
+    """Senoide de velocidade com 40 intervalos encurtados até o piso (picos)."""
+    rng = np.random.default_rng(0)
+    dt = np.full(N, 0.002) + rng.normal(0, 0.0002, N)
+    spikes = rng.choice(N, 40, replace=False)
+    dt[spikes] = 0.001
+    true_v = 800 * np.sin(np.arange(N) / 300)
+    dx = np.round(true_v * 0.002)
+    return dt, dx, dx / dt, spikes, true_v
+
+
+@pytest.mark.parametrize("spec", ["median:3", "savgol:9:2", "oneeuro:3:0.002:1", "median:5,oneeuro"])
+def test_streaming_matches_batch(jittered, spec):
+    dt, _, vx, _, _ = jittered
+    vy = np.zeros(N)
+    groups = np.array(["dev"] * N, dtype=object)
+    whole = parse_chain(spec)(groups, vx, vy, dt)
+    chain = parse_chain(spec)
+    parts = [chain(groups[lo:lo + 777], vx[lo:lo + 777], vy[lo:lo + 777], dt[lo:lo + 777])
+             for lo in range(0, N, 777)]
+    for a, b in zip(whole, (np.concatenate([p[i] for p in parts]) for i in range(3))):
+        np.testing.assert_allclose(a, b, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("spec", ["median:3", "median:5,oneeuro"])
+def test_median_removes_spikes(jittered, spec):
+    dt, _, vx, spikes, true_v = jittered
+    filtered = parse_chain(spec)(np.array(["dev"] * N, dtype=object), vx, np.zeros(N), dt)[0]
+    assert np.abs(vx[spikes]).max() > 1.5 * np.abs(true_v).max()
+    assert np.abs(filtered[spikes]).max() < 1.5 * np.abs(true_v).max()
+
+
+def test_interleaved_devices_keep_separate_state():
+    rng = np.random.default_rng(1)
+    a, b = rng.normal(0, 100, 50), rng.normal(1000, 100, 50)
+    groups = np.array(["a"] * 10 + ["b"] * 10 + ["a"] * 40 + ["b"] * 40, dtype=object)
+    vx = np.concatenate([a[:10], b[:10], a[10:], b[10:]])
+    dt = np.full(100, 0.002)
+    out = parse_chain("median:3,savgol:5:2")(groups, vx, np.zeros(100), dt)[0]
+    alone = parse_chain("median:3,savgol:5:2")
+    np.testing.assert_allclose(out[groups == "a"], alone(["a"] * 50, a, np.zeros(50), dt[:50])[0])
+    np.testing.assert_allclose(out[groups == "b"], alone(["b"] * 50, b, np.zeros(50), dt[:50])[0])
+
+
+def test_batch_filters_are_causal():
+    x = np.array([1.0, 5.0, 2.0, 8.0, 3.0, 100.0])
+    np.testing.assert_array_equal(median_filter(x, 3), [1.0, 3.0, 2.0, 5.0, 3.0, 8.0])
+    ramp = np.arange(10.0)
+    np.testing.assert_allclose(savgol_filter(ramp, 5, 1)[4:], ramp[4:])  # reta exata
+    for split in range(1, len(x)):   # histórico maior que k - 1: só as últimas contam
+        np.testing.assert_allclose(median_filter(x[split:], 3, history=x[:split]), median_filter(x, 3)[split:])
+        np.testing.assert_allclose(savgol_filter(x[split:], 5, 2, history=x[:split]), savgol_filter(x, 5, 2)[split:])
+
+
+@pytest.mark.parametrize("spec", ["", "none", None])
+def test_empty_chain(spec):
+    assert parse_chain(spec) is None
+
+
+def test_unknown_filter():
+    with pytest.raises(ValueError):
+        parse_chain("median:3,kalman")
+    with pytest.raises(ValueError):
+        parse_chain("savgol:3:3")
+
+
+def test_resample_conserves_displacement(jittered):
+    """Grade uniforme e deslocamento conservado (até o último ponto da grade), em qualquer divisão."""
+    dt, dx, _, _, _ = jittered
+    t_us = np.cumsum(np.round(dt * 1e6)).astype(np.int64)
+    grid, rx, _, _ = resample(t_us, dx, np.zeros(N), 250)
+    resampler = Resampler(250)
+    pieces = [resampler.process("dev", t_us[lo:lo + 999], dx[lo:lo + 999], np.zeros(len(dx[lo:lo + 999])))
+              for lo in range(0, N, 999)]
+    assert len(grid) > 1 and np.all(np.diff(grid) == 4000)
+    assert abs(rx.sum() - np.interp(grid[-1], t_us, np.cumsum(dx) - dx[0])) < 1e-6
+    np.testing.assert_array_equal(grid, np.concatenate([p[0] for p in pieces]))
+    np.testing.assert_allclose(rx, np.concatenate([p[1] for p in pieces]))
+
+
+def test_smoothed_analysis_keeps_still_rows_zero():
+    t0 = np.datetime64("2025-01-01T00:00:00", "us")
+    ts = t0 + np.arange(8) * np.timedelta64(2_000, "us")
+    dx = np.array([0, 4, 4, 40, 4, 0, 0, 4])
+    batch, _, last = analyze_grouped(["a"] * 8, np.arange(8), ts, dx, np.zeros(8, dtype=int),
+                                  smooth=parse_chain("median:3,oneeuro"))
+    speed = batch["vel_direita"]
+    assert np.all(speed[dx == 0] == 0)
+    assert speed[3] < 40 / 0.002          # pico atenuado
+    assert last[-1] and speed[-1] == 4 / MIN_DELTA   # última do dispositivo: sem filtro, intervalo no piso
@@ -0,0 +1,43 @@
+# test_framing.py
+
+from framing import LineFramer, is_json_object
+
+
+def test_frames_split_across_feeds():
+    framer = LineFramer()
+    assert framer.feed(b'{"dx": 1}\n{"dx"') == [b'{"dx": 1}']
+    assert framer.feed(b': 2}') == []
+    assert framer.feed(b"\n\n{}\r\n") == [b'{"dx": 2}', b"{}"]
+    assert framer.stats()["pending_bytes"] == 0
+
+
+def test_delimiter_split_across_feeds():
+    framer = LineFramer(delimiter=b"\r\n")
+    assert framer.feed(b"a=1\r") == []
+    assert framer.feed(b"\nb=2\r") == [b"a=1"]
+    assert framer.feed(b"\n") == [b"b=2"]
+    # Byte a byte dá o mesmo resultado
+    stream = b"x=1\r\ny=22\r\n\r\nz=333\r\n"
+    framer = LineFramer(delimiter=b"\r\n")
+    frames = [frame for i in range(len(stream)) for frame in framer.feed(stream[i:i + 1])]
+    assert frames == [b"x=1", b"y=22", b"z=333"]
+
+
+def test_oversized_frame_is_discarded_and_resyncs():
+    framer = LineFramer(max_frame=8)
+    # Sem delimitador além do limite: descarta e ignora até a próxima quebra de linha
+    assert framer.feed(b"0123456789") == []
+    assert framer.feed(b"abc") == []
+    assert framer.feed(b"def\nok\n") == [b"ok"]
+    assert framer.stats() == {"frames": 1, "malformed": 0, "oversized": 1,
+                              "discarded_bytes": 17, "pending_bytes": 0}
+    # Quadro grande com o delimitador no mesmo bloco: só ele sai
+    assert framer.feed(b"ok2\n" + b"x" * 20 + b"\nok3\n") == [b"ok2", b"ok3"]
+    assert framer.oversized == 2 and framer.discarded_bytes == 17 + 21
+
+
+def test_accept_filter_counts_malformed():
+    framer = LineFramer(accept=is_json_object)
+    frames = framer.feed(b'{"dx": 1}\nlixo\n  {"dx": 2}  \n{"dx": 3\n')
+    assert frames == [b'{"dx": 1}', b'{"dx": 2}']
+    assert (framer.frames, framer.malformed) == (2, 2)
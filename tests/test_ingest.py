@@ -0,0 +1,66 @@
+# test_ingest.py
+
+import json
+import select
+import time
+from database import get_connection
+from insert_local import NOTIFY_CHANNEL, MouseMovementInserter, reserve_ids
+from spool import Spool
+
+DEVICE = "TEST-INGEST"
+
+
+def test_reserve_ids_contiguous_and_gaps(db):
+    with db.cursor() as cur:
+        cur.execute("CREATE TEMP SEQUENCE test_reserve_seq; CREATE TEMP SEQUENCE test_reserve_gaps INCREMENT 3;")
+        assert reserve_ids(cur, 5, "test_reserve_seq") == range(1, 6)
+        assert reserve_ids(cur, 2, "test_reserve_seq") == range(6, 8)
+        assert list(reserve_ids(cur, 4, "test_reserve_gaps")) == [1, 4, 7, 10]
+    db.rollback()
+
+
+def _drain(inserter, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while inserter.pending and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert inserter.pending == 0
+
+
+def test_notify_matches_copied_ids(tmp_path, db):
+    """COPY com ids reservados: a faixa anunciada é exatamente a das linhas gravadas."""
+    listener = get_connection()
+    listener.autocommit = True
+    try:
+        with listener.cursor() as cur:
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL};")
+        inserter = MouseMovementInserter(spool_dir=str(tmp_path), flush_interval=0.05)
+        try:
+            payload = json.dumps({"dx": 1, "dy": -1, "L": 0, "U": 0, "R": 0, "D": 0, "X": 0})
+            for _ in range(25):
+                inserter.insert_from_json(payload, device_id=DEVICE)
+            _drain(inserter)
+        finally:
+            inserter.close()
+
+        ranges = []
+        deadline = time.monotonic() + 5
+        with db.cursor() as cur:
+            cur.execute("SELECT id FROM mouse_movements WHERE device_id = %s ORDER BY id;", (DEVICE,))
+            ids = [r[0] for r in cur.fetchall()]
+        db.commit()
+        while time.monotonic() < deadline and sum(hi - lo + 1 for lo, hi in ranges) < len(ids):
+            select.select([listener], [], [], 0.1)
+            listener.poll()
+            ranges += [tuple(map(int, n.payload.split("-"))) for n in listener.notifies]
+            listener.notifies.clear()
+        assert len(ids) == 25
+        covered = [i for lo, hi in ranges for i in range(lo, hi + 1)]
+        assert covered == ids
+    finally:
+        listener.close()
+        spool = Spool(str(tmp_path))
+        spool.close()
+        with db.cursor() as cur:
+            cur.execute("DELETE FROM mouse_movements WHERE device_id = %s;", (DEVICE,))
+            cur.execute("DELETE FROM analysis_checkpoint WHERE name = %s;", (f"spool:{spool.spool_id}",))
+        db.commit()
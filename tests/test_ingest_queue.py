@@ -0,0 +1,98 @@
+# test_ingest_queue.py
+
+import asyncio
+import threading
+import time
+from ingest_queue import IngestPipeline
+
+
+class SlowSink:
+    """Sink bloqueante que demora `delay` s por lote e só começa quando `gate` abre."""
+
+    def __init__(self, delay: float = 0.0, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.gate = threading.Event()
+        self.gate.set()
+        self.batches = []
+
+    def __call__(self, batch):
+        self.gate.wait()
+        time.sleep(self.delay)
+        if self.fail_on is not None and self.fail_on in batch:
+            raise RuntimeError("banco fora do ar")
+        self.batches.append(list(batch))
+
+    @property
+    def items(self):
+        return [item for batch in self.batches for item in batch]
+
+
+def test_submit_drops_when_full():
+    async def scenario():
+        sink = SlowSink()
+        sink.gate.clear()
+        pipeline = IngestPipeline(sink, maxsize=3, batch_size=1)
+        pipeline.start()
+        assert pipeline.submit(0)
+        await asyncio.sleep(0.05)           # a task tira o 0 da fila e fica presa no sink
+        accepted = [pipeline.submit(i) for i in range(1, 6)]
+        assert accepted == [True, True, True, False, False]
+        assert pipeline.depth == 3
+        sink.gate.set()
+        await pipeline.stop()
+        return sink, pipeline
+
+    sink, pipeline = asyncio.run(scenario())
+    assert sink.items == [0, 1, 2, 3]
+    stats = pipeline.stats()
+    assert (stats["enqueued"], stats["dropped"], stats["written"]) == (4, 2, 4)
+    assert (stats["depth"], stats["max_depth"]) == (0, 3)
+
+
+def test_put_waits_and_keeps_order():
+    """Produtor mais rápido que o sink: put() espera vaga, nada se perde e a ordem se mantém."""
+    async def scenario():
+        sink = SlowSink(delay=0.005)
+        pipeline = IngestPipeline(sink, maxsize=10, batch_size=4)
+        pipeline.start()
+        for i in range(200):
+            await pipeline.put(i)
+        await pipeline.stop()
+        return sink, pipeline
+
+    sink, pipeline = asyncio.run(scenario())
+    assert sink.items == list(range(200))
+    assert max(len(batch) for batch in sink.batches) == 4
+    assert pipeline.dropped == 0 and pipeline.max_depth <= 10
+
+
+def test_stop_drains_queue():
+    async def scenario():
+        sink = SlowSink(delay=0.01)
+        pipeline = IngestPipeline(sink, batch_size=8)
+        pipeline.start()
+        for i in range(50):
+            pipeline.submit(i)
+        await pipeline.stop()
+        return sink, pipeline
+
+    sink, pipeline = asyncio.run(scenario())
+    assert sink.items == list(range(50))
+    assert pipeline.depth == 0 and pipeline.written == 50
+
+
+def test_failed_batch_is_counted_and_pipeline_continues():
+    async def scenario():
+        sink = SlowSink(fail_on=3)
+        pipeline = IngestPipeline(sink, batch_size=2)
+        pipeline.start()
+        for i in range(6):
+            await pipeline.put(i)
+            await asyncio.sleep(0.01)       # um lote por item
+        await pipeline.stop()
+        return sink, pipeline
+
+    sink, pipeline = asyncio.run(scenario())
+    assert sink.items == [0, 1, 2, 4, 5]
+    assert pipeline.failed == 1 and pipeline.written == 5
@@ -0,0 +1,83 @@
+# test_joylink.py
+
+import threading
+import time
+from datetime import datetime
+import insert_local
+from joylink import JoyLinkReader, JoystickWriter, parse_line
+
+
+class _ChunkSource:
+    """Fonte em memória: entrega os blocos em ordem e depois o fim (None)."""
+
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+        self.reads = []
+
+    def read(self, size):
+        self.reads.append(time.perf_counter())
+        return self._chunks.pop(0) if self._chunks else None
+
+    def close(self):
+        pass
+
+
+def test_parse_line():
+    now = datetime(2025, 1, 1)
+    assert parse_line(b"A0=512,A1=498,B0=1,B1=0,B3=1", now) == (
+        now, 512, 498, 0b1001, '{"B0":1,"B1":0,"B3":1}')
+    assert parse_line(b"A0=1,A1=x", now) is None
+    assert parse_line(b"A1=3,B0=1", now) is None
+
+
+def test_reader_never_waits_for_a_slow_db(monkeypatch):
+    """Banco lento para recusar: a leitura segue no ritmo da fonte e o buffer fica limitado."""
+    calls = []
+
+    def slow_pool():
+        calls.append(threading.current_thread())
+        time.sleep(0.5)
+
+    monkeypatch.setattr(insert_local, "get_pool", slow_pool)
+    chunk = b"".join(b"A0=%d,A1=%d,B0=0\n" % (i, i) for i in range(100))
+    source = _ChunkSource([chunk] * 50)
+    writer = JoystickWriter(flush_size=100, flush_interval=0.05, max_rows=1_000)
+    reader = JoyLinkReader(source, writer)
+    dropped = writer._dropped.get()
+    try:
+        reader.start()
+        assert reader.join(timeout=2.0)
+        # 50 blocos, cada um com um lote cheio: nenhum esperou pelo banco
+        assert source.reads[-1] - source.reads[0] < 0.3
+        assert reader.rows == 5_000
+    finally:
+        writer._stop.set()
+        writer._wake.set()
+        writer._thread.join()
+    assert calls and reader._thread not in calls
+    assert len(writer._rows) == 1_000
+    assert writer._dropped.get() == dropped + 4_000
+
+
+def test_rejected_first_batch_keeps_the_table(db):
+    """O primeiro lote é recusado (INT estourado): a tabela continua e o lote seguinte é gravado."""
+    table = "test_joylink_data"
+    with db.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {table};")
+    db.commit()
+    writer = JoystickWriter(flush_size=1_000, flush_interval=3600, table=table)
+    now = datetime(2025, 1, 1)
+    try:
+        writer.add_rows([(now, 2 ** 40, 0, 0, "{}")])
+        assert writer.flush() == 0
+        writer.add_rows([(now, 512, 498, 1, '{"B0":1}')])
+        assert writer.flush() == 1
+        with db.cursor() as cur:
+            cur.execute(f"SELECT analog_x, analog_y, buttons FROM {table};")
+            assert cur.fetchall() == [(512, 498, 1)]
+        db.commit()
+    finally:
+        writer.close()
+        with db.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {table};")
+        db.commit()
@@ -0,0 +1,88 @@
+# test_logger.py
+
+import io
+import json
+import urllib.request
+import pytest
+from utils import logger
+from utils.logger import MetricsFile, Registry, configure, get_logger, start_http_server
+
+
+@pytest.fixture
+def output():
+    stream = io.StringIO()
+    configure(level="INFO", fmt="text", stream=stream)
+    yield stream
+    configure()
+
+
+def test_rate_limit_counts_suppressed(output, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logger.time, "monotonic", lambda: now[0])
+    log = get_logger("test")
+    for i in range(1000):
+        log.warning("⚠ repetida %d", i, every=60)
+    now[0] += 61
+    log.warning("⚠ repetida %d", 1000, every=60)
+    assert output.getvalue().splitlines() == ["⚠ repetida 0", "⚠ repetida 1000  suprimidas=999"]
+
+
+def test_disabled_level_does_not_format(output):
+    class Explode:
+        def __str__(self):
+            raise AssertionError("formatado com o nível desligado")
+
+    get_logger("test").debug("não formatada %s", Explode())
+    assert output.getvalue() == ""
+
+
+def test_json_format_with_fields():
+    stream = io.StringIO()
+    configure(level="DEBUG", fmt="json", stream=stream)
+    try:
+        get_logger("test").error("❌ falha %s", "x", lote=3)
+    finally:
+        configure()
+    data = json.loads(stream.getvalue())
+    assert (data["level"], data["logger"], data["msg"], data["lote"]) == \
+        ("error", "pointertrack.test", "❌ falha x", 3)
+
+
+def test_prometheus_text():
+    registry = Registry()
+    hits = registry.counter("demo_packets_total", "Pacotes", source="json")
+    latency = registry.histogram("demo_flush_seconds", "Latência")
+    for _ in range(5):
+        hits.inc()
+    for v in (0.002, 0.02, 0.2):
+        latency.observe(v)
+    registry.gauge("demo_queue_depth", "Fila").set_function(lambda: 42)
+    registry.counter("demo_quoted_total", path='a"b\\c').inc()
+    text = registry.render_prometheus()
+    assert 'demo_packets_total{source="json"} 5' in text
+    assert 'demo_flush_seconds_bucket{le="0.025"} 2' in text
+    assert 'demo_flush_seconds_count 3' in text
+    assert "demo_queue_depth 42" in text
+    assert 'demo_quoted_total{path="a\\"b\\\\c"} 1' in text
+    assert registry.counter("demo_packets_total", source="json") is hits
+    with pytest.raises(ValueError):
+        registry.gauge("demo_packets_total")
+
+
+def test_exporters(tmp_path):
+    registry = Registry()
+    registry.counter("demo_total").inc(3)
+    server = start_http_server(0, registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert "demo_total 3" in response.read().decode()
+        with urllib.request.urlopen(url + "/metrics.json") as response:
+            assert json.load(response)["metrics"]["demo_total"][0]["value"] == 3
+    finally:
+        server.shutdown()
+
+    path = tmp_path / "metrics.prom"
+    exporter = MetricsFile(str(path), interval=3600, registry=registry)
+    exporter.close()
+    assert "demo_total 3" in path.read_text()
@@ -0,0 +1,134 @@
+# test_movement_analysis.py
+
+import math
+from datetime import timedelta
+import numpy as np
+import pytest
+from processing.movement_analysis import MovementFeatureEngine, MovementFeatures, fitts_throughput
+
+RATE = 500
+START = int(np.datetime64("2026-01-01T12:00:00", "us").astype(np.int64))
+REST = np.zeros(int(RATE * 1.2), dtype=int)
+
+
+def stroke(distance: float, seconds: float, angle: float = 0.0, bend: float = 0.0):
+    """Traço de jerk mínimo quantizado em contagens inteiras (dx, dy)."""
+    tau = np.arange(1, int(seconds * RATE) + 1) / (seconds * RATE)
+    s = distance * (10 * tau ** 3 - 15 * tau ** 4 + 6 * tau ** 5)
+    theta = angle + bend * tau
+    step = np.diff(s, prepend=0)
+    px, py = np.round(np.cumsum(step * np.cos(theta))), np.round(np.cumsum(step * np.sin(theta)))
+    return np.diff(px, prepend=0).astype(int), np.diff(py, prepend=0).astype(int)
+
+
+def run(dx, dy, device="dev", engine_kwargs=None, close=True):
+    out = []
+    engine = MovementFeatureEngine(out.append, **(engine_kwargs or {}))
+    ts = START + np.arange(1, len(dx) + 1) * (1_000_000 // RATE)
+    engine.process([device] * len(dx), ts.astype("M8[us]"), dx, dy)
+    if close:
+        engine.close()
+    return out, engine
+
+
+@pytest.fixture(scope="module")
+def movements():
+    """Traço reto, curva de 90° e dois traços colados, separados por repousos."""
+    straight, curve = stroke(400, 0.4), stroke(400, 0.4, bend=math.pi / 2)
+    double = np.concatenate([stroke(200, 0.3)[0], stroke(200, 0.3)[0]])
+    dx = np.concatenate([straight[0], REST, curve[0], REST, double, REST])
+    dy = np.concatenate([straight[1], REST, curve[1], REST, np.zeros_like(double), REST])
+    out, engine = run(dx, dy)
+    assert len(out) == 3
+    assert engine.stats() == {"samples": len(dx), "movements": 3, "devices": 1, "active": 0}
+    return out
+
+
+def test_straight_minimum_jerk_stroke(movements):
+    straight = movements[0]
+    assert straight.reason == "idle"
+    assert abs(straight.path_length - 400) < 2
+    assert straight.straightness > 0.99
+    assert abs(straight.direction) < 1
+    assert abs(straight.time_to_peak / straight.duration - 0.5) < 0.1
+    assert abs(straight.peak_speed - 1.875 * 400 / 0.4) < 0.1 * 1875
+    assert straight.submovements == 1
+
+
+def test_curve_is_less_straight(movements):
+    straight, curve, _ = movements
+    assert curve.straightness < 0.95
+    assert curve.curvature > straight.curvature
+    assert curve.direction < 0          # termina para baixo (dy > 0)
+
+
+def test_two_submovements(movements):
+    double = movements[2]
+    assert double.submovements == 2
+    assert double.reason == "idle"
+    assert double.normalized_jerk > movements[0].normalized_jerk
+
+
+def test_close_and_flush():
+    dx, dy = stroke(100, 0.2)
+    out, engine = run(dx, dy, close=False)
+    assert out == [] and engine.stats()["active"] == 1
+    end = np.datetime64(START + len(dx) * 2_000, "us").item()
+    assert engine.flush(end + timedelta(seconds=0.5)) == 0
+    assert engine.flush(end + timedelta(seconds=1.5)) == 1
+    assert [f.reason for f in out] == ["idle"]
+
+    out, _ = run(dx, dy)
+    assert [f.reason for f in out] == ["stop"]
+
+
+def test_devices_are_independent():
+    dx, dy = stroke(300, 0.3)
+    out = []
+    engine = MovementFeatureEngine(out.append)
+    ts = (START + np.repeat(np.arange(1, len(dx) + 1), 2) * 2_000).astype("M8[us]")
+    engine.process(["a", "b"] * len(dx), ts, np.repeat(dx, 2), np.repeat(-dy, 2))
+    engine.close()
+    assert sorted(f.device_id for f in out) == ["a", "b"]
+    assert out[0][3:-1] == out[1][3:-1]
+
+
+def test_fitts_throughput():
+    features = MovementFeatures(None, None, None, 10, 0.5, 300.0, 300.0, 1.0, 0.0, 600.0,
+                                1000.0, 0.25, 1.0, 1.0, 1.0, 0.0, 1, "idle")
+    assert fitts_throughput(features, 100) == pytest.approx(math.log2(4) / 0.5)
+    assert fitts_throughput(features._replace(duration=0.0), 100) == 0.0
+
+
+def test_refed_chunk_is_written_once(db):
+    """Analisador retomado relê o mesmo lote: nenhum movimento duplica, com ou sem dispositivo."""
+    from insert_local import FeatureWriter
+    from schema import ensure_schema
+
+    dx, dy = stroke(300, 0.3)
+    dx, dy = np.concatenate([dx, REST]), np.concatenate([dy, REST])
+    ts = (START + np.arange(1, len(dx) + 1) * (1_000_000 // RATE)).astype("M8[us]")
+    devices = ["", "TEST-FEATURES"]
+    with db.cursor() as cur:
+        ensure_schema(cur)
+    db.commit()
+    writer = FeatureWriter(flush_interval=3600)
+    try:
+        for _ in range(2):
+            engine = MovementFeatureEngine(writer.write)
+            for device in devices:
+                engine.process([device] * len(dx), ts, dx, dy)
+            engine.close()
+            writer.flush()
+        with db.cursor() as cur:
+            cur.execute("SELECT COALESCE(device_id, '<null>'), count(*) FROM mouse_movement_features "
+                        "WHERE start_ts BETWEEN %s AND %s GROUP BY 1 ORDER BY 1;",
+                        (ts[0].item(), ts[-1].item()))
+            assert cur.fetchall() == [("<null>", 1), ("TEST-FEATURES", 1)]
+    finally:
+        writer.close()
+        db.rollback()
+        with db.cursor() as cur:
+            cur.execute("DELETE FROM mouse_movement_features WHERE start_ts BETWEEN %s AND %s;",
+                        (ts[0].item(), ts[-1].item()))
+        db.commit()
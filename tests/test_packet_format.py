@@ -0,0 +1,74 @@
+# test_packet_format.py
+
+import numpy as np
+from packet_format import (FRAME_SIZE, PacketStream, decode_frames, encode_frame, encode_frames,
+                           pack_buttons, unpack_buttons)
+
+
+def _samples(n: int = 50):
+    rng = np.random.default_rng(0)
+    seq = np.arange(65_520, 65_520 + n)                 # o u16 dá a volta no meio
+    device_ts = (1 << 32) - 1_000 + np.arange(n) * 8_000
+    dx = rng.integers(-32_768, 32_768, n)
+    dy = rng.integers(-32_768, 32_768, n)
+    buttons = rng.integers(0, 32, n)
+    return seq, device_ts, dx, dy, buttons
+
+
+def test_round_trip():
+    seq, device_ts, dx, dy, buttons = _samples()
+    data = encode_frames(seq, device_ts, dx, dy, buttons)
+    assert data[:FRAME_SIZE] == encode_frame(seq[0], device_ts[0], dx[0], dy[0], buttons[0])
+    records, consumed, skipped = decode_frames(data)
+    assert (consumed, skipped) == (len(data), 0)
+    assert records["seq"].tolist() == (seq & 0xFFFF).tolist()
+    assert records["device_ts"].tolist() == (device_ts & 0xFFFFFFFF).tolist()
+    assert records["dx"].tolist() == dx.tolist() and records["dy"].tolist() == dy.tolist()
+    assert records["buttons"].tolist() == buttons.tolist()
+    bits = unpack_buttons(np.array([pack_buttons(L=1, R=1, X=1)]))
+    assert {name: int(v[0]) for name, v in bits.items()} == {"L": 1, "U": 0, "R": 1, "D": 0, "X": 1}
+
+
+def test_garbage_and_corrupt_frames_resync():
+    frames = [encode_frame(i, i * 1_000, i, -i, 0) for i in range(4)]
+    corrupt = bytearray(frames[2])
+    corrupt[7] ^= 0xFF                                  # dx alterado: checksum não bate
+    data = b"lixo\xa5" + frames[0] + frames[1] + bytes(corrupt) + frames[3]
+    records, consumed, skipped = decode_frames(data)
+    assert records["seq"].tolist() == [0, 1, 3]
+    assert consumed == len(data)
+    assert skipped == 5 + FRAME_SIZE
+
+
+def test_incomplete_tail_is_not_consumed():
+    data = encode_frame(1, 10, 1, 1, 0) + encode_frame(2, 20, 2, 2, 0)[:5]
+    records, consumed, skipped = decode_frames(data)
+    assert (len(records), consumed, skipped) == (1, FRAME_SIZE, 0)
+
+
+def test_stream_frame_split_across_feeds():
+    seq, device_ts, dx, dy, buttons = _samples(10)
+    data = b"\x00\x01" + encode_frames(seq, device_ts, dx, dy, buttons)
+    stream = PacketStream()
+    decoded = []
+    for i in range(0, len(data), 7):                    # pedaços que cortam os quadros
+        lines, records = stream.feed(data[i:i + 7])
+        assert lines == []
+        if records is not None:
+            decoded += records["dx"].tolist()
+    assert stream.mode == "binary"
+    assert decoded == dx.tolist()
+    assert stream.stats()["frames"] == 10 and stream.stats()["discarded_bytes"] == 2
+
+
+def test_stream_detects_json():
+    stream = PacketStream()
+    assert stream.feed(b"\r\n  ") == ([], None)         # nada significativo ainda
+    lines, records = stream.feed(b'{"dx": 1, "dy": 2}\n{"dx": ')
+    assert stream.mode == "json" and records is None
+    assert lines == [b'{"dx": 1, "dy": 2}']
+    assert stream.feed(b'3}\n') == ([b'{"dx": 3}'], None)
+    stream.reset()
+    assert stream.mode is None
+    stream.feed(encode_frame(0, 0, 0, 0, 0))
+    assert stream.mode == "binary"
@@ -0,0 +1,124 @@
+# test_parallel_analysis.py
+
+from datetime import date, datetime, timedelta
+import numpy as np
+import pytest
+from analysis_kernels import ANALYSIS_COLUMNS
+from pointer_analyse import AnalyzerState, _process_new
+from schema import ensure_schema, list_partitions
+from processing.parallel_analysis import _fetch_range, _range_batch, plan_run
+
+DEVICES = ("TEST-PAR-A", "TEST-PAR-B", "TEST-PAR-C")
+
+
+@pytest.fixture
+def movements(db):
+    """Insere amostras (device_id, segundos) em ordem e retorna os ids; apaga as de teste ao final."""
+    inserted = []
+
+    def insert(*samples):
+        start = datetime.now().replace(microsecond=0)
+        with db.cursor() as cur:
+            ensure_schema(cur)
+            for device, seconds in samples:
+                cur.execute("INSERT INTO mouse_movements (timestamp, dx, dy, L, U, R, D, X, device_id) "
+                            "VALUES (%s, 1, 1, 0, 0, 0, 0, 0, %s) RETURNING id;",
+                            (start + timedelta(seconds=seconds), device))
+                inserted.append(cur.fetchone()[0])
+        db.commit()
+        return inserted
+
+    yield insert
+    db.rollback()
+    with db.cursor() as cur:
+        cur.execute("DELETE FROM mouse_movements WHERE id = ANY(%s);", (inserted,))
+    db.commit()
+
+
+def test_fetch_range_finds_successors_beyond_lookahead(db, movements):
+    a, b, c = DEVICES
+    ids = movements((a, 0), (b, 0), (None, 0),        # a faixa
+                    (c, 1), (c, 2), (c, 3),           # a sobreposição: só C
+                    (b, 4), (c, 5), (None, 6), (b, 7), (None, 8))
+    lo, hi, end, limit = ids[0], ids[2], ids[5], ids[9]
+    with db.cursor() as cur:
+        rows, n = _fetch_range(cur, lo, hi, limit, lookahead=end - hi)
+    db.commit()
+    assert n == 3
+    assert [r[0] for r in rows[:n]] == ids[:3]
+    following = {r[1]: r[0] for r in rows[n:]}
+    # A parou de enviar: nenhum sucessor; B e a amostra sem dispositivo ('') vêm da
+    # busca depois da sobreposição, o primeiro de cada
+    assert following == {b: ids[6], "": ids[8], c: ids[3]}
+
+
+def test_fetch_range_respects_limit(db, movements):
+    a, b, _ = DEVICES
+    ids = movements((a, 0), (b, 0), (a, 1), (b, 2))
+    with db.cursor() as cur:
+        rows, n = _fetch_range(cur, ids[0], ids[1], limit=ids[2], lookahead=0)
+    db.commit()
+    assert n == 2
+    assert {r[1]: r[0] for r in rows[n:]} == {a: ids[2]}
+
+
+class _Capture:
+    """Writer do analisador ao vivo que só guarda os lotes."""
+
+    def __init__(self):
+        self.batches = []
+
+    def write_batch(self, batch, checkpoint=None) -> int:
+        self.batches.append(batch)
+        return len(batch)
+
+
+def _by_movement(batches) -> dict:
+    return {movement_id: row for batch in batches
+            for movement_id, row in zip(batch.movement_id.tolist(), zip(
+                batch.movement_ts.tolist(), *(batch[name].tolist() for name in ANALYSIS_COLUMNS)))}
+
+
+def test_backfill_pairs_like_the_live_analyzer(db, movements):
+    """Pacotes fora de ordem: a faixa pega o próximo id do dispositivo, não o próximo instante."""
+    a, b, _ = DEVICES
+    ids = movements((a, 0), (b, 0),
+                    (a, 10), (a, 5),          # o id seguinte de A chegou com instante maior
+                    (b, 2), (a, 12), (b, 3), (a, 13))
+    pending = [ids[6], ids[7]]                # a última de cada dispositivo fica para o ao vivo
+
+    live = _Capture()
+    _process_new(db, live, AnalyzerState(last_id=ids[0] - 1), upto=ids[-1], itersize=3)
+    backfill = []
+    with db.cursor() as cur:
+        for lo in range(ids[0], ids[-1] + 1, 2):
+            batch, _ = _range_batch(cur, lo, lo + 1, ids[-1], pending, lookahead=0)
+            backfill.append(batch)
+    db.commit()
+
+    expected = _by_movement(live.batches)
+    assert sorted(expected) == ids[:6]
+    assert _by_movement(backfill) == expected
+    # A -> próximo id: 10 s depois (não os 5 s da amostra seguinte no tempo)
+    assert np.isclose(expected[ids[0]][ANALYSIS_COLUMNS.index("vel_direita") + 1], 1 / 10)
+
+
+def test_plan_run_creates_partitions_for_the_history(db):
+    """Backfill de dias antigos: análises e rollups ganham partições diárias, não a DEFAULT."""
+    days = [date(2001, 1, 1), date(2001, 1, 3)]
+    try:
+        with db.cursor() as cur:
+            ensure_schema(cur)
+            cur.execute("SELECT EXISTS (SELECT 1 FROM mouse_analyse);")
+            if cur.fetchone()[0]:
+                pytest.skip("mouse_analyse já tem análises")
+            for day in days:
+                cur.execute("INSERT INTO mouse_movements (timestamp, dx, dy, L, U, R, D, X, device_id) "
+                            "VALUES (%s, 1, 1, 0, 0, 0, 0, 0, %s);", (day, DEVICES[0]))
+            plan_run(cur, "test-parallel-partitions", 1000)
+            for table in ("mouse_analyse", "mouse_rollup_1s", "mouse_rollup_1m"):
+                names = {name for name, _ in list_partitions(cur, table)}
+                assert {f"{table}_p20010101", f"{table}_p20010102", f"{table}_p20010103"} <= names
+    finally:
+        # Tudo na mesma transação: o rollback desfaz amostras, backfill e partições
+        db.rollback()
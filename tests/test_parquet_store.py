@@ -0,0 +1,87 @@
+# test_parquet_store.py
+
+from datetime import date, datetime, timedelta
+import pytest
+from analysis_kernels import ANALYSIS_COLUMNS
+from parquet_store import NULL_PARTITION, export_day, load, load_columns
+from schema import ensure_schema
+
+# pyarrow é opcional no projeto
+ds = pytest.importorskip("pyarrow.dataset")
+
+# Dia sem partição própria (cai na DEFAULT), longe dos usados em outros testes
+DAY = date(2099, 2, 1)
+START = datetime(2099, 2, 1, 10, 0, 0)
+DEVICES = ("TEST:PQ:01", "TEST-PQ-2", None)
+
+
+@pytest.fixture
+def analyses(db):
+    """Análises de três dispositivos (um sem id) em DAY, intercaladas no tempo."""
+    rows = []
+    for i in range(30):
+        device = DEVICES[i % 3]
+        rows.append((START + timedelta(seconds=i), device, 900_000 + i,
+                     *[float(i)] * len(ANALYSIS_COLUMNS)))
+    with db.cursor() as cur:
+        ensure_schema(cur)
+        cur.executemany(
+            "INSERT INTO mouse_analyse (movement_ts, device_id, movement_id, "
+            + ", ".join(ANALYSIS_COLUMNS) + ") VALUES (" + ", ".join(["%s"] * (3 + len(ANALYSIS_COLUMNS))) + ");",
+            rows)
+    db.commit()
+    yield db
+    db.rollback()
+    with db.cursor() as cur:
+        cur.execute("DELETE FROM mouse_analyse WHERE movement_ts >= %s AND movement_ts < %s;",
+                    (DAY, DAY + timedelta(days=1)))
+    db.commit()
+
+
+def test_export_writes_one_file_per_device(analyses, tmp_path):
+    assert export_day(analyses, "mouse_analyse", DAY, str(tmp_path)) == 30
+    day_dir = tmp_path / "mouse_analyse" / f"day={DAY}"
+    assert sorted(p.name for p in day_dir.iterdir()) == sorted(
+        ["device_id=TEST%3APQ%3A01", "device_id=TEST-PQ-2", f"device_id={NULL_PARTITION}"])
+    assert not list((tmp_path / "mouse_analyse").glob(".*"))
+
+    # Dia sem linhas não apaga o que já foi exportado
+    assert export_day(analyses, "mouse_analyse", DAY + timedelta(days=1), str(tmp_path)) == 0
+    assert day_dir.exists()
+
+
+def test_load_filters_and_orders_by_time(analyses, tmp_path):
+    export_day(analyses, "mouse_analyse", DAY, str(tmp_path))
+    root = str(tmp_path)
+
+    everything = load("mouse_analyse", root=root)
+    assert everything.num_rows == 30
+    ts = everything.column("movement_ts").to_pylist()
+    assert ts == sorted(ts)
+
+    one = load_columns("mouse_analyse", ["movement_id", "vel_euclidiana"], device_id="TEST:PQ:01",
+                       root=root)
+    assert set(one) == {"movement_id", "vel_euclidiana"}
+    # Sem a coluna de tempo na projeção, fica a ordem dos arquivos (um só dispositivo aqui)
+    assert one["movement_id"].tolist() == [900_000 + i for i in range(0, 30, 3)]
+
+    window = load("mouse_analyse", ["movement_ts", "movement_id"], since=START + timedelta(seconds=10),
+                  until=START + timedelta(seconds=20), root=root)
+    assert window.column("movement_id").to_pylist() == [900_000 + i for i in range(10, 20)]
+
+    fast = load("mouse_analyse", ["movement_id"], filter=ds.field("vel_euclidiana") >= 27, root=root)
+    assert sorted(fast.column("movement_id").to_pylist()) == [900_027, 900_028, 900_029]
+
+    no_device = load("mouse_analyse", ["device_id", "movement_id"],
+                     filter=ds.field("device_id").is_null(), root=root)
+    assert no_device.num_rows == 10
+
+
+def test_reexport_replaces_the_day(analyses, tmp_path):
+    root = str(tmp_path)
+    export_day(analyses, "mouse_analyse", DAY, root)
+    with analyses.cursor() as cur:
+        cur.execute("DELETE FROM mouse_analyse WHERE movement_id >= 900020 AND movement_ts >= %s;", (DAY,))
+    analyses.commit()
+    assert export_day(analyses, "mouse_analyse", DAY, root) == 20
+    assert load("mouse_analyse", ["movement_id"], root=root).num_rows == 20
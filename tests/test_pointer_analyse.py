@@ -0,0 +1,56 @@
+# test_pointer_analyse.py
+
+import pytest
+import pointer_analyse
+from pointer_analyse import RECONNECT_MAX, RECONNECT_MIN, AnalyzerState, notified_upto
+
+
+class _Stop(BaseException):
+    """Interrompe o laço do LISTEN (que não retorna) dentro do teste."""
+
+
+def test_notified_upto_skips_malformed_payloads():
+    assert notified_upto(["1-10", "11-25", "3-7"]) == 25
+    assert notified_upto(["", "abc", "5-", "-", "1-x", "7-9"]) == 9
+    assert notified_upto(["nada", ""]) is None
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(pointer_analyse.time, "sleep", delays.append)
+    return delays
+
+
+def test_listen_retries_without_pool(monkeypatch, sleeps):
+    """Sem banco o LISTEN espera com espera crescente, em vez de cair para o polling."""
+    calls = []
+
+    def no_pool():
+        calls.append(1)
+        if len(calls) > 8:
+            raise _Stop
+        return None
+
+    monkeypatch.setattr(pointer_analyse, "get_pool", no_pool)
+    with pytest.raises(_Stop):
+        pointer_analyse._listen_loop(None, AnalyzerState(), 100)
+    assert sleeps == [1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 30.0, 30.0]
+    assert sleeps[0] == RECONNECT_MIN and max(sleeps) == RECONNECT_MAX
+
+
+def test_listen_survives_analysis_error(db, monkeypatch, sleeps):
+    """Um erro fora do psycopg2 na análise é registrado e o LISTEN reconecta."""
+    calls = []
+
+    def process_new(conn, writer, state, upto=None, itersize=None):
+        calls.append(upto)
+        if len(calls) == 1:
+            raise ValueError("lote inválido")
+        raise _Stop
+
+    monkeypatch.setattr(pointer_analyse, "_process_new", process_new)
+    with pytest.raises(_Stop):
+        pointer_analyse._listen_loop(None, AnalyzerState(), 100)
+    assert calls == [None, None]
+    assert sleeps == [RECONNECT_MIN]
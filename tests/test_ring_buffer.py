@@ -0,0 +1,66 @@
+# test_ring_buffer.py
+
+import numpy as np
+import pytest
+from ring_buffer import RingBuffer
+
+
+def test_invalid_capacity():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+
+def test_snapshot_before_wraparound():
+    ring = RingBuffer(4)
+    assert ring.last() is None
+    assert ring.snapshot()["x"].tolist() == []
+    for i in range(3):
+        ring.append(i, -i, 10.0 + i)
+    snap = ring.snapshot()
+    assert snap["x"].tolist() == [0, 1, 2]
+    assert snap["t"].tolist() == [10.0, 11.0, 12.0]
+    assert ring.last() == (2.0, -2.0, 12.0)
+    assert (len(ring), ring.overwritten) == (3, 0)
+    # Cópia: mexer nela não altera o buffer
+    snap["x"][:] = 99
+    assert ring.snapshot()["x"].tolist() == [0, 1, 2]
+
+
+def test_append_overwrites_oldest():
+    ring = RingBuffer(4)
+    for i in range(10):
+        ring.append(i, i, i)
+    assert (len(ring), ring.overwritten) == (4, 6)
+    # Em ordem cronológica mesmo com a cabeça no meio do array
+    assert ring.snapshot()["x"].tolist() == [6, 7, 8, 9]
+    assert ring.last() == (9.0, 9.0, 9.0)
+
+
+def test_extend_matches_appends():
+    """Lotes de vários tamanhos (maiores que a capacidade, cruzando o fim) equivalem a appends."""
+    by_batch, by_sample = RingBuffer(5), RingBuffer(5)
+    value = 0
+    for size in (0, 2, 4, 1, 12, 3, 5):
+        batch = np.arange(value, value + size, dtype="f8")
+        value += size
+        by_batch.extend(batch, -batch, batch * 2)
+        for v in batch:
+            by_sample.append(v, -v, v * 2)
+        for field in ("x", "y", "t"):
+            assert by_batch.snapshot()[field].tolist() == by_sample.snapshot()[field].tolist()
+        assert (len(by_batch), by_batch.overwritten) == (len(by_sample), by_sample.overwritten)
+    assert by_batch.snapshot()["x"].tolist() == [22, 23, 24, 25, 26]
+    assert by_batch.overwritten == value - 5
+
+
+def test_custom_fields_and_clear():
+    ring = RingBuffer(3, fields=(("id", "i8"), ("v", "f4")))
+    assert ring.fields == ("id", "v") and ring.capacity == 3
+    ring.extend([1, 2, 3, 4], [0.5, 1.5, 2.5, 3.5])
+    snap = ring.snapshot()
+    assert snap["id"].dtype == np.int64 and snap["v"].dtype == np.float32
+    assert snap["id"].tolist() == [2, 3, 4]
+    ring.clear()
+    assert len(ring) == 0 and ring.last() is None
+    ring.append(7, 1.0)
+    assert ring.snapshot()["id"].tolist() == [7]
@@ -0,0 +1,64 @@
+# test_rollups.py
+
+import numpy as np
+import pytest
+from analysis_kernels import ANALYSIS_COLUMNS
+from rollups import SKETCH_GAMMA, aggregate, bin_value, merge_sketches, sketch_bins, sketch_quantiles
+
+
+def test_sketch_quantiles_within_bound():
+    """Quantis de dois sketches somados contra os valores exatos (com negativos e zeros)."""
+    n = 100_000
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.lognormal(5, 1.5, n), -rng.lognormal(3, 1, n // 10), np.zeros(n // 20)])
+    qs = [0.01, 0.25, 0.5, 0.75, 0.99]
+    halves = [merge_sketches(dict(zip(*np.unique(sketch_bins(part), return_counts=True))))
+              for part in np.array_split(rng.permutation(values), 2)]
+    estimate = sketch_quantiles(merge_sketches(*halves), qs)
+    exact = np.quantile(values, qs, method="lower")
+    bound = (SKETCH_GAMMA - 1) / (SKETCH_GAMMA + 1)
+    for q, e, x in zip(qs, estimate, exact):
+        error = abs(e - x) / abs(x) if x else abs(e)
+        assert error <= bound + 1e-9, q
+
+
+@pytest.mark.parametrize("value", [0.0005, 0.001, 1.0, 123.456, -7.5, 1e9])
+def test_bin_value_is_close_to_members(value):
+    bound = (SKETCH_GAMMA - 1) / (SKETCH_GAMMA + 1)
+    estimate = bin_value(int(sketch_bins([value])[0]))
+    assert (estimate == 0.0) if abs(value) < 1e-3 else abs(estimate - value) / abs(value) <= bound + 1e-9
+
+
+def test_empty_sketch_quantiles_are_nan():
+    assert all(np.isnan(sketch_quantiles({}, [0.5, 0.9])))
+
+
+def test_aggregate_buckets_by_device_and_unit():
+    ts = np.array(["2025-01-01T00:00:00.1", "2025-01-01T00:00:00.9",
+                   "2025-01-01T00:00:01.2", "2025-01-01T00:00:00.5"], dtype="datetime64[us]")
+    values = np.ones((4, len(ANALYSIS_COLUMNS)))
+    values[:, 0] = [1.0, 3.0, 5.0, 7.0]
+    values[1, 1] = np.nan                      # não finito: ignorado
+    rows = aggregate(ts, ["a", "a", "a", "b"], values, "s")
+    speed = {(r[0].second, r[1]): r[3:7] for r in rows if r[2] == ANALYSIS_COLUMNS[0]}
+    assert speed == {(0, "a"): (2, 4.0, 1.0, 3.0), (1, "a"): (1, 5.0, 5.0, 5.0), (0, "b"): (1, 7.0, 7.0, 7.0)}
+    assert [r[3] for r in rows if r[2] == ANALYSIS_COLUMNS[1]] == [1, 1, 1]
+    assert rows == sorted(rows, key=lambda r: r[:3])
+    minute = aggregate(ts, ["a", "a", "a", "b"], values, "m")
+    assert {r[1]: r[3] for r in minute if r[2] == ANALYSIS_COLUMNS[0]} == {"a": 3, "b": 1}
+
+
+def test_directional_metrics_skip_other_directions():
+    """Direita e esquerda alternadas: cada direção tem a média só das suas amostras."""
+    ts = np.array(["2025-01-01T00:00:00"] * 4, dtype="datetime64[us]")
+    vx = np.array([100.0, -300.0, 200.0, -500.0])
+    values = np.zeros((4, len(ANALYSIS_COLUMNS)))
+    col = {name: j for j, name in enumerate(ANALYSIS_COLUMNS)}
+    values[:, col["vel_direita"]] = np.maximum(vx, 0)
+    values[:, col["vel_esquerda"]] = np.maximum(-vx, 0)
+    values[:, col["vel_euclidiana"]] = np.abs(vx)
+    stats = {r[2]: r[3:5] for r in aggregate(ts, [""] * 4, values, "s")}
+    assert stats["vel_direita"] == (2, 300.0)
+    assert stats["vel_esquerda"] == (2, 800.0)
+    assert stats["vel_euclidiana"] == (4, 1100.0)
+    assert "vel_cima" not in stats and "acel_baixo" not in stats
@@ -0,0 +1,131 @@
+# test_schema.py
+
+from datetime import date, timedelta
+import pytest
+import schema
+from database import connection
+
+# Dias bem no futuro: não se confundem com as partições em uso
+TODAY = date(2099, 1, 1)
+DAYS = [TODAY + timedelta(days=d) for d in range(-1, schema.PARTITION_DAYS_AHEAD + 1)]
+
+
+@pytest.fixture
+def fresh(db, monkeypatch):
+    """Processo que ainda não garantiu nenhuma partição; apaga as de teste ao final."""
+    monkeypatch.setattr(schema, "_ready_until", None)
+    monkeypatch.setattr(schema, "_unconfirmed", {})
+    yield db
+    db.rollback()
+    with db.cursor() as cur:
+        for table in schema.PARTITIONED:
+            for day in DAYS:
+                cur.execute(f"DROP TABLE IF EXISTS {table}_p{day:%Y%m%d};")
+    db.commit()
+
+
+def _exists(cur, day: date) -> bool:
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (f"mouse_movements_p{day:%Y%m%d}",))
+    return cur.fetchone()[0]
+
+
+def test_rollback_forgets_partitions(fresh):
+    with fresh.cursor() as cur:
+        schema.maintain(cur, TODAY)
+        assert _exists(cur, TODAY)
+    fresh.rollback()
+    with fresh.cursor() as cur:
+        assert not _exists(cur, TODAY)
+        schema.maintain(cur, TODAY)
+        assert _exists(cur, TODAY)
+    fresh.commit()
+    assert schema._ready_until is None        # confirmado só na próxima chamada
+
+
+def test_commit_confirms_partitions(fresh):
+    with fresh.cursor() as cur:
+        schema.maintain(cur, TODAY)
+        schema.maintain(cur, TODAY)           # mesma transação: nada a refazer
+    fresh.commit()
+    with fresh.cursor() as cur:
+        schema.maintain(cur, TODAY)
+        assert schema._ready_until == DAYS[-1] and schema._unconfirmed == {}
+        cur.execute("SELECT txid_current_if_assigned();")
+        assert cur.fetchone()[0] is None      # confirmado sem DDL nem trava
+    fresh.commit()
+
+
+def test_other_connection_keeps_open_transaction_pending(fresh, monkeypatch):
+    """Outra thread (outra conexão) não descarta partições de uma transação ainda aberta."""
+    with fresh.cursor() as cur:
+        schema.maintain(cur, TODAY)
+        cur.execute("SELECT txid_current();")
+        xid = cur.fetchone()[0]
+    # Dias já garantidos antes: a outra conexão não precisa de DDL (nem espera a trava)
+    monkeypatch.setattr(schema, "_ready_until", DAYS[0])
+    before = DAYS[0] - timedelta(days=3)
+    with connection() as other, other.cursor() as cur:
+        schema.maintain(cur, before)
+        assert schema._unconfirmed == {xid: DAYS[-1]}
+        other.rollback()
+        fresh.commit()
+        schema.maintain(cur, before)
+        other.rollback()
+    assert schema._ready_until == DAYS[-1] and schema._unconfirmed == {}
+
+
+def test_legacy_tables_only_migrate_from_cli(fresh):
+    """Fora da CLI, tabela antiga ou id INTEGER levanta MigrationRequired sem mexer em nada."""
+    with fresh.cursor() as cur:
+        cur.execute("CREATE SCHEMA test_pointertrack_legacy; SET LOCAL search_path = test_pointertrack_legacy;")
+        cur.execute("CREATE TABLE mouse_clicks (id SERIAL PRIMARY KEY, timestamp TIMESTAMP, dx INTEGER, "
+                    "dy INTEGER, action VARCHAR(10));")
+        cur.execute("INSERT INTO mouse_clicks (timestamp, dx, dy, action) VALUES (%s, 1, 2, 'press');",
+                    (TODAY,))
+        with pytest.raises(schema.MigrationRequired, match=r"mouse_clicks"):
+            schema.maintain(cur, TODAY)
+        assert schema.table_kind(cur, "mouse_clicks") == "r" and schema._ready_until is None
+        schema.ensure_schema(cur, TODAY, migrate=True)
+        assert schema.table_kind(cur, "mouse_clicks") == "p"
+        cur.execute("SELECT COUNT(*) FROM mouse_clicks;")
+        assert cur.fetchone()[0] == 1
+
+        cur.execute("ALTER TABLE mouse_movements ALTER COLUMN id TYPE INTEGER;")
+        with pytest.raises(schema.MigrationRequired, match=r"mouse_movements\.id"):
+            schema.ensure_schema(cur, TODAY)
+
+
+def test_old_integer_ids_are_widened(fresh):
+    """Tabelas e sequências INTEGER de um esquema anterior passam a BIGINT (esquema isolado, desfeito)."""
+    with fresh.cursor() as cur:
+        cur.execute("CREATE SCHEMA test_pointertrack_widen; SET LOCAL search_path = test_pointertrack_widen;")
+        schema.ensure_schema(cur, TODAY)
+        for table in ("mouse_movements", "mouse_clicks", "mouse_analyse"):
+            cur.execute(f"ALTER TABLE {table} ALTER COLUMN id TYPE INTEGER; "
+                        f"ALTER SEQUENCE {table}_id_seq AS INTEGER;")
+        schema.ensure_schema(cur, TODAY, migrate=True)
+        cur.execute("""
+            SELECT table_name, data_type FROM information_schema.columns
+            WHERE column_name = 'id' AND table_schema = current_schema() AND table_name = ANY(%s);
+        """, (list(schema.PARTITIONED),))
+        columns = dict(cur.fetchall())
+        cur.execute("SELECT sequence_name, data_type FROM information_schema.sequences "
+                    "WHERE sequence_schema = current_schema();")
+        sequences = dict(cur.fetchall())
+    assert columns == {"mouse_movements": "bigint", "mouse_clicks": "bigint", "mouse_analyse": "bigint"}
+    assert {sequences[f"{table}_id_seq"] for table in columns} == {"bigint"}
+
+
+def test_retention_prunes_default_partition(fresh):
+    """Linhas antigas que caíram na DEFAULT também saem na retenção (esquema isolado, desfeito)."""
+    with fresh.cursor() as cur:
+        cur.execute("CREATE SCHEMA test_pointertrack_retention; SET LOCAL search_path = test_pointertrack_retention;")
+        schema.ensure_schema(cur, TODAY)
+        late = TODAY + timedelta(days=30)   # sem partição: também cai na DEFAULT
+        for ts in (date(2000, 1, 1), late):
+            cur.execute("INSERT INTO mouse_clicks (timestamp, dx, dy, action) VALUES (%s, 0, 0, 'press');", (ts,))
+        dropped = schema.apply_retention(cur, 0, TODAY)
+        cur.execute("SELECT timestamp::date FROM mouse_clicks_default;")
+        kept = [row[0] for row in cur.fetchall()]
+    assert f"mouse_clicks_p{DAYS[0]:%Y%m%d}" in dropped
+    assert kept == [late]
@@ -0,0 +1,108 @@
+# test_segmenter.py
+
+import threading
+import time
+from segmenter import MovementSegmenter
+
+
+class _Sink:
+    """Guarda os segmentos e a thread que entregou cada um."""
+
+    def __init__(self):
+        self.segments = []
+        self.threads = []
+        self.ready = threading.Event()
+
+    def __call__(self, segment):
+        self.segments.append(segment)
+        self.threads.append(threading.current_thread())
+        self.ready.set()
+
+
+def test_click_closes_segment_with_totals():
+    sink = _Sink()
+    segmenter = MovementSegmenter(sink, idle_timeout=3600)
+    try:
+        for t, (x, y) in enumerate([(0, 0), (3, 0), (1, 0), (1, 4), (1, 1)]):
+            segmenter.on_move(x, y, t=1_000.0 + t)
+        segment = segmenter.close_segment("click")
+        assert segmenter.close_segment("click") is None     # nada ativo
+    finally:
+        segmenter.close()
+    assert sink.segments == [segment]
+    assert sink.threads == [threading.current_thread()]
+    assert (segment.events, segment.reason) == (5, "click")
+    assert (segment.dx_direita, segment.dx_esquerda, segment.dy_cima, segment.dy_baixo) == (3, 2, 3, 4)
+    assert segment.distance == 3 + 2 + 4 + 3
+    assert (segment.end_ts - segment.start_ts).total_seconds() == 4
+    assert segment.points is None
+
+
+def test_idle_timeout_closes_on_timer_thread():
+    """Parado por idle_timeout: o timer fecha o segmento, contado a partir do último evento."""
+    sink = _Sink()
+    segmenter = MovementSegmenter(sink, idle_timeout=0.1)
+    try:
+        start = time.time()
+        for i in range(5):
+            last = time.time()
+            segmenter.on_move(i, 0)
+            time.sleep(0.04)            # mais curto que o prazo: o segmento segue aberto
+        assert not sink.segments
+        assert sink.ready.wait(2.0)
+        closed = time.time()
+    finally:
+        segmenter.close()
+    assert len(sink.segments) == 1
+    segment = sink.segments[0]
+    assert (segment.events, segment.reason, segment.dx_direita) == (5, "idle", 4)
+    assert closed - last >= 0.1 and closed - start < 1.0
+    assert sink.threads[0] is segmenter._thread
+    assert segmenter.stats()["segments"] == 1
+
+
+def test_new_segment_after_idle():
+    sink = _Sink()
+    segmenter = MovementSegmenter(sink, idle_timeout=0.05)
+    try:
+        segmenter.on_move(0, 0)
+        assert sink.ready.wait(2.0)
+        sink.ready.clear()
+        segmenter.on_move(10, 10)
+        segmenter.on_move(5, 10)
+        assert sink.ready.wait(2.0)
+    finally:
+        segmenter.close()
+    assert [(s.events, s.reason) for s in sink.segments] == [(1, "idle"), (2, "idle")]
+    # O segundo parte do zero: o salto desde o fim do primeiro não conta
+    assert (sink.segments[1].dx_esquerda, sink.segments[1].distance) == (5, 5)
+
+
+def test_close_flushes_active_segment():
+    sink = _Sink()
+    segmenter = MovementSegmenter(sink, idle_timeout=3600)
+    segmenter.on_move(0, 0, t=1_000.0)
+    segmenter.on_move(0, -2, t=1_000.5)
+    segmenter.close()
+    assert not segmenter._thread.is_alive()
+    assert [(s.events, s.reason, s.dy_cima) for s in sink.segments] == [(2, "stop", 2)]
+
+    idle = _Sink()
+    MovementSegmenter(idle, idle_timeout=3600).close()
+    assert idle.segments == []
+
+
+def test_keep_points_holds_latest_capacity():
+    sink = _Sink()
+    segmenter = MovementSegmenter(sink, idle_timeout=3600, capacity=3, keep_points=True)
+    try:
+        for i in range(5):
+            segmenter.on_move(i, 2 * i, t=1_000.0 + i)
+        assert segmenter.stats() == {"segments": 0, "active": True, "points": 3, "overwritten": 2}
+        segment = segmenter.close_segment()
+    finally:
+        segmenter.close()
+    assert segment.events == 5
+    assert segment.points["x"].tolist() == [2, 3, 4]
+    assert segment.points["y"].tolist() == [4, 6, 8]
+    assert segment.points["t"].tolist() == [1_002.0, 1_003.0, 1_004.0]
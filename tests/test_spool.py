@@ -0,0 +1,176 @@
+# test_spool.py
+
+import json
+import time
+from datetime import datetime
+import numpy as np
+import pytest
+from spool import RECORD_SIZE, Spool, make_records
+
+
+def _records(spool, n, start=0, device="AA:BB:CC:DD:EE:FF"):
+    records = make_records(n)
+    records["ts"] = np.datetime64(datetime.now(), "us")
+    records["dx"] = np.arange(start, start + n)
+    records["device"] = spool.device_index(device)
+    return records
+
+
+def test_append_reopen_commit_compact(tmp_path):
+    spool = Spool(str(tmp_path), segment_records=64)
+    records = _records(spool, 150)
+    assert spool.append(records[:100]) == 100
+    spool.close()
+
+    spool = Spool(str(tmp_path))
+    assert spool.head == spool.recovered == 100
+    spool.append(records[100:])
+    spool.commit(130)
+    assert spool.compact() == 2
+    rest = spool.read(1000)
+    assert spool.head == 150 and spool.pending == 20
+    assert rest["lsn"][0] == 131
+    assert rest["dx"].tolist() == list(range(130, 150))
+    assert spool.device_ids(rest["device"][:1]) == ["AA:BB:CC:DD:EE:FF"]
+    spool.close()
+
+
+def test_read_does_not_cross_segments(tmp_path):
+    spool = Spool(str(tmp_path), segment_records=64)
+    spool.append(_records(spool, 100))
+    assert len(spool.read(1000)) == 64
+    spool.commit(64)
+    assert spool.read(1000)["lsn"].tolist() == list(range(65, 101))
+    spool.close()
+
+
+def test_recovery_stops_at_torn_record(tmp_path):
+    """Registro não persistido no meio do segmento: o fim do log é o anterior."""
+    spool = Spool(str(tmp_path), segment_records=64)
+    spool.append(_records(spool, 40))
+    spool.close()
+    with open(tmp_path / f"{0:012d}.seg", "r+b") as f:
+        f.seek(30 * RECORD_SIZE)
+        f.write(bytes(RECORD_SIZE))
+
+    spool = Spool(str(tmp_path))
+    assert spool.head == 30
+    assert spool.append(_records(spool, 1)) == 31
+    spool.close()
+
+
+def _zero(tmp_path, segment, first, last):
+    """Simula registros não persistidos (queda do sistema): [first, last) do segmento zerados."""
+    with open(tmp_path / f"{segment:012d}.seg", "r+b") as f:
+        f.seek(first * RECORD_SIZE)
+        f.write(bytes((last - first) * RECORD_SIZE))
+
+
+def test_stale_records_after_torn_one_do_not_come_back(tmp_path):
+    spool = Spool(str(tmp_path), segment_records=64)
+    spool.append(_records(spool, 40))
+    spool.close()
+    _zero(tmp_path, 0, 30, 31)
+
+    spool = Spool(str(tmp_path))
+    spool.append(_records(spool, 1))
+    spool.close()
+    # 32..40 antigos foram descartados na abertura: não se juntam ao 31 novo
+    spool = Spool(str(tmp_path))
+    assert spool.head == 31
+    spool.close()
+
+
+def test_recovery_checks_earlier_segments(tmp_path):
+    """Fim de um segmento anterior zerado: a recuperação para nele, não no último segmento."""
+    spool = Spool(str(tmp_path), segment_records=64)
+    spool.append(_records(spool, 150))
+    spool.close()
+    _zero(tmp_path, 0, 50, 64)
+
+    spool = Spool(str(tmp_path))
+    assert spool.head == spool.recovered == 50
+    assert sorted(p.name for p in tmp_path.glob("*.seg")) == [f"{0:012d}.seg"]
+    assert spool.read(1000)["lsn"].tolist() == list(range(1, 51))
+    spool.append(_records(spool, 20))
+    spool.close()
+
+    spool = Spool(str(tmp_path))
+    assert spool.head == 70
+    records = spool.read(1000)
+    assert records["lsn"].tolist() == list(range(1, 65))
+    assert (records["ts"] > np.datetime64("2000-01-01")).all()
+    spool.close()
+
+
+def test_recovery_starts_at_committed(tmp_path):
+    """Registros zerados já confirmados no banco não cortam o log."""
+    spool = Spool(str(tmp_path), segment_records=64)
+    spool.append(_records(spool, 150))
+    spool.commit(60)
+    spool.close()
+    _zero(tmp_path, 0, 50, 60)
+
+    spool = Spool(str(tmp_path))
+    assert (spool.head, spool.pending) == (150, 90)
+    spool.close()
+
+
+def test_single_process_per_directory(tmp_path):
+    spool = Spool(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        Spool(str(tmp_path))
+    spool.close()
+
+
+def _wait_drained(inserter, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while inserter.pending and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert inserter.pending == 0
+
+
+def test_replay_after_lost_tail_does_not_resend(tmp_path, db):
+    """
+    O banco confirmou lsns que o spool perdeu (queda antes do msync) e o
+    marcador local ficou atrasado: nada do que sobreviveu é regravado e as
+    amostras novas vão para o banco sob a nova identidade.
+    """
+    from checkpoint import ensure_checkpoint_table, save_checkpoint
+    from insert_local import MouseMovementInserter
+    from schema import ensure_schema
+
+    spool = Spool(str(tmp_path))
+    spool.append(_records(spool, 100, device="TEST-SPOOL-OLD"))
+    spool.commit(40)
+    old_id = spool.spool_id
+    spool.close()
+    with db.cursor() as cur:
+        ensure_schema(cur)
+        ensure_checkpoint_table(cur)
+        save_checkpoint(cur, f"spool:{old_id}", 150, [])
+    db.commit()
+
+    inserter = MouseMovementInserter(spool_dir=str(tmp_path), flush_interval=0.05)
+    try:
+        payload = json.dumps({"dx": 1, "dy": 1, "L": 0, "U": 0, "R": 0, "D": 0, "X": 0})
+        for _ in range(10):
+            inserter.insert_from_json(payload, device_id="TEST-SPOOL-NEW")
+        _wait_drained(inserter)
+    finally:
+        inserter.close()
+
+    try:
+        with db.cursor() as cur:
+            cur.execute("SELECT device_id, count(*) FROM mouse_movements "
+                        "WHERE device_id IN ('TEST-SPOOL-OLD', 'TEST-SPOOL-NEW') GROUP BY 1;")
+            counts = dict(cur.fetchall())
+        assert counts == {"TEST-SPOOL-NEW": 10}
+    finally:
+        spool = Spool(str(tmp_path))
+        spool.close()
+        with db.cursor() as cur:
+            cur.execute("DELETE FROM mouse_movements WHERE device_id IN ('TEST-SPOOL-OLD', 'TEST-SPOOL-NEW');")
+            cur.execute("DELETE FROM analysis_checkpoint WHERE name = ANY(%s);",
+                        ([f"spool:{old_id}", f"spool:{spool.spool_id}"],))
+        db.commit()
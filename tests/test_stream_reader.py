@@ -0,0 +1,84 @@
+# test_stream_reader.py
+
+from datetime import datetime, timedelta
+import numpy as np
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from stream_reader import concat_columns, rows_to_columns, stream_columns
+
+SERIES = "SELECT g FROM generate_series(1, %s) AS g ORDER BY g;"
+START = datetime(2025, 1, 1)
+
+
+def test_concat_columns():
+    a = rows_to_columns([(1, 0.5), (2, None)], (("id", "i8"), ("v", "f8")))
+    b = rows_to_columns([], (("id", "i8"), ("v", "f8")))
+    c = rows_to_columns([(3, 1.5)], (("id", "i8"), ("v", "f8")))
+    out = concat_columns(a, b, c)
+    assert set(out) == {"id", "v"}
+    assert out["id"].dtype == np.int64 and out["id"].tolist() == [1, 2, 3]
+    assert np.isnan(out["v"][1]) and out["v"][[0, 2]].tolist() == [0.5, 1.5]
+
+
+def test_chunks_follow_itersize(db):
+    fields = (("g", "i8"),)
+    for n, sizes in ((10, [4, 4, 2]), (8, [4, 4]), (0, [])):
+        chunks = list(stream_columns(db, SERIES, (n,), fields, itersize=4))
+        assert [len(chunk["g"]) for chunk in chunks] == sizes
+        if chunks:
+            assert concat_columns(*chunks)["g"].tolist() == list(range(1, n + 1))
+    db.rollback()
+
+
+def test_reads_through_a_server_side_cursor(db):
+    stream = stream_columns(db, SERIES, (100,), (("g", "i8"),), itersize=10)
+    first = next(stream)
+    with db.cursor() as cur:
+        cur.execute("SELECT count(*) FROM pg_cursors WHERE name LIKE 'stream_%%';")
+        assert cur.fetchone()[0] == 1
+    assert first["g"].tolist() == list(range(1, 11))
+    stream.close()
+    db.rollback()
+
+
+def test_dtype_mapping(db):
+    fields = (("id", "i8"), ("v", "f8"), ("device_id", object), ("t", "datetime64[us]"))
+    sql = """
+        SELECT g, CASE WHEN g %% 2 = 0 THEN NULL ELSE g * 0.5 END,
+               CASE WHEN g = 3 THEN NULL ELSE 'D' || g END,
+               %s + g * interval '1 millisecond'
+        FROM generate_series(1, 3) AS g ORDER BY g;
+    """
+    (chunk,) = stream_columns(db, sql, (START,), fields)
+    db.rollback()
+    assert chunk["id"].dtype == np.int64 and chunk["id"].tolist() == [1, 2, 3]
+    assert chunk["v"].dtype == np.float64
+    assert chunk["v"][[0, 2]].tolist() == [0.5, 1.5] and np.isnan(chunk["v"][1])
+    assert chunk["device_id"].dtype == object and chunk["device_id"].tolist() == ["D1", "D2", None]
+    assert chunk["t"].dtype == np.dtype("datetime64[us]")
+    assert chunk["t"].tolist() == [START + timedelta(milliseconds=i) for i in (1, 2, 3)]
+
+
+def test_autocommit_restored(db):
+    """Conexão em autocommit: a leitura usa uma transação própria, encerrada ao fim ou ao parar antes."""
+    db.rollback()
+    db.autocommit = True
+    try:
+        chunks = list(stream_columns(db, SERIES, (5,), (("g", "i8"),), itersize=2))
+        assert len(chunks) == 3
+        assert db.autocommit and db.info.transaction_status == TRANSACTION_STATUS_IDLE
+
+        stream = stream_columns(db, SERIES, (5,), (("g", "i8"),), itersize=2)
+        next(stream)
+        assert not db.autocommit                       # durante a leitura
+        stream.close()                                 # consumidor parou no meio
+        assert db.autocommit and db.info.transaction_status == TRANSACTION_STATUS_IDLE
+    finally:
+        db.autocommit = False
+
+
+def test_caller_transaction_is_kept(db):
+    db.rollback()
+    list(stream_columns(db, SERIES, (3,), (("g", "i8"),)))
+    assert not db.autocommit
+    assert db.info.transaction_status == TRANSACTION_STATUS_INTRANS
+    db.rollback()
@@ -0,0 +1,116 @@
+# config.py
+
+import os
+from typing import NamedTuple
+from urllib.parse import quote
+
+try:
+    from dotenv import load_dotenv
+except ImportError:  # opcional: sem python-dotenv, vale só o ambiente do processo
+    load_dotenv = None
+
+# Configuração central do projeto.
+#
+# Tudo vem de variáveis de ambiente, completadas por um arquivo .env: o
+# caminho em ENV_FILE ou, na falta dele, .env no diretório atual e na raiz
+# do repositório. O .env nunca sobrescreve o que já está no ambiente.
+#
+# Banco (database_settings()):
+#   PG_DB, PG_USER, PG_PASS, PG_HOST, PG_PORT  conexão (padrão: postgres local)
+#   PG_CONNECT_TIMEOUT     segundos para abrir uma conexão (padrão: 5)
+#   PG_STATEMENT_TIMEOUT   limite por comando; ms ou com unidade, "0" desliga (padrão: 30s)
+#   PG_APPLICATION_NAME    nome da sessão em pg_stat_activity (padrão: pointertrack)
+#   PG_POOL_MIN, PG_POOL_MAX  conexões mantidas / máximo por processo (padrão: 1 / 8)
+#   PG_POOL_TIMEOUT        segundos esperando uma conexão livre do pool (padrão: 30)
+#   PG_HEALTH_CHECK        segundos ociosa após os quais a conexão é testada antes do uso (padrão: 30)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_loaded = False
+
+
+def load(path: str | None = None):
+    """
+    Carrega o .env (uma vez por processo; chamadas seguintes não fazem nada,
+    a não ser que `path` seja informado).
+    """
+    global _loaded
+    if _loaded and path is None:
+        return
+    _loaded = True
+    if load_dotenv is None:
+        return
+    candidates = [path or os.environ.get("ENV_FILE") or os.path.join(os.getcwd(), ".env"),
+                  os.path.join(_ROOT, ".env")]
+    for candidate in candidates:
+        if candidate and os.path.isfile(candidate):
+            load_dotenv(candidate, override=False)
+
+
+def get(name: str, default: str | None = None) -> str | None:
+    """Valor de `name` no ambiente (ou no .env); `default` se ausente ou vazio."""
+    load()
+    value = os.environ.get(name)
+    return default if value in (None, "") else value
+
+
+def get_int(name: str, default: int) -> int:
+    return int(get(name, str(default)))
+
+
+def get_float(name: str, default: float) -> float:
+    return float(get(name, str(default)))
+
+
+class DatabaseSettings(NamedTuple):
+    dbname: str
+    user: str
+    password: str
+    host: str
+    port: str
+    connect_timeout: int
+    statement_timeout: str
+    application_name: str
+    pool_min: int
+    pool_max: int
+    pool_timeout: float
+    health_check: float
+
+    def connect_params(self) -> dict:
+        """Argumentos de psycopg2.connect (keepalives TCP detectam conexões mortas)."""
+        return dict(
+            dbname=self.dbname,
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            port=self.port,
+            connect_timeout=self.connect_timeout,
+            application_name=self.application_name,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3,
+            options=f"-c client_encoding=UTF8 -c statement_timeout={self.statement_timeout}",
+        )
+
+    def sqlalchemy_url(self) -> str:
+        """URL postgresql+psycopg2:// para SQLAlchemy/pandas."""
+        return (f"postgresql+psycopg2://{quote(self.user, safe='')}:{quote(self.password, safe='')}"
+                f"@{self.host}:{self.port}/{self.dbname}")
+
+
+def database_settings() -> DatabaseSettings:
+    """Configuração do banco lida do ambiente/.env (ver o cabeçalho do módulo)."""
+    return DatabaseSettings(
+        dbname=get("PG_DB", "postgres"),
+        user=get("PG_USER", "postgres"),
+        password=get("PG_PASS", "1234"),
+        host=get("PG_HOST", "localhost"),
+        port=get("PG_PORT", "5432"),
+        connect_timeout=get_int("PG_CONNECT_TIMEOUT", 5),
+        statement_timeout=get("PG_STATEMENT_TIMEOUT", "30s").replace(" ", ""),
+        application_name=get("PG_APPLICATION_NAME", "pointertrack"),
+        pool_min=get_int("PG_POOL_MIN", 1),
+        pool_max=get_int("PG_POOL_MAX", 8),
+        pool_timeout=get_float("PG_POOL_TIMEOUT", 30.0),
+        health_check=get_float("PG_HEALTH_CHECK", 30.0),
+    )
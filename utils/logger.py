@@ -0,0 +1,410 @@
+# logger.py
+
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import config
+
+# Logs e métricas dos serviços (ingestão, replay, analisador, joystick).
+#
+# Logs: get_logger(nome) devolve um Logger sobre o logging padrão, sob
+# "pointertrack.<nome>". O nível é checado antes de formatar qualquer coisa
+# (mensagens no estilo %-format, argumentos só formatados se o nível estiver
+# ativo), então um debug desligado no caminho quente custa uma comparação.
+# every=segundos limita mensagens repetidas (por mensagem ou `key`); as
+# suprimidas são contadas e informadas na próxima que passar. Argumentos
+# nomeados viram campos estruturados.
+#
+#   LOG_LEVEL   DEBUG | INFO | WARNING | ERROR (padrão: INFO)
+#   LOG_FORMAT  text (mensagem + campos k=v) | json (um objeto por linha)
+#
+# Métricas: contadores, gauges e histogramas em memória (REGISTRY),
+# exportados no formato texto do Prometheus ou em JSON:
+#
+#   METRICS_PORT      servidor HTTP local: /metrics (Prometheus) e /metrics.json
+#   METRICS_HOST      interface do servidor (padrão: 127.0.0.1)
+#   METRICS_FILE      arquivo reescrito a cada METRICS_INTERVAL s (.prom: Prometheus; senão JSON)
+#   METRICS_INTERVAL  padrão: 10
+#
+# Os exportadores só rodam nos serviços que chamam start_exporters().
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 10, 50, 100, 500, 1_000, 5_000, 10_000, 50_000, 100_000)
+
+_ROOT_LOGGER = "pointertrack"
+_configured = False
+_min_level = logging.INFO   # nível do logger raiz: corte barato antes do logging
+_configure_lock = threading.Lock()
+
+
+class TextFormatter(logging.Formatter):
+    """Só a mensagem (como os prints de antes), seguida dos campos k=v."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        fields = getattr(record, "fields", None)
+        if fields:
+            message += "  " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    """Um objeto JSON por linha: ts, level, logger, msg e os campos."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def configure(level: str | None = None, fmt: str | None = None, stream=None):
+    """
+    Configura o logger raiz do projeto (chamado no primeiro get_logger();
+    chame antes para mudar nível, formato ou destino).
+    """
+    global _configured, _min_level
+    with _configure_lock:
+        root = logging.getLogger(_ROOT_LOGGER)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        handler = logging.StreamHandler(stream or sys.stdout)
+        fmt = (fmt or config.get("LOG_FORMAT", "text")).lower()
+        handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+        root.addHandler(handler)
+        root.setLevel((level or config.get("LOG_LEVEL", "INFO")).upper())
+        root.propagate = False
+        _min_level = root.level
+        _configured = True
+
+
+class Logger:
+    """Logger com nível checado antes da formatação, limite de taxa e campos."""
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(f"{_ROOT_LOGGER}.{name}")
+        self._limits: dict = {}   # chave -> [último envio (monotônico), suprimidas]
+        self._lock = threading.Lock()
+
+    def enabled(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level: int, msg: str, args, every: float | None, key, exc_info, fields):
+        if not self._logger.isEnabledFor(level):
+            return
+        if every is not None:
+            now = time.monotonic()
+            key = msg if key is None else key
+            with self._lock:
+                limit = self._limits.get(key)
+                if limit is not None and now - limit[0] < every:
+                    limit[1] += 1
+                    return
+                suppressed = limit[1] if limit is not None else 0
+                self._limits[key] = [now, 0]
+            if suppressed:
+                fields["suprimidas"] = suppressed
+        self._logger.log(level, msg, *args, exc_info=exc_info,
+                         extra={"fields": fields} if fields else None, stacklevel=3)
+
+    def debug(self, msg: str, *args, every: float | None = None, key=None, exc_info=None, **fields):
+        if logging.DEBUG >= _min_level:
+            self._log(logging.DEBUG, msg, args, every, key, exc_info, fields)
+
+    def info(self, msg: str, *args, every: float | None = None, key=None, exc_info=None, **fields):
+        if logging.INFO >= _min_level:
+            self._log(logging.INFO, msg, args, every, key, exc_info, fields)
+
+    def warning(self, msg: str, *args, every: float | None = None, key=None, exc_info=None, **fields):
+        if logging.WARNING >= _min_level:
+            self._log(logging.WARNING, msg, args, every, key, exc_info, fields)
+
+    def error(self, msg: str, *args, every: float | None = None, key=None, exc_info=None, **fields):
+        if logging.ERROR >= _min_level:
+            self._log(logging.ERROR, msg, args, every, key, exc_info, fields)
+
+
+def get_logger(name: str) -> Logger:
+    """Logger do componente `name` (configura o projeto na primeira chamada)."""
+    if not _configured:
+        configure()
+    return Logger(name)
+
+
+# -- métricas ---------------------------------------------------------------
+
+class Counter:
+    """Contador monotônico."""
+    kind = "counter"
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n: float = 1):
+        with self._lock:
+            self._value += n
+
+    def get(self) -> float:
+        return self._value
+
+
+class Gauge:
+    """Valor instantâneo; com set_function(), lido só na exportação."""
+    kind = "gauge"
+
+    def __init__(self):
+        self._value = 0.0
+        self._function = None
+
+    def set(self, value: float):
+        self._value = value
+
+    def set_function(self, function):
+        """`function()` dá o valor a cada leitura (None volta ao último set())."""
+        self._function = function
+
+    def get(self) -> float:
+        function = self._function
+        if function is not None:
+            try:
+                return function()
+            except Exception:
+                return float("nan")
+        return self._value
+
+
+class Histogram:
+    """Distribuição em faixas fixas (limites superiores `buckets`), com soma e contagem."""
+    kind = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)   # o último é +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    @contextmanager
+    def time(self):
+        """with hist.time(): ... — observa a duração do bloco em segundos."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def get(self) -> dict:
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative, running = [], 0
+        for n in counts:
+            running += n
+            cumulative.append(running)
+        return {"count": count, "sum": total, "mean": total / count if count else None,
+                "buckets": dict(zip([*map(str, self.buckets), "+Inf"], cumulative))}
+
+
+class Registry:
+    """Métricas do processo, por nome e conjunto de rótulos."""
+
+    def __init__(self):
+        self._families: dict[str, tuple] = {}   # nome -> (tipo, ajuda, {rótulos: métrica})
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    def _get(self, cls, name: str, help: str, labels: dict, **kwargs):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = (cls.kind, help, {})
+            elif family[0] != cls.kind:
+                raise ValueError(f"Métrica {name} já registrada como {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = cls(**kwargs)
+            return metric
+
+    def counter(self, name: str, help: str = "", **labels) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str = "", **labels) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str = "", buckets=LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def _items(self):
+        with self._lock:
+            return [(name, kind, help, list(metrics.items()))
+                    for name, (kind, help, metrics) in sorted(self._families.items())]
+
+    def render_prometheus(self) -> str:
+        """Todas as métricas no formato texto do Prometheus (0.0.4)."""
+        lines = []
+        for name, kind, help, metrics in self._items():
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in metrics:
+                if kind == "histogram":
+                    data = metric.get()
+                    for le, n in data["buckets"].items():
+                        lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {n}")
+                    lines.append(f"{name}_sum{_labels(key)} {data['sum']}")
+                    lines.append(f"{name}_count{_labels(key)} {data['count']}")
+                else:
+                    lines.append(f"{name}{_labels(key)} {metric.get()}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Todas as métricas como dicionário (para JSON)."""
+        metrics = {}
+        for name, kind, _, items in self._items():
+            metrics[name] = [{"labels": dict(key), "value": metric.get()} for key, metric in items]
+        return {"ts": datetime.now().isoformat(timespec="seconds"),
+                "uptime_s": round(time.time() - self._started, 1), "metrics": metrics}
+
+
+def _labels(key: tuple) -> str:
+    if not key:
+        return ""
+    escaped = (f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for k, v in key)
+    return "{" + ",".join(escaped) + "}"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str = "", **labels) -> Counter:
+    return REGISTRY.counter(name, help, **labels)
+
+
+def gauge(name: str, help: str = "", **labels) -> Gauge:
+    return REGISTRY.gauge(name, help, **labels)
+
+
+def histogram(name: str, help: str = "", buckets=LATENCY_BUCKETS, **labels) -> Histogram:
+    return REGISTRY.histogram(name, help, buckets, **labels)
+
+
+# -- exportação -------------------------------------------------------------
+
+def start_http_server(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY):
+    """Serve /metrics (Prometheus) e /metrics.json numa thread; retorna o servidor."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body = json.dumps(registry.snapshot(), default=str).encode()
+                content_type = "application/json"
+            elif self.path.startswith("/metrics"):
+                body = registry.render_prometheus().encode()
+                content_type = "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # sem uma linha por requisição
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
+
+
+class MetricsFile:
+    """Reescreve `path` a cada `interval` s (e na saída do processo) com as métricas."""
+
+    def __init__(self, path: str, interval: float = 10.0, registry: Registry = REGISTRY):
+        self.path = path
+        self._interval = interval
+        self._registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="metrics-file")
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self):
+        if self.path.endswith(".prom"):
+            data = self._registry.render_prometheus()
+        else:
+            data = json.dumps(self._registry.snapshot(), default=str, indent=1)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self.write()
+            except OSError as e:
+                _log.warning("❌ Falha ao gravar métricas em %s: %s", self.path, e, every=60)
+
+    def close(self):
+        if not self._stop.is_set():
+            self._stop.set()
+            self.write()
+
+
+_exporters = None
+
+
+def start_exporters() -> list:
+    """
+    Inicia os exportadores configurados (METRICS_PORT, METRICS_FILE); uma
+    vez por processo. Sem configuração, as métricas só ficam em memória.
+    """
+    global _exporters
+    with _configure_lock:
+        if _exporters is not None:
+            return _exporters
+        _exporters = []
+    port = config.get("METRICS_PORT")
+    if port:
+        host = config.get("METRICS_HOST", "127.0.0.1")
+        try:
+            _exporters.append(start_http_server(int(port), host))
+            _log.info("📊 Métricas em http://%s:%s/metrics", host, port)
+        except OSError as e:
+            _log.error("❌ Falha ao abrir o servidor de métricas na porta %s: %s", port, e)
+    path = config.get("METRICS_FILE")
+    if path:
+        _exporters.append(MetricsFile(path, config.get_float("METRICS_INTERVAL", 10.0)))
+    return _exporters
+
+
+_log = get_logger("metrics")
+